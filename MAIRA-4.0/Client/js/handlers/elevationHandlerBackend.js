@@ -79,10 +79,47 @@ function calcularDistanciaHaversine(lat1, lon1, lat2, lon2) {
   return R * c;
 }
 
+// 📈 Perfil calculado en el servidor: se mandan solo los vértices, el backend
+// densifica cada `paso` metros y devuelve distancia/elevación/pendiente
+async function calcularPerfilServidor(ruta, paso = 30) {
+  const response = await fetch('/api/terreno/perfil', {
+    method: 'POST',
+    headers: {'Content-Type': 'application/json'},
+    body: JSON.stringify({
+      linea: {
+        type: 'LineString',
+        coordinates: ruta.map(p => [p.lng || p.lon, p.lat])
+      },
+      paso: paso
+    })
+  });
+
+  if (!response.ok) throw new Error(`HTTP ${response.status}`);
+  const data = await response.json();
+  console.log(`✅ Perfil servidor: ${data.resumen.muestras} muestras en ${data.resumen.distancia_total}m`);
+
+  return data.distancias.map((distancia, i) => ({
+    lat: data.lats[i],
+    lng: data.lons[i],
+    elevation: data.elevaciones[i],
+    distancia: Math.round(distancia),
+    indice: i,
+    pendiente: data.pendientes[i] === null ? 0 : Math.max(-100, Math.min(100, data.pendientes[i])),
+    ascenso: data.ascenso_acumulado[i]
+  }));
+}
+
 // 📊 Calcular perfil de elevación
 async function calcularPerfilElevacion(ruta) {
   try {
     console.log('📊 Perfil:', ruta.length, 'puntos');
+    if (ruta.length >= 2) {
+      try {
+        return await calcularPerfilServidor(ruta);
+      } catch (error) {
+        console.warn('⚠️ Perfil en servidor no disponible, muestreando vértices:', error);
+      }
+    }
     const elevations = await obtenerElevacionBatch(ruta);
     
     const perfil = [];
@@ -193,6 +230,7 @@ window.elevationHandler = {
   obtenerElevacion,
   obtenerElevacionBatch,
   calcularPerfilElevacion,
+  calcularPerfilServidor,
   procesarDatosElevacion,
   obtenerEstadoSistema,
   getElevation: obtenerElevacion,
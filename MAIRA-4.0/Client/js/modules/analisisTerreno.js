@@ -101,6 +101,7 @@ class AnalisisTerreno {
         // Configuración
         this.config = {
             apiUrl: 'http://localhost:5001/api/terreno',
+            trabajosUrl: 'http://localhost:5001/api/trabajos',
             coloresPendientes: {
                 '0-5': '#2ecc71',      // Verde - Transitable
                 '5-15': '#f1c40f',     // Amarillo - Precaución
@@ -422,7 +423,10 @@ class AnalisisTerreno {
                     <!-- Indicador de carga -->
                     <div id="loadingAnalisis" class="loading-overlay" style="display: none;">
                         <div class="spinner"></div>
-                        <p>Analizando terreno...</p>
+                        <p id="textoProgresoAnalisis">Analizando terreno...</p>
+                        <button id="btnCancelarAnalisis" class="btn btn-secondary" style="display: none;">
+                            <i class="fas fa-times"></i> Cancelar
+                        </button>
                     </div>
                 </div>
             </div>
@@ -444,6 +448,7 @@ class AnalisisTerreno {
         const btnLimpiar = document.getElementById('btnLimpiarAnalisis');
         const btnCargarCapasGIS = document.getElementById('btnCargarCapasGIS');
         const btnLimpiarCapasGIS = document.getElementById('btnLimpiarCapasGIS');
+        const btnCancelarAnalisis = document.getElementById('btnCancelarAnalisis');
 
         if (btnDibujar) {
             btnDibujar.addEventListener('click', () => this.activarDibujoPoligono());
@@ -467,6 +472,10 @@ class AnalisisTerreno {
                 document.getElementById('statsCapasGIS').style.display = 'none';
             });
         }
+
+        if (btnCancelarAnalisis) {
+            btnCancelarAnalisis.addEventListener('click', () => this.cancelarAnalisis());
+        }
     }
 
     /**
@@ -579,57 +588,6 @@ class AnalisisTerreno {
         }
     }
 
-    /**
-     * Genera una grilla de puntos dentro de un polígono
-     * @param {Array} polygonCoords - Coordenadas del polígono [[lng, lat], ...]
-     * @param {Number} resolution - Resolución en metros (default: 100m)
-     * @returns {Array} - Array de puntos {lat, lon}
-     */
-    generarGrillaPuntos(polygonCoords, resolution = 100) {
-        // Calcular bounds del polígono
-        const lngs = polygonCoords.map(p => p[0]);
-        const lats = polygonCoords.map(p => p[1]);
-        
-        const minLng = Math.min(...lngs);
-        const maxLng = Math.max(...lngs);
-        const minLat = Math.min(...lats);
-        const maxLat = Math.max(...lats);
-        
-        // Calcular centro para ajuste de longitud
-        const centerLat = (minLat + maxLat) / 2;
-        
-        // Conversión metros a grados
-        const metersPerDegreeLat = 111320;
-        const metersPerDegreeLon = 111320 * Math.cos(centerLat * Math.PI / 180);
-        
-        const latStep = resolution / metersPerDegreeLat;
-        const lonStep = resolution / metersPerDegreeLon;
-        
-        console.log(`📐 Resolución: ${resolution}m → ${latStep.toFixed(6)}° lat, ${lonStep.toFixed(6)}° lon`);
-        
-        // Generar puntos
-        const points = [];
-        const polygon = L.polygon(polygonCoords.map(p => [p[1], p[0]])); // Leaflet usa [lat, lng]
-        
-        for (let lat = minLat; lat <= maxLat; lat += latStep) {
-            for (let lon = minLng; lon <= maxLng; lon += lonStep) {
-                // Verificar si el punto está dentro del polígono
-                if (polygon.getBounds().contains([lat, lon])) {
-                    // Verificación más precisa con contains (requiere que el polígono esté en el mapa)
-                    const latLng = L.latLng(lat, lon);
-                    
-                    // Usar algoritmo punto-en-polígono simple
-                    if (this.puntoEnPoligono(lat, lon, polygonCoords)) {
-                        points.push({ lat, lon });
-                    }
-                }
-            }
-        }
-        
-        console.log(`✅ Grilla: ${points.length} puntos generados (resolución ${resolution}m)`);
-        return points;
-    }
-
     /**
      * Algoritmo punto-en-polígono (Ray Casting)
      * @param {Number} lat - Latitud del punto
@@ -671,19 +629,15 @@ class AnalisisTerreno {
         
         console.log(`🎯 Resolución seleccionada: ${this.resolucion}m`);
 
-        // 🔍 VALIDAR Y DIVIDIR ÁREA SI ES MUY GRANDE
+        // 🔍 VALIDAR ÁREA
         const geoJSON = this.poligonoActual.toGeoJSON();
         const area = this.calcularAreaPoligono(this.poligonoActual);
         const areaKm2 = area / 1000000;
         
-        // 📏 LÍMITES OPERACIONALES
-        // Chunk: 50km² (~7x7km) - suficiente para Batallón
+        // 📏 LÍMITE OPERACIONAL
         // Total: 2000km² (~45x45km) - cubre operaciones nivel División/Cuerpo
-        const LIMITE_CHUNK_KM2 = 50; // Procesar chunks de 50km²
         const LIMITE_TOTAL_KM2 = 2000; // Máximo total procesable (operaciones División+)
         
-        let procesarPorChunks = false;
-        
         if (areaKm2 > LIMITE_TOTAL_KM2) {
             alert(
                 `⚠️ ÁREA DEMASIADO GRANDE\n\n` +
@@ -699,77 +653,52 @@ class AnalisisTerreno {
             console.log(`❌ Análisis cancelado (${areaKm2.toFixed(2)}km² excede límite ${LIMITE_TOTAL_KM2}km²)`);
             return;
         }
-        
-        if (areaKm2 > LIMITE_CHUNK_KM2) {
-            const numChunks = Math.ceil(areaKm2 / LIMITE_CHUNK_KM2);
-            
-            // Estimar nivel operacional
-            let nivelOperacional = 'Batallón';
-            if (areaKm2 > 1500) nivelOperacional = 'Cuerpo de Ejército';
-            else if (areaKm2 > 500) nivelOperacional = 'División';
-            else if (areaKm2 > 100) nivelOperacional = 'Brigada';
-            
-            const tiempoEstimado = Math.ceil(numChunks * 2); // ~2 seg por chunk
-            
-            const confirmacion = confirm(
-                `📦 ÁREA GRANDE - PROCESAMIENTO POR PARTES\n\n` +
-                `Área total: ${areaKm2.toFixed(2)} km² (~${nivelOperacional})\n` +
-                `Se dividirá en ${numChunks} partes de ${LIMITE_CHUNK_KM2}km² cada una\n` +
-                `Tiempo estimado: ~${tiempoEstimado} segundos\n\n` +
-                `Esto procesará ${Math.round(areaKm2 * 40)} puntos aproximadamente.\n` +
-                `¿Continuar?`
-            );
-            
-            if (!confirmacion) {
-                console.log('❌ Análisis cancelado por usuario');
-                return;
-            }
-            
-            procesarPorChunks = true;
-        }
 
         // Mostrar indicador de carga
         document.getElementById('loadingAnalisis').style.display = 'flex';
+        this.actualizarProgresoAnalisis('Analizando terreno...');
 
         try {
-            // 🎯 PASO 1: Generar grilla de puntos dentro del polígono
-            const gridPoints = this.generarGrillaPuntos(geoJSON.geometry.coordinates[0], this.resolucion);
-            
-            console.log(`📐 Grilla generada: ${gridPoints.length} puntos (área ${areaKm2.toFixed(2)} km²)`);
-            
-            let resultados;
-            
-            // 📦 PROCESAR POR CHUNKS SI ES NECESARIO
-            if (procesarPorChunks) {
-                console.log('📦 Procesando por chunks...');
-                resultados = await this.procesarPorChunks(gridPoints, geoJSON, vehiculo, clima, checkPendientes, checkTransitabilidad);
-            } else {
-                // Procesar normalmente
-                const requestData = {
-                    poligono: geoJSON.geometry.coordinates,
-                    puntos: gridPoints,
-                    vehiculo: vehiculo,
-                    clima: clima,
-                    capas: {
-                        pendientes: checkPendientes,
-                        transitabilidad: checkTransitabilidad
-                    }
-                };
+            // 🎯 La grilla la genera el servidor a partir del polígono y la resolución:
+            // una sola request sin importar el tamaño del área (sin chunks)
+            const requestData = {
+                poligono: geoJSON.geometry.coordinates,
+                grilla: { resolucion: this.resolucion },
+                vehiculo: vehiculo,
+                clima: clima,
+                capas: {
+                    pendientes: checkPendientes,
+                    transitabilidad: checkTransitabilidad
+                }
+            };
 
-                console.log('📡 Enviando solicitud de análisis:', requestData);
+            // ⚙️ Trabajo asíncrono: el servidor lo corre en su pool de procesos y
+            // reporta el avance por Socket.IO a este socket
+            const socket = window.socket;
+            if (socket && socket.connected) {
+                requestData.socket_id = socket.id;
+            }
 
-                const response = await fetch(`${this.config.apiUrl}/analizar`, {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify(requestData)
-                });
+            console.log(`📡 Enviando solicitud de análisis (área ${areaKm2.toFixed(2)} km², grilla ${this.resolucion}m)`);
 
-                if (!response.ok) {
-                    throw new Error(`Error HTTP: ${response.status}`);
-                }
+            const response = await fetch(`${this.config.apiUrl}/trabajos`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify(requestData)
+            });
+
+            if (!response.ok) {
+                throw new Error(`Error HTTP: ${response.status}`);
+            }
 
+            // 200 = rasters del polígono en cache (resultado inmediato), 202 = trabajo encolado
+            let resultados;
+            if (response.status === 202) {
+                const { trabajo } = await response.json();
+                resultados = await this.esperarTrabajo(trabajo.id);
+            } else {
                 resultados = await response.json();
             }
             
@@ -788,115 +717,94 @@ class AnalisisTerreno {
             alert(`Error al analizar el terreno: ${error.message}\n\nVerifique que el servidor API esté corriendo.`);
         } finally {
             // Ocultar indicador de carga
+            this.trabajoActual = null;
+            document.getElementById('btnCancelarAnalisis').style.display = 'none';
             document.getElementById('loadingAnalisis').style.display = 'none';
         }
     }
 
     /**
-     * 📦 Procesa área grande dividiéndola en chunks
+     * Espera un trabajo del servidor: progreso por Socket.IO si hay socket,
+     * si no consulta el estado cada segundo. Resuelve con el resultado.
      */
-    async procesarPorChunks(gridPoints, geoJSON, vehiculo, clima, checkPendientes, checkTransitabilidad) {
-        const CHUNK_SIZE = 2000; // Máximo 2000 puntos por request
-        const totalPuntos = gridPoints.length;
-        const numChunks = Math.ceil(totalPuntos / CHUNK_SIZE);
-        
-        console.log(`📦 Dividiendo ${totalPuntos} puntos en ${numChunks} chunks de ~${CHUNK_SIZE} puntos`);
-        
-        let todosLosPuntosDetalle = [];
-        let pendientePromedio = 0;
-        let pendienteMaxima = -Infinity;
-        let pendienteMinima = Infinity;
-        let distribucionPendientes = {'0-5': 0, '5-15': 0, '15-30': 0, '30+': 0};
-        let puntosCriticos = [];
-        
-        // Procesar cada chunk
-        for (let i = 0; i < numChunks; i++) {
-            const start = i * CHUNK_SIZE;
-            const end = Math.min(start + CHUNK_SIZE, totalPuntos);
-            const chunk = gridPoints.slice(start, end);
-            
-            console.log(`📦 Procesando chunk ${i + 1}/${numChunks} (${chunk.length} puntos)...`);
-            
-            // Actualizar indicador de progreso
-            const progress = Math.round(((i + 1) / numChunks) * 100);
-            document.getElementById('loadingAnalisis').querySelector('p').textContent = 
-                `Analizando terreno... ${progress}% (${i + 1}/${numChunks} partes)`;
-            
-            const requestData = {
-                poligono: geoJSON.geometry.coordinates,
-                puntos: chunk,
-                vehiculo: vehiculo,
-                clima: clima,
-                capas: {
-                    pendientes: checkPendientes,
-                    transitabilidad: checkTransitabilidad
+    esperarTrabajo(trabajoId) {
+        this.trabajoActual = trabajoId;
+        document.getElementById('btnCancelarAnalisis').style.display = 'inline-block';
+        const socket = window.socket && window.socket.connected ? window.socket : null;
+
+        return new Promise((resolve, reject) => {
+            let intervalo = null;
+            let terminado = false;
+
+            // El evento del socket y una consulta en vuelo pueden llegar los dos
+            const terminar = (error) => {
+                if (terminado) return;
+                terminado = true;
+                if (socket) {
+                    socket.off('trabajo_progreso', onProgreso);
+                    socket.off('trabajo_completado', onCompletado);
+                    socket.off('trabajo_error', onError);
+                    socket.off('trabajo_cancelado', onCancelado);
+                }
+                clearInterval(intervalo);
+                if (error) {
+                    reject(error);
+                    return;
                 }
+                fetch(`${this.config.trabajosUrl}/${trabajoId}/resultado`)
+                    .then(r => r.ok ? r.json() : Promise.reject(new Error(`Error HTTP: ${r.status}`)))
+                    .then(resolve, reject);
             };
-            
-            const response = await fetch(`${this.config.apiUrl}/analizar`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(requestData)
-            });
-            
-            if (!response.ok) {
-                throw new Error(`Error HTTP en chunk ${i + 1}: ${response.status}`);
-            }
-            
-            const resultado = await response.json();
-            
-            // Acumular resultados
-            if (resultado.puntos_detalle) {
-                todosLosPuntosDetalle = todosLosPuntosDetalle.concat(resultado.puntos_detalle);
-            }
-            
-            // Actualizar estadísticas
-            if (resultado.pendiente_maxima > pendienteMaxima) {
-                pendienteMaxima = resultado.pendiente_maxima;
-            }
-            if (resultado.pendiente_minima < pendienteMinima) {
-                pendienteMinima = resultado.pendiente_minima;
-            }
-            
-            // Acumular distribución (promedio ponderado después)
-            if (resultado.distribucion_pendientes) {
-                Object.keys(resultado.distribucion_pendientes).forEach(key => {
-                    distribucionPendientes[key] += resultado.distribucion_pendientes[key] * chunk.length;
-                });
-            }
-            
-            if (resultado.puntos_criticos) {
-                puntosCriticos = puntosCriticos.concat(resultado.puntos_criticos);
+
+            const onProgreso = (datos) => {
+                if (datos.id !== trabajoId) return;
+                const tile = datos.tile ? ` (${datos.tile})` : '';
+                this.actualizarProgresoAnalisis(`Analizando terreno... ${Math.round(datos.progreso)}% ${datos.etapa || ''}${tile}`);
+            };
+            const onCompletado = (datos) => { if (datos.id === trabajoId) terminar(); };
+            const onError = (datos) => { if (datos.id === trabajoId) terminar(new Error(datos.error)); };
+            const onCancelado = (datos) => { if (datos.id === trabajoId) terminar(new Error('Análisis cancelado')); };
+
+            if (socket) {
+                socket.on('trabajo_progreso', onProgreso);
+                socket.on('trabajo_completado', onCompletado);
+                socket.on('trabajo_error', onError);
+                socket.on('trabajo_cancelado', onCancelado);
             }
-            
-            // Pequeña pausa para no saturar
-            await new Promise(resolve => setTimeout(resolve, 100));
-        }
-        
-        // Calcular promedios finales
-        Object.keys(distribucionPendientes).forEach(key => {
-            distribucionPendientes[key] = distribucionPendientes[key] / totalPuntos;
+
+            // Respaldo sin socket (o si se pierde un evento): consultar el estado
+            intervalo = setInterval(async () => {
+                try {
+                    const r = await fetch(`${this.config.trabajosUrl}/${trabajoId}`);
+                    if (!r.ok) return;
+                    const trabajo = await r.json();
+                    if (trabajo.estado === 'completado') terminar();
+                    else if (trabajo.estado === 'error') terminar(new Error(trabajo.error));
+                    else if (trabajo.estado === 'cancelado') terminar(new Error('Análisis cancelado'));
+                    else if (!socket) onProgreso({ id: trabajoId, progreso: trabajo.progreso, etapa: trabajo.etapa });
+                } catch (e) {
+                    console.warn('⚠️ Error consultando trabajo:', e);
+                }
+            }, socket ? 5000 : 1000);
         });
-        
-        pendientePromedio = todosLosPuntosDetalle.reduce((sum, p) => sum + p.pendiente, 0) / todosLosPuntosDetalle.length;
-        
-        console.log(`✅ Procesamiento por chunks completado: ${todosLosPuntosDetalle.length} puntos totales`);
-        
-        // Restaurar texto loading
-        document.getElementById('loadingAnalisis').querySelector('p').textContent = 'Analizando terreno...';
-        
-        return {
-            success: true,
-            puntos_detalle: todosLosPuntosDetalle,
-            pendiente_promedio: pendientePromedio,
-            pendiente_maxima: pendienteMaxima,
-            pendiente_minima: pendienteMinima,
-            pct_transitable: todosLosPuntosDetalle.filter(p => p.pendiente < 30).length / todosLosPuntosDetalle.length * 100,
-            distribucion_pendientes: distribucionPendientes,
-            puntos_criticos: puntosCriticos.slice(0, 10)
-        };
+    }
+
+    /**
+     * Cancela el trabajo de análisis en curso
+     */
+    async cancelarAnalisis() {
+        if (!this.trabajoActual) return;
+        console.log(`🛑 Cancelando trabajo ${this.trabajoActual}`);
+        try {
+            await fetch(`${this.config.trabajosUrl}/${this.trabajoActual}/cancelar`, { method: 'POST' });
+        } catch (error) {
+            console.error('❌ Error cancelando análisis:', error);
+        }
+    }
+
+    actualizarProgresoAnalisis(texto) {
+        const elemento = document.getElementById('textoProgresoAnalisis');
+        if (elemento) elemento.textContent = texto;
     }
 
     /**
@@ -952,6 +860,9 @@ class AnalisisTerreno {
             this.crearCalcoVegetacion(resultados.puntos_detalle);
             this.crearCalcoTransitabilidad(resultados.puntos_detalle);
             this.crearCalcoOCOTA(resultados.puntos_detalle); // 🔭 NUEVO: OCOTA
+            if (document.getElementById('checkIntervisibilidad')?.checked) {
+                this.crearCalcoVisibilidad(resultados.puntos_detalle); // 👁️ Cuencas visuales del servidor
+            }
             this.crearCalcoAvenidas(resultados.puntos_detalle); // 🛣️ NUEVO: Avenidas Aproximación
             
             // 🗑️ ELIMINAR POLÍGONO ORIGINAL - Solo quedan cuadrados en calcos separados
@@ -1341,6 +1252,97 @@ class AnalisisTerreno {
         }
     }
 
+    /**
+     * 👁️ Crear calco de intervisibilidad: cuenca visual real (servidor) desde
+     * los puntos más altos del área, pintada como imagen sobre la grilla
+     */
+    async crearCalcoVisibilidad(puntos_detalle) {
+        console.log('👁️ Calculando cuencas visuales...');
+
+        // Observadores: los puntos más altos separados al menos 1 km entre sí
+        const observadores = [];
+        const candidatos = puntos_detalle
+            .filter(p => Number.isFinite(p.elevation))
+            .sort((a, b) => b.elevation - a.elevation);
+        for (const punto of candidatos) {
+            if (observadores.length >= 5) break;
+            const lejos = observadores.every(o =>
+                this.calcularDistanciaMetros(o.lat, o.lon, punto.lat, punto.lon) >= 1000
+            );
+            if (lejos) observadores.push({ lat: punto.lat, lon: punto.lon, altura: 2 });
+        }
+        if (observadores.length === 0) return;
+
+        try {
+            const response = await fetch(`${this.config.apiUrl}/visibilidad`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    observadores: observadores,
+                    alcance: 5000,
+                    resolucion: Math.max(this.resolucion || 30, 30)
+                })
+            });
+            if (!response.ok) {
+                throw new Error(`Error HTTP: ${response.status}`);
+            }
+            const datos = await response.json();
+            const { rows, cols, bbox } = datos.grilla;
+
+            // Grilla -> canvas (fila 0 = norte): intensidad según cuántos observadores ven la celda
+            const canvas = document.createElement('canvas');
+            canvas.width = cols;
+            canvas.height = rows;
+            const ctx = canvas.getContext('2d');
+            const imagen = ctx.createImageData(cols, rows);
+            const maximo = observadores.length;
+            datos.visibilidad.forEach((fila, i) => {
+                fila.forEach((conteo, j) => {
+                    if (!conteo) return;
+                    const k = (i * cols + j) * 4;
+                    imagen.data[k] = 65;
+                    imagen.data[k + 1] = 105;
+                    imagen.data[k + 2] = 225;
+                    imagen.data[k + 3] = Math.round(90 + 140 * conteo / maximo);
+                });
+            });
+            ctx.putImageData(imagen, 0, 0);
+
+            if (typeof window.crearNuevoCalco !== 'function') {
+                console.error('❌ Sistema de calcos no disponible');
+                return;
+            }
+            const timestamp = new Date().toLocaleTimeString('es-AR', { hour: '2-digit', minute: '2-digit', second: '2-digit' });
+            const nombreCalco = `👁️ Intervisibilidad ${timestamp}`;
+            const calcosAnteriores = Object.keys(window.calcos || {}).length;
+            window.crearNuevoCalco();
+
+            const nuevoNombre = `Calco ${calcosAnteriores + 1}`;
+            if (window.calcos && window.calcos[nuevoNombre]) {
+                window.calcos[nombreCalco] = window.calcos[nuevoNombre];
+                delete window.calcos[nuevoNombre];
+
+                L.imageOverlay(canvas.toDataURL(), [[bbox.south, bbox.west], [bbox.north, bbox.east]], {
+                    opacity: 0.8,
+                    className: 'calco-visibilidad'
+                }).addTo(window.calcos[nombreCalco]);
+
+                datos.observadores.forEach(obs => {
+                    L.circleMarker([obs.lat, obs.lon], { radius: 6, color: '#000', fillColor: '#FFD700', fillOpacity: 1 })
+                        .bindTooltip(
+                            `<strong>👁️ Observador</strong><br>` +
+                            `<strong>🏔️ Altitud:</strong> ${obs.elevacion}m<br>` +
+                            `<strong>👀 Visible:</strong> ${obs.pct_visible}% (${obs.area_visible_km2} km²)`
+                        )
+                        .addTo(window.calcos[nombreCalco]);
+                });
+                console.log(`✅ Calco intervisibilidad: ${observadores.length} observadores, grilla ${rows}x${cols}`);
+            }
+        } catch (error) {
+            console.error('❌ Error calculando intervisibilidad:', error);
+        }
+    }
+
     /**
      * Analizar componentes OCOTA para un punto
      */
@@ -5,10 +5,14 @@
 // Ruta relativa desde Client/js/workers/ hacia node_modules/
 importScripts('../../../node_modules/geotiff/dist-browser/geotiff.js');
 
+// empaquetarCoordenadas / fetchBatchBinario (formato de los lotes binarios)
+importScripts('formatoBinario.js');
+
 // Configuración del worker
 const CONFIG = {
     cacheMaxSize: 20,
-    tileBaseUrl: '/api/tiles/elevation'
+    tileBaseUrl: '/api/tiles/elevation',
+    batchUrl: '/api/elevation/batch'
 };
 
 let tileCache = new Map();
@@ -53,6 +57,22 @@ onmessage = async function(e) {
                 });
                 break;
                 
+            case 'FETCH_ELEVATION_BATCH':
+                // Lote binario: data.coords = Float64Array [lat0, lon0, lat1, lon1, ...]
+                // o array de {lat, lng}. El Float32Array resultante se transfiere sin copia.
+                const lote = await fetchBatchBinario(data.url || CONFIG.batchUrl, data.coords || data.puntos);
+                postMessage({
+                    type: 'ELEVATION_BATCH_RESULT',
+                    data: {
+                        elevations: lote.valores,
+                        validCount: lote.validCount,
+                        tilesLoaded: lote.tilesLoaded,
+                        processingTime: lote.processingTime,
+                        requestId: data.requestId
+                    }
+                }, [lote.valores.buffer]);
+                break;
+                
             case 'PROCESS_ELEVATION_DATA':
                 console.log('📊 PROCESANDO DATOS DE ELEVACIÓN');
                 console.log('📥 Datos recibidos:', data);
@@ -0,0 +1,45 @@
+// formatoBinario.js - MAIRA 4.0
+// Formato binario de los lotes de elevación/vegetación, del lado del cliente.
+// Contraparte de Server/services/formato_binario.py; se carga en los workers
+// con importScripts('formatoBinario.js').
+
+/**
+ * Empaqueta puntos {lat, lng|lon} como Float64Array intercalado [lat, lon, ...]
+ */
+function empaquetarCoordenadas(puntos) {
+    const coords = new Float64Array(puntos.length * 2);
+    for (let i = 0; i < puntos.length; i++) {
+        coords[2 * i] = puntos[i].lat;
+        coords[2 * i + 1] = puntos[i].lng !== undefined ? puntos[i].lng : puntos[i].lon;
+    }
+    return coords;
+}
+
+/**
+ * Pide un lote al backend en formato binario.
+ * Los typed arrays usan el endianness de la plataforma, little-endian en todos
+ * los navegadores soportados, que es lo que espera el servidor.
+ * Devuelve Float32Array con NaN donde no hay dato, más los metadatos X-*.
+ */
+async function fetchBatchBinario(url, coords) {
+    const cuerpo = coords instanceof Float64Array ? coords : empaquetarCoordenadas(coords);
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/octet-stream; dtype=float64',
+            'Accept': 'application/octet-stream'
+        },
+        body: cuerpo
+    });
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status} for ${url}`);
+    }
+
+    const valores = new Float32Array(await response.arrayBuffer());
+    return {
+        valores,
+        validCount: parseInt(response.headers.get('X-Valid-Count') || '0', 10),
+        tilesLoaded: parseInt(response.headers.get('X-Tiles-Loaded') || '0', 10),
+        processingTime: parseFloat(response.headers.get('X-Processing-Time') || '0')
+    };
+}
@@ -8,6 +8,9 @@
 // Ruta relativa desde Client/js/workers/ hacia node_modules/
 importScripts('../../../node_modules/geotiff/dist-browser/geotiff.js');
 
+// empaquetarCoordenadas / fetchBatchBinario (formato de los lotes binarios)
+importScripts('formatoBinario.js');
+
 // Cache de datos de vegetación en el worker
 const vegetationCache = new Map();
 
@@ -16,7 +19,8 @@ const VEGETATION_CONFIG = {
     cacheMaxSize: 50,
     noDataValue: -9999,
     scaleFactor: 10000,
-    ndviRange: [-1, 1]
+    ndviRange: [-1, 1],
+    batchUrl: '/api/vegetation/batch'
 };
 
 // URLs de fallback - SE CONFIGURAN DINÁMICAMENTE según entorno
@@ -168,7 +172,7 @@ async function cargarTileVegetacion(tileUrl) {
  * Manejador principal de mensajes del worker
  */
 self.onmessage = async function(e) {
-    const { id, type, coords, tileUrl, isLocal, baseUrls } = e.data;
+    const { id, type, coords, tileUrl, isLocal, baseUrls, batchUrl } = e.data;
     
     // 🔧 Configurar entorno si se recibe
     if (type === 'CONFIG') {
@@ -192,6 +196,20 @@ self.onmessage = async function(e) {
                 });
                 break;
                 
+            case 'getVegetationBatch':
+                // coords: Float64Array [lat0, lon0, ...] o array de {lat, lng}
+                const lote = await fetchBatchBinario(batchUrl || VEGETATION_CONFIG.batchUrl, coords);
+                self.postMessage({
+                    id,
+                    success: true,
+                    data: {
+                        ndvi: lote.valores,
+                        validCount: lote.validCount,
+                        tilesLoaded: lote.tilesLoaded
+                    }
+                }, [lote.valores.buffer]);
+                break;
+                
             case 'clearCache':
                 vegetationCache.clear();
                 self.postMessage({
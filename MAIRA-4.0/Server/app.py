@@ -9,8 +9,6 @@ import time
 import traceback
 import subprocess
 import requests
-import tarfile
-import io
 from datetime import datetime, timedelta
 from flask import Flask, request, jsonify, send_from_directory, send_file, Response
 from flask_socketio import SocketIO, emit, join_room, leave_room
@@ -405,11 +403,16 @@ def serve_altimetria_tiles(filename):
             return jsonify({'error': 'Tiles directory not found'}), 404
         
         file_path = os.path.join(tiles_dir, filename)
-        if not os.path.exists(file_path):
-            print(f"❌ Archivo de tile no encontrado: {file_path}")
-            return jsonify({'error': f'Tile file not found: {filename}'}), 404
-        
-        response = send_from_directory(tiles_dir, filename)
+        if os.path.exists(file_path):
+            response = send_from_directory(tiles_dir, filename)
+        else:
+            # Paquete de AO (.mbtiles, services/almacen_tiles.py) en lugar de los archivos sueltos
+            from services.almacen_tiles import buscar_en_paquetes
+            datos = buscar_en_paquetes(f'Altimetria_Mini_Tiles/{filename}')
+            if datos is None:
+                print(f"❌ Archivo de tile no encontrado: {file_path}")
+                return jsonify({'error': f'Tile file not found: {filename}'}), 404
+            response = Response(datos, mimetype='application/octet-stream')
         
         # Headers optimizados para tiles
         if filename.endswith('.json'):
@@ -445,11 +448,16 @@ def serve_vegetacion_tiles(filename):
             return jsonify({'error': 'Vegetation tiles directory not found'}), 404
         
         file_path = os.path.join(tiles_dir, filename)
-        if not os.path.exists(file_path):
-            print(f"❌ Archivo de tile vegetación no encontrado: {file_path}")
-            return jsonify({'error': f'Vegetation tile file not found: {filename}'}), 404
-        
-        response = send_from_directory(tiles_dir, filename)
+        if os.path.exists(file_path):
+            response = send_from_directory(tiles_dir, filename)
+        else:
+            # Paquete de AO (.mbtiles, services/almacen_tiles.py) en lugar de los archivos sueltos
+            from services.almacen_tiles import buscar_en_paquetes
+            datos = buscar_en_paquetes(f'Vegetacion_Mini_Tiles/{filename}')
+            if datos is None:
+                print(f"❌ Archivo de tile vegetación no encontrado: {file_path}")
+                return jsonify({'error': f'Vegetation tile file not found: {filename}'}), 404
+            response = Response(datos, mimetype='application/octet-stream')
         
         # Headers optimizados para tiles de vegetación
         if filename.endswith('.json'):
@@ -516,6 +524,10 @@ def tiles_diagnostic():
                     'size': os.path.getsize(item_path) if os.path.isfile(item_path) else None
                 })
         
+        # Desempaquetados de archivos .tar.gz en curso o terminados
+        from services.extraccion_tiles import extractor_tiles
+        diagnostic['extracciones'] = extractor_tiles.estadisticas()
+        
         return jsonify(diagnostic)
         
     except Exception as e:
@@ -523,56 +535,61 @@ def tiles_diagnostic():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
-# 🗺️ SISTEMA DE DESCARGA Y CACHE DE TILES
-def descargar_tile(url, path_local):
-    """Descargar un tile y guardarlo localmente"""
+# 📊 ENDPOINT: Estadísticas del pool de rasters abiertos
+@app.route('/api/tiles/pool_stats')
+def tiles_pool_stats():
+    """Contadores hit/miss/desalojos del pool compartido de tiles raster"""
     try:
-        import requests
-        os.makedirs(os.path.dirname(path_local), exist_ok=True)
-        
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        
-        with open(path_local, 'wb') as f:
-            f.write(response.content)
-        
-        print(f"✅ Tile descargado: {path_local}")
-        return True
+        from services.pool_raster import pool_global
+        return jsonify(pool_global.estadisticas())
     except Exception as e:
-        print(f"❌ Error descargando tile {url}: {e}")
-        return False
+        print(f"❌ Error obteniendo estadísticas del pool: {e}")
+        return jsonify({'error': str(e)}), 500
 
+# 🗺️ SISTEMA DE DESCARGA Y CACHE DE TILES
 @app.route('/tiles/<provider>/<int:z>/<int:x>/<int:y>.<ext>')
 def proxy_tile(provider, z, x, y, ext):
     """Proxy/Cache para tiles de mapas - evita problemas de CORS"""
     try:
+        # Cache en disco con cuota y desalojo LRU (ver services/cache_disco_tiles.py);
+        # descargas con sesiones keep-alive y requests agrupados (services/descarga_tiles.py);
+        # archivos sueltos o un .mbtiles por proveedor según MAIRA_TILES_ALMACEN (services/almacen_tiles.py)
+        import mimetypes
+        from services.cache_disco_tiles import obtener_cache_tiles
+        from services.descarga_tiles import descargador_tiles, url_tile
+        from services.almacen_tiles import buscar_en_paquetes
         base_dir = os.path.dirname(os.path.abspath(__file__))
-        tiles_cache_dir = os.path.join(base_dir, 'static', 'tiles', provider)
+        cache = obtener_cache_tiles(os.path.join(base_dir, 'static', 'tiles'))
         tile_filename = f"{z}_{x}_{y}.{ext}"
-        tile_path = os.path.join(tiles_cache_dir, tile_filename)
-        
-        # URLs de providers
-        tile_urls = {
-            'osm': f'https://tile.openstreetmap.org/{z}/{x}/{y}.{ext}',
-            'satellite': f'https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
-            'terrain': f'https://stamen-tiles.a.ssl.fastly.net/terrain/{z}/{x}/{y}.{ext}',
-            'cartodb': f'https://cartodb-basemaps-a.global.ssl.fastly.net/light_all/{z}/{x}/{y}.{ext}'
-        }
+        tile_url = url_tile(provider, z, x, y, ext)
+        
+        def guardar(datos):
+            cache.guardar(provider, tile_filename, datos)
+        
+        def responder(datos):
+            response = Response(datos, mimetype=mimetypes.guess_type(tile_filename)[0] or 'application/octet-stream')
+            response.headers['Cache-Control'] = 'public, max-age=86400'  # Cache 24h
+            response.headers['Access-Control-Allow-Origin'] = '*'
+            return response
         
         # Verificar si el tile ya existe en cache
-        if os.path.exists(tile_path):
+        en_cache = cache.leer(provider, tile_filename)
+        if en_cache is not None:
+            datos, vencido = en_cache
+            if vencido and tile_url:
+                # Vencido: se sirve igual y se renueva en segundo plano
+                descargador_tiles.revalidar(provider, tile_url, guardar)
             print(f"🎯 Sirviendo tile desde cache: {tile_filename}")
-            return send_from_directory(tiles_cache_dir, tile_filename)
+            return responder(datos)
         
-        # Si no existe, intentar descargarlo
-        if provider in tile_urls:
-            tile_url = tile_urls[provider]
-            
-            if descargar_tile(tile_url, tile_path):
-                response = send_from_directory(tiles_cache_dir, tile_filename)
-                response.headers['Cache-Control'] = 'public, max-age=86400'  # Cache 24h
-                response.headers['Access-Control-Allow-Origin'] = '*'
-                return response
+        # Paquetes de AO (.mbtiles) copiados para trabajar sin conexión
+        datos = buscar_en_paquetes(tile_filename, provider)
+        
+        # Si no existe, intentar descargarlo (una sola descarga por tile aunque lo pidan muchos)
+        if datos is None and tile_url:
+            datos = descargador_tiles.descargar(provider, tile_url, guardar)
+        if datos is not None:
+            return responder(datos)
         
         # Si falla la descarga, devolver error
         return jsonify({'error': f'Tile no disponible: {provider}/{z}/{x}/{y}.{ext}'}), 404
@@ -583,23 +600,101 @@ def proxy_tile(provider, z, x, y, ext):
 
 @app.route('/api/tiles/clean_cache')
 def clean_tiles_cache():
-    """Limpiar cache de tiles descargados"""
+    """Limpiar cache de tiles de mapas base (todos o ?proveedor=osm); los tiles de elevación extraídos no se tocan"""
     try:
-        import shutil
+        from services.cache_disco_tiles import obtener_cache_tiles
         base_dir = os.path.dirname(os.path.abspath(__file__))
-        tiles_cache_dir = os.path.join(base_dir, 'static', 'tiles')
+        cache = obtener_cache_tiles(os.path.join(base_dir, 'static', 'tiles'))
         
-        if os.path.exists(tiles_cache_dir):
-            shutil.rmtree(tiles_cache_dir)
-            print("🧹 Cache de tiles limpiado")
-            return jsonify({'message': 'Cache de tiles limpiado exitosamente'})
-        else:
-            return jsonify({'message': 'No hay cache para limpiar'})
+        liberados = cache.limpiar(request.args.get('proveedor'))
+        print(f"🧹 Cache de tiles limpiado ({liberados / (1024 * 1024):.1f} MB)")
+        return jsonify({'message': 'Cache de tiles limpiado exitosamente', 'bytes_liberados': liberados})
             
     except Exception as e:
         print(f"❌ Error limpiando cache: {e}")
         return jsonify({'error': str(e)}), 500
 
+# 📊 ENDPOINT: Estadísticas de la cache en disco de tiles de mapas base
+@app.route('/api/tiles/cache_stats')
+def tiles_cache_stats():
+    """Ocupación por proveedor, cuotas, TTL y contadores de la cache de tiles, de las descargas upstream y de las precargas"""
+    try:
+        from services.cache_disco_tiles import obtener_cache_tiles
+        from services.descarga_tiles import descargador_tiles
+        from services.precarga_tiles import gestor_precargas
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        estadisticas = obtener_cache_tiles(os.path.join(base_dir, 'static', 'tiles')).estadisticas()
+        estadisticas['descargas'] = descargador_tiles.estadisticas()
+        estadisticas['precargas'] = gestor_precargas.estadisticas()
+        return jsonify(estadisticas)
+    except Exception as e:
+        print(f"❌ Error obteniendo estadísticas de la cache de tiles: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def iniciar_precarga_ao(bbox, zoom=None, proveedores=None, capas=None, sid=None):
+    """
+    Precarga en segundo plano de tiles base, mini-tiles y tiles GIS de un área
+    de operaciones (services/precarga_tiles.py); el avance llega a la sala sid.
+    """
+    from services.precarga_tiles import gestor_precargas
+    if gestor_precargas.socketio is None:
+        gestor_precargas.configurar(socketio)
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    return gestor_precargas.iniciar(
+        bbox, os.path.join(base_dir, 'Client', 'Libs', 'datos_argentina'), os.path.join(base_dir, 'static', 'tiles'),
+        zoom=zoom, proveedores=proveedores, capas=capas, sid=sid
+    )
+
+def precargar_area_operaciones(area, sid=None):
+    """Precarga el AO de una partida/operación recién creada si trae uno; nunca interrumpe la creación."""
+    try:
+        from services.precarga_tiles import leer_bbox
+        bbox = leer_bbox(area)
+        if bbox is not None:
+            iniciar_precarga_ao(bbox, sid=sid)
+    except Exception as e:
+        print(f"⚠️ Precarga del área de operaciones no iniciada: {e}")
+
+# 🔥 ENDPOINTS: Precarga de tiles del área de operaciones
+@app.route('/api/tiles/precarga', methods=['POST'])
+def precargar_tiles_ao():
+    """
+    Calienta las caches de un AO: {"bbox": {west, south, east, north} o [w, s, e, n],
+    "zoom": [8, 13], "proveedores": ["osm"], "capas": ["base", "altimetria", "vegetacion", "gis"],
+    "socket_id": ...}. Responde 202 con el estado de la precarga.
+    """
+    try:
+        from services.precarga_tiles import leer_bbox
+        data = request.get_json(silent=True) or {}
+        bbox = leer_bbox(data.get('bbox'))
+        if bbox is None:
+            return jsonify({'error': 'Se requiere bbox con west/south/east/north'}), 400
+        precarga = iniciar_precarga_ao(bbox, zoom=data.get('zoom'), proveedores=data.get('proveedores'),
+                                       capas=data.get('capas'), sid=data.get('socket_id'))
+        return jsonify(precarga.a_dict()), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"❌ Error iniciando precarga de tiles: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/tiles/precarga/<precarga_id>', methods=['GET'])
+def estado_precarga_tiles(precarga_id):
+    """Avance de una precarga de AO"""
+    from services.precarga_tiles import gestor_precargas
+    precarga = gestor_precargas.obtener(precarga_id)
+    if precarga is None:
+        return jsonify({'error': 'Precarga no encontrada'}), 404
+    return jsonify(precarga.a_dict())
+
+@app.route('/api/tiles/precarga/<precarga_id>/cancelar', methods=['POST'])
+def cancelar_precarga_tiles(precarga_id):
+    """Cancela una precarga en curso"""
+    from services.precarga_tiles import gestor_precargas
+    if not gestor_precargas.cancelar(precarga_id):
+        return jsonify({'error': 'Precarga inexistente o ya terminada', 'success': False}), 404
+    return jsonify({'success': True, 'id': precarga_id})
+
 # 🚀 PROXY PARA GITHUB RELEASES - PARA DESCARGAR DATOS DE ELEVACIÓN
 @app.route('/api/proxy/github/<path:filename>')
 def proxy_github_release(filename):
@@ -685,7 +780,9 @@ def proxy_github_release(filename):
 def serve_elevation_tile(filepath):
     """
     Sirve tiles de elevación desde GitHub releases.
-    Si no existe localmente, descarga y descomprime el .tar.gz correspondiente.
+    Si no existe localmente, lo extrae del .tar.gz: con índice .idx.json baja solo
+    ese miembro por Range; sin índice espera a que el desempaquetado en segundo
+    plano del archivo llegue al tile.
     """
     try:
         base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -697,6 +794,12 @@ def serve_elevation_tile(filepath):
             print(f'✅ Sirviendo tile desde cache local: {filepath}')
             return send_from_directory(tiles_dir, filepath)
 
+        # Paquete de AO (.mbtiles) copiado para trabajar sin conexión
+        from services.almacen_tiles import buscar_en_paquetes
+        datos = buscar_en_paquetes(f'Altimetria_Mini_Tiles/{filepath}')
+        if datos is not None:
+            return Response(datos, mimetype='image/tiff')
+
         # Si no existe, necesitamos descargarlo y descomprimirlo
         print(f'📦 Tile no encontrado localmente, descargando: {filepath}')
 
@@ -714,46 +817,18 @@ def serve_elevation_tile(filepath):
         else:
             return jsonify({'error': f'No se pudo determinar la provincia para {filepath}'}), 400
 
-        # Descargar el .tar.gz de altimetría desde GitHub
-        tar_gz_url = f'https://github.com/Ehr051/MAIRA_4.0/releases/download/v4.0/maira_altimetria_tiles.tar.gz'
-        print(f'📥 Descargando {tar_gz_url} para extraer {filepath}')
-
-        response = requests.get(tar_gz_url, stream=True, timeout=300)
-        if not response.ok:
-            return jsonify({'error': f'Error descargando tar.gz: {response.status_code}'}), 500
-
-        # Crear directorio si no existe
-        os.makedirs(tiles_dir, exist_ok=True)
-
-        # Procesar el archivo tar.gz y extraer el archivo específico
-        with tarfile.open(fileobj=io.BytesIO(response.content), mode='r:gz') as tar:
-            # Buscar el archivo específico dentro del tar
-            for member in tar.getmembers():
-                # Buscar archivos que terminen con el filepath o que coincidan exactamente
-                if member.name.endswith(filepath) or member.name == filepath or f'Altimetria_Mini_Tiles/{filepath}' in member.name:
-                    print(f'📂 Extrayendo {member.name} a {tile_path}')
-
-                    # Extraer el archivo con la ruta correcta
-                    # Si el member tiene la ruta completa, extraerlo directamente
-                    if member.name.startswith('Altimetria_Mini_Tiles/'):
-                        # Crear el directorio padre si no existe
-                        os.makedirs(os.path.dirname(tile_path), exist_ok=True)
-                        # Extraer solo el contenido del archivo
-                        with tar.extractfile(member) as source, open(tile_path, 'wb') as target:
-                            target.write(source.read())
-                    else:
-                        # Extraer normalmente
-                        tar.extract(member, tiles_dir)
+        # Archivo de altimetría: URL (release de GitHub por defecto) o ruta local
+        tar_gz_url = os.getenv('MAIRA_ALTIMETRIA_ARCHIVO',
+                               'https://github.com/Ehr051/MAIRA_4.0/releases/download/v4.0/maira_altimetria_tiles.tar.gz')
 
-                    # Verificar que se extrajo correctamente
-                    if os.path.exists(tile_path):
-                        print(f'✅ Tile extraído exitosamente: {filepath}')
-                        return send_from_directory(tiles_dir, filepath)
-                    else:
-                        return jsonify({'error': f'Error extrayendo archivo: {filepath}'}), 500
+        # Misses concurrentes del mismo tile comparten una sola extracción y el
+        # archivo se desempaqueta una vez en segundo plano (services/extraccion_tiles.py)
+        from services.extraccion_tiles import extractor_tiles
+        if extractor_tiles.obtener(tar_gz_url, filepath, tiles_dir, prefijo='Altimetria_Mini_Tiles/') is None:
+            return jsonify({'error': f'Archivo no encontrado en tar.gz: {filepath}'}), 404
 
-        # Si no se encontró el archivo en el tar
-        return jsonify({'error': f'Archivo no encontrado en tar.gz: {filepath}'}), 404
+        print(f'✅ Tile extraído exitosamente: {filepath}')
+        return send_from_directory(tiles_dir, filepath)
 
     except Exception as e:
         print(f'❌ Error sirviendo tile de elevación {filepath}: {e}')
@@ -1377,28 +1452,18 @@ def extraer_tile_vegetacion():
         if os.path.exists(output_path):
             return jsonify({"success": True, "message": "Tile de vegetación ya disponible", "path": f"/{output_path}"})
         
-        # Crear directorios si no existen
-        os.makedirs(tiles_dir, exist_ok=True)
-        os.makedirs("temp_extract", exist_ok=True)
-        
-        # Descargar el archivo TAR.GZ si no existe localmente
-        if not os.path.exists(local_tar_path):
-            print(f"📥 Descargando archivo TAR: {tar_url}")
-            import urllib.request
-            urllib.request.urlretrieve(tar_url, local_tar_path)
+        # Un solo desempaquetado del archivo aunque varios clientes pidan a la vez
+        # (services/extraccion_tiles.py); un TAR ya descargado se reutiliza
+        from services.extraccion_tiles import extractor_tiles
+        fuente = local_tar_path if os.path.exists(local_tar_path) else tar_url
+        if extractor_tiles.obtener(fuente, tile_filename, tiles_dir) is None:
+            return jsonify({"success": False, "message": f"Tile de vegetación {tile_filename} no encontrado en {archivo_tar}"}), 404
         
-        # Extraer el tile específico de vegetación
-        tarfile_lib, traceback_lib = lazy_import_tarfile()
-        with tarfile_lib.open(local_tar_path, 'r:gz') as tar:
-            try:
-                tar.extract(tile_filename, tiles_dir)
-                return jsonify({
-                    "success": True, 
-                    "message": "Tile de vegetación extraído exitosamente",
-                    "path": f"/{output_path}"
-                })
-            except KeyError:
-                return jsonify({"success": False, "message": f"Tile de vegetación {tile_filename} no encontrado en {archivo_tar}"}), 404
+        return jsonify({
+            "success": True, 
+            "message": "Tile de vegetación extraído exitosamente",
+            "path": f"/{output_path}"
+        })
     
     except Exception as e:
         print(f"❌ Error extrayendo tile de vegetación: {str(e)}")
@@ -1819,6 +1884,9 @@ def crear_partida(data):
             print(f"📋 Actualizando lista de partidas globales...")
             actualizar_lista_partidas()
             
+            # Área de operaciones opcional ({west, south, east, north}): tiles calientes al entrar
+            precargar_area_operaciones(configuracion.get('areaOperaciones'), sid=request.sid)
+            
             print(f"✅ Partida creada exitosamente: {codigo_partida}")
             print(f"🎯 Usuario debería recibir evento 'partidaCreada' ahora")
 
@@ -2391,6 +2459,7 @@ def crear_operacion_gb(data, callback=None):
             # Actualizar lista global de operaciones
             print("🔄 [DEBUG] Actualizando lista global de operaciones")
             actualizar_lista_operaciones_gb()
+            precargar_area_operaciones(data.get('areaOperaciones'), sid=request.sid)
             
             print(f"🎖️ [DEBUG] Operación GB creada exitosamente: {codigo_operacion}")
 
@@ -5266,7 +5335,8 @@ def get_elevation_batch():
             {"lat": -38.07, "lon": -62.00, "index": 0},
             {"lat": -38.08, "lon": -62.01, "index": 1},
             ...
-        ]
+        ],
+        "resolucion": 500    // opcional: separación de los puntos en metros (lee overviews)
     }
     
     Response: {
@@ -5274,170 +5344,119 @@ def get_elevation_batch():
         "tiles_loaded": 3,
         "processing_time": 1.234
     }
+
+    Modo binario (clientes nuevos, ver services/formato_binario.py):
+        Content-Type: application/octet-stream; dtype=float32|float64
+        -> pares lat,lon little-endian intercalados
+        Accept: application/octet-stream
+        -> float32 little-endian por punto (NaN = sin dato), metadatos en X-*
+
+    Modo grilla (ver services/grilla_muestreo.py):
+        Body: {"grilla": {"bbox": {...}, "resolucion": 50, "poligono": [...]}}
+        -> matriz rows x cols (fila 0 = norte) + metadata "grilla"
     """
     import time
-    import json
     start_time = time.time()
     
     try:
-        # Importar rasterio
         try:
-            import rasterio
             import numpy as np
+            from services.muestreo_raster import ordenar_por_indice, a_lista_json
+            from services.pipeline_terreno import muestrear_terreno, capas_request
+            from services.formato_binario import (
+                leer_puntos_request, acepta_binario, respuesta_binaria, respuesta_grilla
+            )
+            from services.grilla_muestreo import leer_grilla_request, leer_paso_request
+            from services.pool_raster import pool_global
+            from services.catalogo_tiles import obtener_catalogo, obtener_catalogo_nacional
         except ImportError:
             return jsonify({
                 'error': 'rasterio no instalado',
                 'message': 'pip install rasterio'
             }), 500
         
-        data = request.get_json()
-        if not data or 'points' not in data:
-            return jsonify({'error': 'Se requiere points'}), 400
-        
-        points = data['points']
-        print(f'📊 Batch: {len(points)} puntos')
-        
-        # Calcular bounds
-        lats = [p['lat'] for p in points]
-        lons = [p['lon'] for p in points]
-        bounds = {
-            'north': max(lats),
-            'south': min(lats),
-            'east': max(lons),
-            'west': min(lons)
-        }
-        center_lat = (bounds['north'] + bounds['south']) / 2
-        center_lon = (bounds['east'] + bounds['west']) / 2
-        
-        print(f'📍 Bounds: lat [{bounds["south"]:.4f}, {bounds["north"]:.4f}], lon [{bounds["west"]:.4f}, {bounds["east"]:.4f}]')
-        print(f'📍 Centro: ({center_lat:.4f}, {center_lon:.4f})')
-        
+        # JSON {"points": [...]}, pares lat,lon binarios (ver services/formato_binario.py)
+        # o {"grilla": {...}} generada en el servidor (ver services/grilla_muestreo.py)
+        try:
+            grilla = leer_grilla_request(request)
+            if grilla is None:
+                lats, lons, indices = leer_puntos_request(request)
+                paso = leer_paso_request(request)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if grilla is not None:
+            print(f'📊 Batch: grilla {grilla.rows}x{grilla.cols}')
+        else:
+            n_puntos = len(lats)
+            print(f'📊 Batch: {n_puntos} puntos')
+
         # Path base
         base_dir = os.path.dirname(os.path.abspath(__file__))
         tiles_base = os.path.join(base_dir, 'Client', 'Libs', 'datos_argentina', 'Altimetria_Mini_Tiles')
         
-        # 🗺️ Determinar provincia según latitud (Argentina: norte = -22°, sur = -55°)
-        # Referencia geográfica aproximada:
-        # Norte (-22 a -28): Jujuy, Salta, Formosa, Chaco, Misiones
-        # Centro_Norte (-28 a -34): Santiago del Estero, Córdoba, Santa Fe, Entre Ríos
-        # Centro (-34 a -40): Buenos Aires, La Pampa, Mendoza, San Luis, San Juan
-        # Sur (-40 a -46): Neuquén, Río Negro, Chubut
-        # Patagonia (-46 a -55): Santa Cruz, Tierra del Fuego
-        
-        provincia = None
-        if center_lat >= -28:
-            provincia = 'norte'
-            print(f'🌍 Provincia detectada: NORTE (lat >= -28°)')
-        elif center_lat >= -34:
-            provincia = 'centro_norte'
-            print(f'🌍 Provincia detectada: CENTRO_NORTE (-34° a -28°)')
-        elif center_lat >= -40:
-            provincia = 'centro'
-            print(f'🌍 Provincia detectada: CENTRO (-40° a -34°)')
-        elif center_lat >= -46:
-            provincia = 'sur'
-            print(f'🌍 Provincia detectada: SUR (-46° a -40°)')
-        else:
-            provincia = 'patagonia'
-            print(f'🌍 Provincia detectada: PATAGONIA (lat < -46°)')
-        
-        print(f'📁 Usando provincia: {provincia}')
-        
-        # Cargar índice provincial
-        provincial_index_path = os.path.join(tiles_base, provincia, f'{provincia}_mini_tiles_index.json')
-        
-        if not os.path.exists(provincial_index_path):
-            return jsonify({'error': f'Índice provincial no existe: {provincial_index_path}'}), 404
-        
-        with open(provincial_index_path, 'r', encoding='utf-8') as f:
-            provincial_index = json.load(f)
-        
-        # Filtrar tiles que intersectan con bounds
-        # provincial_index['tiles'] es un DICCIONARIO, no un array
-        relevant_tiles = []
-        tiles_dict = provincial_index.get('tiles', {})
-        
-        for tile_id, tile_info in tiles_dict.items():
-            tile_bounds = tile_info.get('bounds', {})
-            if not tile_bounds:
-                continue
-            
-            # Verificar intersección
-            if (tile_bounds['north'] >= bounds['south'] and 
-                tile_bounds['south'] <= bounds['north'] and
-                tile_bounds['east'] >= bounds['west'] and 
-                tile_bounds['west'] <= bounds['east']):
-                relevant_tiles.append(tile_info)
-        
-        print(f'🎯 {len(relevant_tiles)} tiles relevantes de {len(tiles_dict)} totales')
-        
-        # 🔍 Cargar SOLO los tiles relevantes
-        tile_cache = {}
-        for tile_info in relevant_tiles:
-            filename = tile_info.get('filename')
-            if not filename:
-                continue
-            
-            tile_path = os.path.join(tiles_base, provincia, filename)
-            if os.path.exists(tile_path):
-                try:
-                    src = rasterio.open(tile_path)
-                    tile_cache[filename] = {
-                        'src': src,
-                        'bounds': src.bounds,
-                        'info': tile_info
-                    }
-                    print(f'📦 Tile: {filename}')
-                except Exception as e:
-                    print(f'⚠️ Error: {filename}: {e}')
-        
-        print(f'✅ {len(tile_cache)} tiles cargados en memoria')
-        
-        # Procesar puntos
-        elevations = [None] * len(points)
+        # 🗺️ Mosaico nacional: fusiona los índices de todas las provincias
+        # (norte, centro_norte, centro, sur, patagonia) y resuelve cada punto
+        # contra el tile que lo contiene, sin adivinar la provincia por latitud.
+        # Los lotes que cruzan los límites de 34°S/40°S se resuelven en una pasada.
+        try:
+            catalogo = obtener_catalogo_nacional(tiles_base)
+        except FileNotFoundError as e:
+            return jsonify({'error': str(e)}), 404
+        
+        # 🧩 Capas extra opcionales: {"capas": ["pendiente", "orientacion", "ndvi", "clase"]}
+        capas = capas_request(request)
+        catalogo_ndvi = None
+        if 'ndvi' in capas or 'clase' in capas:
+            try:
+                catalogo_ndvi = obtener_catalogo(os.path.join(
+                    os.path.dirname(tiles_base), 'Vegetacion_Mini_Tiles', 'vegetation_master_index.json'
+                ))
+            except FileNotFoundError:
+                print('⚠️ Sin índice de vegetación: capas ndvi/clase sin datos')
+        con_pendiente = bool({'pendiente', 'orientacion', 'clase'} & set(capas))
+        
+        # 🔍 Pipeline único (services/pipeline_terreno.py): una lectura de DEM por tile
+        # alimenta elevación y pendiente; el NDVI se lee una vez por tile de vegetación
+        if grilla is not None:
+            terreno = muestrear_terreno(catalogo, catalogo_ndvi, grilla=grilla,
+                                        pendiente=con_pendiente, pool=pool_global)
+            print(f'✅ Grilla {grilla.rows}x{grilla.cols}: {terreno.tiles_dem} tiles muestreados')
+            return respuesta_grilla(request, grilla, terreno.matriz('elevacion'), 'elevations',
+                                    terreno.tiles_dem, time.time() - start_time,
+                                    extras=terreno.matrices_json(capas))
+
+        terreno = muestrear_terreno(catalogo, catalogo_ndvi, lons=lons, lats=lats,
+                                    pendiente=con_pendiente, pool=pool_global, paso=paso)
+        valores, tiles_usados = terreno.elevacion, terreno.tiles_dem
+        
+        print(f'✅ {tiles_usados} tiles muestreados')
+        
+        sin_tile = int(np.isnan(valores).sum())
+        if sin_tile:
+            print(f'⚠️ {sin_tile} puntos sin tile/elevación')
         
-        for point in points:
-            lat = point['lat']
-            lon = point['lon']
-            idx = point.get('index', 0)
-            
-            # Buscar tile que contenga este punto
-            found = False
-            for tile_name, tile_info in tile_cache.items():
-                src = tile_info['src']
-                bounds = tile_info['bounds']
-                
-                # Verificar si el punto está dentro de los bounds del tile
-                if bounds.left <= lon <= bounds.right and bounds.bottom <= lat <= bounds.top:
-                    try:
-                        py, px = src.index(lon, lat)
-                        if 0 <= py < src.height and 0 <= px < src.width:
-                            elevation = float(src.read(1)[py, px])
-                            if elevation != -9999:  # Ignorar valores NODATA
-                                elevations[idx] = elevation
-                                found = True
-                                break
-                    except Exception as e:
-                        pass
-            
-            if not found:
-                print(f'⚠️ No tile para lat={lat:.4f}, lon={lon:.4f}')
-        
-        # Cerrar tiles
-        for tile_info in tile_cache.values():
-            tile_info['src'].close()
         
         processing_time = time.time() - start_time
-        valid_count = sum(1 for e in elevations if e is not None)
-        
-        print(f'✅ {valid_count}/{len(points)} en {processing_time:.2f}s')
+        valid_count = n_puntos - sin_tile
         
+        print(f'✅ {valid_count}/{n_puntos} en {processing_time:.2f}s')
+
+        # Cliente binario: float32 little-endian en orden de índice, NaN = sin dato
+        if acepta_binario(request):
+            if indices is not None:
+                valores = ordenar_por_indice(valores, indices, n_puntos)
+            return respuesta_binaria(valores, count=n_puntos, valid_count=valid_count,
+                                     tiles_loaded=tiles_usados, processing_time=processing_time)
+
+        elevations = a_lista_json(valores, indices, n_puntos)
         return jsonify({
             'elevations': elevations,
             'count': len(elevations),
             'valid_count': valid_count,
-            'tiles_loaded': len(tile_cache),
-            'processing_time': processing_time
+            'tiles_loaded': tiles_usados,
+            'processing_time': processing_time,
+            **terreno.columnas_json([c for c in capas if c != 'elevacion'], indices, n_puntos)
         })
         
     except Exception as e:
@@ -5458,7 +5477,8 @@ def get_vegetation_batch():
             {"lat": -38.07, "lon": -62.00, "index": 0},
             {"lat": -38.08, "lon": -62.01, "index": 1},
             ...
-        ]
+        ],
+        "resolucion": 500    // opcional: separación de los puntos en metros (lee overviews)
     }
     
     Response: {
@@ -5466,42 +5486,53 @@ def get_vegetation_batch():
         "tiles_loaded": 3,
         "processing_time": 0.234
     }
+
+    Modo binario (clientes nuevos, ver services/formato_binario.py):
+        Content-Type: application/octet-stream; dtype=float32|float64
+        -> pares lat,lon little-endian intercalados
+        Accept: application/octet-stream
+        -> float32 little-endian por punto (NaN = sin dato), metadatos en X-*
+
+    Modo grilla (ver services/grilla_muestreo.py):
+        Body: {"grilla": {"bbox": {...}, "resolucion": 50, "poligono": [...]}}
+        -> matriz rows x cols (fila 0 = norte) + metadata "grilla"
     """
     print('🌿 === VEGETATION BATCH API CALLED ===')
     start_time = time.time()
     
     try:
-        # Importar rasterio
         try:
-            import rasterio
+            import numpy as np
+            from services.muestreo_raster import ordenar_por_indice, a_lista_json
+            from services.pipeline_terreno import muestrear_terreno
+            from services.formato_binario import (
+                leer_puntos_request, acepta_binario, respuesta_binaria, respuesta_grilla
+            )
+            from services.grilla_muestreo import leer_grilla_request, leer_paso_request
+            from services.pool_raster import pool_global
+            from services.catalogo_tiles import obtener_catalogo
         except ImportError:
             return jsonify({
                 'error': 'rasterio no instalado',
                 'message': 'pip install rasterio'
             }), 500
         
-        data = request.get_json()
-        if not data or 'points' not in data:
-            return jsonify({'error': 'Se requiere points'}), 400
-        
-        points = data['points']
-        print(f'📊 Batch vegetation: {len(points)} puntos')
-        
-        # Calcular bounds
-        lats = [p['lat'] for p in points]
-        lons = [p['lon'] for p in points]
-        bounds = {
-            'north': max(lats),
-            'south': min(lats),
-            'east': max(lons),
-            'west': min(lons)
-        }
-        center_lat = (bounds['north'] + bounds['south']) / 2
-        center_lon = (bounds['east'] + bounds['west']) / 2
-        
-        print(f'📍 Bounds: lat [{bounds["south"]:.4f}, {bounds["north"]:.4f}], lon [{bounds["west"]:.4f}, {bounds["east"]:.4f}]')
-        print(f'📍 Centro: ({center_lat:.4f}, {center_lon:.4f})')
-        
+        # JSON {"points": [...]}, pares lat,lon binarios (ver services/formato_binario.py)
+        # o {"grilla": {...}} generada en el servidor (ver services/grilla_muestreo.py)
+        try:
+            grilla = leer_grilla_request(request)
+            if grilla is None:
+                lats, lons, indices = leer_puntos_request(request)
+                paso = leer_paso_request(request)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if grilla is not None:
+            print(f'📊 Batch vegetation: grilla {grilla.rows}x{grilla.cols}')
+        else:
+            n_puntos = len(lats)
+            print(f'📊 Batch vegetation: {n_puntos} puntos')
+
         # Path base
         base_dir = os.path.dirname(os.path.abspath(__file__))
         tiles_base = os.path.join(base_dir, 'Client', 'Libs', 'datos_argentina', 'Vegetacion_Mini_Tiles')
@@ -5512,102 +5543,46 @@ def get_vegetation_batch():
         if not os.path.exists(master_index_path):
             return jsonify({'error': f'Master index no existe: {master_index_path}'}), 404
         
-        print(f'📁 Cargando master index: {master_index_path}')
-        
-        with open(master_index_path, 'r', encoding='utf-8') as f:
-            master_index = json.load(f)
-        
-        # Filtrar tiles que intersectan con bounds
-        relevant_tiles = []
-        tiles_dict = master_index.get('tiles', {})
+        # Catálogo en memoria (índice espacial, recarga por mtime)
+        catalogo = obtener_catalogo(master_index_path)
         
-        for tile_id, tile_info in tiles_dict.items():
-            tile_bounds = tile_info.get('bounds', {})
-            if not tile_bounds:
-                continue
-            
-            # Verificar intersección
-            if (tile_bounds['north'] >= bounds['south'] and 
-                tile_bounds['south'] <= bounds['north'] and
-                tile_bounds['east'] >= bounds['west'] and 
-                tile_bounds['west'] <= bounds['east']):
-                relevant_tiles.append(tile_info)
-        
-        print(f'🎯 {len(relevant_tiles)} tiles relevantes de {len(tiles_dict)} totales')
-        
-        # 🔍 Cargar SOLO los tiles relevantes desde sus batches
-        tile_cache = {}
-        for tile_info in relevant_tiles:
-            filename = tile_info.get('filename')
-            package = tile_info.get('package')  # batch folder
-            
-            if not filename or not package:
-                continue
-            
-            # Path: vegetation_ndvi_batch_XX/filename.tif
-            tile_path = os.path.join(tiles_base, package, filename)
-            
-            if os.path.exists(tile_path):
-                try:
-                    src = rasterio.open(tile_path)
-                    tile_cache[filename] = {
-                        'src': src,
-                        'bounds': src.bounds,
-                        'info': tile_info
-                    }
-                    print(f'📦 Tile: {package}/{filename}')
-                except Exception as e:
-                    print(f'⚠️ Error: {filename}: {e}')
+        # 🔍 Mismo pipeline que elevación/análisis, solo con la capa NDVI
+        # (normalizada a 0-1 dentro del pipeline)
+        if grilla is not None:
+            terreno = muestrear_terreno(catalogo_ndvi=catalogo, grilla=grilla, pool=pool_global)
+            print(f'✅ Grilla {grilla.rows}x{grilla.cols}: {terreno.tiles_ndvi} tiles muestreados')
+            return respuesta_grilla(request, grilla, terreno.matriz('ndvi'), 'ndvi_values',
+                                    terreno.tiles_ndvi, time.time() - start_time)
+
+        terreno = muestrear_terreno(catalogo_ndvi=catalogo, lons=lons, lats=lats, pool=pool_global, paso=paso)
+        valores, tiles_usados = terreno.ndvi, terreno.tiles_ndvi
         
-        print(f'✅ {len(tile_cache)} tiles cargados en memoria')
+        print(f'✅ {tiles_usados} tiles muestreados')
         
-        # Procesar puntos
-        ndvi_values = [None] * len(points)
+        sin_tile = int(np.isnan(valores).sum())
+        if sin_tile:
+            print(f'⚠️ {sin_tile} puntos sin tile/NDVI')
         
-        for point in points:
-            lat = point['lat']
-            lon = point['lon']
-            idx = point.get('index', 0)
-            
-            # Buscar tile que contenga este punto
-            found = False
-            for tile_name, tile_info in tile_cache.items():
-                src = tile_info['src']
-                bounds = tile_info['bounds']
-                
-                # Verificar si el punto está dentro de los bounds del tile
-                if bounds.left <= lon <= bounds.right and bounds.bottom <= lat <= bounds.top:
-                    try:
-                        py, px = src.index(lon, lat)
-                        if 0 <= py < src.height and 0 <= px < src.width:
-                            ndvi_value = float(src.read(1)[py, px])
-                            if ndvi_value != -9999:  # Ignorar valores NODATA
-                                # NDVI usualmente está en rango 0-255, normalizar a 0-1
-                                if ndvi_value > 1:
-                                    ndvi_value = ndvi_value / 255.0
-                                ndvi_values[idx] = ndvi_value
-                                found = True
-                                break
-                    except Exception as e:
-                        pass
-            
-            if not found:
-                print(f'⚠️ No tile para lat={lat:.4f}, lon={lon:.4f}')
-        
-        # Cerrar tiles
-        for tile_info in tile_cache.values():
-            tile_info['src'].close()
+        salida = valores
         
         processing_time = time.time() - start_time
-        valid_count = sum(1 for v in ndvi_values if v is not None)
-        
-        print(f'✅ {valid_count}/{len(points)} en {processing_time:.2f}s')
+        valid_count = n_puntos - sin_tile
         
+        print(f'✅ {valid_count}/{n_puntos} en {processing_time:.2f}s')
+
+        # Cliente binario: float32 little-endian en orden de índice, NaN = sin dato
+        if acepta_binario(request):
+            if indices is not None:
+                salida = ordenar_por_indice(salida, indices, n_puntos)
+            return respuesta_binaria(salida, count=n_puntos, valid_count=valid_count,
+                                     tiles_loaded=tiles_usados, processing_time=processing_time)
+
+        ndvi_values = a_lista_json(salida, indices, n_puntos)
         return jsonify({
             'ndvi_values': ndvi_values,
             'count': len(ndvi_values),
             'valid_count': valid_count,
-            'tiles_loaded': len(tile_cache),
+            'tiles_loaded': tiles_usados,
             'processing_time': processing_time
         })
         
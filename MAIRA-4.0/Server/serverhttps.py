@@ -18,7 +18,6 @@ import subprocess
 import signal
 import ssl
 from dotenv import load_dotenv
-import requests
 from datetime import datetime, timedelta
 from config import SERVER_URL, CLIENT_URL, SERVER_IP
 
@@ -782,6 +781,8 @@ def crear_partida(data):
             join_room(codigo_partida, sid=request.sid)
             emit('partidaCreada', partida)
             actualizar_lista_partidas()
+            # Área de operaciones opcional ({west, south, east, north}): tiles calientes al entrar
+            precargar_area_operaciones(configuracion.get('areaOperaciones'), sid=request.sid)
             print("Partida creada con éxito:", partida)
 
             # Emitir el evento para actualizar la lista de partidas disponibles
@@ -1827,6 +1828,7 @@ def handle_crear_operacion_gb(data, callback=None):
         emit('operacionesGB', {'operaciones': operaciones_lista}, broadcast=True)
         
         print(f"Operación GB '{nombre}' creada con éxito, ID: {operacion_id}")
+        precargar_area_operaciones(data.get('areaOperaciones'), sid=request.sid)
         
     except Exception as e:
         print(f"Error al crear operación GB: {e}")
@@ -2589,11 +2591,16 @@ def serve_altimetria_tiles(filename):
             return jsonify({'error': 'Tiles directory not found'}), 404
         
         file_path = os.path.join(tiles_dir, filename)
-        if not os.path.exists(file_path):
-            print(f"❌ Archivo de tile no encontrado: {file_path}")
-            return jsonify({'error': f'Tile file not found: {filename}'}), 404
-        
-        response = send_from_directory(tiles_dir, filename)
+        if os.path.exists(file_path):
+            response = send_from_directory(tiles_dir, filename)
+        else:
+            # Paquete de AO (.mbtiles, services/almacen_tiles.py) en lugar de los archivos sueltos
+            from services.almacen_tiles import buscar_en_paquetes
+            datos = buscar_en_paquetes(f'Altimetria_Mini_Tiles/{filename}')
+            if datos is None:
+                print(f"❌ Archivo de tile no encontrado: {file_path}")
+                return jsonify({'error': f'Tile file not found: {filename}'}), 404
+            response = Response(datos, mimetype='application/octet-stream')
         
         # Headers optimizados para tiles
         if filename.endswith('.json'):
@@ -2633,11 +2640,16 @@ def serve_vegetacion_tiles(filename):
             return jsonify({'error': 'Vegetation tiles directory not found'}), 404
         
         file_path = os.path.join(tiles_dir, filename)
-        if not os.path.exists(file_path):
-            print(f"❌ Archivo de tile vegetación no encontrado: {file_path}")
-            return jsonify({'error': f'Vegetation tile file not found: {filename}'}), 404
-        
-        response = send_from_directory(tiles_dir, filename)
+        if os.path.exists(file_path):
+            response = send_from_directory(tiles_dir, filename)
+        else:
+            # Paquete de AO (.mbtiles, services/almacen_tiles.py) en lugar de los archivos sueltos
+            from services.almacen_tiles import buscar_en_paquetes
+            datos = buscar_en_paquetes(f'Vegetacion_Mini_Tiles/{filename}')
+            if datos is None:
+                print(f"❌ Archivo de tile vegetación no encontrado: {file_path}")
+                return jsonify({'error': f'Vegetation tile file not found: {filename}'}), 404
+            response = Response(datos, mimetype='application/octet-stream')
         
         # Headers optimizados para tiles de vegetación
         if filename.endswith('.json'):
@@ -2704,6 +2716,10 @@ def tiles_diagnostic():
                     'size': os.path.getsize(item_path) if os.path.isfile(item_path) else None
                 })
         
+        # Desempaquetados de archivos .tar.gz en curso o terminados
+        from services.extraccion_tiles import extractor_tiles
+        diagnostic['extracciones'] = extractor_tiles.estadisticas()
+        
         return jsonify(diagnostic)
         
     except Exception as e:
@@ -2711,56 +2727,61 @@ def tiles_diagnostic():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
-# 🗺️ SISTEMA DE DESCARGA Y CACHE DE TILES
-def descargar_tile(url, path_local):
-    """Descargar un tile y guardarlo localmente"""
+# 📊 ENDPOINT: Estadísticas del pool de rasters abiertos
+@app.route('/api/tiles/pool_stats')
+def tiles_pool_stats():
+    """Contadores hit/miss/desalojos del pool compartido de tiles raster"""
     try:
-        import requests
-        os.makedirs(os.path.dirname(path_local), exist_ok=True)
-        
-        response = requests.get(url, stream=True, timeout=10)
-        response.raise_for_status()
-        
-        with open(path_local, 'wb') as f:
-            f.write(response.content)
-        
-        print(f"✅ Tile descargado: {path_local}")
-        return True
+        from services.pool_raster import pool_global
+        return jsonify(pool_global.estadisticas())
     except Exception as e:
-        print(f"❌ Error descargando tile {url}: {e}")
-        return False
+        print(f"❌ Error obteniendo estadísticas del pool: {e}")
+        return jsonify({'error': str(e)}), 500
 
+# 🗺️ SISTEMA DE DESCARGA Y CACHE DE TILES
 @app.route('/tiles/<provider>/<int:z>/<int:x>/<int:y>.<ext>')
 def proxy_tile(provider, z, x, y, ext):
     """Proxy/Cache para tiles de mapas - evita problemas de CORS"""
     try:
+        # Cache en disco con cuota y desalojo LRU (ver services/cache_disco_tiles.py);
+        # descargas con sesiones keep-alive y requests agrupados (services/descarga_tiles.py);
+        # archivos sueltos o un .mbtiles por proveedor según MAIRA_TILES_ALMACEN (services/almacen_tiles.py)
+        import mimetypes
+        from services.cache_disco_tiles import obtener_cache_tiles
+        from services.descarga_tiles import descargador_tiles, url_tile
+        from services.almacen_tiles import buscar_en_paquetes
         base_dir = os.path.dirname(os.path.abspath(__file__))
-        tiles_cache_dir = os.path.join(base_dir, '..', 'static', 'tiles', provider)
+        cache = obtener_cache_tiles(os.path.join(base_dir, '..', 'static', 'tiles'))
         tile_filename = f"{z}_{x}_{y}.{ext}"
-        tile_path = os.path.join(tiles_cache_dir, tile_filename)
-        
-        # URLs de providers
-        tile_urls = {
-            'osm': f'https://tile.openstreetmap.org/{z}/{x}/{y}.{ext}',
-            'satellite': f'https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
-            'terrain': f'https://stamen-tiles.a.ssl.fastly.net/terrain/{z}/{x}/{y}.{ext}',
-            'cartodb': f'https://cartodb-basemaps-a.global.ssl.fastly.net/light_all/{z}/{x}/{y}.{ext}'
-        }
+        tile_url = url_tile(provider, z, x, y, ext)
+        
+        def guardar(datos):
+            cache.guardar(provider, tile_filename, datos)
+        
+        def responder(datos):
+            response = Response(datos, mimetype=mimetypes.guess_type(tile_filename)[0] or 'application/octet-stream')
+            response.headers['Cache-Control'] = 'public, max-age=86400'  # Cache 24h
+            response.headers['Access-Control-Allow-Origin'] = '*'
+            return response
         
         # Verificar si el tile ya existe en cache
-        if os.path.exists(tile_path):
+        en_cache = cache.leer(provider, tile_filename)
+        if en_cache is not None:
+            datos, vencido = en_cache
+            if vencido and tile_url:
+                # Vencido: se sirve igual y se renueva en segundo plano
+                descargador_tiles.revalidar(provider, tile_url, guardar)
             print(f"🎯 Sirviendo tile desde cache: {tile_filename}")
-            return send_from_directory(tiles_cache_dir, tile_filename)
+            return responder(datos)
         
-        # Si no existe, intentar descargarlo
-        if provider in tile_urls:
-            tile_url = tile_urls[provider]
-            
-            if descargar_tile(tile_url, tile_path):
-                response = send_from_directory(tiles_cache_dir, tile_filename)
-                response.headers['Cache-Control'] = 'public, max-age=86400'  # Cache 24h
-                response.headers['Access-Control-Allow-Origin'] = '*'
-                return response
+        # Paquetes de AO (.mbtiles) copiados para trabajar sin conexión
+        datos = buscar_en_paquetes(tile_filename, provider)
+        
+        # Si no existe, intentar descargarlo (una sola descarga por tile aunque lo pidan muchos)
+        if datos is None and tile_url:
+            datos = descargador_tiles.descargar(provider, tile_url, guardar)
+        if datos is not None:
+            return responder(datos)
         
         # Si falla la descarga, devolver error
         return jsonify({'error': f'Tile no disponible: {provider}/{z}/{x}/{y}.{ext}'}), 404
@@ -2771,29 +2792,109 @@ def proxy_tile(provider, z, x, y, ext):
 
 @app.route('/api/tiles/clean_cache')
 def clean_tiles_cache():
-    """Limpiar cache de tiles descargados"""
+    """Limpiar cache de tiles de mapas base (todos o ?proveedor=osm); los tiles de elevación extraídos no se tocan"""
     try:
-        import shutil
+        from services.cache_disco_tiles import obtener_cache_tiles
         base_dir = os.path.dirname(os.path.abspath(__file__))
-        tiles_cache_dir = os.path.join(base_dir, '..', 'static', 'tiles')
+        cache = obtener_cache_tiles(os.path.join(base_dir, '..', 'static', 'tiles'))
         
-        if os.path.exists(tiles_cache_dir):
-            shutil.rmtree(tiles_cache_dir)
-            print("🧹 Cache de tiles limpiado")
-            return jsonify({'message': 'Cache de tiles limpiado exitosamente'})
-        else:
-            return jsonify({'message': 'No hay cache para limpiar'})
+        liberados = cache.limpiar(request.args.get('proveedor'))
+        print(f"🧹 Cache de tiles limpiado ({liberados / (1024 * 1024):.1f} MB)")
+        return jsonify({'message': 'Cache de tiles limpiado exitosamente', 'bytes_liberados': liberados})
             
     except Exception as e:
         print(f"❌ Error limpiando cache: {e}")
         return jsonify({'error': str(e)}), 500
 
+# 📊 ENDPOINT: Estadísticas de la cache en disco de tiles de mapas base
+@app.route('/api/tiles/cache_stats')
+def tiles_cache_stats():
+    """Ocupación por proveedor, cuotas, TTL y contadores de la cache de tiles, de las descargas upstream y de las precargas"""
+    try:
+        from services.cache_disco_tiles import obtener_cache_tiles
+        from services.descarga_tiles import descargador_tiles
+        from services.precarga_tiles import gestor_precargas
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        estadisticas = obtener_cache_tiles(os.path.join(base_dir, '..', 'static', 'tiles')).estadisticas()
+        estadisticas['descargas'] = descargador_tiles.estadisticas()
+        estadisticas['precargas'] = gestor_precargas.estadisticas()
+        return jsonify(estadisticas)
+    except Exception as e:
+        print(f"❌ Error obteniendo estadísticas de la cache de tiles: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def iniciar_precarga_ao(bbox, zoom=None, proveedores=None, capas=None, sid=None):
+    """
+    Precarga en segundo plano de tiles base, mini-tiles y tiles GIS de un área
+    de operaciones (services/precarga_tiles.py); el avance llega a la sala sid.
+    """
+    from services.precarga_tiles import gestor_precargas
+    if gestor_precargas.socketio is None:
+        gestor_precargas.configurar(socketio)
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    return gestor_precargas.iniciar(
+        bbox, os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina'), os.path.join(base_dir, '..', 'static', 'tiles'),
+        zoom=zoom, proveedores=proveedores, capas=capas, sid=sid
+    )
+
+def precargar_area_operaciones(area, sid=None):
+    """Precarga el AO de una partida/operación recién creada si trae uno; nunca interrumpe la creación."""
+    try:
+        from services.precarga_tiles import leer_bbox
+        bbox = leer_bbox(area)
+        if bbox is not None:
+            iniciar_precarga_ao(bbox, sid=sid)
+    except Exception as e:
+        print(f"⚠️ Precarga del área de operaciones no iniciada: {e}")
+
+# 🔥 ENDPOINTS: Precarga de tiles del área de operaciones
+@app.route('/api/tiles/precarga', methods=['POST'])
+def precargar_tiles_ao():
+    """
+    Calienta las caches de un AO: {"bbox": {west, south, east, north} o [w, s, e, n],
+    "zoom": [8, 13], "proveedores": ["osm"], "capas": ["base", "altimetria", "vegetacion", "gis"],
+    "socket_id": ...}. Responde 202 con el estado de la precarga.
+    """
+    try:
+        from services.precarga_tiles import leer_bbox
+        data = request.get_json(silent=True) or {}
+        bbox = leer_bbox(data.get('bbox'))
+        if bbox is None:
+            return jsonify({'error': 'Se requiere bbox con west/south/east/north'}), 400
+        precarga = iniciar_precarga_ao(bbox, zoom=data.get('zoom'), proveedores=data.get('proveedores'),
+                                       capas=data.get('capas'), sid=data.get('socket_id'))
+        return jsonify(precarga.a_dict()), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"❌ Error iniciando precarga de tiles: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/tiles/precarga/<precarga_id>', methods=['GET'])
+def estado_precarga_tiles(precarga_id):
+    """Avance de una precarga de AO"""
+    from services.precarga_tiles import gestor_precargas
+    precarga = gestor_precargas.obtener(precarga_id)
+    if precarga is None:
+        return jsonify({'error': 'Precarga no encontrada'}), 404
+    return jsonify(precarga.a_dict())
+
+@app.route('/api/tiles/precarga/<precarga_id>/cancelar', methods=['POST'])
+def cancelar_precarga_tiles(precarga_id):
+    """Cancela una precarga en curso"""
+    from services.precarga_tiles import gestor_precargas
+    if not gestor_precargas.cancelar(precarga_id):
+        return jsonify({'error': 'Precarga inexistente o ya terminada', 'success': False}), 404
+    return jsonify({'success': True, 'id': precarga_id})
+
 # 🗺️ SISTEMA DE DESCARGA Y DESCOMPRESIÓN DE TILES DE ELEVACIÓN
 @app.route('/api/tiles/elevation/<path:filepath>')
 def serve_elevation_tile(filepath):
     """
     Sirve tiles de elevación desde GitHub releases.
-    Si no existe localmente, descarga y descomprime el .tar.gz correspondiente.
+    Si no existe localmente, lo extrae del .tar.gz: con índice .idx.json baja solo
+    ese miembro por Range; sin índice espera a que el desempaquetado en segundo
+    plano del archivo llegue al tile.
     """
     try:
         base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -2805,6 +2906,12 @@ def serve_elevation_tile(filepath):
             print(f'✅ Sirviendo tile desde cache local: {filepath}')
             return send_from_directory(tiles_dir, filepath)
 
+        # Paquete de AO (.mbtiles) copiado para trabajar sin conexión
+        from services.almacen_tiles import buscar_en_paquetes
+        datos = buscar_en_paquetes(f'Altimetria_Mini_Tiles/{filepath}')
+        if datos is not None:
+            return Response(datos, mimetype='image/tiff')
+
         # Si no existe, necesitamos descargarlo y descomprimirlo
         print(f'📦 Tile no encontrado localmente, descargando: {filepath}')
 
@@ -2822,48 +2929,18 @@ def serve_elevation_tile(filepath):
         else:
             return jsonify({'error': f'No se pudo determinar la provincia para {filepath}'}), 400
 
-        # Descargar el .tar.gz de altimetría desde GitHub
-        tar_gz_url = f'https://github.com/Ehr051/MAIRA_4.0/releases/download/v4.0/maira_altimetria_tiles.tar.gz'
-        print(f'📥 Descargando {tar_gz_url} para extraer {filepath}')
-
-        response = requests.get(tar_gz_url, stream=True, timeout=300)
-        if not response.ok:
-            return jsonify({'error': f'Error descargando tar.gz: {response.status_code}'}), 500
+        # Archivo de altimetría: URL (release de GitHub por defecto) o ruta local
+        tar_gz_url = os.getenv('MAIRA_ALTIMETRIA_ARCHIVO',
+                               'https://github.com/Ehr051/MAIRA_4.0/releases/download/v4.0/maira_altimetria_tiles.tar.gz')
 
-        # Crear directorio si no existe
-        os.makedirs(tiles_dir, exist_ok=True)
-
-        # Procesar el archivo tar.gz y extraer el archivo específico
-        import tarfile
-        import io
-        with tarfile.open(fileobj=io.BytesIO(response.content), mode='r:gz') as tar:
-            # Buscar el archivo específico dentro del tar
-            for member in tar.getmembers():
-                # Buscar archivos que terminen con el filepath o que coincidan exactamente
-                if member.name.endswith(filepath) or member.name == filepath or f'Altimetria_Mini_Tiles/{filepath}' in member.name:
-                    print(f'📂 Extrayendo {member.name} a {tile_path}')
-
-                    # Extraer el archivo con la ruta correcta
-                    # Si el member tiene la ruta completa, extraerlo directamente
-                    if member.name.startswith('Altimetria_Mini_Tiles/'):
-                        # Crear el directorio padre si no existe
-                        os.makedirs(os.path.dirname(tile_path), exist_ok=True)
-                        # Extraer solo el contenido del archivo
-                        with tar.extractfile(member) as source, open(tile_path, 'wb') as target:
-                            target.write(source.read())
-                    else:
-                        # Extraer normalmente
-                        tar.extract(member, tiles_dir)
-
-                    # Verificar que se extrajo correctamente
-                    if os.path.exists(tile_path):
-                        print(f'✅ Tile extraído exitosamente: {filepath}')
-                        return send_from_directory(tiles_dir, filepath)
-                    else:
-                        return jsonify({'error': f'Error extrayendo archivo: {filepath}'}), 500
+        # Misses concurrentes del mismo tile comparten una sola extracción y el
+        # archivo se desempaqueta una vez en segundo plano (services/extraccion_tiles.py)
+        from services.extraccion_tiles import extractor_tiles
+        if extractor_tiles.obtener(tar_gz_url, filepath, tiles_dir, prefijo='Altimetria_Mini_Tiles/') is None:
+            return jsonify({'error': f'Archivo no encontrado en tar.gz: {filepath}'}), 404
 
-        # Si no se encontró el archivo en el tar
-        return jsonify({'error': f'Archivo no encontrado en tar.gz: {filepath}'}), 404
+        print(f'✅ Tile extraído exitosamente: {filepath}')
+        return send_from_directory(tiles_dir, filepath)
 
     except Exception as e:
         print(f'❌ Error sirviendo tile de elevación {filepath}: {e}')
@@ -2934,29 +3011,18 @@ def extraer_tile_vegetacion():
         if os.path.exists(output_path):
             return jsonify({"success": True, "message": "Tile de vegetación ya disponible", "path": f"/{output_path}"})
         
-        # Crear directorios si no existen
-        os.makedirs(tiles_dir, exist_ok=True)
-        os.makedirs("temp_extract", exist_ok=True)
-        
-        # Descargar el archivo TAR.GZ si no existe localmente
-        if not os.path.exists(local_tar_path):
-            print(f"📥 Descargando archivo TAR: {tar_url}")
-            import urllib.request
-            urllib.request.urlretrieve(tar_url, local_tar_path)
+        # Un solo desempaquetado del archivo aunque varios clientes pidan a la vez
+        # (services/extraccion_tiles.py); un TAR ya descargado se reutiliza
+        from services.extraccion_tiles import extractor_tiles
+        fuente = local_tar_path if os.path.exists(local_tar_path) else tar_url
+        if extractor_tiles.obtener(fuente, tile_filename, tiles_dir) is None:
+            return jsonify({"success": False, "message": f"Tile de vegetación {tile_filename} no encontrado en {archivo_tar}"}), 404
         
-        # Extraer el tile específico de vegetación
-        import tarfile
-        import traceback as traceback_lib
-        with tarfile.open(local_tar_path, 'r:gz') as tar:
-            try:
-                tar.extract(tile_filename, tiles_dir)
-                return jsonify({
-                    "success": True, 
-                    "message": "Tile de vegetación extraído exitosamente",
-                    "path": f"/{output_path}"
-                })
-            except KeyError:
-                return jsonify({"success": False, "message": f"Tile de vegetación {tile_filename} no encontrado en {archivo_tar}"}), 404
+        return jsonify({
+            "success": True, 
+            "message": "Tile de vegetación extraído exitosamente",
+            "path": f"/{output_path}"
+        })
     
     except Exception as e:
         print(f"❌ Error extrayendo tile de vegetación: {str(e)}")
@@ -2968,142 +3034,102 @@ def get_elevation_batch():
     """
     Recibe un array de coordenadas y devuelve todas las elevaciones de una vez.
     Esto evita hacer miles de requests individuales.
+    Acepta también el modo binario float32/float64 (ver services/formato_binario.py)
+    y el modo grilla bbox + rows/cols o resolución (ver services/grilla_muestreo.py).
+    Con "resolucion" (metros, en el JSON o ?resolucion=) los puntos sueltos se leen
+    del overview más grueso que alcance a esa separación.
     """
     import time
-    import json
     start_time = time.time()
 
     try:
-        # Importar rasterio
         try:
-            import rasterio
             import numpy as np
+            from services.muestreo_raster import ordenar_por_indice, a_lista_json
+            from services.pipeline_terreno import muestrear_terreno, capas_request
+            from services.formato_binario import (
+                leer_puntos_request, acepta_binario, respuesta_binaria, respuesta_grilla
+            )
+            from services.grilla_muestreo import leer_grilla_request, leer_paso_request
+            from services.pool_raster import pool_global
+            from services.catalogo_tiles import obtener_catalogo, obtener_catalogo_nacional
         except ImportError:
             return jsonify({
                 'error': 'rasterio no instalado',
                 'message': 'pip install rasterio'
             }), 500
 
-        data = request.get_json()
-        if not data or 'points' not in data:
-            return jsonify({'error': 'Se requiere points'}), 400
-
-        points = data['points']
-        print(f'📊 Batch: {len(points)} puntos')
-
-        # Calcular bounds
-        lats = [p['lat'] for p in points]
-        lons = [p['lon'] for p in points]
-        bounds = {
-            'north': max(lats),
-            'south': min(lats),
-            'east': max(lons),
-            'west': min(lons)
-        }
-        center_lat = (bounds['north'] + bounds['south']) / 2
-        center_lon = (bounds['east'] + bounds['west']) / 2
+        # JSON {"points": [...]}, pares lat,lon binarios (ver services/formato_binario.py)
+        # o {"grilla": {...}} generada en el servidor (ver services/grilla_muestreo.py)
+        try:
+            grilla = leer_grilla_request(request)
+            if grilla is None:
+                lats, lons, indices = leer_puntos_request(request)
+                paso = leer_paso_request(request)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if grilla is not None:
+            print(f'📊 Batch: grilla {grilla.rows}x{grilla.cols}')
+        else:
+            n_puntos = len(lats)
+            print(f'📊 Batch: {n_puntos} puntos')
 
         # Path base
         tiles_base = os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina', 'Altimetria_Mini_Tiles')
 
-        # Determinar provincia según latitud
-        provincia = None
-        if center_lat > -30:
-            provincia = 'norte'
-        elif center_lat > -36:
-            provincia = 'centro_norte'
-        elif center_lat > -42:
-            provincia = 'centro'
-        elif center_lat > -48:
-            provincia = 'sur'
-        else:
-            provincia = 'patagonia'
-
-        print(f'📁 Usando provincia: {provincia}')
-
-        # Cargar índice provincial
-        provincial_index_path = os.path.join(tiles_base, provincia, f'{provincia}_mini_tiles_index.json')
-
-        if not os.path.exists(provincial_index_path):
-            return jsonify({'error': f'Índice provincial no existe: {provincial_index_path}'}), 404
-
-        with open(provincial_index_path, 'r', encoding='utf-8') as f:
-            provincial_index = json.load(f)
-
-        # Filtrar tiles relevantes
-        relevant_tiles = []
-        tiles_dict = provincial_index.get('tiles', {})
-
-        for tile_id, tile_info in tiles_dict.items():
-            tile_bounds = tile_info.get('bounds', {})
-            if not tile_bounds:
-                continue
-
-            if (tile_bounds['north'] >= bounds['south'] and
-                tile_bounds['south'] <= bounds['north'] and
-                tile_bounds['east'] >= bounds['west'] and
-                tile_bounds['west'] <= bounds['east']):
-                relevant_tiles.append(tile_info)
-
-        print(f'🎯 {len(relevant_tiles)} tiles relevantes')
-
-        # Cargar tiles
-        tile_cache = {}
-        for tile_info in relevant_tiles:
-            filename = tile_info.get('filename')
-            if not filename:
-                continue
-
-            tile_path = os.path.join(tiles_base, provincia, filename)
-            if os.path.exists(tile_path):
-                try:
-                    src = rasterio.open(tile_path)
-                    tile_cache[filename] = {
-                        'src': src,
-                        'bounds': src.bounds,
-                        'info': tile_info
-                    }
-                except Exception as e:
-                    print(f'⚠️ Error: {filename}: {e}')
-
-        # Procesar puntos
-        elevations = [None] * len(points)
-
-        for point in points:
-            lat = point['lat']
-            lon = point['lon']
-            idx = point.get('index', 0)
-
-            for tile_name, tile_info in tile_cache.items():
-                src = tile_info['src']
-                bounds = tile_info['bounds']
-
-                if bounds.left <= lon <= bounds.right and bounds.bottom <= lat <= bounds.top:
-                    try:
-                        py, px = src.index(lon, lat)
-                        if 0 <= py < src.height and 0 <= px < src.width:
-                            elevation = float(src.read(1)[py, px])
-                            if elevation != -9999:
-                                elevations[idx] = elevation
-                                break
-                    except:
-                        pass
-
-        # Cerrar tiles
-        for tile_info in tile_cache.values():
-            tile_info['src'].close()
-
+        # Mosaico nacional: todas las provincias en un único catálogo,
+        # cada punto se resuelve contra el tile que lo contiene
+        try:
+            catalogo = obtener_catalogo_nacional(tiles_base)
+        except FileNotFoundError as e:
+            return jsonify({'error': str(e)}), 404
+
+        # Capas extra opcionales: {"capas": ["pendiente", "orientacion", "ndvi", "clase"]}
+        capas = capas_request(request)
+        catalogo_ndvi = None
+        if 'ndvi' in capas or 'clase' in capas:
+            try:
+                catalogo_ndvi = obtener_catalogo(os.path.join(
+                    os.path.dirname(tiles_base), 'Vegetacion_Mini_Tiles', 'vegetation_master_index.json'
+                ))
+            except FileNotFoundError:
+                print('⚠️ Sin índice de vegetación: capas ndvi/clase sin datos')
+        con_pendiente = bool({'pendiente', 'orientacion', 'clase'} & set(capas))
+
+        # Pipeline único (services/pipeline_terreno.py): una lectura de DEM por tile
+        # alimenta elevación y pendiente; el NDVI se lee una vez por tile de vegetación
+        if grilla is not None:
+            terreno = muestrear_terreno(catalogo, catalogo_ndvi, grilla=grilla,
+                                        pendiente=con_pendiente, pool=pool_global)
+            print(f'✅ Grilla {grilla.rows}x{grilla.cols}: {terreno.tiles_dem} tiles muestreados')
+            return respuesta_grilla(request, grilla, terreno.matriz('elevacion'), 'elevations',
+                                    terreno.tiles_dem, time.time() - start_time,
+                                    extras=terreno.matrices_json(capas))
+
+        terreno = muestrear_terreno(catalogo, catalogo_ndvi, lons=lons, lats=lats,
+                                    pendiente=con_pendiente, pool=pool_global, paso=paso)
+        valores, tiles_usados = terreno.elevacion, terreno.tiles_dem
         processing_time = time.time() - start_time
-        valid_count = sum(1 for e in elevations if e is not None)
+        valid_count = n_puntos - int(np.isnan(valores).sum())
+
+        print(f'✅ {valid_count}/{n_puntos} en {processing_time:.2f}s')
 
-        print(f'✅ {valid_count}/{len(points)} en {processing_time:.2f}s')
+        # Cliente binario: float32 little-endian en orden de índice, NaN = sin dato
+        if acepta_binario(request):
+            if indices is not None:
+                valores = ordenar_por_indice(valores, indices, n_puntos)
+            return respuesta_binaria(valores, count=n_puntos, valid_count=valid_count,
+                                     tiles_loaded=tiles_usados, processing_time=processing_time)
 
+        elevations = a_lista_json(valores, indices, n_puntos)
         return jsonify({
             'elevations': elevations,
             'count': len(elevations),
             'valid_count': valid_count,
-            'tiles_loaded': len(tile_cache),
-            'processing_time': processing_time
+            'tiles_loaded': tiles_usados,
+            'processing_time': processing_time,
+            **terreno.columnas_json([c for c in capas if c != 'elevacion'], indices, n_puntos)
         })
 
     except Exception as e:
@@ -3115,33 +3141,39 @@ def get_elevation_batch():
 # 🌿 ENDPOINT BATCH VEGETATION
 @app.route('/api/vegetation/batch', methods=['POST'])
 def get_vegetation_batch():
-    """Procesa múltiples coordenadas para obtener valores NDVI"""
+    """Procesa múltiples coordenadas para obtener valores NDVI (JSON, binario o grilla; "resolucion" opcional en metros)"""
     import time
-    import json
     start_time = time.time()
 
     try:
         try:
-            import rasterio
+            import numpy as np
+            from services.muestreo_raster import ordenar_por_indice, a_lista_json
+            from services.pipeline_terreno import muestrear_terreno
+            from services.formato_binario import (
+                leer_puntos_request, acepta_binario, respuesta_binaria, respuesta_grilla
+            )
+            from services.grilla_muestreo import leer_grilla_request, leer_paso_request
+            from services.pool_raster import pool_global
+            from services.catalogo_tiles import obtener_catalogo
         except ImportError:
             return jsonify({'error': 'rasterio no instalado'}), 500
 
-        data = request.get_json()
-        if not data or 'points' not in data:
-            return jsonify({'error': 'Se requiere points'}), 400
-
-        points = data['points']
-        print(f'📊 Batch vegetation: {len(points)} puntos')
-
-        # Calcular bounds
-        lats = [p['lat'] for p in points]
-        lons = [p['lon'] for p in points]
-        bounds = {
-            'north': max(lats),
-            'south': min(lats),
-            'east': max(lons),
-            'west': min(lons)
-        }
+        # JSON {"points": [...]}, pares lat,lon binarios (ver services/formato_binario.py)
+        # o {"grilla": {...}} generada en el servidor (ver services/grilla_muestreo.py)
+        try:
+            grilla = leer_grilla_request(request)
+            if grilla is None:
+                lats, lons, indices = leer_puntos_request(request)
+                paso = leer_paso_request(request)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if grilla is not None:
+            print(f'📊 Batch vegetation: grilla {grilla.rows}x{grilla.cols}')
+        else:
+            n_puntos = len(lats)
+            print(f'📊 Batch vegetation: {n_puntos} puntos')
 
         tiles_base = os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina', 'Vegetacion_Mini_Tiles')
         master_index_path = os.path.join(tiles_base, 'vegetation_master_index.json')
@@ -3149,85 +3181,37 @@ def get_vegetation_batch():
         if not os.path.exists(master_index_path):
             return jsonify({'error': f'Master index no existe'}), 404
 
-        with open(master_index_path, 'r', encoding='utf-8') as f:
-            master_index = json.load(f)
-
-        # Filtrar tiles relevantes
-        relevant_tiles = []
-        tiles_dict = master_index.get('tiles', {})
-
-        for tile_id, tile_info in tiles_dict.items():
-            tile_bounds = tile_info.get('bounds', {})
-            if not tile_bounds:
-                continue
-
-            if (tile_bounds['north'] >= bounds['south'] and
-                tile_bounds['south'] <= bounds['north'] and
-                tile_bounds['east'] >= bounds['west'] and
-                tile_bounds['west'] <= bounds['east']):
-                relevant_tiles.append(tile_info)
-
-        # Cargar tiles
-        tile_cache = {}
-        for tile_info in relevant_tiles:
-            filename = tile_info.get('filename')
-            package = tile_info.get('package')
-
-            if not filename or not package:
-                continue
-
-            tile_path = os.path.join(tiles_base, package, filename)
+        # Catálogo en memoria (índice espacial, recarga por mtime)
+        catalogo = obtener_catalogo(master_index_path)
 
-            if os.path.exists(tile_path):
-                try:
-                    src = rasterio.open(tile_path)
-                    tile_cache[filename] = {
-                        'src': src,
-                        'bounds': src.bounds,
-                        'info': tile_info
-                    }
-                except Exception as e:
-                    print(f'⚠️ Error: {filename}: {e}')
-
-        # Procesar puntos
-        ndvi_values = [None] * len(points)
-
-        for point in points:
-            lat = point['lat']
-            lon = point['lon']
-            idx = point.get('index', 0)
-
-            for tile_name, tile_info in tile_cache.items():
-                src = tile_info['src']
-                bounds = tile_info['bounds']
-
-                if bounds.left <= lon <= bounds.right and bounds.bottom <= lat <= bounds.top:
-                    try:
-                        py, px = src.index(lon, lat)
-                        if 0 <= py < src.height and 0 <= px < src.width:
-                            ndvi_value = float(src.read(1)[py, px])
-                            if ndvi_value != -9999:
-                                if ndvi_value > 1:
-                                    ndvi_value = ndvi_value / 255.0
-                                ndvi_values[idx] = ndvi_value
-                                break
-                    except:
-                        pass
-
-        # Cerrar tiles
-        for tile_info in tile_cache.values():
-            tile_info['src'].close()
+        # Mismo pipeline que elevación/análisis, solo con la capa NDVI (ya normalizada 0-1)
+        if grilla is not None:
+            terreno = muestrear_terreno(catalogo_ndvi=catalogo, grilla=grilla, pool=pool_global)
+            print(f'✅ Grilla {grilla.rows}x{grilla.cols}: {terreno.tiles_ndvi} tiles muestreados')
+            return respuesta_grilla(request, grilla, terreno.matriz('ndvi'), 'ndvi_values',
+                                    terreno.tiles_ndvi, time.time() - start_time)
 
+        terreno = muestrear_terreno(catalogo_ndvi=catalogo, lons=lons, lats=lats, pool=pool_global, paso=paso)
+        valores, tiles_usados = terreno.ndvi, terreno.tiles_ndvi
+        salida = valores
         processing_time = time.time() - start_time
-        valid_count = sum(1 for v in ndvi_values if v is not None)
+        valid_count = n_puntos - int(np.isnan(valores).sum())
+
+        print(f'✅ {valid_count}/{n_puntos} en {processing_time:.2f}s')
 
-        print(f'✅ {valid_count}/{len(points)} en {processing_time:.2f}s')
+        # Cliente binario: float32 little-endian en orden de índice, NaN = sin dato
+        if acepta_binario(request):
+            if indices is not None:
+                salida = ordenar_por_indice(salida, indices, n_puntos)
+            return respuesta_binaria(salida, count=n_puntos, valid_count=valid_count,
+                                     tiles_loaded=tiles_usados, processing_time=processing_time)
 
+        ndvi_values = a_lista_json(salida, indices, n_puntos)
         return jsonify({
             'ndvi_values': ndvi_values,
             'count': len(ndvi_values),
             'valid_count': valid_count,
-            'tiles_loaded': len(tile_cache),
+            'tiles_loaded': tiles_usados,
             'processing_time': processing_time
         })
 
@@ -3260,7 +3244,7 @@ def actualizar_adjunto_en_db(informe_id, adjunto_db):
 # 🗺️ ENDPOINT ANÁLISIS DE TERRENO
 # ===============================================================================
 # Analiza un polígono para calcular pendientes, transitabilidad y estadísticas
-# Reutiliza el patrón de get_elevation_batch con tiles provinciales
+# Reutiliza el patrón de get_elevation_batch con el mosaico nacional de tiles
 # ===============================================================================
 
 @app.route('/api/terreno/analizar', methods=['POST'])
@@ -3274,6 +3258,8 @@ def analizar_terreno():
     Request JSON:
     {
         "poligono": [[[lng, lat], [lng, lat], ...]], // GeoJSON coordinates
+        "grilla": {"resolucion": 50},   // Opcional: grilla generada en el servidor
+                                        // (en lugar de enviar "puntos")
         "vehiculo": "TAM" | "VCLC" | "M113" | "infanteria",
         "clima": "seco" | "humedo" | "inundado",
         "capas": {
@@ -3282,6 +3268,10 @@ def analizar_terreno():
         }
     }
     
+    Cache (services/cache_terreno.py): los rasters y puntos_detalle del polígono
+    se reutilizan al cambiar vehículo/clima/capas, y las estadísticas por
+    combinación; las cabeceras X-Cache-Raster y X-Cache-Analisis indican HIT o MISS.
+    
     Response JSON:
     {
         "pendiente_promedio": 12.5,
@@ -3293,467 +3283,812 @@ def analizar_terreno():
             "15-30": 20,
             "30+": 5
         },
-        "puntos_criticos": [...],
-        "mapa_calor": [...] // Opcional: grid con pendientes para visualización
+        "puntos_criticos": [...],       // Celdas más empinadas sobre el límite
+        "puntos_detalle": [...],        // Por celda: elevation, pendiente, orientacion, ndvi, clase
+        "grilla": {"rows", "cols", "bbox", ...}
     }
-    """
-    import time
-    import json
-    import math
-    
-    start_time = time.time()
     
+    Para polígonos grandes usar POST /api/terreno/trabajos (pool de procesos
+    con progreso por Socket.IO).
+    """
     try:
         # Importar rasterio
         try:
             import rasterio
-            import numpy as np
+            from services.analisis_terreno import AnalisisTerreno, ErrorAnalisis
+            from services.cache_terreno import marcar_respuesta
+            from services.pool_raster import pool_global
         except ImportError:
             return jsonify({
                 'error': 'rasterio no instalado',
                 'message': 'pip install rasterio'
             }), 500
         
-        # Validar request
-        data = request.get_json()
-        if not data or 'poligono' not in data:
-            return jsonify({'error': 'Se requiere poligono en formato GeoJSON'}), 400
-        
-        poligono_coords = data['poligono'][0] if len(data['poligono']) > 0 else []
-        vehiculo = data.get('vehiculo', 'TAM')
-        clima = data.get('clima', 'seco')
-        capas = data.get('capas', {'pendientes': True, 'transitabilidad': True})
-        
-        if len(poligono_coords) < 3:
-            return jsonify({'error': 'El polígono debe tener al menos 3 puntos'}), 400
-        
-        print(f'🗺️ Análisis de terreno: {len(poligono_coords)} puntos, vehículo={vehiculo}, clima={clima}')
-        
-        # ========================================================================
-        # PASO 1: Extraer latitudes/longitudes del polígono (GeoJSON es [lng, lat])
-        # ========================================================================
-        # ====================================================================
-        # PASO 1: Obtener puntos para análisis (grilla o vértices)
-        # ====================================================================
-        grid_points = data.get('puntos', None)
-        
-        if grid_points and len(grid_points) > 0:
-            # Usar grilla enviada desde frontend
-            lats = [p['lat'] for p in grid_points]
-            lons = [p['lon'] for p in grid_points]
-            print(f'📐 Usando grilla: {len(grid_points)} puntos')
-        else:
-            # Fallback: usar solo vértices del polígono
-            lons = [p[0] for p in poligono_coords]
-            lats = [p[1] for p in poligono_coords]
-            print(f'📐 Usando vértices: {len(poligono_coords)} puntos')
-        bounds = {
-            'north': max(lats),
-            'south': min(lats),
-            'east': max(lons),
-            'west': min(lons)
-        }
-        center_lat = (bounds['north'] + bounds['south']) / 2
-        center_lon = (bounds['east'] + bounds['west']) / 2
-        
-        print(f'📊 Bounds: N={bounds["north"]:.4f}, S={bounds["south"]:.4f}, E={bounds["east"]:.4f}, W={bounds["west"]:.4f}')
+        # Validación, grilla sobre el polígono (GeoJSON es [lng, lat]) y
+        # catálogos de altimetría/vegetación: services/analisis_terreno.py
+        datos_argentina = os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina')
+        try:
+            analisis = AnalisisTerreno.desde_request(request.get_json(silent=True), request, datos_argentina)
+            grilla = analisis.grilla
+            print(f'🗺️ Análisis de terreno: vehículo={analisis.vehiculo}, clima={analisis.clima}')
+            print(f'📐 Grilla {grilla.rows}x{grilla.cols}, {int(grilla.mascara.sum())} celdas en el polígono')
+            
+            # Pipeline único + estadísticas por vehículo/clima, con cache de dos niveles
+            cuerpo, raster_hit, analisis_hit = analisis.ejecutar(pool=pool_global)
+        except ErrorAnalisis as e:
+            return jsonify({'error': str(e)}), e.status
         
-        # ========================================================================
-        # PASO 2: Cargar tiles de elevación (mismo patrón que get_elevation_batch)
-        # ========================================================================
-        tiles_base = os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina', 'Altimetria_Mini_Tiles')
+        respuesta = app.response_class(cuerpo, mimetype='application/json')
+        return marcar_respuesta(respuesta, raster=raster_hit, analisis=analisis_hit)
+    
+    except Exception as e:
+        print(f'❌ Error en análisis de terreno: {e}')
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'success': False}), 500
+
+
+@app.route('/api/terreno/trabajos', methods=['POST'])
+def enviar_trabajo_terreno():
+    """
+    Versión asíncrona de /api/terreno/analizar para polígonos grandes.
+    
+    Mismo JSON que /api/terreno/analizar más "socket_id" (socket.id del
+    cliente) para recibir trabajo_progreso / trabajo_completado por Socket.IO.
+    
+    - 200: los rasters del polígono ya estaban en cache, resultado inmediato
+    - 202: {"trabajo": {"id", "estado", ...}}; el resultado se obtiene con
+      GET /api/trabajos/<id>/resultado
+    """
+    try:
+        try:
+            import rasterio
+            from services.analisis_terreno import AnalisisTerreno, ErrorAnalisis, trabajo_analisis
+            from services.cache_terreno import marcar_respuesta
+            from services.pool_raster import pool_global
+            from services.trabajos import gestor_trabajos
+        except ImportError:
+            return jsonify({
+                'error': 'rasterio no instalado',
+                'message': 'pip install rasterio'
+            }), 500
         
-        # Determinar provincia según latitud
-        provincia = None
-        if center_lat > -30:
-            provincia = 'norte'
-        elif center_lat > -36:
-            provincia = 'centro_norte'
-        elif center_lat > -42:
-            provincia = 'centro'
-        elif center_lat > -48:
-            provincia = 'sur'
-        else:
-            provincia = 'patagonia'
+        data = request.get_json(silent=True)
+        datos_argentina = os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina')
+        try:
+            analisis = AnalisisTerreno.desde_request(data, request, datos_argentina)
+            
+            # Cambio de vehículo/clima sobre un polígono ya muestreado: milisegundos
+            if analisis.rasters_en_cache:
+                cuerpo, raster_hit, analisis_hit = analisis.ejecutar(pool=pool_global)
+                respuesta = app.response_class(cuerpo, mimetype='application/json')
+                return marcar_respuesta(respuesta, raster=raster_hit, analisis=analisis_hit)
+        except ErrorAnalisis as e:
+            return jsonify({'error': str(e)}), e.status
+        
+        if gestor_trabajos.socketio is None:
+            gestor_trabajos.configurar(socketio)
+        trabajo = gestor_trabajos.enviar(
+            'analisis_terreno', trabajo_analisis, analisis.parametros(),
+            sid=data.get('socket_id'), al_terminar=analisis.guardar_trabajo
+        )
+        return jsonify({'success': True, 'trabajo': trabajo.a_dict()}), 202
+    
+    except Exception as e:
+        print(f'❌ Error enviando trabajo de terreno: {e}')
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'success': False}), 500
+
+
+# ⚙️ ENDPOINTS: Estado, resultado y cancelación de trabajos asíncronos
+@app.route('/api/trabajos/<trabajo_id>', methods=['GET'])
+def estado_trabajo(trabajo_id):
+    """Estado y progreso de un trabajo (services/trabajos.py)"""
+    from services.trabajos import gestor_trabajos
+    trabajo = gestor_trabajos.obtener(trabajo_id)
+    if trabajo is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(trabajo.a_dict())
+
+
+@app.route('/api/trabajos/<trabajo_id>/resultado', methods=['GET'])
+def resultado_trabajo(trabajo_id):
+    """Resultado de un trabajo completado (202 mientras sigue en curso)"""
+    from services.trabajos import gestor_trabajos, COMPLETADO, ERROR, CANCELADO
+    trabajo = gestor_trabajos.obtener(trabajo_id)
+    if trabajo is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    if trabajo.estado == ERROR:
+        return jsonify({'error': trabajo.error, 'success': False}), 500
+    if trabajo.estado == CANCELADO:
+        return jsonify({'error': 'Trabajo cancelado', 'success': False}), 409
+    if trabajo.estado != COMPLETADO:
+        return jsonify(trabajo.a_dict()), 202
+    
+    resultado = trabajo.resultado
+    if isinstance(resultado, bytes):
+        return app.response_class(resultado, mimetype='application/json')
+    return jsonify(resultado)
+
+
+@app.route('/api/trabajos/<trabajo_id>/cancelar', methods=['POST'])
+def cancelar_trabajo(trabajo_id):
+    """Cancela un trabajo en cola o en curso"""
+    from services.trabajos import gestor_trabajos
+    if not gestor_trabajos.cancelar(trabajo_id):
+        return jsonify({'error': 'Trabajo inexistente o ya terminado', 'success': False}), 404
+    return jsonify({'success': True, 'id': trabajo_id})
+
+
+@app.route('/api/trabajos/stats')
+def trabajos_stats():
+    """Contadores del pool de trabajos asíncronos"""
+    from services.trabajos import gestor_trabajos
+    return jsonify(gestor_trabajos.estadisticas())
+
+
+# ===============================================================================
+# 👁️ ENDPOINTS INTERVISIBILIDAD (OCOTA)
+# ===============================================================================
+# Cuencas visuales y líneas de vista sobre el mosaico nacional de altimetría
+# (services/visibilidad.py)
+# ===============================================================================
+
+@app.route('/api/terreno/visibilidad', methods=['POST'])
+def calcular_visibilidad():
+    """
+    Cuenca visual (viewshed) de uno o más observadores.
+    
+    Request JSON:
+    {
+        "observadores": [{"lat": -38.1, "lon": -61.9, "altura": 2, "alcance": 5000}, ...],
+        "alcance": 5000,            // metros, por defecto para observadores sin alcance
+        "resolucion": 30,           // metros por celda
+        "altura_objetivo": 0        // 0 = ver el suelo; 2.5 = ver un vehículo
+    }
+    
+    Response JSON (o float32 fila-mayor con Accept: application/octet-stream):
+    {
+        "visibilidad": [[...]],     // cuántos observadores ven cada celda (null = sin evaluar)
+        "grilla": {"rows", "cols", "bbox", ...},
+        "observadores": [{"lat", "lon", "pct_visible", "area_visible_km2", ...}]
+    }
+    """
+    import time
+    start_time = time.time()
+    
+    try:
+        try:
+            import rasterio
+            from services.visibilidad import cuencas_combinadas, RESOLUCION_DEFAULT
+            from services.formato_binario import respuesta_grilla
+            from services.pool_raster import pool_global
+            from services.catalogo_tiles import obtener_catalogo_nacional
+        except ImportError:
+            return jsonify({
+                'error': 'rasterio no instalado',
+                'message': 'pip install rasterio'
+            }), 500
         
-        print(f'📁 Provincia: {provincia}')
+        data = request.get_json(silent=True) or {}
+        observadores = data.get('observadores') or []
+        if not observadores:
+            return jsonify({'error': 'Se requiere al menos un observador'}), 400
+        if len(observadores) > 100:
+            return jsonify({'error': 'Máximo 100 observadores por consulta'}), 400
         
-        # Cargar índice provincial
-        provincial_index_path = os.path.join(tiles_base, provincia, f'{provincia}_mini_tiles_index.json')
-        if not os.path.exists(provincial_index_path):
-            return jsonify({'error': f'Índice provincial no existe: {provincial_index_path}'}), 404
+        tiles_base = os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina', 'Altimetria_Mini_Tiles')
+        try:
+            catalogo = obtener_catalogo_nacional(tiles_base)
+        except FileNotFoundError as e:
+            return jsonify({'error': str(e)}), 404
         
-        with open(provincial_index_path, 'r', encoding='utf-8') as f:
-            provincial_index = json.load(f)
+        try:
+            grilla, conteo, cuencas = cuencas_combinadas(
+                catalogo, observadores,
+                alcance=float(data.get('alcance', 5000)),
+                altura_objetivo=float(data.get('altura_objetivo', 0)),
+                resolucion=float(data.get('resolucion', RESOLUCION_DEFAULT)),
+                pool=pool_global
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': f'Observadores inválidos: {e}'}), 400
         
-        # Filtrar tiles relevantes
-        relevant_tiles = []
-        tiles_dict = provincial_index.get('tiles', {})
+        print(f'👁️ {len(cuencas)} cuencas visuales en grilla {grilla.rows}x{grilla.cols}')
+        return respuesta_grilla(request, grilla, conteo, 'visibilidad',
+                                len(catalogo.tiles_bbox(grilla.bbox)), time.time() - start_time,
+                                extras={'observadores': [c.resumen() for c in cuencas]})
+    
+    except Exception as e:
+        print(f'❌ Error calculando visibilidad: {e}')
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'success': False}), 500
+
+
+@app.route('/api/terreno/linea_vista', methods=['POST'])
+def calcular_linea_vista():
+    """
+    Líneas de vista punto a punto.
+    
+    Request JSON:
+    {
+        "pares": [{"origen": {"lat", "lon", "altura"?}, "destino": {"lat", "lon", "altura"?}}, ...],
+        "altura_observador": 2,     // por defecto para origen sin altura
+        "altura_objetivo": 2,       // por defecto para destino sin altura
+        "paso": 30                  // metros entre muestras del perfil
+    }
+    
+    Response JSON:
+    {
+        "resultados": [{"visible", "distancia", "margen_minimo", "obstruccion": {...} | null}, ...]
+    }
+    """
+    import time
+    start_time = time.time()
+    
+    try:
+        try:
+            import rasterio
+            from services.visibilidad import linea_de_vista, RESOLUCION_DEFAULT
+            from services.pool_raster import pool_global
+            from services.catalogo_tiles import obtener_catalogo_nacional
+        except ImportError:
+            return jsonify({
+                'error': 'rasterio no instalado',
+                'message': 'pip install rasterio'
+            }), 500
         
-        for tile_id, tile_info in tiles_dict.items():
-            tile_bounds = tile_info.get('bounds', {})
-            if not tile_bounds:
-                continue
-            
-            if (tile_bounds['north'] >= bounds['south'] and
-                tile_bounds['south'] <= bounds['north'] and
-                tile_bounds['east'] >= bounds['west'] and
-                tile_bounds['west'] <= bounds['east']):
-                relevant_tiles.append(tile_info)
-        
-        print(f'🎯 {len(relevant_tiles)} tiles relevantes')
-        
-        if len(relevant_tiles) == 0:
-            return jsonify({'error': 'No se encontraron tiles para el área seleccionada'}), 404
-        
-        # Cargar tiles en cache
-        tile_cache = {}
-        for tile_info in relevant_tiles:
-            filename = tile_info.get('filename')
-            if not filename:
-                continue
-            
-            tile_path = os.path.join(tiles_base, provincia, filename)
-            if os.path.exists(tile_path):
-                try:
-                    src = rasterio.open(tile_path)
-                    tile_cache[filename] = {
-                        'src': src,
-                        'bounds': src.bounds,
-                        'info': tile_info
-                    }
-                except Exception as e:
-                    print(f'⚠️ Error cargando {filename}: {e}')
+        data = request.get_json(silent=True) or {}
+        pares = data.get('pares') or []
+        if not pares:
+            return jsonify({'error': 'Se requiere al menos un par origen/destino'}), 400
+        if len(pares) > 100:
+            return jsonify({'error': 'Máximo 100 pares por consulta'}), 400
         
-        print(f'💾 {len(tile_cache)} tiles cargados')
+        tiles_base = os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina', 'Altimetria_Mini_Tiles')
+        try:
+            catalogo = obtener_catalogo_nacional(tiles_base)
+        except FileNotFoundError as e:
+            return jsonify({'error': str(e)}), 404
         
-        # ========================================================================
-        # PASO 3: Obtener elevaciones de cada punto del polígono
-        # ========================================================================
-        elevations = []
-        valid_points = []
+        altura_obs = float(data.get('altura_observador', 2))
+        altura_obj = float(data.get('altura_objetivo', 2))
+        paso = max(float(data.get('paso', RESOLUCION_DEFAULT)), 1.0)
         
-        for i, (lon, lat) in enumerate(zip(lons, lats)):
-            elevation = None
-            
-            for tile_name, tile_info in tile_cache.items():
-                src = tile_info['src']
-                bounds_tile = tile_info['bounds']
-                
-                if bounds_tile.left <= lon <= bounds_tile.right and bounds_tile.bottom <= lat <= bounds_tile.top:
-                    try:
-                        py, px = src.index(lon, lat)
-                        if 0 <= py < src.height and 0 <= px < src.width:
-                            elev = float(src.read(1)[py, px])
-                            if elev != -9999:
-                                elevation = elev
-                                break
-                    except:
-                        pass
-            
-            if elevation is not None:
-                elevations.append(elevation)
-                valid_points.append({'lat': lat, 'lon': lon, 'elevation': elevation, 'index': i})
+        try:
+            resultados = [
+                linea_de_vista(
+                    catalogo,
+                    (par['origen']['lat'], par['origen']['lon']),
+                    (par['destino']['lat'], par['destino']['lon']),
+                    altura_obs=float(par['origen'].get('altura', altura_obs)),
+                    altura_obj=float(par['destino'].get('altura', altura_obj)),
+                    paso=paso, pool=pool_global
+                )
+                for par in pares
+            ]
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': f'Pares inválidos: {e}'}), 400
         
-        # Cerrar tiles
-        for tile_info in tile_cache.values():
-            tile_info['src'].close()
+        visibles = sum(1 for r in resultados if r['visible'])
+        print(f'👁️ {visibles}/{len(resultados)} líneas de vista despejadas')
+        return jsonify({
+            'resultados': resultados,
+            'count': len(resultados),
+            'processing_time': time.time() - start_time
+        })
+    
+    except Exception as e:
+        print(f'❌ Error calculando líneas de vista: {e}')
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'success': False}), 500
+
+
+# ===============================================================================
+# 📈 ENDPOINT: Perfil de elevación de una polilínea
+# ===============================================================================
+
+@app.route('/api/terreno/perfil', methods=['POST'])
+def calcular_perfil_elevacion():
+    """
+    Perfil de elevación densificado en el servidor (services/perfil_elevacion.py).
+    
+    Request JSON:
+    {
+        "linea": {"type": "LineString", "coordinates": [[lon, lat], ...]},
+        // o "polilinea": "<polyline codificada>", "precision": 5
+        "paso": 30,                 // metros entre muestras
+        "desnivel": 10,             // refina donde el salto supera N metros (0 = sin refinar)
+        "linea_vista": {"altura_observador": 2, "altura_objetivo": 2}   // opcional (o true)
+    }
+    
+    Response JSON:
+    {
+        "distancias": [...], "elevaciones": [...], "pendientes": [...],   // pendiente en %
+        "ascenso_acumulado": [...], "descenso_acumulado": [...],
+        "lats": [...], "lons": [...], "vertices": [...],   // índice de cada vértice original
+        "resumen": {"distancia_total", "ascenso_total", ...},
+        "linea_vista": {"visible", "obstruccion", ...}     // si se pidió
+    }
+    """
+    import time
+    start_time = time.time()
+    
+    try:
+        try:
+            import rasterio
+            from services.perfil_elevacion import (
+                leer_linea, perfil_elevacion, PASO_DEFAULT, DESNIVEL_REFINAR
+            )
+            from services.visibilidad import linea_de_vista, MAX_MUESTRAS_LINEA
+            from services.pool_raster import pool_global
+            from services.catalogo_tiles import obtener_catalogo_nacional
+        except ImportError:
+            return jsonify({
+                'error': 'rasterio no instalado',
+                'message': 'pip install rasterio'
+            }), 500
         
-        if len(elevations) < 2:
-            return jsonify({'error': 'No se pudieron obtener suficientes elevaciones del área'}), 500
+        data = request.get_json(silent=True) or {}
+        try:
+            coords = leer_linea(data)
+            paso = float(data.get('paso', PASO_DEFAULT))
+            desnivel = float(data.get('desnivel', DESNIVEL_REFINAR))
+        except (IndexError, TypeError, ValueError) as e:
+            return jsonify({'error': f'Línea inválida: {e}'}), 400
         
-        print(f'✅ {len(elevations)} elevaciones obtenidas')
+        tiles_base = os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina', 'Altimetria_Mini_Tiles')
+        try:
+            catalogo = obtener_catalogo_nacional(tiles_base)
+        except FileNotFoundError as e:
+            return jsonify({'error': str(e)}), 404
+        
+        perfil = perfil_elevacion(catalogo, coords, paso=paso, desnivel=desnivel, pool=pool_global)
+        
+        opciones_lv = data.get('linea_vista')
+        if opciones_lv:
+            opciones_lv = opciones_lv if isinstance(opciones_lv, dict) else {}
+            # La recta origen-destino no es más larga que el perfil: este paso
+            # la deja dentro de MAX_MUESTRAS_LINEA
+            paso_lv = max(perfil.paso, float(perfil.distancias[-1]) / (MAX_MUESTRAS_LINEA - 2))
+            perfil.linea_vista = linea_de_vista(
+                catalogo, coords[0], coords[-1],
+                altura_obs=float(opciones_lv.get('altura_observador', 2)),
+                altura_obj=float(opciones_lv.get('altura_objetivo', 2)),
+                paso=paso_lv, pool=pool_global
+            )
         
-        # ========================================================================
-        # PASO 4: Calcular pendientes entre puntos consecutivos
-        # ========================================================================
-        pendientes = []
-        distancias = []
+        resultado = perfil.a_dict()
+        resultado['tiles_loaded'] = perfil.tiles
+        resultado['processing_time'] = time.time() - start_time
+        print(f"📈 Perfil: {resultado['resumen']['muestras']} muestras en "
+              f"{resultado['resumen']['distancia_total']:.0f} m ({resultado['processing_time']:.2f}s)")
+        return jsonify(resultado)
+    
+    except Exception as e:
+        print(f'❌ Error calculando perfil: {e}')
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'success': False}), 500
+
+
+# ===============================================================================
+# 🧭 ENDPOINT: Ruta campo traviesa de mínimo costo
+# ===============================================================================
+
+@app.route('/api/terreno/ruta', methods=['POST'])
+def planificar_ruta_terreno():
+    """
+    Ruta más rápida campo traviesa según pendiente, vegetación, vehículo y clima
+    (services/rutas_terreno.py).
+    
+    Request JSON:
+    {
+        "origen": {"lat": -38.35, "lon": -61.7},
+        // o "origenes": [{"lat", "lon"}, ...]  (Dijkstra multi-origen: sale del más conveniente)
+        "destino": {"lat": -38.25, "lon": -61.5},
+        "vehiculo": "TAM",          // TAM, VCLC, M113, infanteria, camion
+        "clima": "seco",            // seco, humedo, inundado (o climas BV8: LLUVIA, ...)
+        "resolucion": 30,           // metros (se agranda en áreas muy grandes)
+        "area": {"bbox": {...}}     // opcional: área de la operación (o {"poligono": [...]})
+    }
+    
+    Response JSON:
+    {
+        "geometria": {"type": "LineString", "coordinates": [[lon, lat], ...]},
+        "distancia_m", "tiempo_s", "eta_min", "velocidad_media_kmh",
+        "origen": 0, "composicion_m": {"ABIERTO": ..., ...},
+        "cache": {"raster": true, "costo": false}
+    }
+    """
+    import time
+    start_time = time.time()
+    
+    try:
+        try:
+            import rasterio
+            from services.rutas_terreno import planificar_ruta, SinRuta, RESOLUCION_DEFAULT
+            from services.analisis_terreno import catalogos_terreno, ErrorAnalisis
+            from services.pool_raster import pool_global
+        except ImportError:
+            return jsonify({
+                'error': 'rasterio no instalado',
+                'message': 'pip install rasterio'
+            }), 500
         
-        for i in range(len(valid_points) - 1):
-            p1 = valid_points[i]
-            p2 = valid_points[i + 1]
-            
-            # Calcular distancia horizontal usando fórmula de Haversine
-            lat1_rad = math.radians(p1['lat'])
-            lat2_rad = math.radians(p2['lat'])
-            dlon = math.radians(p2['lon'] - p1['lon'])
-            dlat = lat2_rad - lat1_rad
-            
-            a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
-            c = 2 * math.asin(math.sqrt(a))
-            distancia_horizontal = 6371000 * c  # Radio Tierra en metros
-            
-            # Diferencia de elevación
-            delta_elevation = abs(p2['elevation'] - p1['elevation'])
-            
-            # Pendiente en grados (arctan de delta_h / distancia_h)
-            if distancia_horizontal > 0:
-                pendiente_rad = math.atan(delta_elevation / distancia_horizontal)
-                pendiente_deg = math.degrees(pendiente_rad)
-                pendientes.append(pendiente_deg)
-                distancias.append(distancia_horizontal)
-        
-        if len(pendientes) == 0:
-            return jsonify({'error': 'No se pudieron calcular pendientes'}), 500
-        
-        print(f'📐 {len(pendientes)} pendientes calculadas')
-        
-        # ========================================================================
-        # PASO 5: Calcular estadísticas
-        # ========================================================================
-        pendiente_promedio = float(np.mean(pendientes))
-        pendiente_maxima = float(np.max(pendientes))
-        pendiente_minima = float(np.min(pendientes))
-        
-        # Distribución por rangos
-        rango_0_5 = sum(1 for p in pendientes if p < 5)
-        rango_5_15 = sum(1 for p in pendientes if 5 <= p < 15)
-        rango_15_30 = sum(1 for p in pendientes if 15 <= p < 30)
-        rango_30_plus = sum(1 for p in pendientes if p >= 30)
-        
-        total_segmentos = len(pendientes)
-        
-        distribucion_pendientes = {
-            '0-5': round((rango_0_5 / total_segmentos) * 100, 1),
-            '5-15': round((rango_5_15 / total_segmentos) * 100, 1),
-            '15-30': round((rango_15_30 / total_segmentos) * 100, 1),
-            '30+': round((rango_30_plus / total_segmentos) * 100, 1)
-        }
+        data = request.get_json(silent=True) or {}
+        try:
+            origenes = data.get('origenes') or [data['origen']]
+            origenes = [(float(o['lat']), float(o['lon'])) for o in origenes]
+            destino = (float(data['destino']['lat']), float(data['destino']['lon']))
+            resolucion = float(data.get('resolucion', RESOLUCION_DEFAULT))
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': f'Se requieren origen y destino con lat/lon: {e}'}), 400
+        
+        datos_argentina = os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina')
+        try:
+            catalogo, catalogo_ndvi = catalogos_terreno(datos_argentina)
+            ruta = planificar_ruta(
+                catalogo, catalogo_ndvi, origenes, destino,
+                vehiculo=data.get('vehiculo', 'TAM'),
+                clima=data.get('clima', 'seco'),
+                resolucion=resolucion,
+                area=data.get('area'),
+                pool=pool_global
+            )
+        except ErrorAnalisis as e:
+            return jsonify({'error': str(e), 'success': False}), e.status
+        except SinRuta as e:
+            return jsonify({'error': str(e), 'success': False}), 404
+        except ValueError as e:
+            return jsonify({'error': str(e), 'success': False}), 400
+        
+        ruta['success'] = True
+        ruta['processing_time'] = time.time() - start_time
+        print(f"🧭 Ruta {ruta['busqueda']['vehiculo']}: {ruta['distancia_m']:.0f} m, "
+              f"ETA {ruta['eta_min']} min ({ruta['busqueda']['celdas_exploradas']} celdas exploradas, "
+              f"{ruta['processing_time']:.2f}s)")
+        return jsonify(ruta)
+    
+    except Exception as e:
+        print(f'❌ Error planificando ruta: {e}')
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'success': False}), 500
+
+
+# ===============================================================================
+# 🛣️ ENDPOINTS RED VIAL: Rutas de convoy sobre el grafo CSR
+# ===============================================================================
+# Grafo construido offline con tools/create_road_graph.py y abierto por mmap
+# (services/grafo_vial.py)
+# ===============================================================================
+
+def _parametros_red_vial(data):
+    """Perfil de ruteo del request: peso, velocidad máxima (km/h) y tipos de vía excluidos."""
+    from services.grafo_vial import TIPOS_VIA
+    peso = data.get('peso', 'tiempo')
+    if peso not in ('tiempo', 'distancia'):
+        raise ValueError('peso debe ser "tiempo" o "distancia"')
+    velocidad_max = data.get('velocidad_max')
+    velocidad_max = float(velocidad_max) if velocidad_max else None
+    excluir = tuple(data.get('excluir') or ())
+    desconocidos = [t for t in excluir if t not in TIPOS_VIA]
+    if desconocidos:
+        raise ValueError(f'Tipos de vía desconocidos: {desconocidos}')
+    return {'peso': peso, 'velocidad_max': velocidad_max, 'excluir': excluir}
+
+
+@app.route('/api/red_vial/ruta', methods=['POST'])
+def ruta_red_vial():
+    """
+    Ruta por la red vial entre dos puntos (Dijkstra bidireccional).
+    
+    Request JSON:
+    {
+        "origen": {"lat": -38.0, "lon": -62.0},
+        "destino": {"lat": -38.6, "lon": -61.4},
+        "peso": "tiempo",            // o "distancia"
+        "velocidad_max": 60,         // km/h del convoy (tope sobre la velocidad de la vía)
+        "excluir": ["caminos"]       // tipos de vía a evitar
+    }
+    
+    Response JSON:
+    {
+        "geometria": {"type": "LineString", "coordinates": [[lon, lat], ...]},
+        "distancia_m", "tiempo_s", "eta_min",
+        "por_tipo_m": {"ruta_nacional": ..., ...},
+        "acceso_m": [origen, destino]   // distancia al nodo vial más cercano
+    }
+    """
+    import time
+    start_time = time.time()
+    
+    try:
+        from services.grafo_vial import obtener_grafo_vial, SinRutaVial
         
-        # ========================================================================
-        # PASO 6: Calcular transitabilidad según vehículo/clima
-        # ========================================================================
-        # Límites de pendiente por vehículo (en grados)
-        limites_vehiculos = {
-            'TAM': 30,          # Tanque Argentino Mediano
-            'VCLC': 25,         # Vehículo de Combate Ligero
-            'M113': 20,         # Transporte Personal
-            'infanteria': 45,   # Infantería a pie
-            'camion': 15        # Camión logístico
-        }
+        data = request.get_json(silent=True) or {}
+        try:
+            origen = (float(data['origen']['lat']), float(data['origen']['lon']))
+            destino = (float(data['destino']['lat']), float(data['destino']['lon']))
+            parametros = _parametros_red_vial(data)
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': f'Parámetros inválidos: {e}'}), 400
         
-        # Factor de clima (multiplica el límite)
-        factores_clima = {
-            'seco': 1.0,
-            'humedo': 0.8,      # Reduce 20% el límite
-            'inundado': 0.6     # Reduce 40% el límite
-        }
+        try:
+            grafo = obtener_grafo_vial(os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina', 'Grafo_Vial'))
+            ruta = grafo.ruta(origen, destino, **parametros)
+        except FileNotFoundError as e:
+            return jsonify({'error': str(e)}), 404
+        except SinRutaVial as e:
+            return jsonify({'error': str(e), 'success': False}), 404
+        
+        ruta['success'] = True
+        ruta['processing_time'] = time.time() - start_time
+        print(f"🛣️ Ruta vial: {ruta['distancia_m']:.0f} m en {ruta['processing_time'] * 1000:.0f}ms")
+        return jsonify(ruta)
+    
+    except Exception as e:
+        print(f'❌ Error calculando ruta vial: {e}')
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'success': False}), 500
+
+
+@app.route('/api/red_vial/rutas', methods=['POST'])
+def rutas_red_vial_lote():
+    """
+    Lote de rutas de convoy: los pares se agrupan por origen y cada origen
+    resuelve todos sus destinos con una sola expansión.
+    
+    Request JSON:
+    {
+        "pares": [{"origen": {"lat", "lon"}, "destino": {"lat", "lon"}}, ...],
+        "peso": "tiempo", "velocidad_max": 60, "excluir": []
+    }
+    
+    Response JSON:
+    {
+        "rutas": [{...} | {"error": "..."}, ...],   // en el orden de los pares
+        "count": 120, "sin_ruta": 2
+    }
+    """
+    import time
+    start_time = time.time()
+    
+    try:
+        from services.grafo_vial import obtener_grafo_vial
         
-        limite_vehiculo = limites_vehiculos.get(vehiculo, 30)
-        factor_clima = factores_clima.get(clima, 1.0)
-        limite_efectivo = limite_vehiculo * factor_clima
-        
-        # Calcular % transitable (segmentos con pendiente <= límite)
-        segmentos_transitables = sum(1 for p in pendientes if p <= limite_efectivo)
-        pct_transitable = round((segmentos_transitables / total_segmentos) * 100, 1)
-        
-        print(f'✅ Transitabilidad: {pct_transitable}% (límite {limite_efectivo:.1f}°)')
-        
-        # ========================================================================
-        # PASO 7: Identificar puntos críticos (pendiente > límite)
-        # ========================================================================
-        puntos_criticos = []
-        for i, pendiente in enumerate(pendientes):
-            if pendiente > limite_efectivo:
-                p1 = valid_points[i]
-                p2 = valid_points[i + 1]
-                puntos_criticos.append({
-                    'lat': (p1['lat'] + p2['lat']) / 2,
-                    'lon': (p1['lon'] + p2['lon']) / 2,
-                    'pendiente': round(pendiente, 1),
-                    'limite': round(limite_efectivo, 1)
-                })
+        data = request.get_json(silent=True) or {}
+        try:
+            pares = [
+                ((float(p['origen']['lat']), float(p['origen']['lon'])),
+                 (float(p['destino']['lat']), float(p['destino']['lon'])))
+                for p in data.get('pares') or []
+            ]
+            parametros = _parametros_red_vial(data)
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': f'Parámetros inválidos: {e}'}), 400
+        if not pares:
+            return jsonify({'error': 'Se requiere al menos un par origen/destino'}), 400
+        if len(pares) > 2000:
+            return jsonify({'error': 'Máximo 2000 pares por consulta'}), 400
         
-        print(f'⚠️ {len(puntos_criticos)} puntos críticos')
+        try:
+            grafo = obtener_grafo_vial(os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina', 'Grafo_Vial'))
+        except FileNotFoundError as e:
+            return jsonify({'error': str(e)}), 404
         
-        # ========================================================================
-        # PASO 8: Retornar resultados
-        # ========================================================================
+        rutas = grafo.rutas_lote(pares, **parametros)
+        sin_ruta = sum(1 for r in rutas if 'error' in r)
         processing_time = time.time() - start_time
-        # ========================================================================
-        # 🎨 GENERAR PUNTOS_DETALLE PARA VISUALIZACIÓN
-        # ========================================================================
-        puntos_detalle = []
-        
-        # Iterar sobre los puntos con elevaciones válidas
-        for i in range(len(lats)):
-            if i < len(elevations):
-                lat = lats[i]
-                lon = lons[i]
-                elevation = elevations[i]
-                
-                # Calcular pendiente en este punto (promedio con vecinos)
-                pendiente_punto = 0.0
-                
-                if i > 0 and i < len(pendientes):
-                    # Promedio de pendiente con segmento anterior y siguiente
-                    count = 0
-                    if i - 1 < len(pendientes):
-                        pendiente_punto += pendientes[i - 1]
-                        count += 1
-                    if i < len(pendientes):
-                        pendiente_punto += pendientes[i]
-                        count += 1
-                    if count > 0:
-                        pendiente_punto = pendiente_punto / count
-                elif i < len(pendientes):
-                    pendiente_punto = pendientes[i]
-                
-                puntos_detalle.append({
-                    'lat': float(lat),
-                    'lon': float(lon),
-                    'elevation': float(elevation),
-                    'pendiente': round(float(pendiente_punto), 2),
-                    'ndvi': 0.0  # Se actualizará después con valores reales
-                })
+        print(f'🛣️ Lote vial: {len(rutas) - sin_ruta}/{len(rutas)} rutas en {processing_time:.2f}s')
+        return jsonify({
+            'success': True,
+            'rutas': rutas,
+            'count': len(rutas),
+            'sin_ruta': sin_ruta,
+            'processing_time': processing_time
+        })
+    
+    except Exception as e:
+        print(f'❌ Error calculando lote de rutas viales: {e}')
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'success': False}), 500
+
+
+# ===============================================================================
+# 📐 ENDPOINT: Estadísticas zonales por polígono
+# ===============================================================================
+
+@app.route('/api/terreno/estadisticas_zonales', methods=['POST'])
+def calcular_estadisticas_zonales():
+    """
+    Elevación, pendiente y NDVI agregados dentro de uno o más polígonos
+    (services/estadisticas_zonales.py).
+    
+    Request JSON:
+    {
+        "zonas": [
+            {"id": "S1", "poligono": [[lon, lat], ...]},   // anillo o coordenadas GeoJSON Polygon
+            <Feature Polygon>, ...
+        ],
+        "umbral_pendiente": 30,     // grados: % de celdas con pendiente >= umbral
+        "umbral_ndvi": 0.6          // % boscoso: celdas con NDVI >= umbral
+    }
+    
+    Response JSON:
+    {
+        "zonas": [{
+            "id": "S1", "celdas", "area_km2",
+            "elevacion": {"media", "min", "max", "desvio", "celdas_validas"},
+            "pendiente": {"media", "max", "umbral", "pct_sobre_umbral", "distribucion"},
+            "ndvi": {"media", "umbral", "pct_sobre_umbral", "celdas_validas"},
+            "tiles": {"completos", "borde"}
+        }, ...]
+    }
+    """
+    import time
+    start_time = time.time()
+    
+    try:
+        try:
+            import rasterio
+            from services.estadisticas_zonales import estadisticas_zonales
+            from services.analisis_terreno import catalogos_terreno, ErrorAnalisis
+            from services.pool_raster import pool_global
+        except ImportError:
+            return jsonify({
+                'error': 'rasterio no instalado',
+                'message': 'pip install rasterio'
+            }), 500
         
-        print(f'🎨 Puntos detalle generados: {len(puntos_detalle)}')
+        data = request.get_json(silent=True) or {}
+        zonas = data.get('zonas')
+        if not isinstance(zonas, list) or not zonas:
+            return jsonify({'error': 'Se requiere "zonas" con al menos un polígono'}), 400
+        if len(zonas) > 200:
+            return jsonify({'error': f'Máximo 200 zonas por llamada (recibidas {len(zonas)})'}), 400
         
-        # 🌿 INTEGRACIÓN NDVI - Obtener vegetación para todos los puntos
         try:
-            print(f'🌿 Obteniendo NDVI para {len(puntos_detalle)} puntos...')
-            
-            # Importaciones necesarias
-            from shapely.geometry import box
-            import rasterio
-            
-            # Preparar bounds del área
-            all_lats = [p['lat'] for p in puntos_detalle]
-            all_lons = [p['lon'] for p in puntos_detalle]
-            bounds_area = {
-                'north': max(all_lats),
-                'south': min(all_lats),
-                'east': max(all_lons),
-                'west': min(all_lons)
-            }
-            
-            # Cargar vegetation_master_index.json (estructura correcta)
-            vegetation_tiles_path = os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina', 'Vegetacion_Mini_Tiles')
-            master_index_path = os.path.join(vegetation_tiles_path, 'vegetation_master_index.json')
-            
-            if not os.path.exists(master_index_path):
-                print(f'⚠️ No existe {master_index_path}')
-                print(f'🔍 Buscando en: {os.path.abspath(master_index_path)}')
-                raise FileNotFoundError(f'Master index no encontrado')
-            
-            print(f'📖 Leyendo {master_index_path}')
-            with open(master_index_path, 'r', encoding='utf-8') as f:
-                master_index = json.load(f)
-            
-            # Filtrar tiles relevantes usando bounds
-            relevant_tiles = []
-            tiles_dict = master_index.get('tiles', {})
-            
-            for tile_id, tile_info in tiles_dict.items():
-                tile_bounds = tile_info.get('bounds', {})
-                if not tile_bounds:
-                    continue
-                
-                # Verificar intersección
-                if (tile_bounds['north'] >= bounds_area['south'] and
-                    tile_bounds['south'] <= bounds_area['north'] and
-                    tile_bounds['east'] >= bounds_area['west'] and
-                    tile_bounds['west'] <= bounds_area['east']):
-                    relevant_tiles.append(tile_info)
-            
-            print(f'🎯 {len(relevant_tiles)} tiles NDVI relevantes')
-            
-            # Cargar tiles
-            tile_cache = {}
-            for tile_info in relevant_tiles:
-                filename = tile_info.get('filename')
-                package = tile_info.get('package')
-                
-                if not filename or not package:
-                    continue
-                
-                tile_path = os.path.join(vegetation_tiles_path, package, filename)
-                
-                if os.path.exists(tile_path):
-                    try:
-                        src = rasterio.open(tile_path)
-                        tile_cache[filename] = {
-                            'src': src,
-                            'bounds': src.bounds,
-                            'info': tile_info
-                        }
-                    except Exception as e:
-                        print(f'⚠️ Error cargando {filename}: {e}')
-            
-            print(f'💾 {len(tile_cache)} tiles NDVI cargados')
-            
-            # Procesar cada punto para obtener NDVI
-            ndvi_count = 0
-            for idx, punto in enumerate(puntos_detalle):
-                lat = punto['lat']
-                lon = punto['lon']
-                
-                for tile_name, tile_info in tile_cache.items():
-                    src = tile_info['src']
-                    bounds = tile_info['bounds']
-                    
-                    # Verificar si punto está dentro del tile
-                    if bounds.left <= lon <= bounds.right and bounds.bottom <= lat <= bounds.top:
-                        try:
-                            py, px = src.index(lon, lat)
-                            if 0 <= py < src.height and 0 <= px < src.width:
-                                ndvi_value = float(src.read(1)[py, px])
-                                if ndvi_value != -9999:
-                                    # Normalizar si está en escala 0-255
-                                    if ndvi_value > 1:
-                                        ndvi_value = ndvi_value / 255.0
-                                    puntos_detalle[idx]['ndvi'] = round(ndvi_value, 3)
-                                    ndvi_count += 1
-                                    break
-                        except Exception as e:
-                            # Silencioso, continuar con siguiente tile
-                            pass
-            
-            # Cerrar tiles
-            for tile_info in tile_cache.values():
-                tile_info['src'].close()
-            
-            print(f'✅ NDVI integrado: {ndvi_count}/{len(puntos_detalle)} puntos con valores reales')
+            umbral_pendiente = float(data.get('umbral_pendiente', 30))
+            umbral_ndvi = float(data.get('umbral_ndvi', 0.6))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'Umbral inválido: {e}', 'success': False}), 400
         
-        except Exception as e:
-            print(f'⚠️ Error obteniendo NDVI (continuando con 0.0): {e}')
-            import traceback
-            traceback.print_exc()
+        datos_argentina = os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina')
+        try:
+            catalogo, catalogo_ndvi = catalogos_terreno(datos_argentina)
+            resultados = estadisticas_zonales(
+                catalogo, catalogo_ndvi, zonas,
+                umbral_pendiente=umbral_pendiente,
+                umbral_ndvi=umbral_ndvi,
+                pool=pool_global
+            )
+        except ErrorAnalisis as e:
+            return jsonify({'error': str(e), 'success': False}), e.status
+        except ValueError as e:
+            # Forma de las zonas o tope de tiles (services/estadisticas_zonales.py)
+            return jsonify({'error': f'Zona inválida: {e}', 'success': False}), 400
         
+        processing_time = time.time() - start_time
+        print(f'📐 Estadísticas zonales: {len(resultados)} zona(s) en {processing_time:.2f}s')
+        return jsonify({
+            'success': True,
+            'zonas': resultados,
+            'count': len(resultados),
+            'processing_time': processing_time
+        })
+    
+    except Exception as e:
+        print(f'❌ Error calculando estadísticas zonales: {e}')
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'success': False}), 500
 
+
+# ===============================================================================
+# 📚 ENDPOINT: Resumen de área desde los resúmenes precalculados de tiles
+# ===============================================================================
+
+@app.route('/api/terreno/resumen', methods=['POST'])
+def resumen_area_terreno():
+    """
+    Cota máxima/mínima, elevación y NDVI medios y cobertura de datos de un bbox,
+    respondidos con los resúmenes por tile (services/resumen_tiles.py) sin abrir
+    los GeoTIFF. Opcionalmente una vista general rows x cols (media y máximo).
+    
+    Request JSON:
+    {
+        "bbox": {"west": -62, "south": -39, "east": -60, "north": -37},
+        "vista": {"rows": 64, "cols": 64, "capa": "elevacion"}    // opcional (o "ndvi")
+    }
+    
+    Response JSON:
+    {
+        "elevacion": {"min", "max", "media", "celdas", "celdas_validas", "cobertura", "exacto", "tiles"},
+        "ndvi": {...} | null,
+        "vista": {"bbox", "rows", "cols", "nivel": "tile"|"bloque", "media": [[...]], "max": [[...]]}
+    }
+    """
+    import time
+    start_time = time.time()
+    
+    try:
+        from services.resumen_tiles import resumen_area, vista_general
+        from services.analisis_terreno import catalogos_terreno, ErrorAnalisis
+        from services.muestreo_raster import a_lista_json
+        import numpy as np
+        
+        data = request.get_json(silent=True) or {}
+        try:
+            bbox = {k: float(data['bbox'][k]) for k in ('west', 'south', 'east', 'north')}
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'Se requiere bbox con west, south, east, north'}), 400
         
-        resultado = {
+        datos_argentina = os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina')
+        try:
+            catalogo, catalogo_ndvi = catalogos_terreno(datos_argentina)
+        except ErrorAnalisis as e:
+            return jsonify({'error': str(e), 'success': False}), e.status
+        
+        respuesta = {
             'success': True,
-            'puntos_detalle': puntos_detalle,
-            'pendiente_promedio': round(pendiente_promedio, 1),
-            'pendiente_maxima': round(pendiente_maxima, 1),
-            'pendiente_minima': round(pendiente_minima, 1),
-            'pct_transitable': pct_transitable,
-            'distribucion_pendientes': distribucion_pendientes,
-            'puntos_criticos': puntos_criticos[:10],  # Máximo 10 para no saturar
-            'estadisticas': {
-                'puntos_analizados': len(valid_points),
-                'segmentos_calculados': total_segmentos,
-                'tiles_usados': len(tile_cache),
-                'vehiculo': vehiculo,
-                'clima': clima,
-                'limite_efectivo': round(limite_efectivo, 1),
-                'processing_time': round(processing_time, 2)
-            }
+            'elevacion': resumen_area(catalogo, bbox),
+            'ndvi': resumen_area(catalogo_ndvi, bbox) if catalogo_ndvi is not None else None
         }
         
-        print(f'🎉 Análisis completado en {processing_time:.2f}s')
-        
-        return jsonify(resultado)
+        if data.get('vista'):
+            vista = data['vista']
+            catalogo_vista = catalogo_ndvi if vista.get('capa') == 'ndvi' else catalogo
+            if catalogo_vista is None:
+                return jsonify({'error': 'No hay catálogo de vegetación'}), 404
+            try:
+                grillas = vista_general(catalogo_vista, bbox, vista.get('rows', 64), vista.get('cols', 64))
+            except (ValueError, TypeError) as e:
+                return jsonify({'error': str(e), 'success': False}), 400
+            decimales = 3 if vista.get('capa') == 'ndvi' else 1
+            grillas['media'] = a_lista_json(np.round(grillas['media'], decimales))
+            grillas['max'] = a_lista_json(np.round(grillas['max'], decimales))
+            respuesta['vista'] = grillas
+        
+        if respuesta['elevacion'] is None and respuesta['ndvi'] is None:
+            return jsonify({'error': 'No hay resúmenes de tiles para el área (tools/create_tile_summaries.py)',
+                            'success': False}), 404
+        
+        respuesta['processing_time'] = time.time() - start_time
+        return jsonify(respuesta)
     
     except Exception as e:
-        print(f'❌ Error en análisis de terreno: {e}')
+        print(f'❌ Error en resumen de área: {e}')
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e), 'success': False}), 500
 
 
+# 📊 ENDPOINT: Estadísticas de la cache de análisis de terreno
+@app.route('/api/terreno/cache_stats')
+def terreno_cache_stats():
+    """Contadores de los dos niveles de cache de /api/terreno/analizar, de las superficies de costo y de los parciales zonales"""
+    try:
+        from services.cache_terreno import cache_raster, cache_analisis
+        from services.rutas_terreno import cache_costos
+        from services.estadisticas_zonales import cache_zonal
+        return jsonify({
+            'raster': cache_raster.estadisticas(),
+            'analisis': cache_analisis.estadisticas(),
+            'costos_rutas': cache_costos.estadisticas(),
+            'zonal': cache_zonal.estadisticas()
+        })
+    except Exception as e:
+        print(f"❌ Error obteniendo estadísticas de cache: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 # ===============================================================================
 # 🗺️ ENDPOINT CAPAS GIS VECTORIALES (On-Demand)
 # ===============================================================================
@@ -3820,20 +4155,9 @@ def consultar_capas_gis():
         if not os.path.exists(master_index_path):
             return jsonify({'error': 'Master index de tiles GIS no encontrado. Ejecutar tools/create_gis_tiles.py'}), 500
         
-        with open(master_index_path, 'r', encoding='utf-8') as f:
-            master_index = json.load(f)
-        
-        # Encontrar tiles relevantes que intersectan con bounds
-        relevant_tiles = []
-        for tile_id, tile_info in master_index.get('tiles', {}).items():
-            tile_bounds = tile_info.get('bounds', {})
-            
-            # Verificar intersección
-            if (tile_bounds['north'] >= bounds['south'] and
-                tile_bounds['south'] <= bounds['north'] and
-                tile_bounds['east'] >= bounds['west'] and
-                tile_bounds['west'] <= bounds['east']):
-                relevant_tiles.append(tile_info)
+        # Catálogo en memoria: encontrar tiles relevantes que intersectan con bounds
+        from services.catalogo_tiles import obtener_catalogo
+        relevant_tiles = obtener_catalogo(master_index_path).buscar_bbox(bounds)
         
         print(f'🎯 {len(relevant_tiles)} tiles GIS relevantes para bounds especificados')
         
@@ -3959,6 +4283,13 @@ if __name__ == '__main__':
     print(f"💚 Health Check:            {protocol}://{host}:{port}/health")
     print("="*60 + "\n")
 
+    # 🛣️ Grafo vial por mmap: se abre al iniciar (las páginas se cargan a demanda)
+    try:
+        from services.grafo_vial import obtener_grafo_vial
+        obtener_grafo_vial(os.path.join(BASE_DIR, 'Client', 'Libs', 'datos_argentina', 'Grafo_Vial'))
+    except Exception as e:
+        print(f"⚠️ Grafo vial no disponible: {e}")
+
     try:
         if https_mode:
             # Verificar certificados SSL
@@ -12,6 +12,29 @@ Estructura:
 - clima_service.py: Sistema de clima progresivo
 - terreno_service.py: Análisis OCOKA de terreno
 - fallas_service.py: Estimación de fallas por MTBF
+- muestreo_raster.py: Muestreo vectorizado de tiles de altimetría/NDVI
+- pool_raster.py: Pool LRU de datasets y bandas decodificadas compartido
+- tiles_npy.py: Mini-tiles exportados a .npy crudos, leídos por np.memmap desde el pool
+- catalogo_tiles.py: Índices de tiles en memoria con hash de grilla espacial
+- formato_binario.py: Formato binario float32/float64 de los endpoints batch
+- grilla_muestreo.py: Grillas bbox + rows×cols/resolución con máscara de polígono
+- pendientes.py: Pendiente/orientación de Horn 3x3 y estadísticas de transitabilidad
+- pipeline_terreno.py: Muestreo único de elevación + pendiente + NDVI + clase de terreno
+- cache_terreno.py: Cache de dos niveles (rasters / resultado) del análisis de terreno
+- analisis_terreno.py: Análisis de pendientes/transitabilidad de un polígono
+- trabajos.py: Trabajos pesados en pool de procesos con progreso por Socket.IO
+- visibilidad.py: Cuencas visuales (barrido radial R2) y líneas de vista
+- perfil_elevacion.py: Perfiles de elevación de polilíneas densificadas en el servidor
+- rutas_terreno.py: Rutas campo traviesa de mínimo costo (A* sobre superficies de costo)
+- grafo_vial.py: Grafo vial CSR por mmap y rutas de convoy (Dijkstra bidireccional y por lotes)
+- estadisticas_zonales.py: Estadísticas zonales de elevación/pendiente/NDVI por polígono con parciales por tile
+- resumen_tiles.py: Resúmenes precalculados por tile (estadísticas y tablas de áreas sumadas) para consultas de área
+- archivo_tiles.py: .tar.gz de tiles con un miembro gzip por entrada e índice de offsets (extracción por Range)
+- extraccion_tiles.py: Single-flight por tile y desempaquetado único en segundo plano de cada archivo
+- almacen_tiles.py: Almacenes de tiles (archivos sueltos o MBTiles/SQLite), cache de lectura y paquetes de AO
+- cache_disco_tiles.py: Cache en disco de tiles de mapas base con cuotas, TTL y desalojo LRU/LFU
+- descarga_tiles.py: Descarga de tiles con sesiones keep-alive por proveedor, requests agrupados y tope de concurrencia
+- precarga_tiles.py: Precarga en segundo plano de tiles base, mini-tiles y tiles GIS del área de operaciones
 
 Autor: MAIRA Team
 Fecha: 2025-11-12
@@ -28,6 +51,29 @@ __author__ = "MAIRA Team"
 # from .clima_service import ClimaService
 # from .terreno_service import TerrenoService
 # from .fallas_service import FallasService
+from .muestreo_raster import muestrear_tiles, muestrear_dataset
+from .pool_raster import PoolRaster, pool_global
+from .tiles_npy import exportar_tile, abrir_npy
+from .catalogo_tiles import CatalogoTiles, obtener_catalogo, obtener_catalogo_nacional
+from .formato_binario import leer_puntos_request, respuesta_binaria
+from .grilla_muestreo import Grilla, muestrear_grilla
+from .pendientes import calcular_pendiente_horn, pendientes_grilla, pendientes_puntos
+from .pipeline_terreno import muestrear_terreno, ResultadoTerreno
+from .cache_terreno import CacheTTL, cache_raster, cache_analisis
+from .analisis_terreno import AnalisisTerreno, ErrorAnalisis
+from .trabajos import GestorTrabajos, gestor_trabajos
+from .visibilidad import cuenca_visual_observador, cuencas_combinadas, linea_de_vista
+from .perfil_elevacion import perfil_elevacion, leer_linea
+from .rutas_terreno import planificar_ruta, SinRuta
+from .grafo_vial import GrafoVial, obtener_grafo_vial, SinRutaVial
+from .estadisticas_zonales import estadisticas_zonales, cache_zonal
+from .resumen_tiles import ResumenIndice, resumen_area, vista_general
+from .archivo_tiles import escribir_tar_indexado, lector_archivo
+from .extraccion_tiles import extractor_tiles
+from .almacen_tiles import MBTiles, buscar_en_paquetes
+from .cache_disco_tiles import CacheDiscoTiles, obtener_cache_tiles
+from .descarga_tiles import DescargadorTiles, descargador_tiles, url_tile
+from .precarga_tiles import GestorPrecargas, gestor_precargas, leer_bbox
 
 __all__ = [
     # 'BajasService',
@@ -35,5 +81,58 @@ __all__ = [
     # 'IngenierosService',
     # 'ClimaService',
     # 'TerrenoService',
-    # 'FallasService'
+    # 'FallasService',
+    'muestrear_tiles',
+    'muestrear_dataset',
+    'PoolRaster',
+    'pool_global',
+    'exportar_tile',
+    'abrir_npy',
+    'CatalogoTiles',
+    'obtener_catalogo',
+    'obtener_catalogo_nacional',
+    'leer_puntos_request',
+    'respuesta_binaria',
+    'Grilla',
+    'muestrear_grilla',
+    'calcular_pendiente_horn',
+    'pendientes_grilla',
+    'pendientes_puntos',
+    'muestrear_terreno',
+    'ResultadoTerreno',
+    'CacheTTL',
+    'cache_raster',
+    'cache_analisis',
+    'AnalisisTerreno',
+    'ErrorAnalisis',
+    'GestorTrabajos',
+    'gestor_trabajos',
+    'cuenca_visual_observador',
+    'cuencas_combinadas',
+    'linea_de_vista',
+    'perfil_elevacion',
+    'leer_linea',
+    'planificar_ruta',
+    'SinRuta',
+    'GrafoVial',
+    'obtener_grafo_vial',
+    'SinRutaVial',
+    'estadisticas_zonales',
+    'cache_zonal',
+    'ResumenIndice',
+    'resumen_area',
+    'vista_general',
+    'escribir_tar_indexado',
+    'lector_archivo',
+    'extractor_tiles',
+    'MBTiles',
+    'buscar_en_paquetes',
+    'CacheDiscoTiles',
+    'obtener_cache_tiles',
+    'DescargadorTiles',
+    'descargador_tiles',
+    'url_tile',
+    'GestorPrecargas',
+    'gestor_precargas',
+    'leer_bbox',
 ]
@@ -0,0 +1,397 @@
+"""
+Almacenes de tiles: archivos sueltos o MBTiles (SQLite)
+
+La cache del proxy guardaba cada tile base como static/tiles/<proveedor>/
+{z}_{x}_{y}.{ext} en un único directorio plano, y crear_mini_tiles.py deja
+miles de TIFF sueltos: a escala, los lookups de directorio y los inodos son
+el cuello de botella, y llevar un área de operaciones (AO) a una notebook
+sin conexión eran 100k archivos. Este módulo da:
+
+- MBTiles: un archivo SQLite con el esquema MBTiles 1.3 (metadata + tiles
+  con filas TMS) en modo WAL y conexiones por hilo. Los tiles XYZ van a la
+  tabla `tiles`; los mini-tiles derivados (TIFF de altimetría/vegetación,
+  que no siguen la grilla XYZ) a la tabla extra `archivos`, por nombre
+  relativo a datos_argentina (p.ej. 'Altimetria_Mini_Tiles/centro/x.tif').
+  Los lectores MBTiles estándar ignoran esa tabla.
+- AlmacenArchivos / AlmacenMBTiles: el backend de bytes de CacheDiscoTiles
+  (cache_disco_tiles.py), elegido por entorno; con MBTiles cada proveedor
+  es un único static/tiles/<proveedor>.mbtiles.
+- CacheLectura: LRU en memoria por bytes para los tiles más pedidos.
+- Paquetes de AO: .mbtiles de solo lectura (tools/export_ao_mbtiles.py) que
+  el proxy y las rutas de mini-tiles consultan antes de ir a la red.
+
+Uso:
+-----
+    paquete = MBTiles('ao_bahia_blanca.mbtiles')
+    paquete.escribir('12_1380_2468.png', datos)
+    paquete.escribir('Altimetria_Mini_Tiles/centro/centro_tile_0001.tif', tif)
+    paquete.compactar()                    # un solo archivo, sin -wal/-shm
+
+    datos = buscar_en_paquetes('12_1380_2468.png', proveedor='osm')   # bytes o None
+
+Configuración:
+--------------
+- MAIRA_TILES_ALMACEN: backend de la cache de tiles base, 'archivos' o 'mbtiles' (archivos)
+- MAIRA_TILES_LECTURA_MB: cache de lectura en memoria por proceso (32)
+- MAIRA_TILES_PAQUETES: paquetes .mbtiles de AO separados por coma
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import re
+import glob
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+PATRON_XYZ = re.compile(r'^(\d+)_(\d+)_(\d+)\.(\w+)$')
+TAMANO_LOTE = 500   # filas por transacción al escribir o borrar en lote
+
+
+def nombre_xyz(nombre):
+    """(z, x, y, ext) de '{z}_{x}_{y}.{ext}', o None si no es un tile XYZ."""
+    coincidencia = PATRON_XYZ.match(nombre)
+    if coincidencia is None:
+        return None
+    z, x, y, ext = coincidencia.groups()
+    return int(z), int(x), int(y), ext
+
+
+class CacheLectura:
+    """LRU thread-safe de bytes en memoria, limitado por presupuesto"""
+
+    def __init__(self, presupuesto_mb=32):
+        self.presupuesto_bytes = int(presupuesto_mb * 1024 * 1024)
+        self._entradas = OrderedDict()   # clave -> (valor, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self._misses += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self._hits += 1
+            return entrada[0]
+
+    def poner(self, clave, valor, tamano):
+        if tamano > self.presupuesto_bytes // 8:
+            return  # un tile enorme no desaloja a todos los demás
+        with self._lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._entradas[clave] = (valor, tamano)
+            self._bytes += tamano
+            while self._bytes > self.presupuesto_bytes:
+                _, (_, liberado) = self._entradas.popitem(last=False)
+                self._bytes -= liberado
+
+    def descartar(self, clave):
+        with self._lock:
+            entrada = self._entradas.pop(clave, None)
+            if entrada is not None:
+                self._bytes -= entrada[1]
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def estadisticas(self):
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'entradas': len(self._entradas),
+                'bytes_en_uso': self._bytes,
+                'presupuesto_bytes': self.presupuesto_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / total, 3) if total else 0.0
+            }
+
+
+class MBTiles:
+    """Un archivo MBTiles (un proveedor o un paquete de AO) con conexiones SQLite por hilo"""
+
+    def __init__(self, ruta, solo_lectura=False):
+        self.ruta = ruta
+        self.solo_lectura = solo_lectura
+        self._local = threading.local()
+        if not solo_lectura:
+            os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+            db = self._conexion()
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript('''
+                CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT);
+                CREATE UNIQUE INDEX IF NOT EXISTS metadata_name ON metadata (name);
+                CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER,
+                                                  tile_row INTEGER, tile_data BLOB);
+                CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row);
+                CREATE TABLE IF NOT EXISTS archivos (nombre TEXT PRIMARY KEY, datos BLOB);
+            ''')
+
+    def _conexion(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            if self.solo_lectura:
+                db = sqlite3.connect(f'file:{os.path.abspath(self.ruta)}?mode=ro', uri=True,
+                                     timeout=10, check_same_thread=False)
+            else:
+                db = sqlite3.connect(self.ruta, timeout=10, check_same_thread=False, isolation_level=None)
+                db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    # ------------------------------------------------------------------
+    # Metadata
+    # ------------------------------------------------------------------
+    def metadata(self):
+        return dict(self._conexion().execute('SELECT name, value FROM metadata'))
+
+    def poner_metadata(self, **valores):
+        self._conexion().executemany(
+            'INSERT INTO metadata (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value',
+            [(nombre, str(valor)) for nombre, valor in valores.items()])
+
+    # ------------------------------------------------------------------
+    # Tiles por nombre: '{z}_{x}_{y}.{ext}' a `tiles`, el resto a `archivos`
+    # ------------------------------------------------------------------
+    def leer(self, nombre):
+        """Bytes del tile o None."""
+        xyz = nombre_xyz(nombre)
+        if xyz is None:
+            fila = self._conexion().execute('SELECT datos FROM archivos WHERE nombre = ?', (nombre,)).fetchone()
+        else:
+            z, x, y, _ = xyz
+            fila = self._conexion().execute(
+                'SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?',
+                (z, x, (1 << z) - 1 - y)).fetchone()
+        return bytes(fila[0]) if fila else None
+
+    def escribir(self, nombre, datos):
+        self.escribir_lote([(nombre, datos)])
+
+    def escribir_lote(self, pares):
+        """Escribe (nombre, bytes) en transacciones de TAMANO_LOTE; devuelve la cantidad."""
+        db = self._conexion()
+        cantidad = 0
+        lote = []
+        for par in pares:
+            lote.append(par)
+            if len(lote) >= TAMANO_LOTE:
+                cantidad += self._escribir(db, lote)
+                lote = []
+        if lote:
+            cantidad += self._escribir(db, lote)
+        return cantidad
+
+    def _escribir(self, db, lote):
+        tiles, archivos, formato = [], [], None
+        for nombre, datos in lote:
+            xyz = nombre_xyz(nombre)
+            if xyz is None:
+                archivos.append((nombre, sqlite3.Binary(datos)))
+            else:
+                z, x, y, formato = xyz
+                tiles.append((z, x, (1 << z) - 1 - y, sqlite3.Binary(datos)))
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if tiles:
+                db.executemany('INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) '
+                               'VALUES (?, ?, ?, ?)', tiles)
+                db.execute("INSERT OR IGNORE INTO metadata (name, value) VALUES ('format', ?)", (formato,))
+            if archivos:
+                db.executemany('INSERT OR REPLACE INTO archivos (nombre, datos) VALUES (?, ?)', archivos)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return len(lote)
+
+    def borrar(self, nombres):
+        tiles, archivos = [], []
+        for nombre in nombres:
+            xyz = nombre_xyz(nombre)
+            if xyz is None:
+                archivos.append((nombre,))
+            else:
+                z, x, y, _ = xyz
+                tiles.append((z, x, (1 << z) - 1 - y))
+        db = self._conexion()
+        db.execute('BEGIN IMMEDIATE')
+        db.executemany('DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?', tiles)
+        db.executemany('DELETE FROM archivos WHERE nombre = ?', archivos)
+        db.execute('COMMIT')
+
+    def listar(self):
+        """(nombre, bytes) de todo lo almacenado."""
+        db = self._conexion()
+        formato = self.metadata().get('format', 'png')
+        for z, columna, fila, tamano in db.execute(
+                'SELECT zoom_level, tile_column, tile_row, LENGTH(tile_data) FROM tiles'):
+            yield f'{z}_{columna}_{(1 << z) - 1 - fila}.{formato}', tamano
+        for nombre, tamano in db.execute('SELECT nombre, LENGTH(datos) FROM archivos'):
+            yield nombre, tamano
+
+    def contar(self):
+        db = self._conexion()
+        return {
+            'tiles': db.execute('SELECT COUNT(*) FROM tiles').fetchone()[0],
+            'archivos': db.execute('SELECT COUNT(*) FROM archivos').fetchone()[0]
+        }
+
+    def compactar(self):
+        """Vuelca el WAL y pasa a journal DELETE: el .mbtiles queda autocontenido para copiarlo."""
+        db = self._conexion()
+        db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        db.execute('PRAGMA journal_mode=DELETE')
+        db.execute('VACUUM')
+
+
+# ----------------------------------------------------------------------
+# Backends de bytes de CacheDiscoTiles
+# ----------------------------------------------------------------------
+class AlmacenArchivos:
+    """directorio/<proveedor>/<nombre>, un archivo por tile (layout histórico)"""
+
+    tipo = 'archivos'
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+
+    def ruta(self, proveedor, nombre):
+        return os.path.join(self.directorio, proveedor, nombre)
+
+    def leer(self, proveedor, nombre):
+        try:
+            with open(self.ruta(proveedor, nombre), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def escribir(self, proveedor, nombre, datos):
+        """Temporal + rename: nunca se lee un tile a medio escribir."""
+        ruta = self.ruta(proveedor, nombre)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporal, 'wb') as f:
+            f.write(datos)
+        os.replace(temporal, ruta)
+
+    def borrar(self, proveedor, nombres):
+        for nombre in nombres:
+            try:
+                os.remove(self.ruta(proveedor, nombre))
+            except FileNotFoundError:
+                pass
+
+    def listar(self):
+        """(proveedor, nombre, bytes, creado, acceso) de los tiles en disco."""
+        for proveedor in os.listdir(self.directorio):
+            carpeta = os.path.join(self.directorio, proveedor)
+            if not os.path.isdir(carpeta) or proveedor == 'data_argentina':
+                continue
+            for entrada in os.scandir(carpeta):
+                if entrada.is_file() and not entrada.name.endswith('.tmp'):
+                    info = entrada.stat()
+                    yield proveedor, entrada.name, info.st_size, info.st_mtime, info.st_atime
+
+
+class AlmacenMBTiles:
+    """directorio/<proveedor>.mbtiles, un tileset SQLite por proveedor"""
+
+    tipo = 'mbtiles'
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._tilesets = {}
+        self._lock = threading.Lock()
+
+    def tileset(self, proveedor):
+        with self._lock:
+            tileset = self._tilesets.get(proveedor)
+            if tileset is None:
+                tileset = MBTiles(os.path.join(self.directorio, f'{proveedor}.mbtiles'))
+                tileset.poner_metadata(name=proveedor, type='baselayer', maira_proveedor=proveedor)
+                self._tilesets[proveedor] = tileset
+            return tileset
+
+    def leer(self, proveedor, nombre):
+        return self.tileset(proveedor).leer(nombre)
+
+    def escribir(self, proveedor, nombre, datos):
+        self.tileset(proveedor).escribir(nombre, datos)
+
+    def borrar(self, proveedor, nombres):
+        self.tileset(proveedor).borrar(nombres)
+
+    def listar(self):
+        ahora = time.time()   # MBTiles no guarda fechas: los adoptados cuentan como recién bajados
+        for ruta in glob.glob(os.path.join(self.directorio, '*.mbtiles')):
+            proveedor = os.path.basename(ruta)[:-len('.mbtiles')]
+            for nombre, tamano in self.tileset(proveedor).listar():
+                yield proveedor, nombre, tamano, ahora, ahora
+
+
+def crear_almacen(tipo, directorio):
+    """AlmacenArchivos o AlmacenMBTiles según `tipo`."""
+    if tipo == 'mbtiles':
+        return AlmacenMBTiles(directorio)
+    if tipo == 'archivos':
+        return AlmacenArchivos(directorio)
+    raise ValueError(f'Almacén de tiles desconocido: {tipo}')
+
+
+# ----------------------------------------------------------------------
+# Paquetes de AO de solo lectura
+# ----------------------------------------------------------------------
+_paquetes = None
+_paquetes_lock = threading.Lock()
+_lectura_paquetes = CacheLectura(float(os.getenv('MAIRA_TILES_LECTURA_MB', '32')))
+
+
+def obtener_paquetes():
+    """[(MBTiles, proveedor)] de los paquetes de MAIRA_TILES_PAQUETES que existen."""
+    global _paquetes
+    with _paquetes_lock:
+        if _paquetes is None:
+            _paquetes = []
+            for ruta in filter(None, (r.strip() for r in os.getenv('MAIRA_TILES_PAQUETES', '').split(','))):
+                if not os.path.exists(ruta):
+                    print(f'⚠️ Paquete de tiles no encontrado: {ruta}')
+                    continue
+                paquete = MBTiles(ruta, solo_lectura=True)
+                _paquetes.append((paquete, paquete.metadata().get('maira_proveedor')))
+                print(f'🗃️ Paquete de tiles: {os.path.basename(ruta)} ({paquete.contar()})')
+        return _paquetes
+
+
+def buscar_en_paquetes(nombre, proveedor=None):
+    """
+    Bytes de `nombre` en los paquetes de AO, o None. Los tiles XYZ solo se
+    buscan en paquetes del mismo proveedor; los mini-tiles en todos.
+    """
+    paquetes = obtener_paquetes()
+    if not paquetes:
+        return None
+    xyz = nombre_xyz(nombre) is not None
+    clave = (proveedor if xyz else None, nombre)
+    datos = _lectura_paquetes.obtener(clave)
+    if datos is not None:
+        return datos
+    for paquete, proveedor_paquete in paquetes:
+        if xyz and proveedor_paquete != proveedor:
+            continue
+        datos = paquete.leer(nombre)
+        if datos is not None:
+            _lectura_paquetes.poner(clave, datos, len(datos))
+            return datos
+    return None
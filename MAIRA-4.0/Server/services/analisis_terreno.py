@@ -0,0 +1,319 @@
+"""
+Análisis de terreno de un polígono: pendientes, transitabilidad y detalle
+
+Lógica de /api/terreno/analizar separada del endpoint para poder correrla
+en el hilo del request (polígonos chicos o con rasters en cache) o como
+trabajo en el pool de procesos (trabajos.py) con progreso por tile.
+
+Pasos: grilla sobre el polígono -> pipeline de terreno (pipeline_terreno.py)
+-> estadísticas por vehículo/clima -> detalle por celda serializado una vez.
+Las respuestas se arman con los dos niveles de cache_terreno.py.
+
+Uso:
+-----
+    analisis = AnalisisTerreno.desde_request(data, request, datos_argentina)
+    cuerpo, raster_hit, analisis_hit = analisis.ejecutar(pool=pool_global)
+
+    # En el pool de procesos (trabajos.py)
+    trabajo = gestor_trabajos.enviar('analisis_terreno', trabajo_analisis,
+                                     analisis.parametros(), al_terminar=analisis.guardar_trabajo)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import time
+
+import numpy as np
+
+from .grilla_muestreo import Grilla, leer_grilla_request
+from .pendientes import estadisticas_pendientes, puntos_criticos
+from .pipeline_terreno import muestrear_terreno, nombres_clase
+from .muestreo_raster import a_lista_json
+from .catalogo_tiles import obtener_catalogo, obtener_catalogo_nacional
+from .cache_terreno import (
+    cache_raster, cache_analisis, cuantizar_poligono, clave_raster, clave_analisis,
+    bytes_resultado, json_fragmento, componer_json
+)
+
+# Límites de pendiente por vehículo (en grados)
+LIMITES_VEHICULOS = {
+    'TAM': 30,          # Tanque Argentino Mediano
+    'VCLC': 25,         # Vehículo de Combate Ligero
+    'M113': 20,         # Transporte Personal
+    'infanteria': 45,   # Infantería a pie
+    'camion': 15        # Camión logístico
+}
+
+# Factor de clima (multiplica el límite)
+FACTORES_CLIMA = {
+    'seco': 1.0,
+    'humedo': 0.8,      # Reduce 20% el límite
+    'inundado': 0.6     # Reduce 40% el límite
+}
+
+
+class ErrorAnalisis(Exception):
+    """Error del análisis con el status HTTP que corresponde devolver"""
+
+    def __init__(self, mensaje, status=500):
+        super().__init__(mensaje)
+        self.status = status
+
+
+def limite_pendiente(vehiculo, clima):
+    """Pendiente máxima transitable (grados) para el vehículo y el clima."""
+    return LIMITES_VEHICULOS.get(vehiculo, 30) * FACTORES_CLIMA.get(clima, 1.0)
+
+
+def catalogos_terreno(datos_argentina):
+    """
+    (catalogo_dem, catalogo_ndvi); sin índice de vegetación el NDVI queda en None.
+
+    Raises:
+        ErrorAnalisis 404 si no hay índices de altimetría
+    """
+    try:
+        catalogo = obtener_catalogo_nacional(os.path.join(datos_argentina, 'Altimetria_Mini_Tiles'))
+    except FileNotFoundError as e:
+        raise ErrorAnalisis(str(e), 404)
+
+    ruta_ndvi = os.path.join(datos_argentina, 'Vegetacion_Mini_Tiles', 'vegetation_master_index.json')
+    try:
+        catalogo_ndvi = obtener_catalogo(ruta_ndvi)
+    except FileNotFoundError:
+        print(f'⚠️ No existe {ruta_ndvi} (continuando con NDVI 0.0)')
+        catalogo_ndvi = None
+    return catalogo, catalogo_ndvi
+
+
+def muestrear_poligono(grilla, catalogo, catalogo_ndvi, pool=None, progreso=None):
+    """
+    Pipeline de terreno bajo la grilla, validado.
+
+    Raises:
+        ErrorAnalisis si no hay tiles o elevaciones suficientes
+    """
+    terreno = muestrear_terreno(catalogo, catalogo_ndvi, grilla=grilla, pool=pool, progreso=progreso)
+    print(f'💾 {terreno.tiles_dem} tiles DEM, {terreno.tiles_ndvi} tiles NDVI muestreados')
+
+    if terreno.tiles_dem == 0:
+        raise ErrorAnalisis('No se encontraron tiles para el área seleccionada', 404)
+    if np.count_nonzero(~np.isnan(terreno.elevacion)) < 2:
+        raise ErrorAnalisis('No se pudieron obtener suficientes elevaciones del área', 500)
+    return terreno
+
+
+def derivar_resultado(terreno, grilla, vehiculo, clima):
+    """
+    Estadísticas, distribución, transitabilidad y puntos críticos para un
+    vehículo/clima. Barato: solo opera sobre los arrays ya muestreados.
+    """
+    limite_efectivo = limite_pendiente(vehiculo, clima)
+
+    stats = estadisticas_pendientes(terreno.pendiente, limite_efectivo)
+    if stats is None:
+        raise ErrorAnalisis('No se pudieron calcular pendientes', 500)
+    print(f'✅ Transitabilidad: {stats["pct_transitable"]}% (límite {limite_efectivo:.1f}°)')
+
+    # Las celdas más empinadas sobre el límite
+    criticos = puntos_criticos(terreno.lons, terreno.lats, terreno.pendiente,
+                               terreno.orientacion, limite_efectivo)
+
+    return {
+        'success': True,
+        'pendiente_promedio': round(stats['promedio'], 1),
+        'pendiente_maxima': round(stats['maxima'], 1),
+        'pendiente_minima': round(stats['minima'], 1),
+        'pct_transitable': stats['pct_transitable'],
+        'distribucion_pendientes': stats['distribucion'],
+        'puntos_criticos': criticos,  # Máximo 10 para no saturar
+        'grilla': grilla.metadata(),
+        'estadisticas': {
+            'puntos_analizados': int(np.count_nonzero(~np.isnan(terreno.elevacion))),
+            'celdas_con_pendiente': stats['celdas'],
+            'tiles_usados': terreno.tiles_dem,
+            'tiles_ndvi_usados': terreno.tiles_ndvi,
+            'vehiculo': vehiculo,
+            'clima': clima,
+            'limite_efectivo': round(limite_efectivo, 1)
+        }
+    }
+
+
+def serializar_detalle(terreno):
+    """puntos_detalle (una entrada por celda con elevación) serializado una sola vez."""
+    validos = ~np.isnan(terreno.elevacion)
+    ndvi = terreno.ndvi if terreno.ndvi is not None else np.zeros(len(terreno))
+
+    puntos_detalle = [
+        {
+            'lat': lat,
+            'lon': lon,
+            'elevation': elevation,
+            'pendiente': pendiente,
+            'orientacion': orientacion,
+            'ndvi': 0.0 if ndvi_punto is None else ndvi_punto,
+            'clase': clase
+        }
+        for lat, lon, elevation, pendiente, orientacion, ndvi_punto, clase in zip(
+            terreno.lats[validos].tolist(),
+            terreno.lons[validos].tolist(),
+            terreno.elevacion[validos].tolist(),
+            np.round(terreno.pendiente[validos], 2).tolist(),
+            a_lista_json(np.round(terreno.orientacion[validos])),
+            a_lista_json(np.round(ndvi[validos], 3)),
+            nombres_clase(terreno.clase[validos])
+        )
+    ]
+    print(f'🎨 Puntos detalle generados: {len(puntos_detalle)}')
+    return json_fragmento(puntos_detalle)
+
+
+class AnalisisTerreno:
+    """Parámetros de un análisis y su resolución contra la cache de dos niveles"""
+
+    def __init__(self, poligono, grilla, vehiculo, clima, capas, datos_argentina):
+        self.poligono = poligono
+        self.grilla = grilla
+        self.vehiculo = vehiculo
+        self.clima = clima
+        self.capas = capas
+        self.datos_argentina = datos_argentina
+        self.catalogo, self.catalogo_ndvi = catalogos_terreno(datos_argentina)
+        self.clave = clave_raster(poligono, grilla, self.catalogo, self.catalogo_ndvi)
+        self.clave_respuesta = clave_analisis(self.clave, vehiculo, clima, capas)
+
+    @classmethod
+    def desde_request(cls, data, request, datos_argentina):
+        """
+        Valida el JSON de /api/terreno/analizar y arma la grilla.
+
+        Raises:
+            ErrorAnalisis 400/404 ante datos inválidos o sin índices
+        """
+        if not data or 'poligono' not in data:
+            raise ErrorAnalisis('Se requiere poligono en formato GeoJSON', 400)
+
+        # Cuantizado (~1 m) para que la grilla y la clave de cache coincidan
+        # entre requests que difieren solo por ruido de coordenadas
+        poligono = cuantizar_poligono(data['poligono'])
+        if len(poligono) == 0 or len(poligono[0]) < 3:
+            raise ErrorAnalisis('El polígono debe tener al menos 3 puntos', 400)
+
+        # Con {"grilla": {...}} la define el cliente; si no, se arma con la
+        # resolución pedida (100m por defecto). La pendiente de Horn necesita
+        # una grilla regular: la lista "puntos" de clientes viejos ya no se usa.
+        try:
+            grilla = leer_grilla_request(request, poligono=poligono)
+            if grilla is None:
+                grilla = Grilla.desde_spec({'resolucion': data.get('resolucion', 100)}, poligono=poligono)
+        except ValueError as e:
+            raise ErrorAnalisis(str(e), 400)
+
+        if not grilla.mascara.any():
+            raise ErrorAnalisis('El polígono no contiene celdas de la grilla', 400)
+
+        return cls(
+            poligono, grilla,
+            data.get('vehiculo', 'TAM'),
+            data.get('clima', 'seco'),
+            data.get('capas', {'pendientes': True, 'transitabilidad': True}),
+            datos_argentina
+        )
+
+    @property
+    def rasters_en_cache(self):
+        return self.clave in cache_raster
+
+    def parametros(self):
+        """Dict picklable para correr el análisis en otro proceso (trabajo_analisis)."""
+        return {
+            'poligono': self.poligono,
+            'bbox': self.grilla.bbox,
+            'rows': self.grilla.rows,
+            'cols': self.grilla.cols,
+            'vehiculo': self.vehiculo,
+            'clima': self.clima,
+            'datos_argentina': self.datos_argentina
+        }
+
+    def ejecutar(self, pool=None, progreso=None):
+        """
+        Resuelve el análisis usando los dos niveles de cache.
+
+        Returns:
+            (cuerpo_json_bytes, raster_hit, analisis_hit)
+        """
+        start_time = time.time()
+
+        entrada = cache_raster.obtener(self.clave)
+        raster_hit = entrada is not None
+        if raster_hit:
+            terreno, detalle = entrada
+            print('⚡ Rasters del polígono desde cache')
+        else:
+            terreno = muestrear_poligono(self.grilla, self.catalogo, self.catalogo_ndvi,
+                                         pool=pool, progreso=progreso)
+            detalle = None
+
+        resultado = cache_analisis.obtener(self.clave_respuesta)
+        analisis_hit = resultado is not None
+        if not analisis_hit:
+            resultado = derivar_resultado(terreno, self.grilla, self.vehiculo, self.clima)
+            self._guardar_resultado(resultado)
+
+        if detalle is None:
+            detalle = serializar_detalle(terreno)
+            self._guardar_rasters(terreno, detalle)
+
+        return self.componer(resultado, detalle, time.time() - start_time), raster_hit, analisis_hit
+
+    def guardar_trabajo(self, salida):
+        """
+        Callback de fin de trabajo: cachea lo calculado en el proceso hijo y
+        devuelve el cuerpo final de la respuesta.
+        """
+        terreno, detalle, resultado, processing_time = salida
+        self._guardar_rasters(terreno, detalle)
+        self._guardar_resultado(resultado)
+        return self.componer(resultado, detalle, processing_time)
+
+    def _guardar_rasters(self, terreno, detalle):
+        cache_raster.guardar(self.clave, (terreno, detalle), bytes_resultado(terreno) + len(detalle))
+
+    def _guardar_resultado(self, resultado):
+        cache_analisis.guardar(self.clave_respuesta, resultado, len(json_fragmento(resultado)))
+
+    @staticmethod
+    def componer(resultado, detalle, processing_time):
+        """Cuerpo JSON final: resultado del vehículo/clima + detalle ya serializado."""
+        print(f'🎉 Análisis completado en {processing_time:.2f}s')
+        resultado = dict(resultado, estadisticas=dict(resultado['estadisticas'],
+                                                      processing_time=round(processing_time, 2)))
+        return componer_json(resultado, puntos_detalle=detalle)
+
+
+def trabajo_analisis(parametros, progreso=None):
+    """
+    Análisis completo sin cache para el pool de procesos (trabajos.py).
+    Los catálogos y el pool de rasters son los del proceso hijo.
+
+    Returns:
+        (terreno, detalle_json, resultado, processing_time)
+    """
+    from .pool_raster import pool_global
+
+    start_time = time.time()
+    grilla = Grilla(parametros['bbox'], parametros['rows'], parametros['cols'], parametros['poligono'])
+    catalogo, catalogo_ndvi = catalogos_terreno(parametros['datos_argentina'])
+
+    terreno = muestrear_poligono(grilla, catalogo, catalogo_ndvi, pool=pool_global, progreso=progreso)
+    if progreso is not None:
+        progreso(90, 'estadisticas')
+    resultado = derivar_resultado(terreno, grilla, parametros['vehiculo'], parametros['clima'])
+    if progreso is not None:
+        progreso(95, 'detalle')
+    detalle = serializar_detalle(terreno)
+    return terreno, detalle, resultado, time.time() - start_time
@@ -0,0 +1,211 @@
+"""
+Archivos .tar.gz de tiles con índice de offsets para leer un miembro suelto
+
+Un .tar.gz común es un único stream gzip: para sacar un tile hay que bajar y
+descomprimir todo el archivo hasta encontrarlo. Acá cada entrada del tar
+(cabecera + datos + relleno) se comprime como un miembro gzip propio y los
+miembros se concatenan. El resultado sigue siendo un .tar.gz válido (tar,
+Python y pako leen gzip multi-miembro), así que los clientes que bajan el
+archivo entero no cambian; y un sidecar archivo.tar.gz.idx.json guarda por
+entrada dónde empieza su miembro gzip y cuánto mide, para pedir solo esos
+bytes con un Range HTTP o un seek local.
+
+archivo.tar.gz.idx.json:
+    {"formato": "tar.gz-indexado", "version": 1,
+     "miembros": {"centro/tile_0001.tif": [offset, longitud, cabecera, tamano]}}
+- offset, longitud: bytes del miembro gzip dentro del .tar.gz
+- cabecera: bytes de cabecera tar antes de los datos (ya descomprimidos)
+- tamano: bytes del archivo
+
+Uso:
+-----
+    escribir_tar_indexado('centro_part_01.tar.gz', [(ruta_local, 'centro/tile_0001.tif'), ...])
+
+    lector = lector_archivo('https://.../maira_altimetria_tiles.tar.gz')  # o ruta local
+    if lector.indice() is not None:
+        lector.extraer('centro/tile_0001.tif', destino)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import gzip
+import json
+import time
+import zlib
+import tarfile
+import threading
+from contextlib import contextmanager
+
+FORMATO_INDICE = 'tar.gz-indexado'
+NIVEL_GZIP = 6
+TIMEOUT_HTTP = 60
+
+
+def ruta_indice(archivo):
+    return archivo + '.idx.json'
+
+
+def _gzip(datos):
+    compresor = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)
+    return compresor.compress(datos) + compresor.flush()
+
+
+def escribir_tar_indexado(ruta_salida, miembros):
+    """
+    Escribe un .tar.gz con un miembro gzip por entrada y su índice al lado.
+
+    Args:
+        ruta_salida: ruta del .tar.gz
+        miembros: iterable de (ruta_local o bytes, nombre_en_el_tar)
+
+    Returns:
+        dict del índice (también guardado en ruta_salida + '.idx.json')
+    """
+    indice = {}
+    offset = 0
+    with open(ruta_salida, 'wb') as salida:
+        for fuente, nombre in miembros:
+            if isinstance(fuente, (bytes, bytearray)):
+                datos, mtime = bytes(fuente), time.time()
+            else:
+                with open(fuente, 'rb') as f:
+                    datos = f.read()
+                mtime = os.path.getmtime(fuente)
+            info = tarfile.TarInfo(nombre)
+            info.size = len(datos)
+            info.mtime = int(mtime)
+            info.mode = 0o644
+            cabecera = info.tobuf(format=tarfile.PAX_FORMAT)
+            relleno = b'\0' * (-len(datos) % tarfile.BLOCKSIZE)
+
+            miembro = _gzip(cabecera + datos + relleno)
+            salida.write(miembro)
+            indice[nombre] = [offset, len(miembro), len(cabecera), len(datos)]
+            offset += len(miembro)
+
+        # Fin de archivo tar: dos bloques en cero, también como miembro propio
+        salida.write(_gzip(b'\0' * (2 * tarfile.BLOCKSIZE)))
+
+    temporal = ruta_indice(ruta_salida) + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump({'formato': FORMATO_INDICE, 'version': 1, 'miembros': indice}, f)
+    os.replace(temporal, ruta_indice(ruta_salida))
+    return indice
+
+
+@contextmanager
+def abrir_stream(fuente):
+    """
+    TarFile de lectura secuencial ('r|') de un .tar.gz local o remoto, sin
+    cargarlo en memoria. GzipFile en lugar de 'r|gz' porque el modo stream de
+    tarfile corta en el primer miembro gzip de los archivos indexados.
+    """
+    if fuente.startswith(('http://', 'https://')):
+        import requests
+        respuesta = requests.get(fuente, stream=True, timeout=300)
+        respuesta.raise_for_status()
+        origen = respuesta.raw
+    else:
+        origen = open(fuente, 'rb')
+    with origen, gzip.GzipFile(fileobj=origen, mode='rb') as descomprimido:
+        with tarfile.open(fileobj=descomprimido, mode='r|') as tar:
+            yield tar
+
+
+class LectorArchivo:
+    """Lee miembros sueltos de un .tar.gz indexado local o remoto (HTTP Range)"""
+
+    def __init__(self, fuente):
+        self.fuente = fuente
+        self.remoto = fuente.startswith(('http://', 'https://'))
+        self._indice = None
+        self._cargado = False
+        self._lock = threading.Lock()
+
+    def indice(self):
+        """{nombre: [offset, longitud, cabecera, tamano]} o None si el archivo no tiene índice."""
+        with self._lock:
+            if not self._cargado:
+                self._indice = self._cargar_indice()
+                self._cargado = True
+            return self._indice
+
+    def _cargar_indice(self):
+        try:
+            if self.remoto:
+                import requests
+                respuesta = requests.get(ruta_indice(self.fuente), timeout=TIMEOUT_HTTP)
+                if respuesta.status_code == 404:
+                    return None
+                respuesta.raise_for_status()
+                datos = respuesta.json()
+            else:
+                with open(ruta_indice(self.fuente), 'r', encoding='utf-8') as f:
+                    datos = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        if datos.get('formato') != FORMATO_INDICE:
+            print(f'⚠️ Índice con formato desconocido: {ruta_indice(self.fuente)}')
+            return None
+        print(f'🗂️ Índice de archivo cargado: {os.path.basename(self.fuente)} ({len(datos["miembros"])} miembros)')
+        return datos['miembros']
+
+    def buscar(self, nombre):
+        """Nombre del miembro que corresponde a `nombre` (exacto o por sufijo de ruta), o None."""
+        miembros = self.indice() or {}
+        if nombre in miembros:
+            return nombre
+        for candidato in miembros:
+            if candidato.endswith('/' + nombre):
+                return candidato
+        return None
+
+    def _leer_rango(self, offset, longitud):
+        if not self.remoto:
+            with open(self.fuente, 'rb') as f:
+                f.seek(offset)
+                return f.read(longitud)
+
+        import requests
+        with requests.get(self.fuente, timeout=TIMEOUT_HTTP, stream=True,
+                          headers={'Range': f'bytes={offset}-{offset + longitud - 1}'}) as respuesta:
+            # Un 200 significa que el servidor ignoró el Range: no bajar el archivo entero
+            if respuesta.status_code != 206:
+                raise IOError(f'{self.fuente} no respondió al Range (HTTP {respuesta.status_code})')
+            return respuesta.content
+
+    def leer(self, nombre):
+        """Bytes del miembro `nombre` (ver buscar()). KeyError si no está en el índice."""
+        encontrado = self.buscar(nombre)
+        if encontrado is None:
+            raise KeyError(nombre)
+        offset, longitud, cabecera, tamano = self.indice()[encontrado]
+        entrada = zlib.decompress(self._leer_rango(offset, longitud), 31)
+        return entrada[cabecera:cabecera + tamano]
+
+    def extraer(self, nombre, destino):
+        """Escribe el miembro en `destino` (atómico: temporal + rename)."""
+        datos = self.leer(nombre)
+        os.makedirs(os.path.dirname(destino) or '.', exist_ok=True)
+        temporal = f'{destino}.{os.getpid()}.tmp'
+        with open(temporal, 'wb') as f:
+            f.write(datos)
+        os.replace(temporal, destino)
+        return len(datos)
+
+
+_lectores = {}
+_lectores_lock = threading.Lock()
+
+
+def lector_archivo(fuente):
+    """LectorArchivo del proceso para una ruta o URL (el índice se baja una vez)."""
+    with _lectores_lock:
+        lector = _lectores.get(fuente)
+        if lector is None:
+            lector = LectorArchivo(fuente)
+            _lectores[fuente] = lector
+        return lector
@@ -0,0 +1,295 @@
+"""
+Cache en disco de tiles de mapas base con cuota de bytes y desalojo LRU/LFU
+
+El proxy /tiles/<provider>/... guardaba cada tile bajado en
+static/tiles/<provider>/ para siempre, y la única limpieza era borrar todo.
+Esta cache mantiene los tiles con un índice SQLite al lado (proveedor,
+nombre, bytes, creado, último acceso, hits):
+
+- Cuota total y cuotas por proveedor; al pasarse desaloja por último acceso
+  (LRU) o por cantidad de hits (LFU) hasta bajar al 90 % de la cuota.
+- TTL por proveedor: un tile vencido se sigue sirviendo mientras se renueva
+  en segundo plano (descarga_tiles.py).
+- Los accesos se acumulan en memoria y se escriben al índice por lotes, así
+  un hit no es una escritura en SQLite. El índice está en modo WAL y lo
+  comparten los workers del mismo servidor.
+- Los tiles que ya estaban en disco antes del índice se adoptan al abrirlo.
+- Los bytes van a un almacén de almacen_tiles.py: archivos sueltos por
+  proveedor o un único <proveedor>.mbtiles; los más pedidos se sirven desde
+  una cache de lectura en memoria.
+
+Uso:
+-----
+    cache = obtener_cache_tiles(tiles_cache_dir)
+    en_cache = cache.leer('osm', '12_1380_2468.png')   # (bytes, vencido) o None
+    if en_cache is None:
+        cache.guardar('osm', '12_1380_2468.png', datos)
+
+Configuración:
+--------------
+- MAIRA_TILES_CACHE_MB: cuota total en disco (2048)
+- MAIRA_TILES_CACHE_CUOTAS: cuotas por proveedor en MB, p.ej. "osm=512,satellite=1024"
+- MAIRA_TILES_CACHE_TTL_H: horas de vida de un tile (720)
+- MAIRA_TILES_CACHE_TTLS: TTL por proveedor en horas, p.ej. "osm=168"
+- MAIRA_TILES_CACHE_POLITICA: 'lru' o 'lfu' (lru)
+- MAIRA_TILES_ALMACEN: 'archivos' o 'mbtiles' (archivos)
+- MAIRA_TILES_LECTURA_MB: cache de lectura en memoria (32)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+from .almacen_tiles import CacheLectura, crear_almacen
+
+NOMBRE_INDICE = '.cache_tiles.sqlite3'
+NOMBRE_INDICE_MBTILES = '.cache_tiles_mbtiles.sqlite3'   # índice propio: cambiar de almacén arranca vacío
+FRACCION_OBJETIVO = 0.9     # desalojar hasta el 90 % de la cuota
+LOTE_ACCESOS = 256          # accesos acumulados antes de escribir al índice
+INTERVALO_ACCESOS = 10      # o segundos desde la última escritura
+
+
+def _leer_pares(texto):
+    """'osm=512,satellite=1024' -> {'osm': 512.0, 'satellite': 1024.0}"""
+    pares = {}
+    for parte in (texto or '').split(','):
+        if '=' in parte:
+            clave, valor = parte.split('=', 1)
+            pares[clave.strip()] = float(valor)
+    return pares
+
+
+class CacheDiscoTiles:
+    """Tiles de mapas base por proveedor en un almacén en disco, con índice SQLite de accesos"""
+
+    def __init__(self, directorio, cuota_mb=2048, cuotas_mb=None, ttl_horas=720,
+                 ttls_horas=None, politica='lru', almacen='archivos', lectura_mb=32):
+        self.directorio = directorio
+        self.almacen = crear_almacen(almacen, directorio)
+        self.cuota_bytes = int(cuota_mb * 1024 * 1024)
+        self.cuotas_bytes = {p: int(mb * 1024 * 1024) for p, mb in (cuotas_mb or {}).items()}
+        self.ttl = ttl_horas * 3600
+        self.ttls = {p: horas * 3600 for p, horas in (ttls_horas or {}).items()}
+        self.politica = politica
+
+        self._lock = threading.Lock()
+        self._accesos = {}            # (proveedor, nombre) -> (último acceso, hits nuevos)
+        self._ultima_escritura = time.time()
+        self._bytes_sin_chequear = 0
+        self._lectura = CacheLectura(lectura_mb)
+
+        self._hits = 0
+        self._misses = 0
+        self._vencidos = 0
+        self._guardados = 0
+        self._desalojos = 0
+
+        os.makedirs(directorio, exist_ok=True)
+        indice = NOMBRE_INDICE_MBTILES if self.almacen.tipo == 'mbtiles' else NOMBRE_INDICE
+        self._db = sqlite3.connect(os.path.join(directorio, indice),
+                                   timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS tiles (
+            proveedor TEXT NOT NULL, nombre TEXT NOT NULL, bytes INTEGER NOT NULL,
+            creado REAL NOT NULL, acceso REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (proveedor, nombre))''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS tiles_acceso ON tiles (proveedor, acceso)')
+        with self._lock:
+            if self._db.execute('SELECT COUNT(*) FROM tiles').fetchone()[0] == 0:
+                self._adoptar_existentes()
+            self._desalojar()
+
+    def ttl_proveedor(self, proveedor):
+        return self.ttls.get(proveedor, self.ttl)
+
+    def _creado(self, proveedor, nombre):
+        with self._lock:
+            fila = self._db.execute('SELECT creado FROM tiles WHERE proveedor = ? AND nombre = ?',
+                                    (proveedor, nombre)).fetchone()
+        return fila[0] if fila else None
+
+    def vigente(self, proveedor, nombre):
+        """True si el tile está y no venció; no cuenta como acceso (precargas)."""
+        creado = self._creado(proveedor, nombre)
+        return creado is not None and time.time() - creado <= self.ttl_proveedor(proveedor)
+
+    def leer(self, proveedor, nombre):
+        """
+        (bytes, vencido) del tile, o None si no está.
+        Un tile vencido se puede servir mientras se renueva.
+        """
+        clave = (proveedor, nombre)
+        entrada = self._lectura.obtener(clave)
+        if entrada is None:
+            creado = self._creado(proveedor, nombre)
+            datos = self.almacen.leer(proveedor, nombre) if creado is not None else None
+            if datos is None:
+                with self._lock:
+                    self._misses += 1
+                return None
+            entrada = (datos, creado)
+            self._lectura.poner(clave, entrada, len(datos))
+        datos, creado = entrada
+
+        ahora = time.time()
+        vencido = ahora - creado > self.ttl_proveedor(proveedor)
+        with self._lock:
+            if vencido:
+                self._vencidos += 1
+            else:
+                self._hits += 1
+            _, hits = self._accesos.get((proveedor, nombre), (0, 0))
+            self._accesos[(proveedor, nombre)] = (ahora, hits + 1)
+            if len(self._accesos) >= LOTE_ACCESOS or ahora - self._ultima_escritura > INTERVALO_ACCESOS:
+                self._escribir_accesos()
+        return datos, vencido
+
+    def guardar(self, proveedor, nombre, datos):
+        """Escribe el tile en el almacén, lo registra y desaloja si se pasó de cuota."""
+        self.almacen.escribir(proveedor, nombre, datos)
+
+        ahora = time.time()
+        self._lectura.poner((proveedor, nombre), (datos, ahora), len(datos))
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO tiles (proveedor, nombre, bytes, creado, acceso, hits) VALUES (?, ?, ?, ?, ?, 0) '
+                'ON CONFLICT (proveedor, nombre) DO UPDATE SET bytes = excluded.bytes, '
+                'creado = excluded.creado, acceso = excluded.acceso',
+                (proveedor, nombre, len(datos), ahora, ahora))
+            self._guardados += 1
+            # Chequear la cuota cada ~1 % de bytes nuevos, no en cada tile
+            self._bytes_sin_chequear += len(datos)
+            if self._bytes_sin_chequear > self.cuota_bytes * 0.01:
+                self._desalojar()
+
+    def _escribir_accesos(self):
+        """Vuelca los accesos acumulados al índice (llamar con lock)."""
+        if self._accesos:
+            self._db.execute('BEGIN')
+            self._db.executemany(
+                'UPDATE tiles SET acceso = MAX(acceso, ?), hits = hits + ? WHERE proveedor = ? AND nombre = ?',
+                [(acceso, hits, proveedor, nombre) for (proveedor, nombre), (acceso, hits) in self._accesos.items()])
+            self._db.execute('COMMIT')
+            self._accesos.clear()
+        self._ultima_escritura = time.time()
+
+    def _desalojar(self):
+        """Borra tiles por LRU/LFU hasta entrar en las cuotas (llamar con lock)."""
+        self._escribir_accesos()
+        self._bytes_sin_chequear = 0
+        orden = 'hits, acceso' if self.politica == 'lfu' else 'acceso'
+        usados = dict(self._db.execute('SELECT proveedor, SUM(bytes) FROM tiles GROUP BY proveedor').fetchall())
+
+        for proveedor, cuota in self.cuotas_bytes.items():
+            if usados.get(proveedor, 0) > cuota:
+                usados[proveedor] -= self._borrar(
+                    usados[proveedor] - int(cuota * FRACCION_OBJETIVO),
+                    f'SELECT proveedor, nombre, bytes FROM tiles WHERE proveedor = ? ORDER BY {orden}',
+                    (proveedor,))
+
+        total = sum(usados.values())
+        if total > self.cuota_bytes:
+            self._borrar(total - int(self.cuota_bytes * FRACCION_OBJETIVO),
+                         f'SELECT proveedor, nombre, bytes FROM tiles ORDER BY {orden}', ())
+
+    def _borrar(self, bytes_a_liberar, consulta, parametros):
+        liberados = 0
+        borrados = []
+        cursor = self._db.execute(consulta, parametros)
+        for proveedor, nombre, tamano in cursor:
+            if liberados >= bytes_a_liberar:
+                break
+            borrados.append((proveedor, nombre))
+            liberados += tamano
+        cursor.close()
+
+        por_proveedor = {}
+        for proveedor, nombre in borrados:
+            por_proveedor.setdefault(proveedor, []).append(nombre)
+            self._lectura.descartar((proveedor, nombre))
+        for proveedor, nombres in por_proveedor.items():
+            self.almacen.borrar(proveedor, nombres)
+        self._db.execute('BEGIN')
+        self._db.executemany('DELETE FROM tiles WHERE proveedor = ? AND nombre = ?', borrados)
+        self._db.execute('COMMIT')
+        self._desalojos += len(borrados)
+        if borrados:
+            print(f'🧹 Cache de tiles: {len(borrados)} desalojados ({liberados / (1024 * 1024):.1f} MB)')
+        return liberados
+
+    def _adoptar_existentes(self):
+        """Registra los tiles que ya estaban en el almacén (llamar con lock)."""
+        filas = list(self.almacen.listar())
+        if filas:
+            self._db.execute('BEGIN')
+            self._db.executemany(
+                'INSERT OR IGNORE INTO tiles (proveedor, nombre, bytes, creado, acceso) VALUES (?, ?, ?, ?, ?)', filas)
+            self._db.execute('COMMIT')
+            print(f'🗂️ Cache de tiles: {len(filas)} tiles existentes adoptados')
+
+    def limpiar(self, proveedor=None):
+        """Borra los tiles cacheados (de un proveedor o todos); devuelve los bytes liberados."""
+        with self._lock:
+            self._accesos.clear()
+            if proveedor is None:
+                return self._borrar(float('inf'), 'SELECT proveedor, nombre, bytes FROM tiles', ())
+            return self._borrar(float('inf'), 'SELECT proveedor, nombre, bytes FROM tiles WHERE proveedor = ?',
+                                (proveedor,))
+
+    def estadisticas(self):
+        """Contadores de uso y ocupación por proveedor."""
+        with self._lock:
+            self._escribir_accesos()
+            proveedores = {
+                proveedor: {
+                    'tiles': cantidad,
+                    'bytes': tamano,
+                    'cuota_bytes': self.cuotas_bytes.get(proveedor),
+                    'ttl': self.ttl_proveedor(proveedor)
+                }
+                for proveedor, cantidad, tamano in self._db.execute(
+                    'SELECT proveedor, COUNT(*), SUM(bytes) FROM tiles GROUP BY proveedor')
+            }
+            total = self._hits + self._vencidos + self._misses
+            return {
+                'proveedores': proveedores,
+                'almacen': self.almacen.tipo,
+                'lectura': self._lectura.estadisticas(),
+                'bytes_en_uso': sum(p['bytes'] for p in proveedores.values()),
+                'cuota_bytes': self.cuota_bytes,
+                'politica': self.politica,
+                'hits': self._hits,
+                'vencidos': self._vencidos,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / total, 3) if total else 0.0,
+                'guardados': self._guardados,
+                'desalojos': self._desalojos
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def obtener_cache_tiles(directorio):
+    """CacheDiscoTiles del proceso para un directorio, configurada por entorno."""
+    clave = os.path.abspath(directorio)
+    with _caches_lock:
+        cache = _caches.get(clave)
+        if cache is None:
+            cache = CacheDiscoTiles(
+                clave,
+                cuota_mb=float(os.getenv('MAIRA_TILES_CACHE_MB', '2048')),
+                cuotas_mb=_leer_pares(os.getenv('MAIRA_TILES_CACHE_CUOTAS')),
+                ttl_horas=float(os.getenv('MAIRA_TILES_CACHE_TTL_H', '720')),
+                ttls_horas=_leer_pares(os.getenv('MAIRA_TILES_CACHE_TTLS')),
+                politica=os.getenv('MAIRA_TILES_CACHE_POLITICA', 'lru').lower(),
+                almacen=os.getenv('MAIRA_TILES_ALMACEN', 'archivos').lower(),
+                lectura_mb=float(os.getenv('MAIRA_TILES_LECTURA_MB', '32'))
+            )
+            _caches[clave] = cache
+        return cache
@@ -0,0 +1,215 @@
+"""
+Cache de resultados del análisis de terreno en dos niveles
+
+Los planificadores repiten /api/terreno/analizar sobre el mismo polígono
+cambiando vehículo, clima o capas. Lo caro es el muestreo de rasters
+(elevación, pendiente y NDVI bajo el polígono); lo que depende del vehículo
+y del clima son estadísticas sobre esos arrays.
+
+- Nivel 1 (raster): ResultadoTerreno (pipeline_terreno.py) y el detalle
+  por celda ya serializado, por polígono cuantizado + grilla + versión de
+  los catálogos. No depende del vehículo ni del clima.
+- Nivel 2 (derivado): estadísticas y puntos críticos por clave de nivel 1 +
+  vehículo + clima + capas.
+
+La respuesta se arma pegando el detalle serializado (decenas de MB en
+polígonos grandes) con el JSON chico del nivel 2, sin volver a serializarlo.
+
+Ambos niveles desalojan por LRU según un presupuesto de bytes y descartan
+entradas más viejas que el TTL.
+
+Uso:
+-----
+    poligono = cuantizar_poligono(data['poligono'])
+    clave = clave_raster(poligono, grilla, catalogo, catalogo_ndvi)
+    entrada = cache_raster.obtener(clave)
+    if entrada is None:
+        terreno = muestrear_terreno(...)
+        detalle = json_fragmento(puntos_detalle)
+        cache_raster.guardar(clave, (terreno, detalle), bytes_resultado(terreno) + len(detalle))
+
+    resultado = cache_analisis.obtener(clave_analisis(clave, vehiculo, clima, capas))
+    cuerpo = componer_json(resultado, puntos_detalle=detalle)
+
+Configuración:
+--------------
+- MAIRA_CACHE_RASTER_MB: presupuesto del nivel 1 (256)
+- MAIRA_CACHE_ANALISIS_MB: presupuesto del nivel 2 (64)
+- MAIRA_CACHE_TERRENO_TTL: segundos de vida de una entrada (900)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Decimales de grado al cuantizar el polígono (1e-5° ≈ 1 m)
+DECIMALES_POLIGONO = 5
+
+
+class CacheTTL:
+    """Cache LRU thread-safe acotada por bytes y con vencimiento por TTL"""
+
+    def __init__(self, presupuesto_mb=64, ttl=900):
+        self.presupuesto_bytes = int(presupuesto_mb * 1024 * 1024)
+        self.ttl = ttl
+
+        self._entradas = OrderedDict()   # clave -> (valor, bytes, creado)
+        self._bytes_en_uso = 0
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._desalojos = 0
+        self._vencidas = 0
+
+    def obtener(self, clave):
+        """Valor cacheado o None si no está o venció."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and time.time() - entrada[2] > self.ttl:
+                self._quitar(clave)
+                self._vencidas += 1
+                entrada = None
+            if entrada is None:
+                self._misses += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self._hits += 1
+            return entrada[0]
+
+    def __contains__(self, clave):
+        """Presencia de una entrada vigente, sin contar hit/miss ni tocar el orden LRU."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            return entrada is not None and time.time() - entrada[2] <= self.ttl
+
+    def guardar(self, clave, valor, tamano):
+        """Guarda un valor de `tamano` bytes; los que superan el presupuesto no se cachean."""
+        if tamano > self.presupuesto_bytes:
+            return
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = (valor, tamano, time.time())
+            self._bytes_en_uso += tamano
+            while self._bytes_en_uso > self.presupuesto_bytes:
+                self._quitar(next(iter(self._entradas)))
+                self._desalojos += 1
+
+    def _quitar(self, clave):
+        """Quita una entrada (llamar con lock)."""
+        _, tamano, _ = self._entradas.pop(clave)
+        self._bytes_en_uso -= tamano
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes_en_uso = 0
+
+    def estadisticas(self):
+        """Contadores de uso para diagnóstico."""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'entradas': len(self._entradas),
+                'bytes_en_uso': self._bytes_en_uso,
+                'presupuesto_bytes': self.presupuesto_bytes,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / total, 3) if total else 0.0,
+                'desalojos': self._desalojos,
+                'vencidas': self._vencidas
+            }
+
+
+def cuantizar_poligono(poligono, decimales=DECIMALES_POLIGONO):
+    """
+    Redondea las coordenadas del polígono (anillo suelto o GeoJSON Polygon).
+    Se usa también para armar la grilla, así polígonos que difieren por
+    debajo del cuanto comparten resultado exacto.
+    """
+    if not poligono:
+        return poligono
+    if isinstance(poligono[0][0], (int, float)):
+        return [[round(float(x), decimales), round(float(y), decimales)] for x, y, *_ in poligono]
+    return [cuantizar_poligono(anillo, decimales) for anillo in poligono]
+
+
+def _hash(*partes):
+    texto = json.dumps(partes, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+
+def clave_raster(poligono, grilla, catalogo_dem, catalogo_ndvi=None):
+    """Clave de nivel 1: polígono cuantizado, forma/bbox de la grilla y versión de catálogos."""
+    return _hash(
+        poligono,
+        grilla.rows, grilla.cols,
+        [round(grilla.bbox[k], 9) for k in ('west', 'south', 'east', 'north')],
+        catalogo_dem.version,
+        catalogo_ndvi.version if catalogo_ndvi is not None else None
+    )
+
+
+def clave_analisis(clave_nivel1, vehiculo, clima, capas):
+    """Clave de nivel 2: resultado raster + parámetros baratos del análisis."""
+    return _hash(clave_nivel1, vehiculo, clima, capas)
+
+
+def bytes_resultado(resultado):
+    """Memoria aproximada de un ResultadoTerreno (suma de sus arrays)."""
+    total = 0
+    for valor in vars(resultado).values():
+        if isinstance(valor, np.ndarray):
+            total += valor.nbytes
+    if resultado.grilla is not None:
+        total += resultado.grilla.mascara.nbytes
+    return total
+
+
+def json_fragmento(valor):
+    """Serializa una sola vez un valor grande para insertarlo tal cual en respuestas."""
+    return json.dumps(valor, separators=(',', ':')).encode('utf-8')
+
+
+def componer_json(resultado, **fragmentos):
+    """
+    Cuerpo JSON de `resultado` (dict) más claves cuyo valor ya viene
+    serializado con json_fragmento().
+    """
+    partes = [b'{']
+    for clave, fragmento in fragmentos.items():
+        partes += [json.dumps(clave).encode('utf-8'), b':', fragmento, b',']
+    resto = json.dumps(resultado, separators=(',', ':')).encode('utf-8')
+    if resto == b'{}':
+        partes[-1] = b'}'
+        return b''.join(partes)
+    return b''.join(partes) + resto[1:]
+
+
+def marcar_respuesta(respuesta, raster, analisis):
+    """Cabeceras X-Cache-Raster / X-Cache-Analisis (HIT o MISS), visibles cross-origin."""
+    respuesta.headers['X-Cache-Raster'] = 'HIT' if raster else 'MISS'
+    respuesta.headers['X-Cache-Analisis'] = 'HIT' if analisis else 'MISS'
+    respuesta.headers['Access-Control-Expose-Headers'] = 'X-Cache-Raster, X-Cache-Analisis'
+    return respuesta
+
+
+cache_raster = CacheTTL(
+    presupuesto_mb=float(os.getenv('MAIRA_CACHE_RASTER_MB', '256')),
+    ttl=float(os.getenv('MAIRA_CACHE_TERRENO_TTL', '900'))
+)
+
+cache_analisis = CacheTTL(
+    presupuesto_mb=float(os.getenv('MAIRA_CACHE_ANALISIS_MB', '64')),
+    ttl=float(os.getenv('MAIRA_CACHE_TERRENO_TTL', '900'))
+)
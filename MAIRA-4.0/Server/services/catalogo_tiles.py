@@ -0,0 +1,245 @@
+"""
+Catálogos de tiles en memoria con índice espacial
+
+Los índices JSON de mini-tiles ({provincia}_mini_tiles_index.json,
+vegetation_master_index.json, gis_tiles_master_index.json) se cargan una sola
+vez por proceso y se indexan con un hash de grilla regular (los tiles son
+regulares). El catálogo se recarga solo si cambia el mtime del archivo.
+
+Las búsquedas por bbox y punto→tile recorren únicamente las celdas
+involucradas, no todo el catálogo.
+
+Un catálogo puede fusionar varios índices: obtener_catalogo_nacional() arma
+un mosaico virtual (tipo VRT) con todas las provincias de altimetría, así
+cada punto se resuelve contra el tile que lo contiene sin adivinar la
+provincia por latitud.
+
+Uso:
+-----
+    catalogo = obtener_catalogo(ruta_indice)
+    tiles = catalogo.tiles_para_puntos(lons, lats)   # [(ruta, bounds), ...]
+    infos = catalogo.buscar_bbox(bounds)             # [tile_info, ...]
+
+    nacional = obtener_catalogo_nacional(tiles_base)  # Altimetria_Mini_Tiles
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import json
+import glob
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+
+def resolver_ruta_default(directorio_indice, tile_info):
+    """Tile junto al índice, dentro de su 'package' si lo tiene (vegetación)."""
+    return os.path.join(directorio_indice, tile_info.get('package', ''), tile_info['filename'])
+
+
+class _IndiceGrilla:
+    """Estado inmutable del catálogo: arrays de bounds + hash de celdas."""
+
+    def __init__(self, infos, rutas):
+        self.infos = infos
+        self.rutas = rutas
+        n = len(infos)
+
+        self.west = np.array([t['bounds']['west'] for t in infos], dtype=np.float64)
+        self.south = np.array([t['bounds']['south'] for t in infos], dtype=np.float64)
+        self.east = np.array([t['bounds']['east'] for t in infos], dtype=np.float64)
+        self.north = np.array([t['bounds']['north'] for t in infos], dtype=np.float64)
+
+        if n:
+            self.celda_x = float(np.median(self.east - self.west)) or 1.0
+            self.celda_y = float(np.median(self.north - self.south)) or 1.0
+            self.origen_x = float(self.west.min())
+            self.origen_y = float(self.south.min())
+        else:
+            self.celda_x = self.celda_y = 1.0
+            self.origen_x = self.origen_y = 0.0
+
+        self.celdas = defaultdict(list)
+        ix0, iy0 = self._celda(self.west, self.south)
+        ix1, iy1 = self._celda(self.east, self.north)
+        for t in range(n):
+            for ix in range(ix0[t], ix1[t] + 1):
+                for iy in range(iy0[t], iy1[t] + 1):
+                    self.celdas[(ix, iy)].append(t)
+
+    def _celda(self, x, y):
+        ix = np.floor((np.asarray(x) - self.origen_x) / self.celda_x).astype(np.int64)
+        iy = np.floor((np.asarray(y) - self.origen_y) / self.celda_y).astype(np.int64)
+        return ix, iy
+
+    def candidatos_bbox(self, west, south, east, north):
+        """Índices de tiles que intersectan el bbox (inclusive en los bordes)."""
+        ix0, iy0 = self._celda(west, south)
+        ix1, iy1 = self._celda(east, north)
+        n_celdas = (int(ix1) - int(ix0) + 1) * (int(iy1) - int(iy0) + 1)
+
+        if n_celdas > len(self.infos):
+            # Bbox enorme (vista nacional): más barato filtrar todo vectorizado
+            candidatos = np.arange(len(self.infos))
+        else:
+            encontrados = set()
+            for ix in range(int(ix0), int(ix1) + 1):
+                for iy in range(int(iy0), int(iy1) + 1):
+                    encontrados.update(self.celdas.get((ix, iy), ()))
+            candidatos = np.array(sorted(encontrados), dtype=np.int64)
+
+        if len(candidatos) == 0:
+            return candidatos
+        intersecta = ((self.north[candidatos] >= south) & (self.south[candidatos] <= north) &
+                      (self.east[candidatos] >= west) & (self.west[candidatos] <= east))
+        return candidatos[intersecta]
+
+    def candidatos_puntos(self, lons, lats):
+        """Índices de tiles que pueden contener alguno de los puntos."""
+        if len(self.infos) == 0 or len(lons) == 0:
+            return np.array([], dtype=np.int64)
+        ix, iy = self._celda(lons, lats)
+        encontrados = set()
+        for celda in set(zip(ix.tolist(), iy.tolist())):
+            encontrados.update(self.celdas.get(celda, ()))
+        return np.array(sorted(encontrados), dtype=np.int64)
+
+
+class CatalogoTiles:
+    """Catálogo de uno o más índices JSON de tiles, recargado al cambiar su mtime"""
+
+    def __init__(self, rutas_indice, resolver_ruta=None):
+        if isinstance(rutas_indice, str):
+            rutas_indice = [rutas_indice]
+        self.rutas_indice = list(rutas_indice)
+        self.resolver_ruta = resolver_ruta or resolver_ruta_default
+        self.metadata = {}
+
+        self._mtime = None
+        self._indice = None
+        self._lock = threading.Lock()
+        self.recargas = 0
+
+    def _indice_actual(self):
+        """Devuelve el índice vigente, recargando si el archivo cambió."""
+        mtime = tuple(os.stat(ruta).st_mtime for ruta in self.rutas_indice)
+        if self._indice is not None and mtime == self._mtime:
+            return self._indice
+
+        with self._lock:
+            if self._indice is not None and mtime == self._mtime:
+                return self._indice
+
+            infos = []
+            rutas = []
+            metadata = {}
+            for ruta_indice in self.rutas_indice:
+                with open(ruta_indice, 'r', encoding='utf-8') as f:
+                    datos = json.load(f)
+
+                directorio = os.path.dirname(ruta_indice)
+                for valor in datos.get('tiles', {}).values():
+                    # Los índices regionales de vegetation_tile_processor guardan listas
+                    for info in (valor if isinstance(valor, list) else [valor]):
+                        if info.get('bounds') and info.get('filename'):
+                            infos.append(info)
+                            rutas.append(self.resolver_ruta(directorio, info))
+
+                metadata[os.path.basename(ruta_indice)] = {k: v for k, v in datos.items() if k != 'tiles'}
+
+            self.metadata = metadata
+            self._indice = _IndiceGrilla(infos, rutas)
+            self._mtime = mtime
+            self.recargas += 1
+            nombres = ', '.join(os.path.basename(r) for r in self.rutas_indice)
+            print(f'🗂️ Catálogo cargado: {nombres} ({len(infos)} tiles)')
+            return self._indice
+
+    @property
+    def total(self):
+        return len(self._indice_actual().infos)
+
+    @property
+    def version(self):
+        """mtimes de los índices vigentes: cambia cuando el catálogo se recarga."""
+        self._indice_actual()
+        return self._mtime
+
+    def buscar_bbox(self, bounds):
+        """tile_info de los tiles que intersectan bounds {'west','south','east','north'}."""
+        indice = self._indice_actual()
+        candidatos = indice.candidatos_bbox(bounds['west'], bounds['south'], bounds['east'], bounds['north'])
+        return [indice.infos[i] for i in candidatos]
+
+    def entradas_bbox(self, bounds):
+        """[(ruta, tile_info)] de los tiles que intersectan bounds, existan o no en disco."""
+        indice = self._indice_actual()
+        candidatos = indice.candidatos_bbox(bounds['west'], bounds['south'], bounds['east'], bounds['north'])
+        return [(indice.rutas[i], indice.infos[i]) for i in candidatos]
+
+    def tiles_bbox(self, bounds, solo_existentes=True):
+        """[(ruta, bounds)] para el motor de muestreo, limitado a un bbox."""
+        indice = self._indice_actual()
+        candidatos = indice.candidatos_bbox(bounds['west'], bounds['south'], bounds['east'], bounds['north'])
+        return self._como_tiles(indice, candidatos, solo_existentes)
+
+    def tiles_para_puntos(self, lons, lats, solo_existentes=True):
+        """[(ruta, bounds)] de los tiles que pueden contener los puntos."""
+        indice = self._indice_actual()
+        candidatos = indice.candidatos_puntos(np.asarray(lons), np.asarray(lats))
+        return self._como_tiles(indice, candidatos, solo_existentes)
+
+    @staticmethod
+    def _como_tiles(indice, candidatos, solo_existentes):
+        tiles = []
+        for i in candidatos:
+            ruta = indice.rutas[i]
+            if solo_existentes and not os.path.exists(ruta):
+                continue
+            tiles.append((ruta, indice.infos[i]['bounds']))
+        return tiles
+
+
+_catalogos = {}
+_catalogos_lock = threading.Lock()
+
+
+def obtener_catalogo(rutas_indice, resolver_ruta=None):
+    """
+    Devuelve el CatalogoTiles del proceso para uno o más índices JSON.
+
+    Raises:
+        FileNotFoundError si algún índice no existe
+    """
+    if isinstance(rutas_indice, str):
+        rutas_indice = [rutas_indice]
+    clave = tuple(os.path.abspath(r) for r in rutas_indice)
+    for ruta in clave:
+        if not os.path.exists(ruta):
+            raise FileNotFoundError(f'Índice no existe: {ruta}')
+
+    catalogo = _catalogos.get(clave)
+    if catalogo is None:
+        with _catalogos_lock:
+            catalogo = _catalogos.get(clave)
+            if catalogo is None:
+                catalogo = CatalogoTiles(list(clave), resolver_ruta)
+                _catalogos[clave] = catalogo
+    return catalogo
+
+
+def obtener_catalogo_nacional(tiles_base):
+    """
+    Mosaico virtual de altimetría: fusiona todos los
+    {provincia}/{provincia}_mini_tiles_index.json bajo tiles_base.
+
+    Raises:
+        FileNotFoundError si no hay índices provinciales
+    """
+    rutas = sorted(glob.glob(os.path.join(tiles_base, '*', '*_mini_tiles_index.json')))
+    if not rutas:
+        raise FileNotFoundError(f'No hay índices provinciales en {tiles_base}')
+    return obtener_catalogo(rutas)
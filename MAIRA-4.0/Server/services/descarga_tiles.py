@@ -0,0 +1,176 @@
+"""
+Descarga de tiles de mapas base con conexiones reutilizadas y requests agrupados
+
+descargar_tile abría una conexión nueva por tile dentro del hilo del request,
+y 50 clientes pidiendo el mismo tile sin cachear eran 50 descargas. Acá:
+
+- Una requests.Session por proveedor con pool de conexiones keep-alive.
+- Requests idénticos en curso se agrupan (VueloUnico de extraccion_tiles.py):
+  una descarga, todos reciben los mismos bytes.
+- Un semáforo por proveedor limita las descargas simultáneas hacia afuera;
+  si no hay lugar en TIMEOUT_COLA segundos el tile se da por no disponible.
+- revalidar() renueva en segundo plano un tile vencido mientras el proxy
+  sirve el viejo (stale-while-revalidate).
+
+Las URLs de cada proveedor se pueden redirigir por entorno, p.ej. a un
+servidor local de prueba (tools/benchmark_tile_proxy.py).
+
+Uso:
+-----
+    url = url_tile('osm', z, x, y, 'png')
+    guardar = lambda datos: cache.guardar('osm', nombre, datos)
+    datos = descargador_tiles.descargar('osm', url, guardar)   # bytes o None
+    descargador_tiles.revalidar('osm', url, guardar)           # tile vencido: se sirve el viejo
+
+Configuración:
+--------------
+- MAIRA_TILES_CONCURRENCIA: descargas simultáneas por proveedor (8)
+- MAIRA_TILES_UPSTREAM: URLs por proveedor, p.ej. "osm=http://127.0.0.1:8090/{z}/{x}/{y}.{ext}"
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import threading
+
+from .extraccion_tiles import VueloUnico
+
+TIMEOUT = (3.05, 10)   # conexión, lectura
+TIMEOUT_COLA = 15      # segundos esperando lugar en el semáforo del proveedor
+AGENTE = 'MAIRA/4.0 (proxy de tiles)'
+
+
+def _urls_proveedor():
+    urls = {
+        'osm': 'https://tile.openstreetmap.org/{z}/{x}/{y}.{ext}',
+        'satellite': 'https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
+        'terrain': 'https://stamen-tiles.a.ssl.fastly.net/terrain/{z}/{x}/{y}.{ext}',
+        'cartodb': 'https://cartodb-basemaps-a.global.ssl.fastly.net/light_all/{z}/{x}/{y}.{ext}'
+    }
+    for par in os.getenv('MAIRA_TILES_UPSTREAM', '').split(','):
+        if '=' in par:
+            proveedor, url = par.split('=', 1)
+            urls[proveedor.strip()] = url.strip()
+    return urls
+
+
+URLS_PROVEEDOR = _urls_proveedor()
+
+
+def url_tile(proveedor, z, x, y, ext):
+    """URL upstream del tile, o None si el proveedor no existe."""
+    plantilla = URLS_PROVEEDOR.get(proveedor)
+    return plantilla.format(z=z, x=x, y=y, ext=ext) if plantilla else None
+
+
+class DescargadorTiles:
+    """Sesiones HTTP por proveedor, agrupamiento de requests y tope de concurrencia"""
+
+    def __init__(self, concurrencia=8):
+        self.concurrencia = concurrencia
+        self._sesiones = {}
+        self._semaforos = {}
+        self._vuelos = VueloUnico()
+        self._revalidando = set()
+        self._lock = threading.Lock()
+
+        self._descargas = 0
+        self._agrupadas = 0
+        self._errores = 0
+        self._sin_lugar = 0
+        self._revalidaciones = 0
+
+    def _recursos(self, proveedor):
+        with self._lock:
+            sesion = self._sesiones.get(proveedor)
+            if sesion is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                sesion = requests.Session()
+                adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrencia, max_retries=1)
+                sesion.mount('http://', adaptador)
+                sesion.mount('https://', adaptador)
+                sesion.headers['User-Agent'] = AGENTE
+                self._sesiones[proveedor] = sesion
+                self._semaforos[proveedor] = threading.BoundedSemaphore(self.concurrencia)
+            return sesion, self._semaforos[proveedor]
+
+    def _bajar(self, proveedor, url):
+        sesion, semaforo = self._recursos(proveedor)
+        if not semaforo.acquire(timeout=TIMEOUT_COLA):
+            with self._lock:
+                self._sin_lugar += 1
+            print(f'⚠️ Sin lugar para descargar tile de {proveedor}: {url}')
+            return None
+        try:
+            respuesta = sesion.get(url, timeout=TIMEOUT)
+            respuesta.raise_for_status()
+            with self._lock:
+                self._descargas += 1
+            return respuesta.content
+        except Exception as e:
+            with self._lock:
+                self._errores += 1
+            print(f'❌ Error descargando tile {url}: {e}')
+            return None
+        finally:
+            semaforo.release()
+
+    def descargar(self, proveedor, url, al_descargar=None):
+        """
+        Bytes del tile o None si falla; requests iguales en curso comparten la
+        descarga. al_descargar(bytes) lo corre solo quien descarga (p.ej. para
+        guardarlo en la cache una vez), antes de liberar a los que esperan.
+        """
+        lider = []
+
+        def bajar():
+            lider.append(True)
+            datos = self._bajar(proveedor, url)
+            if datos is not None and al_descargar is not None:
+                al_descargar(datos)
+            return datos
+
+        datos = self._vuelos.ejecutar(url, bajar)
+        if not lider:
+            with self._lock:
+                self._agrupadas += 1
+        return datos
+
+    def revalidar(self, proveedor, url, al_terminar):
+        """Descarga el tile en segundo plano y llama al_terminar(bytes) si lo consigue (una vez por URL en curso)."""
+        with self._lock:
+            if url in self._revalidando:
+                return
+            self._revalidando.add(url)
+            self._revalidaciones += 1
+
+        def tarea():
+            try:
+                self.descargar(proveedor, url, al_terminar)
+            except Exception as e:
+                print(f'❌ Error revalidando tile {url}: {e}')
+            finally:
+                with self._lock:
+                    self._revalidando.discard(url)
+
+        threading.Thread(target=tarea, daemon=True, name='revalidar-tile').start()
+
+    def estadisticas(self):
+        """Contadores de uso para diagnóstico."""
+        with self._lock:
+            return {
+                'proveedores': sorted(self._sesiones),
+                'concurrencia': self.concurrencia,
+                'descargas': self._descargas,
+                'agrupadas': self._agrupadas,
+                'errores': self._errores,
+                'sin_lugar': self._sin_lugar,
+                'revalidaciones': self._revalidaciones,
+                'revalidando': len(self._revalidando)
+            }
+
+
+descargador_tiles = DescargadorTiles(concurrencia=int(os.getenv('MAIRA_TILES_CONCURRENCIA', '8')))
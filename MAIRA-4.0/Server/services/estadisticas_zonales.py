@@ -0,0 +1,448 @@
+"""
+Estadísticas zonales de elevación, pendiente y NDVI sobre polígonos
+
+Preguntas de planeamiento del tipo "elevación media y máxima, % boscoso
+(NDVI > x), % con pendiente > 30° dentro de este sector" se respondían
+mandando cada punto de una grilla por los endpoints batch y agregando en
+JavaScript. Acá cada polígono se rasteriza sobre la grilla nativa de cada
+tile (DEM y NDVI) y se reduce con máscaras NumPy.
+
+Los agregados se arman sumando parciales por tile (conteos, sumas, mín/máx
+e histogramas), así que se combinan sin volver a tocar los píxeles:
+
+- Un tile completamente dentro del polígono aporta su parcial de tile
+  entero, que no depende del polígono: se cachea y lo reutiliza cualquier
+  sector que cubra ese tile.
+- Un tile de borde se rasteriza solo en la ventana del bbox del polígono;
+  su parcial se cachea por (tile, polígono) y la pendiente de Horn del tile
+  completo se cachea aparte, así los sectores superpuestos no la recalculan.
+
+Los umbrales se aplican sobre histogramas de 1° (pendiente) y 0.01 (NDVI),
+por lo que un umbral se resuelve a esa precisión. Se asume que los tiles de
+un catálogo no se superponen.
+
+Uso:
+-----
+    zonas = estadisticas_zonales(catalogo, catalogo_ndvi,
+                                 [{'id': 'S1', 'poligono': anillo}, ...],
+                                 umbral_pendiente=30, umbral_ndvi=0.6, pool=pool_global)
+
+Configuración:
+--------------
+- MAIRA_CACHE_ZONAL_MB: presupuesto de la cache de parciales y pendientes por tile (128)
+- MAIRA_ZONAL_MAX_TILES: tiles distintos (DEM + NDVI) que puede tocar una llamada (64)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import json
+import math
+import hashlib
+
+import numpy as np
+
+from .grilla_muestreo import METROS_POR_GRADO, _anillos_poligono, punto_en_anillo, mascara_poligono
+from .muestreo_raster import NODATA_DEFAULT, normalizar_ndvi
+from .pendientes import calcular_pendiente_horn, RANGOS_PENDIENTE
+from .cache_terreno import CacheTTL, cuantizar_poligono
+
+BINS_PENDIENTE = 90         # 1° por bin, 0-90°
+BINS_NDVI = 100             # 0.01 por bin, 0-1
+MAX_TILES_LLAMADA = int(os.getenv('MAIRA_ZONAL_MAX_TILES', '64'))
+
+cache_zonal = CacheTTL(
+    presupuesto_mb=float(os.getenv('MAIRA_CACHE_ZONAL_MB', '128')),
+    ttl=float(os.getenv('MAIRA_CACHE_TERRENO_TTL', '900'))
+)
+
+
+class ParcialZonal:
+    """Agregados sumables de un tile (o de una zona completa)"""
+
+    __slots__ = ('celdas', 'area_m2', 'n_elev', 'suma_elev', 'suma2_elev', 'min_elev', 'max_elev',
+                 'n_pend', 'suma_pend', 'max_pend', 'hist_pend',
+                 'n_ndvi', 'suma_ndvi', 'hist_ndvi')
+
+    def __init__(self):
+        self.celdas = 0
+        self.area_m2 = 0.0
+        self.n_elev = 0
+        self.suma_elev = 0.0
+        self.suma2_elev = 0.0
+        self.min_elev = np.inf
+        self.max_elev = -np.inf
+        self.n_pend = 0
+        self.suma_pend = 0.0
+        self.max_pend = -np.inf
+        self.hist_pend = np.zeros(BINS_PENDIENTE, dtype=np.int64)
+        self.n_ndvi = 0
+        self.suma_ndvi = 0.0
+        self.hist_ndvi = np.zeros(BINS_NDVI, dtype=np.int64)
+
+    def __iadd__(self, otro):
+        self.celdas += otro.celdas
+        self.area_m2 += otro.area_m2
+        self.n_elev += otro.n_elev
+        self.suma_elev += otro.suma_elev
+        self.suma2_elev += otro.suma2_elev
+        self.min_elev = min(self.min_elev, otro.min_elev)
+        self.max_elev = max(self.max_elev, otro.max_elev)
+        self.n_pend += otro.n_pend
+        self.suma_pend += otro.suma_pend
+        self.max_pend = max(self.max_pend, otro.max_pend)
+        self.hist_pend = self.hist_pend + otro.hist_pend
+        self.n_ndvi += otro.n_ndvi
+        self.suma_ndvi += otro.suma_ndvi
+        self.hist_ndvi = self.hist_ndvi + otro.hist_ndvi
+        return self
+
+    @property
+    def bytes(self):
+        return self.hist_pend.nbytes + self.hist_ndvi.nbytes + 256
+
+    def agregar_dem(self, elev, pend, area_celdas):
+        """Reduce elevaciones y pendientes ya enmascaradas (arrays 1-D alineados)."""
+        self.celdas += len(elev)
+        self.area_m2 += float(area_celdas.sum())
+        elev = elev[~np.isnan(elev)]
+        if elev.size:
+            self.n_elev += elev.size
+            self.suma_elev += float(elev.sum())
+            self.suma2_elev += float(np.square(elev).sum())
+            self.min_elev = min(self.min_elev, float(elev.min()))
+            self.max_elev = max(self.max_elev, float(elev.max()))
+        pend = pend[~np.isnan(pend)]
+        if pend.size:
+            self.n_pend += pend.size
+            self.suma_pend += float(pend.sum())
+            self.max_pend = max(self.max_pend, float(pend.max()))
+            self.hist_pend += np.bincount(np.minimum(pend.astype(np.int64), BINS_PENDIENTE - 1),
+                                          minlength=BINS_PENDIENTE)
+
+    def agregar_ndvi(self, ndvi):
+        ndvi = ndvi[~np.isnan(ndvi)]
+        if ndvi.size:
+            self.n_ndvi += ndvi.size
+            self.suma_ndvi += float(ndvi.sum())
+            bins = np.clip((ndvi * BINS_NDVI).astype(np.int64), 0, BINS_NDVI - 1)
+            self.hist_ndvi += np.bincount(bins, minlength=BINS_NDVI)
+
+    def resumen(self, umbral_pendiente=30, umbral_ndvi=0.6):
+        """Agregados finales de la zona; None en las capas sin datos."""
+        salida = {
+            'celdas': self.celdas,
+            'area_km2': round(self.area_m2 / 1e6, 3),
+            'elevacion': None,
+            'pendiente': None,
+            'ndvi': None
+        }
+        if self.n_elev:
+            media = self.suma_elev / self.n_elev
+            varianza = max(self.suma2_elev / self.n_elev - media ** 2, 0.0)
+            salida['elevacion'] = {
+                'media': round(media, 1),
+                'min': round(self.min_elev, 1),
+                'max': round(self.max_elev, 1),
+                'desvio': round(float(np.sqrt(varianza)), 1),
+                'celdas_validas': self.n_elev
+            }
+        if self.n_pend:
+            umbral = int(round(umbral_pendiente))
+            salida['pendiente'] = {
+                'media': round(self.suma_pend / self.n_pend, 1),
+                'max': round(self.max_pend, 1),
+                'umbral': umbral,
+                'pct_sobre_umbral': round(100 * int(self.hist_pend[umbral:].sum()) / self.n_pend, 1),
+                'distribucion': {
+                    etiqueta: round(100 * int(self.hist_pend[desde:min(hasta, BINS_PENDIENTE)].sum()) / self.n_pend, 1)
+                    for etiqueta, desde, hasta in RANGOS_PENDIENTE
+                }
+            }
+        if self.n_ndvi:
+            umbral = int(round(umbral_ndvi * BINS_NDVI))
+            salida['ndvi'] = {
+                'media': round(self.suma_ndvi / self.n_ndvi, 3),
+                'umbral': umbral / BINS_NDVI,
+                'pct_sobre_umbral': round(100 * int(self.hist_ndvi[umbral:].sum()) / self.n_ndvi, 1),
+                'celdas_validas': self.n_ndvi
+            }
+        return salida
+
+
+# ----------------------------------------------------------------------
+# Geometría
+# ----------------------------------------------------------------------
+def _orientacion(ax, ay, bx, by, cx, cy):
+    return np.sign((bx - ax) * (cy - ay) - (by - ay) * (cx - ax))
+
+
+def _anillo_corta_caja(anillo, bounds):
+    """Algún vértice del anillo dentro de la caja o alguna arista cruzando uno de sus lados."""
+    x, y = anillo[:, 0], anillo[:, 1]
+    w, s, e, n = bounds['west'], bounds['south'], bounds['east'], bounds['north']
+    if np.any((x > w) & (x < e) & (y > s) & (y < n)):
+        return True
+    x0, y0 = x, y
+    x1, y1 = np.roll(x, -1), np.roll(y, -1)
+    for (ax, ay), (bx, by) in (((w, s), (e, s)), ((e, s), (e, n)), ((e, n), (w, n)), ((w, n), (w, s))):
+        cruza = ((_orientacion(x0, y0, x1, y1, ax, ay) * _orientacion(x0, y0, x1, y1, bx, by) < 0) &
+                 (_orientacion(ax, ay, bx, by, x0, y0) * _orientacion(ax, ay, bx, by, x1, y1) < 0))
+        if cruza.any():
+            return True
+    return False
+
+
+def caja_dentro_poligono(bounds, anillos):
+    """El rectángulo bounds queda entero dentro del polígono (y fuera de sus huecos)."""
+    lons = np.array([bounds['west'], bounds['east'], bounds['east'], bounds['west']])
+    lats = np.array([bounds['south'], bounds['south'], bounds['north'], bounds['north']])
+    if not punto_en_anillo(lons, lats, anillos[0]).all():
+        return False
+    if any(punto_en_anillo(lons, lats, hueco).any() for hueco in anillos[1:]):
+        return False
+    return not any(_anillo_corta_caja(anillo, bounds) for anillo in anillos)
+
+
+def _bbox_anillos(anillos):
+    exterior = anillos[0]
+    return {
+        'west': float(exterior[:, 0].min()), 'east': float(exterior[:, 0].max()),
+        'south': float(exterior[:, 1].min()), 'north': float(exterior[:, 1].max())
+    }
+
+
+# ----------------------------------------------------------------------
+# Lectura por tile
+# ----------------------------------------------------------------------
+def _leer_tile(ruta, pool=None, nodata=NODATA_DEFAULT):
+    """(datos float64 con NaN, transform) de la banda 1 completa del tile."""
+    if pool is not None:
+        banda = pool.banda(ruta)
+        datos, transform, nodata_raster = banda.datos, banda.transform, banda.nodata
+    else:
+        import rasterio
+        with rasterio.open(ruta) as src:
+            datos, transform, nodata_raster = src.read(1), src.transform, src.nodata
+    valores = datos.astype(np.float64)
+    sin_dato = valores == nodata
+    if nodata_raster is not None:
+        sin_dato |= valores == nodata_raster
+    valores[sin_dato] = np.nan
+    return valores, transform
+
+
+def _centros(transform, forma):
+    """Longitudes (cols) y latitudes (filas) de los centros de píxel del tile."""
+    filas, cols = forma
+    lons = transform.c + (np.arange(cols) + 0.5) * transform.a
+    lats = transform.f + (np.arange(filas) + 0.5) * transform.e
+    return lons, lats
+
+
+def _area_filas(transform, lats):
+    """Área en m² de un píxel en cada fila."""
+    return (abs(transform.a) * METROS_POR_GRADO * np.cos(np.radians(lats)) *
+            abs(transform.e) * METROS_POR_GRADO)
+
+
+def _dem_y_pendiente(ruta, version, pool=None):
+    """DEM del tile y su pendiente de Horn, desde cache o calculados una vez."""
+    clave = ('pendiente', ruta, version)
+    entrada = cache_zonal.obtener(clave)
+    if entrada is None:
+        dem, transform = _leer_tile(ruta, pool)
+        lons, lats = _centros(transform, dem.shape)
+        celda_x = (abs(transform.a) * METROS_POR_GRADO * np.cos(np.radians(lats))).reshape(-1, 1)
+        celda_y = abs(transform.e) * METROS_POR_GRADO
+        pendiente, _ = calcular_pendiente_horn(dem, celda_x, celda_y)
+        entrada = (dem.astype(np.float32), pendiente.astype(np.float32), transform)
+        cache_zonal.guardar(clave, entrada, entrada[0].nbytes + entrada[1].nbytes)
+    return entrada
+
+
+def _ventana(transform, forma, bbox):
+    """Slices de filas/columnas del tile cuyos centros caen en el bbox."""
+    lons, lats = _centros(transform, forma)
+    cols = np.flatnonzero((lons >= bbox['west']) & (lons <= bbox['east']))
+    filas = np.flatnonzero((lats >= bbox['south']) & (lats <= bbox['north']))
+    if cols.size == 0 or filas.size == 0:
+        return None
+    return slice(int(filas[0]), int(filas[-1]) + 1), slice(int(cols[0]), int(cols[-1]) + 1), lons, lats
+
+
+def parcial_dem(ruta, bounds, anillos, clave_poligono, version, pool=None):
+    """Parcial de elevación y pendiente de un tile DEM para el polígono."""
+    completo = caja_dentro_poligono(bounds, anillos)
+    clave = ('dem', ruta, version, None if completo else clave_poligono)
+    parcial = cache_zonal.obtener(clave)
+    if parcial is not None:
+        return parcial, completo
+
+    dem, pendiente, transform = _dem_y_pendiente(ruta, version, pool)
+    parcial = ParcialZonal()
+    if completo:
+        lons, lats = _centros(transform, dem.shape)
+        area = np.repeat(_area_filas(transform, lats), dem.shape[1])
+        parcial.agregar_dem(dem.ravel(), pendiente.ravel(), area)
+    else:
+        ventana = _ventana(transform, dem.shape, _bbox_anillos(anillos))
+        if ventana is not None:
+            filas, cols, lons, lats = ventana
+            lons2d, lats2d = np.meshgrid(lons[cols], lats[filas])
+            mascara = mascara_poligono(lons2d, lats2d, [a.tolist() for a in anillos])
+            area = np.broadcast_to(_area_filas(transform, lats[filas]).reshape(-1, 1), mascara.shape)
+            parcial.agregar_dem(dem[filas, cols][mascara], pendiente[filas, cols][mascara], area[mascara])
+    cache_zonal.guardar(clave, parcial, parcial.bytes)
+    return parcial, completo
+
+
+def parcial_ndvi(ruta, bounds, anillos, clave_poligono, version, pool=None):
+    """Parcial de NDVI de un tile de vegetación para el polígono."""
+    completo = caja_dentro_poligono(bounds, anillos)
+    clave = ('ndvi', ruta, version, None if completo else clave_poligono)
+    parcial = cache_zonal.obtener(clave)
+    if parcial is not None:
+        return parcial
+
+    ndvi, transform = _leer_tile(ruta, pool)
+    ndvi = normalizar_ndvi(ndvi)
+    parcial = ParcialZonal()
+    if completo:
+        parcial.agregar_ndvi(ndvi.ravel())
+    else:
+        ventana = _ventana(transform, ndvi.shape, _bbox_anillos(anillos))
+        if ventana is not None:
+            filas, cols, lons, lats = ventana
+            lons2d, lats2d = np.meshgrid(lons[cols], lats[filas])
+            mascara = mascara_poligono(lons2d, lats2d, [a.tolist() for a in anillos])
+            parcial.agregar_ndvi(ndvi[filas, cols][mascara])
+    cache_zonal.guardar(clave, parcial, parcial.bytes)
+    return parcial
+
+
+# ----------------------------------------------------------------------
+# API
+# ----------------------------------------------------------------------
+def _es_vertice(valor):
+    return (isinstance(valor, (list, tuple)) and len(valor) >= 2 and
+            all(isinstance(c, (int, float)) and not isinstance(c, bool) and math.isfinite(c)
+                for c in valor[:2]))
+
+
+def leer_poligono(poligono, zona=0):
+    """
+    Valida la forma de un anillo suelto o de coordenadas GeoJSON Polygon.
+
+    Returns:
+        (polígono cuantizado, anillos como arrays (n, 2) lon/lat)
+
+    Raises:
+        ValueError si no es una lista de vértices [lon, lat] (o de anillos)
+        con un exterior de al menos 3 vértices
+    """
+    if not isinstance(poligono, list) or not poligono:
+        raise ValueError(f'Zona {zona}: falta el polígono')
+    anillos = [poligono] if _es_vertice(poligono[0]) else poligono
+    for anillo in anillos:
+        if not isinstance(anillo, list) or not all(_es_vertice(v) for v in anillo):
+            raise ValueError(f'Zona {zona}: cada vértice debe ser [lon, lat] numérico')
+    if len(anillos[0]) < 3:
+        raise ValueError(f'Zona {zona}: el polígono necesita al menos 3 vértices')
+    poligono = cuantizar_poligono(poligono)
+    return poligono, _anillos_poligono(poligono)
+
+
+def leer_zona(zona, i=0):
+    """(id, polígono cuantizado, anillos) de {"id"?, "poligono"} o de un Feature Polygon."""
+    if not isinstance(zona, dict):
+        raise ValueError(f'Zona {i}: se espera un objeto con "poligono" o un Feature')
+    if zona.get('type') == 'Feature':
+        geometria = zona.get('geometry')
+        if not isinstance(geometria, dict) or geometria.get('type') != 'Polygon':
+            raise ValueError(f'Zona {i}: la geometría debe ser Polygon')
+        poligono = geometria.get('coordinates')
+        propiedades = zona.get('properties')
+        identificador = zona.get('id', propiedades.get('id', i) if isinstance(propiedades, dict) else i)
+    else:
+        poligono = zona.get('poligono')
+        identificador = zona.get('id', i)
+    return (identificador, *leer_poligono(poligono, i))
+
+
+def _estadisticas_anillos(catalogo, catalogo_ndvi, poligono, anillos, umbral_pendiente, umbral_ndvi, pool):
+    clave_poligono = hashlib.sha1(json.dumps(poligono).encode('utf-8')).hexdigest()
+    bbox = _bbox_anillos(anillos)
+
+    total = ParcialZonal()
+    completos = parciales = 0
+    for ruta, bounds in catalogo.tiles_bbox(bbox):
+        parcial, completo = parcial_dem(ruta, bounds, anillos, clave_poligono, catalogo.version, pool)
+        total += parcial
+        completos += completo
+        parciales += not completo
+
+    if catalogo_ndvi is not None:
+        for ruta, bounds in catalogo_ndvi.tiles_bbox(bbox):
+            parcial = parcial_ndvi(ruta, bounds, anillos, clave_poligono, catalogo_ndvi.version, pool)
+            total.n_ndvi += parcial.n_ndvi
+            total.suma_ndvi += parcial.suma_ndvi
+            total.hist_ndvi = total.hist_ndvi + parcial.hist_ndvi
+
+    resumen = total.resumen(umbral_pendiente, umbral_ndvi)
+    resumen['tiles'] = {'completos': completos, 'borde': parciales}
+    return resumen
+
+
+def contar_tiles(catalogo, catalogo_ndvi, anillos_zonas):
+    """Tiles distintos (DEM + NDVI) que tocan los bbox de las zonas."""
+    rutas = set()
+    for anillos in anillos_zonas:
+        bbox = _bbox_anillos(anillos)
+        for cat in (catalogo, catalogo_ndvi):
+            if cat is not None:
+                rutas.update(ruta for ruta, _ in cat.tiles_bbox(bbox))
+    return len(rutas)
+
+
+def estadisticas_zona(catalogo, catalogo_ndvi, poligono, umbral_pendiente=30, umbral_ndvi=0.6, pool=None):
+    """
+    Estadísticas de un polígono (anillo suelto o coordenadas GeoJSON Polygon).
+
+    Raises:
+        ValueError si el polígono no tiene la forma esperada (ver leer_poligono)
+    """
+    poligono, anillos = leer_poligono(poligono)
+    return _estadisticas_anillos(catalogo, catalogo_ndvi, poligono, anillos, umbral_pendiente, umbral_ndvi, pool)
+
+
+def estadisticas_zonales(catalogo, catalogo_ndvi, zonas, umbral_pendiente=30, umbral_ndvi=0.6, pool=None,
+                         max_tiles=MAX_TILES_LLAMADA):
+    """
+    Estadísticas de varias zonas en una llamada.
+
+    Args:
+        zonas: lista de {"id"?, "poligono"} o Features GeoJSON Polygon
+        max_tiles: tope de tiles distintos que puede leer la llamada
+
+    Returns:
+        lista de resúmenes con el id de cada zona (o su posición)
+
+    Raises:
+        ValueError si alguna zona no tiene la forma esperada o las zonas
+        tocan más de max_tiles tiles (se valida todo antes de leer)
+    """
+    leidas = [leer_zona(zona, i) for i, zona in enumerate(zonas)]
+    tiles = contar_tiles(catalogo, catalogo_ndvi, [anillos for _, _, anillos in leidas])
+    if tiles > max_tiles:
+        raise ValueError(f'Las zonas tocan {tiles} tiles (máximo {max_tiles}); '
+                         f'achicar los sectores o repartirlos en varias llamadas')
+
+    resultados = []
+    for identificador, poligono, anillos in leidas:
+        resumen = _estadisticas_anillos(catalogo, catalogo_ndvi, poligono, anillos,
+                                        umbral_pendiente, umbral_ndvi, pool)
+        resumen['id'] = identificador
+        resultados.append(resumen)
+    return resultados
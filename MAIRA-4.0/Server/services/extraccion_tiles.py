@@ -0,0 +1,233 @@
+"""
+Extracción coordinada de tiles desde archivos .tar.gz
+
+Cuando varios navegadores piden a la vez tiles que faltan en disco, cada
+request bajaba y descomprimía su propia copia del mismo archivo, pisándose en
+los temporales y en archivos de salida a medio escribir. Este módulo:
+
+- Agrupa los misses concurrentes del mismo tile en una sola extracción
+  (single-flight): el primero la hace, los demás esperan su resultado.
+- Desempaqueta cada archivo una sola vez por proceso en un hilo de fondo,
+  en streaming, escribiendo cada tile en un temporal y renombrándolo: nunca
+  se sirve un archivo a medio escribir. Los requests que esperan un tile de
+  un archivo sin índice se liberan apenas ese tile queda en disco.
+- Con archivos indexados (archivo_tiles.py) el tile pedido se baja por Range
+  sin esperar al resto, y el desempaquetado completo sigue en segundo plano.
+
+Después, los requests siguientes son lecturas de disco.
+
+Uso:
+-----
+    ruta = extractor_tiles.obtener(url_tar_gz, 'centro/tile_0001.tif', tiles_dir,
+                                   prefijo='Altimetria_Mini_Tiles/')
+    if ruta is None: ...  # el archivo no contiene ese tile
+
+Configuración:
+--------------
+- MAIRA_EXTRAER_COMPLETO: desempaquetar en segundo plano todo el archivo
+  tras un miss servido por Range (1)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import time
+import shutil
+import threading
+
+from .archivo_tiles import abrir_stream, lector_archivo
+
+EXTRAER_COMPLETO = os.getenv('MAIRA_EXTRAER_COMPLETO', '1') == '1'
+TIMEOUT_ESPERA = 600  # segundos
+
+
+class _Vuelo:
+    __slots__ = ('evento', 'resultado', 'error')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class VueloUnico:
+    """Ejecuta una sola vez cada operación en curso; las llamadas concurrentes con la misma clave esperan su resultado."""
+
+    def __init__(self):
+        self._vuelos = {}
+        self._lock = threading.Lock()
+
+    def ejecutar(self, clave, funcion):
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[clave] = _Vuelo()
+
+        if not lider:
+            vuelo.evento.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado
+
+        try:
+            vuelo.resultado = funcion()
+            return vuelo.resultado
+        except Exception as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._vuelos[clave]
+            vuelo.evento.set()
+
+
+def ruta_dentro(directorio, nombre):
+    """Ruta de `nombre` bajo `directorio`; ValueError si se escapa (p.ej. '../')."""
+    base = os.path.abspath(directorio)
+    destino = os.path.abspath(os.path.join(base, nombre))
+    if os.path.commonpath([base, destino]) != base:
+        raise ValueError(f'Ruta fuera del directorio de tiles: {nombre}')
+    return destino
+
+
+def escribir_atomico(destino, origen):
+    """Copia el file-like `origen` a `destino` vía temporal + rename."""
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporal = f'{destino}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(temporal, 'wb') as f:
+            shutil.copyfileobj(origen, f)
+        os.replace(temporal, destino)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+class TrabajoExtraccion(threading.Thread):
+    """Desempaqueta un .tar.gz completo en streaming, una vez, en segundo plano."""
+
+    def __init__(self, fuente, directorio, prefijo=''):
+        super().__init__(daemon=True, name=f'extraccion-{os.path.basename(fuente)}')
+        self.fuente = fuente
+        self.directorio = directorio
+        self.prefijo = prefijo
+        self.terminado = False
+        self.error = None
+        self.extraidos = 0
+        self._condicion = threading.Condition()
+
+    def run(self):
+        inicio = time.time()
+        print(f'📦 Desempaquetando en segundo plano: {self.fuente}')
+        try:
+            with abrir_stream(self.fuente) as tar:
+                for miembro in tar:
+                    if not miembro.isfile():
+                        continue
+                    nombre = miembro.name
+                    if self.prefijo and self.prefijo in nombre:
+                        nombre = nombre.split(self.prefijo, 1)[1]
+                    try:
+                        destino = ruta_dentro(self.directorio, nombre)
+                    except ValueError as e:
+                        print(f'⚠️ {e}')
+                        continue
+                    if not os.path.exists(destino):
+                        with tar.extractfile(miembro) as origen:
+                            escribir_atomico(destino, origen)
+                        self.extraidos += 1
+                    with self._condicion:
+                        self._condicion.notify_all()
+            print(f'✅ {os.path.basename(self.fuente)}: {self.extraidos} tiles extraídos en {time.time() - inicio:.1f}s')
+        except Exception as e:
+            self.error = e
+            print(f'❌ Error desempaquetando {self.fuente}: {e}')
+        finally:
+            with self._condicion:
+                self.terminado = True
+                self._condicion.notify_all()
+
+    def esperar(self, destino, timeout=TIMEOUT_ESPERA):
+        """
+        Espera a que `destino` esté en disco o a que termine el trabajo.
+
+        Returns:
+            destino, o None si el archivo no lo contenía
+        """
+        limite = time.time() + timeout
+        with self._condicion:
+            while not os.path.exists(destino) and not self.terminado:
+                restante = limite - time.time()
+                if restante <= 0:
+                    raise TimeoutError(f'Tiempo agotado esperando {os.path.basename(destino)}')
+                self._condicion.wait(min(restante, 5))
+        if os.path.exists(destino):
+            return destino
+        if self.error is not None:
+            raise self.error
+        return None
+
+
+class ExtractorTiles:
+    """Single-flight por tile y desempaquetado único por archivo"""
+
+    def __init__(self):
+        self._vuelos = VueloUnico()
+        self._trabajos = {}
+        self._lock = threading.Lock()
+
+    def extraer_todo(self, fuente, directorio, prefijo=''):
+        """TrabajoExtraccion del archivo; lo arranca si no corrió o si falló."""
+        clave = (fuente, os.path.abspath(directorio))
+        with self._lock:
+            trabajo = self._trabajos.get(clave)
+            if trabajo is None or (trabajo.terminado and trabajo.error is not None):
+                trabajo = TrabajoExtraccion(fuente, directorio, prefijo)
+                self._trabajos[clave] = trabajo
+                trabajo.start()
+            return trabajo
+
+    def obtener(self, fuente, nombre, directorio, prefijo='', timeout=TIMEOUT_ESPERA):
+        """
+        Ruta local del tile `nombre` (relativo a directorio), extrayéndolo del
+        .tar.gz `fuente` (URL o ruta) si falta.
+
+        Returns:
+            ruta, o None si el archivo no contiene el tile
+        """
+        destino = ruta_dentro(directorio, nombre)
+        if os.path.exists(destino):
+            return destino
+
+        lector = lector_archivo(fuente)
+        if lector.indice() is None:
+            return self.extraer_todo(fuente, directorio, prefijo).esperar(destino, timeout)
+
+        miembro = lector.buscar(nombre)
+        if miembro is None:
+            return None
+
+        def extraer():
+            if not os.path.exists(destino):
+                tamano = lector.extraer(miembro, destino)
+                print(f'✅ Tile extraído por rango: {miembro} ({tamano / 1024:.0f} KB)')
+            return destino
+
+        self._vuelos.ejecutar(destino, extraer)
+        if EXTRAER_COMPLETO:
+            self.extraer_todo(fuente, directorio, prefijo)
+        return destino
+
+    def estadisticas(self):
+        with self._lock:
+            return [{
+                'archivo': os.path.basename(trabajo.fuente),
+                'terminado': trabajo.terminado,
+                'extraidos': trabajo.extraidos,
+                'error': str(trabajo.error) if trabajo.error else None
+            } for trabajo in self._trabajos.values()]
+
+
+extractor_tiles = ExtractorTiles()
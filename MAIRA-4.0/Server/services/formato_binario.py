@@ -0,0 +1,158 @@
+"""
+Formato binario para los endpoints batch de altimetría / NDVI
+
+Con 50k puntos, parsear la lista JSON de {"lat","lon","index"} y serializar
+la respuesta cuesta más que el muestreo. Este módulo implementa un modo
+binario negociado por cabeceras HTTP que convive con el JSON de siempre:
+
+Request (Content-Type: application/octet-stream; dtype=float32|float64):
+    pares lat,lon intercalados, little-endian -> [lat0, lon0, lat1, lon1, ...]
+    (sin dtype se asume float64). El orden de los pares es el índice.
+
+Response (si Accept prefiere application/octet-stream):
+    float32 little-endian, un valor por punto, NaN = sin dato.
+    Los metadatos van en cabeceras X-Count, X-Valid-Count, X-Tiles-Loaded
+    y X-Processing-Time.
+
+Uso:
+-----
+    lats, lons, indices = leer_puntos_request(request)   # JSON o binario
+    ...
+    if acepta_binario(request):
+        return respuesta_binaria(valores, count=n, valid_count=v)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import numpy as np
+
+MIME_BINARIO = 'application/octet-stream'
+MIME_JSON = 'application/json'
+
+DTYPES_COORDENADAS = {
+    'float32': np.dtype('<f4'),
+    'float64': np.dtype('<f8'),
+}
+
+DTYPE_VALORES = np.dtype('<f4')
+
+
+def pide_binario(request):
+    """True si el cuerpo del request viene en el formato binario."""
+    return request.mimetype == MIME_BINARIO
+
+
+def acepta_binario(request):
+    """True si el cliente prefiere la respuesta binaria sobre JSON."""
+    mejor = request.accept_mimetypes.best_match([MIME_JSON, MIME_BINARIO], default=MIME_JSON)
+    return mejor == MIME_BINARIO
+
+
+def leer_coordenadas_binarias(cuerpo, dtype=None):
+    """
+    Interpreta el cuerpo binario sin copiar (np.frombuffer).
+
+    Args:
+        cuerpo: bytes del request con pares lat,lon intercalados
+        dtype: 'float32' o 'float64' (None = float64)
+
+    Returns:
+        (lats, lons) como vistas de solo lectura sobre el buffer
+
+    Raises:
+        ValueError si el dtype no es soportado o el tamaño no cuadra
+    """
+    nombre = dtype or 'float64'
+    if nombre not in DTYPES_COORDENADAS:
+        raise ValueError(f'dtype no soportado: {nombre} (usar float32 o float64)')
+    tipo = DTYPES_COORDENADAS[nombre]
+
+    if len(cuerpo) % (2 * tipo.itemsize) != 0:
+        raise ValueError(f'Cuerpo de {len(cuerpo)} bytes no es múltiplo de un par lat,lon {nombre}')
+
+    pares = np.frombuffer(cuerpo, dtype=tipo).reshape(-1, 2)
+    return pares[:, 0], pares[:, 1]
+
+
+def leer_puntos_request(request):
+    """
+    Coordenadas de un request batch en cualquiera de los dos formatos.
+
+    Returns:
+        (lats, lons, indices); indices es None en modo binario (el orden
+        de los pares ya es la posición de salida)
+
+    Raises:
+        ValueError si faltan puntos o el cuerpo binario es inválido
+    """
+    if pide_binario(request):
+        lats, lons = leer_coordenadas_binarias(request.get_data(), request.mimetype_params.get('dtype'))
+        indices = None
+    else:
+        from .muestreo_raster import extraer_coordenadas
+
+        data = request.get_json(silent=True)
+        if not data or 'points' not in data:
+            raise ValueError('Se requiere points')
+        lats, lons, indices = extraer_coordenadas(data['points'])
+
+    if len(lats) == 0:
+        raise ValueError('Se requiere al menos un punto')
+    return lats, lons, indices
+
+
+def valores_a_binario(valores):
+    """Array con NaN -> bytes float32 little-endian (NaN se conserva como centinela)."""
+    return np.ascontiguousarray(valores, dtype=DTYPE_VALORES).tobytes()
+
+
+def respuesta_binaria(valores, count=None, valid_count=None, tiles_loaded=None, processing_time=None,
+                      forma=None):
+    """
+    Response Flask con los valores en float32 y los metadatos en cabeceras.
+    Con `forma` (rows, cols) el cuerpo es la matriz en orden fila-mayor.
+    """
+    from flask import Response
+
+    cabeceras = {'X-Value-Dtype': 'float32'}
+    if forma is not None:
+        cabeceras['X-Rows'], cabeceras['X-Cols'] = str(forma[0]), str(forma[1])
+    if count is not None:
+        cabeceras['X-Count'] = str(count)
+    if valid_count is not None:
+        cabeceras['X-Valid-Count'] = str(valid_count)
+    if tiles_loaded is not None:
+        cabeceras['X-Tiles-Loaded'] = str(tiles_loaded)
+    if processing_time is not None:
+        cabeceras['X-Processing-Time'] = f'{processing_time:.4f}'
+    # Sin esto el navegador oculta las cabeceras en requests cross-origin
+    cabeceras['Access-Control-Expose-Headers'] = ', '.join(cabeceras)
+
+    return Response(valores_a_binario(valores), mimetype=MIME_BINARIO, headers=cabeceras)
+
+
+def respuesta_grilla(request, grilla, matriz, clave, tiles_loaded, processing_time, extras=None):
+    """
+    Respuesta del modo grilla (ver grilla_muestreo.py): matriz rows x cols
+    como lista 2-D JSON con null, o float32 fila-mayor si el cliente acepta binario.
+    `extras` agrega capas 2-D adicionales a la respuesta JSON.
+    """
+    from flask import jsonify
+    from .muestreo_raster import a_lista_json
+
+    valid_count = int(np.count_nonzero(~np.isnan(matriz)))
+    if acepta_binario(request):
+        return respuesta_binaria(matriz, count=matriz.size, valid_count=valid_count,
+                                 tiles_loaded=tiles_loaded, processing_time=processing_time,
+                                 forma=grilla.forma)
+
+    return jsonify({
+        clave: a_lista_json(matriz),
+        'grilla': grilla.metadata(),
+        'count': int(matriz.size),
+        'valid_count': valid_count,
+        'tiles_loaded': tiles_loaded,
+        'processing_time': processing_time,
+        **(extras or {})
+    })
@@ -0,0 +1,502 @@
+"""
+Grafo vial topológico en arrays CSR abiertos por mmap, con ruteo en proceso
+
+Las capas de Transporte (rutas nacionales, provinciales y caminos) solo se
+servían como GeoJSON crudo. La planificación logística de convoyes necesita
+cientos de rutas por plan, así que el grafo se construye offline
+(tools/create_road_graph.py) y el servidor lo abre por mmap:
+
+- Nodos: extremos de cada línea y vértices compartidos entre líneas
+  (cruces y empalmes), con coordenadas cuantizadas para unir vértices
+  iguales de tiles distintos.
+- Aristas no dirigidas entre nodos consecutivos de una línea, con largo en
+  metros, tipo de vía y los vértices intermedios para reconstruir la traza.
+- Adyacencia CSR con las dos direcciones: indptr[n]..indptr[n+1] son los
+  vecinos de n; largo y tipo repetidos por entrada CSR para no indirectar.
+- Índice espacial de nodos por celdas de CELDA_INDICE grados (para ubicar
+  el nodo más cercano a una coordenada).
+
+Ruteo: Dijkstra bidireccional para pares sueltos y Dijkstra uno-a-muchos
+para lotes (los pares se agrupan por origen: una expansión resuelve todos
+sus destinos). El peso es tiempo (largo / velocidad del tipo de vía, con
+tope por vehículo) o distancia.
+
+Uso:
+-----
+    grafo = construir_grafo(lineas)                  # [(coords lon/lat, tipo), ...]
+    guardar_grafo(grafo, directorio)
+
+    grafo = obtener_grafo_vial(directorio)           # GrafoVial por mmap
+    ruta = grafo.ruta((lat0, lon0), (lat1, lon1), velocidad_max=60)
+    rutas = grafo.rutas_lote([((lat0, lon0), (lat1, lon1)), ...])
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import json
+import math
+import heapq
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+RADIO_TIERRA = 6371000
+
+TIPOS_VIA = ('ruta_nacional', 'ruta_provincial', 'caminos')
+
+# Velocidad de marcha por tipo de vía (km/h)
+VELOCIDADES_VIA = np.array([80.0, 60.0, 30.0])
+
+DECIMALES_NODO = 6          # 1e-6° ≈ 0.1 m para unir vértices iguales
+CELDA_INDICE = 0.01         # grados por celda del índice espacial de nodos
+RADIO_BUSQUEDA = 5          # celdas a recorrer buscando el nodo más cercano
+
+VERSION_FORMATO = 1
+
+# Arrays del grafo en disco: nombre -> dtype
+ARRAYS = {
+    'nodos': np.float64,         # (N, 2) lon, lat
+    'indptr': np.int64,          # (N + 1,)
+    'vecinos': np.int32,         # (2E,) nodo destino por entrada CSR
+    'aristas': np.int32,         # (2E,) arista no dirigida por entrada CSR
+    'largo_csr': np.float32,     # (2E,) metros
+    'tipo_csr': np.int8,         # (2E,) índice en TIPOS_VIA
+    'arista_origen': np.int32,   # (E,) nodo inicial de la traza de la arista
+    'geom_ptr': np.int64,        # (E + 1,)
+    'geom': np.float32,          # (M, 2) vértices intermedios lon, lat
+    'celda_claves': np.int64,    # (C,) claves ordenadas del índice espacial
+    'celda_ptr': np.int64,       # (C + 1,)
+    'celda_nodos': np.int32,     # (N,) nodos ordenados por celda
+}
+
+
+class SinRutaVial(Exception):
+    """No hay camino por la red vial entre los puntos"""
+
+
+def distancias_tramos(coords):
+    """Haversine entre vértices consecutivos de un array (n, 2) lon/lat."""
+    lon = np.radians(coords[:, 0])
+    lat = np.radians(coords[:, 1])
+    a = (np.sin(np.diff(lat) / 2) ** 2 +
+         np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2)
+    return 2 * RADIO_TIERRA * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _clave_celda(lons, lats):
+    col = np.floor((np.asarray(lons) + 180.0) / CELDA_INDICE).astype(np.int64)
+    fila = np.floor((np.asarray(lats) + 90.0) / CELDA_INDICE).astype(np.int64)
+    return fila * 100000 + col
+
+
+# ----------------------------------------------------------------------
+# Construcción offline
+# ----------------------------------------------------------------------
+def construir_grafo(lineas, decimales=DECIMALES_NODO):
+    """
+    Grafo topológico a partir de polilíneas.
+
+    Args:
+        lineas: iterable de (coords, tipo): coords array-like (n, 2) lon/lat,
+                tipo índice en TIPOS_VIA. Las líneas repetidas (la misma
+                feature en varios tiles) se descartan.
+        decimales: cuantización de coordenadas para unir vértices
+
+    Returns:
+        dict {nombre: array} con las claves de ARRAYS
+    """
+    factor = 10 ** decimales
+    vistas = set()
+    partes, tipos = [], []
+    for coords, tipo in lineas:
+        q = np.round(np.asarray(coords, dtype=np.float64)[:, :2] * factor).astype(np.int64)
+        if len(q) > 1:
+            # Vértices repetidos consecutivos no aportan tramos
+            q = q[np.concatenate([[True], np.any(np.diff(q, axis=0) != 0, axis=1)])]
+        if len(q) < 2:
+            continue
+        firma = min(q.tobytes(), q[::-1].tobytes())
+        if firma in vistas:
+            continue
+        vistas.add(firma)
+        partes.append(q)
+        tipos.append(int(tipo))
+    if not partes:
+        raise ValueError('No hay líneas para construir el grafo')
+
+    # Vértices únicos; son nodo los extremos de línea y los que aparecen más de una vez
+    todos = np.concatenate(partes)
+    unicos, inverso, cuentas = np.unique(todos, axis=0, return_inverse=True, return_counts=True)
+    inverso = inverso.ravel()
+    es_nodo = cuentas >= 2
+    largos_partes = np.array([len(p) for p in partes])
+    fin = np.cumsum(largos_partes)
+    inicio = fin - largos_partes
+    es_nodo[inverso[inicio]] = True
+    es_nodo[inverso[fin - 1]] = True
+    id_nodo = np.cumsum(es_nodo) - 1
+    nodos = unicos[es_nodo] / factor
+
+    u, v, largos, tipo_arista = [], [], [], []
+    geom_ptr, geom = [0], []
+    for k, q in enumerate(partes):
+        vid = inverso[inicio[k]:fin[k]]
+        coords = q / factor
+        tramos = distancias_tramos(coords)
+        acumulado = np.concatenate([[0.0], np.cumsum(tramos)])
+        cortes = np.flatnonzero(es_nodo[vid])
+        for a, b in zip(cortes[:-1], cortes[1:]):
+            na, nb = id_nodo[vid[a]], id_nodo[vid[b]]
+            largo = acumulado[b] - acumulado[a]
+            if na == nb and largo == 0:
+                continue
+            u.append(na)
+            v.append(nb)
+            largos.append(largo)
+            tipo_arista.append(tipos[k])
+            geom.append(coords[a + 1:b])
+            geom_ptr.append(geom_ptr[-1] + b - a - 1)
+
+    u = np.asarray(u, dtype=np.int64)
+    v = np.asarray(v, dtype=np.int64)
+    n_aristas = len(u)
+    largos = np.asarray(largos)
+    tipo_arista = np.asarray(tipo_arista, dtype=np.int8)
+
+    # CSR con ambas direcciones
+    desde = np.concatenate([u, v])
+    hacia = np.concatenate([v, u])
+    aristas = np.concatenate([np.arange(n_aristas), np.arange(n_aristas)])
+    orden = np.argsort(desde, kind='stable')
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(desde, minlength=len(nodos)))])
+
+    # Índice espacial de nodos
+    claves = _clave_celda(nodos[:, 0], nodos[:, 1])
+    orden_celdas = np.argsort(claves, kind='stable')
+    celda_claves, celda_inicio = np.unique(claves[orden_celdas], return_index=True)
+
+    return {
+        'nodos': nodos,
+        'indptr': indptr,
+        'vecinos': hacia[orden],
+        'aristas': aristas[orden],
+        'largo_csr': largos[aristas[orden]],
+        'tipo_csr': tipo_arista[aristas[orden]],
+        'arista_origen': u,
+        'geom_ptr': np.asarray(geom_ptr),
+        'geom': np.concatenate(geom) if geom_ptr[-1] else np.zeros((0, 2)),
+        'celda_claves': celda_claves,
+        'celda_ptr': np.append(celda_inicio, len(nodos)),
+        'celda_nodos': orden_celdas,
+    }
+
+
+def guardar_grafo(grafo, directorio, fuente=None):
+    """
+    Un .npy por array (abrible por mmap) y metadata.json al final. Todo se
+    escribe a temporales y entra con os.replace: un servidor que tiene el
+    grafo anterior mapeado conserva sus archivos (no se truncan) y recarga
+    recién cuando cambia metadata.json.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    temporales = []
+    for nombre, dtype in ARRAYS.items():
+        destino = os.path.join(directorio, f'{nombre}.npy')
+        temporal = destino + '.tmp.npy'
+        np.save(temporal, np.ascontiguousarray(grafo[nombre], dtype=dtype))
+        temporales.append((temporal, destino))
+    for temporal, destino in temporales:
+        os.replace(temporal, destino)
+
+    tipos = np.bincount(grafo['tipo_csr'], minlength=len(TIPOS_VIA)) // 2
+    metadata = {
+        'version': VERSION_FORMATO,
+        'nodos': int(len(grafo['nodos'])),
+        'aristas': int(len(grafo['arista_origen'])),
+        'km_por_tipo': {
+            t: round(float(grafo['largo_csr'][grafo['tipo_csr'] == i].sum()) / 2000, 1)
+            for i, t in enumerate(TIPOS_VIA)
+        },
+        'aristas_por_tipo': {t: int(tipos[i]) for i, t in enumerate(TIPOS_VIA)},
+        'tipos_via': list(TIPOS_VIA),
+        'celda_indice': CELDA_INDICE,
+        'fuente': fuente
+    }
+    ruta_metadata = os.path.join(directorio, 'metadata.json')
+    with open(ruta_metadata + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False)
+    os.replace(ruta_metadata + '.tmp', ruta_metadata)
+    return metadata
+
+
+# ----------------------------------------------------------------------
+# Grafo en el servidor
+# ----------------------------------------------------------------------
+class GrafoVial:
+    """Grafo CSR abierto por mmap con ruteo bidireccional y por lotes"""
+
+    def __init__(self, directorio):
+        with open(os.path.join(directorio, 'metadata.json'), encoding='utf-8') as f:
+            self.metadata = json.load(f)
+        if self.metadata.get('version') != VERSION_FORMATO:
+            raise ValueError(f"Formato de grafo {self.metadata.get('version')} no soportado")
+
+        self.directorio = directorio
+        for nombre in ARRAYS:
+            setattr(self, nombre, np.load(os.path.join(directorio, f'{nombre}.npy'), mmap_mode='r'))
+        self._pesos = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.nodos)
+
+    # -- pesos por perfil ---------------------------------------------
+    def pesos(self, peso='tiempo', velocidad_max=None, excluir=()):
+        """
+        Peso por entrada CSR: segundos (tiempo) o metros (distancia);
+        inf para tipos de vía excluidos. Se calcula una vez por perfil.
+        """
+        clave = (peso, velocidad_max, tuple(sorted(excluir)))
+        pesos = self._pesos.get(clave)
+        if pesos is None:
+            if peso == 'distancia':
+                por_tipo = np.ones(len(TIPOS_VIA))
+            else:
+                velocidades = VELOCIDADES_VIA if velocidad_max is None else np.minimum(VELOCIDADES_VIA, velocidad_max)
+                por_tipo = 3.6 / velocidades
+            for tipo in excluir:
+                por_tipo[TIPOS_VIA.index(tipo)] = np.inf
+            pesos = np.asarray(self.largo_csr, dtype=np.float64) * por_tipo[self.tipo_csr]
+            with self._lock:
+                if len(self._pesos) >= 8:
+                    self._pesos.pop(next(iter(self._pesos)))
+                self._pesos[clave] = pesos
+        return pesos
+
+    # -- ubicación ----------------------------------------------------
+    def _nodos_anillo(self, fila0, col0, radio):
+        """Nodos de las celdas del índice a distancia Chebyshev `radio` de (fila0, col0)."""
+        encontrados = []
+        for fila in range(fila0 - radio, fila0 + radio + 1):
+            for col in range(col0 - radio, col0 + radio + 1):
+                if max(abs(fila - fila0), abs(col - col0)) != radio:
+                    continue
+                clave = fila * 100000 + col
+                k = int(np.searchsorted(self.celda_claves, clave))
+                if k < len(self.celda_claves) and self.celda_claves[k] == clave:
+                    encontrados.append(self.celda_nodos[self.celda_ptr[k]:self.celda_ptr[k + 1]])
+        return encontrados
+
+    def nodo_cercano(self, lat, lon):
+        """
+        (nodo, distancia_m) del nodo más cercano buscando en anillos de
+        celdas del índice hasta RADIO_BUSQUEDA; None si no hay ninguno.
+        """
+        fila0 = int(math.floor((lat + 90.0) / CELDA_INDICE))
+        col0 = int(math.floor((lon + 180.0) / CELDA_INDICE))
+        for radio in range(RADIO_BUSQUEDA + 1):
+            candidatos = self._nodos_anillo(fila0, col0, radio)
+            if not candidatos:
+                continue
+            # El anillo siguiente puede tener un nodo más cerca que uno de la esquina de este
+            candidatos += self._nodos_anillo(fila0, col0, radio + 1)
+            ids = np.concatenate(candidatos)
+            coords = np.asarray(self.nodos[ids])
+            aprox = np.hypot((coords[:, 0] - lon) * math.cos(math.radians(lat)), coords[:, 1] - lat)
+            mejor = int(np.argmin(aprox))
+            return int(ids[mejor]), float(distancias_tramos(np.array([[lon, lat], coords[mejor]]))[0])
+        return None
+
+    # -- búsquedas ----------------------------------------------------
+    def _expandir(self, u, d, pesos):
+        ini, fin = int(self.indptr[u]), int(self.indptr[u + 1])
+        return zip(range(ini, fin), self.vecinos[ini:fin].tolist(), (pesos[ini:fin] + d).tolist())
+
+    def _bidireccional(self, s, t, pesos):
+        """Dijkstra bidireccional (grafo no dirigido: la búsqueda inversa usa el mismo CSR)."""
+        if s == t:
+            return 0.0, [s], []
+        inf = math.inf
+        dist = ({s: 0.0}, {t: 0.0})
+        previo = ({s: None}, {t: None})     # nodo -> (nodo anterior, entrada CSR)
+        cerrados = (set(), set())
+        heaps = ([(0.0, s)], [(0.0, t)])
+        mejor, encuentro = inf, None
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= mejor:
+                break
+            lado = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            d, u = heapq.heappop(heaps[lado])
+            if u in cerrados[lado]:
+                continue
+            cerrados[lado].add(u)
+            dist_lado, dist_otro = dist[lado], dist[1 - lado]
+            for k, v, nd in self._expandir(u, d, pesos):
+                if nd < dist_lado.get(v, inf):
+                    dist_lado[v] = nd
+                    previo[lado][v] = (u, k)
+                    heapq.heappush(heaps[lado], (nd, v))
+                    otra = dist_otro.get(v)
+                    if otra is not None and nd + otra < mejor:
+                        mejor, encuentro = nd + otra, v
+
+        if encuentro is None:
+            raise SinRutaVial('No hay conexión por la red vial entre los puntos')
+
+        # s -> encuentro por la búsqueda directa, encuentro -> t por la inversa
+        nodos, entradas = [encuentro], []
+        nodo = encuentro
+        while previo[0][nodo] is not None:
+            nodo, k = previo[0][nodo]
+            nodos.append(nodo)
+            entradas.append(k)
+        nodos.reverse()
+        entradas.reverse()
+        nodo = encuentro
+        while previo[1][nodo] is not None:
+            nodo, k = previo[1][nodo]
+            nodos.append(nodo)
+            entradas.append(k)
+        return mejor, nodos, entradas
+
+    def _uno_a_muchos(self, s, objetivos, pesos):
+        """Dijkstra desde s hasta cerrar todos los objetivos alcanzables; devuelve `previo`."""
+        inf = math.inf
+        dist = {s: 0.0}
+        previo = {s: None}
+        pendientes = set(objetivos)
+        cerrados = set()
+        heap = [(0.0, s)]
+        while heap and pendientes:
+            d, u = heapq.heappop(heap)
+            if u in cerrados:
+                continue
+            cerrados.add(u)
+            pendientes.discard(u)
+            for k, v, nd in self._expandir(u, d, pesos):
+                if nd < dist.get(v, inf):
+                    dist[v] = nd
+                    previo[v] = (u, k)
+                    heapq.heappush(heap, (nd, v))
+        return dist, previo, cerrados
+
+    # -- resultados ---------------------------------------------------
+    def _traza(self, nodos, entradas):
+        """
+        Coordenadas [lon, lat] del recorrido con los vértices intermedios de cada arista.
+        Las entradas CSR de la mitad inversa de una ruta bidireccional apuntan
+        hacia atrás, así que el nodo siguiente se toma de `nodos`, no del CSR.
+        """
+        coords = [self.nodos[nodos[0]].tolist()]
+        for u, v, k in zip(nodos[:-1], nodos[1:], entradas):
+            e = int(self.aristas[k])
+            intermedios = np.asarray(self.geom[self.geom_ptr[e]:self.geom_ptr[e + 1]], dtype=np.float64)
+            if self.arista_origen[e] != u:
+                intermedios = intermedios[::-1]
+            coords.extend(intermedios.tolist())
+            coords.append(self.nodos[v].tolist())
+        return [[round(lon, 6), round(lat, 6)] for lon, lat in coords]
+
+    def _resultado(self, costo, nodos, entradas, peso, accesos):
+        entradas = np.asarray(entradas, dtype=np.int64)
+        largos = np.asarray(self.largo_csr[entradas], dtype=np.float64) if len(entradas) else np.zeros(0)
+        tipos = np.asarray(self.tipo_csr[entradas]) if len(entradas) else np.zeros(0, dtype=np.int8)
+        resultado = {
+            'geometria': {'type': 'LineString', 'coordinates': self._traza(nodos, entradas.tolist())},
+            'distancia_m': round(float(largos.sum()), 1),
+            'por_tipo_m': {
+                TIPOS_VIA[i]: round(float(largos[tipos == i].sum()), 1)
+                for i in np.unique(tipos).tolist()
+            },
+            'nodos': len(nodos),
+            'acceso_m': [round(a, 1) for a in accesos]
+        }
+        if peso == 'tiempo':
+            resultado['tiempo_s'] = round(costo, 1)
+            resultado['eta_min'] = round(costo / 60, 1)
+        return resultado
+
+    def _ubicar(self, punto):
+        ubicado = self.nodo_cercano(float(punto[0]), float(punto[1]))
+        if ubicado is None:
+            raise SinRutaVial(f'No hay red vial cerca de {punto[0]:.5f}, {punto[1]:.5f}')
+        return ubicado
+
+    def ruta(self, origen, destino, peso='tiempo', velocidad_max=None, excluir=()):
+        """
+        Ruta por la red vial entre dos (lat, lon), entrando y saliendo por
+        el nodo más cercano a cada punto.
+
+        Raises:
+            SinRutaVial si no hay red cerca o no hay conexión
+        """
+        pesos = self.pesos(peso, velocidad_max, excluir)
+        (s, acceso_s), (t, acceso_t) = self._ubicar(origen), self._ubicar(destino)
+        costo, nodos, entradas = self._bidireccional(s, t, pesos)
+        return self._resultado(costo, nodos, entradas, peso, (acceso_s, acceso_t))
+
+    def rutas_lote(self, pares, peso='tiempo', velocidad_max=None, excluir=()):
+        """
+        Muchas rutas de una vez: un Dijkstra por origen distinto resuelve
+        todos sus destinos. Los pares sin ruta devuelven {'error': ...}.
+        """
+        pesos = self.pesos(peso, velocidad_max, excluir)
+        resultados = [None] * len(pares)
+        por_origen = defaultdict(list)
+        for i, (origen, destino) in enumerate(pares):
+            try:
+                s, acceso_s = self._ubicar(origen)
+                t, acceso_t = self._ubicar(destino)
+            except SinRutaVial as e:
+                resultados[i] = {'error': str(e)}
+                continue
+            por_origen[s].append((i, t, acceso_s, acceso_t))
+
+        for s, pedidos in por_origen.items():
+            dist, previo, cerrados = self._uno_a_muchos(s, [t for _, t, _, _ in pedidos], pesos)
+            for i, t, acceso_s, acceso_t in pedidos:
+                if t not in cerrados:
+                    resultados[i] = {'error': 'No hay conexión por la red vial entre los puntos'}
+                    continue
+                nodos, entradas = [t], []
+                while previo[nodos[-1]] is not None:
+                    u, k = previo[nodos[-1]]
+                    nodos.append(u)
+                    entradas.append(k)
+                nodos.reverse()
+                entradas.reverse()
+                resultados[i] = self._resultado(dist[t], nodos, entradas, peso, (acceso_s, acceso_t))
+        return resultados
+
+
+_grafos = {}
+_grafos_lock = threading.Lock()
+
+
+def obtener_grafo_vial(directorio):
+    """
+    GrafoVial del proceso para un directorio; se reabre si cambia metadata.json.
+
+    Raises:
+        FileNotFoundError si el grafo no fue construido
+    """
+    ruta_metadata = os.path.join(directorio, 'metadata.json')
+    if not os.path.exists(ruta_metadata):
+        raise FileNotFoundError(f'Grafo vial no construido: {directorio} (ejecutar tools/create_road_graph.py)')
+    mtime = os.path.getmtime(ruta_metadata)
+
+    entrada = _grafos.get(directorio)
+    if entrada is None or entrada[1] != mtime:
+        with _grafos_lock:
+            entrada = _grafos.get(directorio)
+            if entrada is None or entrada[1] != mtime:
+                grafo = GrafoVial(directorio)
+                entrada = (grafo, mtime)
+                _grafos[directorio] = entrada
+                print(f"🛣️ Grafo vial abierto: {grafo.metadata['nodos']} nodos, "
+                      f"{grafo.metadata['aristas']} aristas")
+    return entrada[0]
@@ -0,0 +1,339 @@
+"""
+Grillas regulares de muestreo generadas en el servidor
+
+En lugar de recibir miles de puntos explícitos (y en chunks), los endpoints
+aceptan una descripción compacta de la grilla:
+
+    "grilla": {
+        "bbox": {"west": ..., "south": ..., "east": ..., "north": ...},
+        "rows": 200, "cols": 300,          # o bien
+        "resolucion": 50,                  # metros por celda
+        "poligono": [[[lng, lat], ...]]    # opcional: máscara (GeoJSON, admite huecos)
+    }
+
+Si hay polígono y falta bbox, el bbox es el del polígono. La grilla se
+recorta con un punto-en-polígono vectorizado y se muestrea por tile con
+una única lectura de ventana (filas y columnas de píxel se calculan por
+separado porque la grilla es regular).
+
+Cada tile se lee en su overview interno más grueso cuyo píxel no supera el
+paso de la grilla (ver muestreo_raster.elegir_nivel): una grilla de 200 km
+con celdas de 500 m no decodifica los tiles a resolución completa. Los
+puntos sueltos pueden declarar su separación con "resolucion" (metros).
+
+Convención de salida: fila 0 = norte, columna 0 = oeste, valores en el
+centro de cada celda, NaN fuera del polígono o sin dato.
+
+Uso:
+-----
+    grilla = Grilla.desde_spec(data['grilla'])
+    valores, tiles_usados = muestrear_grilla(catalogo.tiles_bbox(grilla.bbox), grilla, pool=pool_global)
+    valores.shape == (grilla.rows, grilla.cols)
+
+Configuración:
+--------------
+- MAIRA_GRILLA_MAX_CELDAS: celdas máximas por grilla (4000000)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import math
+
+import numpy as np
+
+from .muestreo_raster import NODATA_DEFAULT, muestrear_tiles, abrir_para_paso, banda_para_paso
+
+METROS_POR_GRADO = 111320
+MAX_CELDAS = int(os.getenv('MAIRA_GRILLA_MAX_CELDAS', '4000000'))
+
+
+def _anillos_poligono(poligono):
+    """Normaliza un anillo suelto o coordenadas GeoJSON de Polygon a lista de anillos."""
+    if not poligono:
+        return []
+    if isinstance(poligono[0][0], (int, float)):
+        return [np.asarray(poligono, dtype=np.float64)]
+    return [np.asarray(anillo, dtype=np.float64) for anillo in poligono if len(anillo) >= 3]
+
+
+def punto_en_anillo(lons, lats, anillo):
+    """
+    Ray casting vectorizado: recorre las aristas del anillo una vez, cada
+    arista evaluada contra todos los puntos a la vez.
+
+    Args:
+        lons, lats: arrays de igual forma
+        anillo: array (n, 2) de [lng, lat]
+    """
+    dentro = np.zeros(np.shape(lons), dtype=bool)
+    xj, yj = anillo[-1]
+    for xi, yi in anillo:
+        cruza = (yi > lats) != (yj > lats)
+        if yj != yi:
+            x_corte = (xj - xi) * (lats - yi) / (yj - yi) + xi
+            dentro ^= cruza & (lons < x_corte)
+        xj, yj = xi, yi
+    return dentro
+
+
+def mascara_poligono(lons, lats, poligono):
+    """Máscara de puntos dentro del polígono (primer anillo) y fuera de sus huecos."""
+    anillos = _anillos_poligono(poligono)
+    if not anillos:
+        return np.ones(np.shape(lons), dtype=bool)
+    mascara = punto_en_anillo(lons, lats, anillos[0])
+    for hueco in anillos[1:]:
+        mascara &= ~punto_en_anillo(lons, lats, hueco)
+    return mascara
+
+
+class Grilla:
+    """Grilla regular sobre un bbox, con máscara opcional de polígono"""
+
+    def __init__(self, bbox, rows, cols, poligono=None):
+        if rows < 1 or cols < 1:
+            raise ValueError('La grilla debe tener al menos 1 fila y 1 columna')
+        if rows * cols > MAX_CELDAS:
+            raise ValueError(f'Grilla de {rows}x{cols} excede el máximo de {MAX_CELDAS} celdas')
+        if bbox['east'] <= bbox['west'] or bbox['north'] <= bbox['south']:
+            raise ValueError('bbox inválido: se requiere west < east y south < north')
+
+        self.bbox = {k: float(bbox[k]) for k in ('west', 'south', 'east', 'north')}
+        self.rows = int(rows)
+        self.cols = int(cols)
+        self.paso_lat = (self.bbox['north'] - self.bbox['south']) / self.rows
+        self.paso_lon = (self.bbox['east'] - self.bbox['west']) / self.cols
+
+        # Centros de celda: filas de norte a sur, columnas de oeste a este
+        self.lats = self.bbox['north'] - (np.arange(self.rows) + 0.5) * self.paso_lat
+        self.lons = self.bbox['west'] + (np.arange(self.cols) + 0.5) * self.paso_lon
+
+        if poligono:
+            lons2d, lats2d = np.meshgrid(self.lons, self.lats)
+            self.mascara = mascara_poligono(lons2d, lats2d, poligono)
+        else:
+            self.mascara = np.ones((self.rows, self.cols), dtype=bool)
+
+    @classmethod
+    def desde_spec(cls, spec, poligono=None):
+        """
+        Construye la grilla desde el JSON del request.
+
+        Args:
+            spec: dict con bbox y rows/cols o resolucion (metros); puede traer poligono
+            poligono: polígono por defecto si spec no trae uno (p.ej. el del análisis)
+
+        Raises:
+            ValueError si la especificación es incompleta o excede MAX_CELDAS
+        """
+        if not isinstance(spec, dict):
+            raise ValueError('grilla debe ser un objeto')
+
+        poligono = spec.get('poligono') or poligono
+        bbox = spec.get('bbox')
+        if bbox is None:
+            anillos = _anillos_poligono(poligono)
+            if not anillos:
+                raise ValueError('grilla requiere bbox o poligono')
+            exterior = anillos[0]
+            bbox = {
+                'west': float(exterior[:, 0].min()), 'east': float(exterior[:, 0].max()),
+                'south': float(exterior[:, 1].min()), 'north': float(exterior[:, 1].max())
+            }
+
+        if 'rows' in spec and 'cols' in spec:
+            rows, cols = int(spec['rows']), int(spec['cols'])
+        elif 'resolucion' in spec:
+            resolucion = float(spec['resolucion'])
+            if resolucion <= 0:
+                raise ValueError('resolucion debe ser positiva (metros)')
+            lat_centro = (bbox['north'] + bbox['south']) / 2
+            metros_lon = METROS_POR_GRADO * math.cos(math.radians(lat_centro))
+            rows = max(1, math.ceil((bbox['north'] - bbox['south']) * METROS_POR_GRADO / resolucion))
+            cols = max(1, math.ceil((bbox['east'] - bbox['west']) * metros_lon / resolucion))
+        else:
+            raise ValueError('grilla requiere rows y cols, o resolucion')
+
+        return cls(bbox, rows, cols, poligono)
+
+    def expandida(self, celdas=1):
+        """
+        Misma grilla con `celdas` filas/columnas extra en cada borde y sin
+        máscara: da a los operadores de vecindad (Horn 3x3) los vecinos del borde.
+        """
+        bbox = {
+            'west': self.bbox['west'] - celdas * self.paso_lon,
+            'east': self.bbox['east'] + celdas * self.paso_lon,
+            'south': self.bbox['south'] - celdas * self.paso_lat,
+            'north': self.bbox['north'] + celdas * self.paso_lat
+        }
+        return Grilla(bbox, self.rows + 2 * celdas, self.cols + 2 * celdas)
+
+    @property
+    def forma(self):
+        return (self.rows, self.cols)
+
+    def coordenadas(self):
+        """(lons, lats) planos de las celdas dentro de la máscara, en orden fila-mayor."""
+        filas, columnas = np.nonzero(self.mascara)
+        return self.lons[columnas], self.lats[filas]
+
+    def a_matriz(self, valores_planos):
+        """Inverso de coordenadas(): reubica valores planos en la matriz rows x cols."""
+        matriz = np.full(self.forma, np.nan)
+        matriz[self.mascara] = valores_planos
+        return matriz
+
+    def metadata(self):
+        """Descripción JSON de la grilla para acompañar la matriz de valores."""
+        return {
+            'rows': self.rows,
+            'cols': self.cols,
+            'bbox': self.bbox,
+            'paso_lat': self.paso_lat,
+            'paso_lon': self.paso_lon,
+            'celdas_en_mascara': int(self.mascara.sum())
+        }
+
+
+def leer_grilla_request(request, poligono=None):
+    """
+    Grilla del request si viene en modo grilla ({"grilla": {...}}), si no None.
+
+    Raises:
+        ValueError si la especificación de grilla es inválida
+    """
+    if request.mimetype != 'application/json':
+        return None
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or data.get('grilla') is None:
+        return None
+    return Grilla.desde_spec(data['grilla'], poligono=poligono)
+
+
+def leer_paso_request(request):
+    """
+    Separación entre puntos sueltos declarada por el cliente ("resolucion" en
+    metros, en el JSON o en la query string) convertida a grados; None si no
+    la declara.
+
+    Raises:
+        ValueError si la resolución no es un número positivo
+    """
+    resolucion = request.args.get('resolucion')
+    if resolucion is None and request.mimetype == 'application/json':
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and data.get('grilla') is None:
+            resolucion = data.get('resolucion')
+    if resolucion is None:
+        return None
+    try:
+        resolucion = float(resolucion)
+    except (TypeError, ValueError):
+        raise ValueError(f'resolucion inválida: {resolucion}')
+    if resolucion <= 0:
+        raise ValueError('resolucion debe ser mayor que 0')
+    return resolucion / METROS_POR_GRADO
+
+
+def _tramo(centros, minimo, maximo):
+    """Slice de centros (monótonos) que caen dentro de [minimo, maximo]."""
+    dentro = np.nonzero((centros >= minimo) & (centros <= maximo))[0]
+    if len(dentro) == 0:
+        return None
+    return slice(int(dentro[0]), int(dentro[-1]) + 1)
+
+
+def muestrear_grilla(tiles, grilla, nodata=NODATA_DEFAULT, pool=None, progreso=None, nativo=False):
+    """
+    Muestrea una grilla completa tile por tile.
+
+    Para cada tile se calcula el bloque de filas/columnas de la grilla que
+    cubre, se traducen a índices de píxel por separado (1-D) y se lee una
+    sola ventana del raster; el bloque se obtiene con np.ix_. Se lee el
+    overview más grueso cuyo píxel no supera el paso de la grilla.
+
+    Args:
+        tiles: iterable de (ruta, bounds), p.ej. catalogo.tiles_bbox(grilla.bbox)
+        grilla: Grilla
+        nodata: valor nodata a descartar
+        pool: PoolRaster opcional (ver pool_raster.py)
+        progreso: callable opcional (leidos, total, ruta, bounds) tras cada tile
+        nativo: leer siempre la resolución nativa, sin overviews
+
+    Returns:
+        (matriz rows x cols float64 con NaN, tiles_usados)
+    """
+    from rasterio.windows import Window
+
+    tiles = list(tiles)
+    paso = None if nativo else min(grilla.paso_lat, grilla.paso_lon)
+    valores = np.full(grilla.forma, np.nan)
+    pendientes = grilla.mascara.copy()
+    tiles_usados = 0
+
+    for leidos, (ruta, bounds) in enumerate(tiles, 1):
+        filas = _tramo(grilla.lats, bounds['south'], bounds['north'])
+        columnas = _tramo(grilla.lons, bounds['west'], bounds['east'])
+        if filas is None or columnas is None or not pendientes[filas, columnas].any():
+            continue
+
+        try:
+            if pool is not None:
+                banda = banda_para_paso(pool, ruta, paso)
+                transform, datos_tile, nodata_raster = banda.transform, banda.datos, banda.nodata
+                alto, ancho = banda.height, banda.width
+            else:
+                src = abrir_para_paso(ruta, paso)
+                transform, datos_tile, nodata_raster = src.transform, None, src.nodata
+                alto, ancho = src.height, src.width
+
+            try:
+                if transform.b != 0 or transform.d != 0:
+                    # Raster rotado: no se puede separar en filas/columnas
+                    sub_lons, sub_lats = np.meshgrid(grilla.lons[columnas], grilla.lats[filas])
+                    bloque, _ = muestrear_tiles([(ruta, bounds)], sub_lons.ravel(), sub_lats.ravel(),
+                                                nodata=nodata, pool=pool, paso=paso)
+                    bloque = bloque.reshape(sub_lons.shape)
+                else:
+                    inv = ~transform
+                    px_cols = np.floor(inv.a * grilla.lons[columnas] + inv.c).astype(np.int64)
+                    px_rows = np.floor(inv.e * grilla.lats[filas] + inv.f).astype(np.int64)
+                    ok_cols = (px_cols >= 0) & (px_cols < ancho)
+                    ok_rows = (px_rows >= 0) & (px_rows < alto)
+
+                    bloque = np.full((len(px_rows), len(px_cols)), np.nan)
+                    if ok_rows.any() and ok_cols.any():
+                        r0, r1 = int(px_rows[ok_rows].min()), int(px_rows[ok_rows].max()) + 1
+                        c0, c1 = int(px_cols[ok_cols].min()), int(px_cols[ok_cols].max()) + 1
+                        if datos_tile is not None:
+                            ventana = datos_tile[r0:r1, c0:c1]
+                        else:
+                            ventana = src.read(1, window=Window(c0, r0, c1 - c0, r1 - r0))
+
+                        sub = ventana[np.ix_(px_rows[ok_rows] - r0, px_cols[ok_cols] - c0)].astype(np.float64)
+                        sin_dato = sub == nodata
+                        if nodata_raster is not None:
+                            sin_dato |= sub == nodata_raster
+                        sub[sin_dato] = np.nan
+                        bloque[np.ix_(ok_rows, ok_cols)] = sub
+            finally:
+                if pool is None:
+                    src.close()
+        except Exception as e:
+            print(f'⚠️ Error muestreando grilla en {ruta}: {e}')
+            continue
+
+        tiles_usados += 1
+        objetivo = pendientes[filas, columnas] & ~np.isnan(bloque)
+        valores[filas, columnas][objetivo] = bloque[objetivo]
+        pendientes[filas, columnas][objetivo] = False
+
+        if progreso is not None:
+            progreso(leidos, len(tiles), ruta, bounds)
+        if not pendientes.any():
+            break
+
+    return valores, tiles_usados
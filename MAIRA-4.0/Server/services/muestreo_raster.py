@@ -0,0 +1,227 @@
+"""
+Muestreo vectorizado de rasters (altimetría / NDVI)
+
+Motor común para los endpoints batch: agrupa los puntos por tile, lee cada
+tile una sola vez (solo la ventana que cubre sus puntos) y obtiene todos los
+valores con una única indexación NumPy.
+
+Uso:
+-----
+    tiles = [(ruta_tif, {'west': ..., 'south': ..., 'east': ..., 'north': ...}), ...]
+    valores, tiles_usados = muestrear_tiles(tiles, lons, lats)
+
+Los puntos sin dato quedan como NaN en el array devuelto. Con
+`pool=pool_global` (ver pool_raster.py) las bandas decodificadas se
+reutilizan entre requests.
+
+Con `paso` (separación entre puntos, en grados) se lee el overview interno
+más grueso cuyo píxel no supera ese paso: la E/S queda acotada por la
+resolución pedida y no por el área. Los tiles sin overviews se leen a
+resolución nativa.
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import numpy as np
+
+NODATA_DEFAULT = -9999
+
+
+def extraer_coordenadas(points):
+    """
+    Convierte la lista JSON [{"lat", "lon", "index"}, ...] en arrays NumPy.
+
+    Returns:
+        (lats, lons, indices) como arrays float64/float64/int64
+    """
+    n = len(points)
+    lats = np.fromiter((p['lat'] for p in points), dtype=np.float64, count=n)
+    lons = np.fromiter((p['lon'] for p in points), dtype=np.float64, count=n)
+    indices = np.fromiter((p.get('index', i) for i, p in enumerate(points)), dtype=np.int64, count=n)
+    return lats, lons, indices
+
+
+def indices_pixel(transform, lons, lats):
+    """
+    Calcula (filas, columnas) de todos los puntos con la transformada afín inversa.
+    Equivale a `src.index(lon, lat)` pero para arrays completos.
+    """
+    inv = ~transform
+    cols = np.floor(inv.a * lons + inv.b * lats + inv.c).astype(np.int64)
+    rows = np.floor(inv.d * lons + inv.e * lats + inv.f).astype(np.int64)
+    return rows, cols
+
+
+def _valores_en_pixeles(datos, rows, cols, nodata, nodata_raster):
+    """Indexación NumPy única + descarte de nodata (devuelve float64 con NaN)."""
+    valores = datos[rows, cols].astype(np.float64)
+    sin_dato = valores == nodata
+    if nodata_raster is not None:
+        sin_dato |= valores == nodata_raster
+    valores[sin_dato] = np.nan
+    return valores
+
+
+def elegir_nivel(pixel, factores, paso):
+    """
+    Nivel más grueso (índice en factores, 0 = nativo) cuyo píxel
+    pixel * factor no supera `paso`; con paso None se usa el nativo.
+    """
+    if not paso:
+        return 0
+    nivel = 0
+    for i, factor in enumerate(factores):
+        if pixel * factor <= paso * 1.000001:
+            nivel = i
+    return nivel
+
+
+def abrir_para_paso(ruta, paso=None):
+    """Dataset rasterio del nivel adecuado para `paso` (el llamador lo cierra)."""
+    import rasterio
+
+    src = rasterio.open(ruta)
+    if paso:
+        pixel = max(abs(src.transform.a), abs(src.transform.e))
+        nivel = elegir_nivel(pixel, [1] + list(src.overviews(1)), paso)
+        if nivel:
+            src.close()
+            src = rasterio.open(ruta, overview_level=nivel - 1)
+    return src
+
+
+def banda_para_paso(pool, ruta, paso=None):
+    """Banda decodificada del pool en el nivel adecuado para `paso`."""
+    if not paso:
+        return pool.banda(ruta)
+    pixel, factores = pool.niveles(ruta)
+    return pool.banda(ruta, nivel=elegir_nivel(pixel, factores, paso))
+
+
+def muestrear_banda(banda, lons, lats, nodata=NODATA_DEFAULT):
+    """
+    Muestrea una banda ya decodificada en memoria (ver pool_raster.BandaDecodificada).
+
+    Returns:
+        Array float64 con NaN donde el punto cae fuera o es nodata
+    """
+    resultado = np.full(len(lons), np.nan)
+    rows, cols = indices_pixel(banda.transform, lons, lats)
+    validos = (rows >= 0) & (rows < banda.height) & (cols >= 0) & (cols < banda.width)
+    if validos.any():
+        resultado[validos] = _valores_en_pixeles(
+            banda.datos, rows[validos], cols[validos], nodata, banda.nodata
+        )
+    return resultado
+
+
+def muestrear_dataset(src, lons, lats, banda=1, nodata=NODATA_DEFAULT):
+    """
+    Muestrea un dataset abierto leyendo solo la ventana que cubre los puntos.
+
+    Args:
+        src: dataset rasterio abierto
+        lons, lats: arrays de coordenadas (mismo CRS que el raster)
+        banda: banda a leer
+        nodata: valor a descartar además del nodata propio del raster
+
+    Returns:
+        Array float64 con NaN donde el punto cae fuera o es nodata
+    """
+    from rasterio.windows import Window
+
+    resultado = np.full(len(lons), np.nan)
+    rows, cols = indices_pixel(src.transform, lons, lats)
+    validos = (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+    if not validos.any():
+        return resultado
+
+    rows_v = rows[validos]
+    cols_v = cols[validos]
+    r0, c0 = int(rows_v.min()), int(cols_v.min())
+    r1, c1 = int(rows_v.max()) + 1, int(cols_v.max()) + 1
+
+    datos = src.read(banda, window=Window(c0, r0, c1 - c0, r1 - r0))
+    resultado[validos] = _valores_en_pixeles(datos, rows_v - r0, cols_v - c0, nodata, src.nodata)
+    return resultado
+
+
+def muestrear_tiles(tiles, lons, lats, nodata=NODATA_DEFAULT, pool=None, paso=None):
+    """
+    Muestrea una lista de tiles agrupando los puntos por tile.
+
+    Cada tile se abre una vez y solo si contiene puntos todavía sin valor;
+    un punto con nodata en un tile sigue pendiente para el siguiente.
+
+    Args:
+        tiles: iterable de (ruta, bounds) con bounds {'west','south','east','north'}
+        lons, lats: arrays de coordenadas
+        nodata: valor nodata a descartar
+        pool: PoolRaster opcional; si se pasa, las bandas decodificadas se
+              reutilizan entre requests en lugar de leer ventanas del disco
+        paso: separación entre puntos en grados (None = resolución nativa)
+
+    Returns:
+        (valores, tiles_usados)
+    """
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    valores = np.full(len(lons), np.nan)
+    pendientes = np.ones(len(lons), dtype=bool)
+    tiles_usados = 0
+
+    for ruta, bounds in tiles:
+        dentro = (pendientes &
+                  (lons >= bounds['west']) & (lons <= bounds['east']) &
+                  (lats >= bounds['south']) & (lats <= bounds['north']))
+        if not dentro.any():
+            continue
+
+        idx = np.nonzero(dentro)[0]
+        try:
+            if pool is not None:
+                muestras = muestrear_banda(banda_para_paso(pool, ruta, paso), lons[idx], lats[idx], nodata=nodata)
+            else:
+                with abrir_para_paso(ruta, paso) as src:
+                    muestras = muestrear_dataset(src, lons[idx], lats[idx], nodata=nodata)
+        except Exception as e:
+            print(f'⚠️ Error muestreando {ruta}: {e}')
+            continue
+
+        tiles_usados += 1
+        encontrados = ~np.isnan(muestras)
+        valores[idx[encontrados]] = muestras[encontrados]
+        pendientes[idx[encontrados]] = False
+
+        if not pendientes.any():
+            break
+
+    return valores, tiles_usados
+
+
+def normalizar_ndvi(valores):
+    """NDVI en escala 0-255 se lleva a 0-1 (los valores <= 1 ya están normalizados)."""
+    return np.where(valores > 1, valores / 255.0, valores)
+
+
+def ordenar_por_indice(valores, indices, total=None):
+    """Ubica cada valor en su posición `index` original (NaN en los huecos)."""
+    ordenados = np.full(total if total is not None else len(valores), np.nan)
+    ordenados[indices] = valores
+    return ordenados
+
+
+def a_lista_json(valores, indices=None, total=None):
+    """
+    Convierte un array con NaN a lista JSON con None.
+
+    Si se pasan `indices`, cada valor se ubica en su posición `index` original
+    dentro de una lista de longitud `total`.
+    """
+    if indices is not None:
+        valores = ordenar_por_indice(valores, indices, total)
+
+    salida = valores.astype(object)
+    salida[np.isnan(valores)] = None
+    return salida.tolist()
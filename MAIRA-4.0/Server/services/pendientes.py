@@ -0,0 +1,286 @@
+"""
+Pendientes y orientaciones por el algoritmo de Horn (3x3)
+
+Reemplaza la pendiente "entre puntos consecutivos" del análisis de terreno:
+lee una sola vez el DEM bajo el polígono (como grilla, ver grilla_muestreo.py),
+calcula pendiente y orientación con los 8 vecinos de cada celda usando
+desplazamientos de arrays NumPy, y deriva histograma, puntos críticos y
+porcentaje transitable de los arrays resultantes. Para puntos sueltos se
+usa el vecindario 3x3 de píxeles nativos (pendientes_puntos).
+
+    a b c       dz/dx = ((c + 2f + i) - (a + 2d + g)) / (8 * dx)
+    d e f       dz/dy = ((a + 2b + c) - (g + 2h + i)) / (8 * dy)   (fila 0 = norte)
+    g h i       pendiente = atan(sqrt(dz/dx² + dz/dy²))
+
+El tamaño de celda en metros se corrige por latitud (dx = Δlon · cos(lat)),
+fila por fila.
+
+Uso:
+-----
+    elev, pend, orient, tiles_usados = pendientes_grilla(catalogo, grilla, pool=pool_global)
+    stats = estadisticas_pendientes(pend, limite_efectivo)
+    criticos = puntos_criticos(lons, lats, pend, orient, limite_efectivo)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import numpy as np
+
+from .grilla_muestreo import METROS_POR_GRADO, muestrear_grilla
+from .muestreo_raster import NODATA_DEFAULT, indices_pixel, abrir_para_paso, banda_para_paso
+
+# (etiqueta, desde, hasta) en grados; mismas claves que distribucion_pendientes
+RANGOS_PENDIENTE = (
+    ('0-5', 0, 5),
+    ('5-15', 5, 15),
+    ('15-30', 15, 30),
+    ('30+', 30, np.inf),
+)
+
+
+def tamanos_celda(grilla):
+    """
+    Tamaño de celda en metros de una grilla geográfica.
+
+    Returns:
+        (celda_x, celda_y): celda_x es un array (rows, 1) corregido por la
+        latitud de cada fila; celda_y es escalar
+    """
+    celda_y = grilla.paso_lat * METROS_POR_GRADO
+    celda_x = grilla.paso_lon * METROS_POR_GRADO * np.cos(np.radians(grilla.lats))
+    return celda_x.reshape(-1, 1), celda_y
+
+
+def _horn(z, vecinos, celda_x, celda_y):
+    """
+    Operador de Horn sobre arrays alineados.
+
+    Args:
+        z: valores centrales (NaN = sin dato)
+        vecinos: (a, b, c, d, f, g, h, i) con la misma forma que z; los NaN
+                 se reemplazan por el valor central
+    """
+    a, b, c, d, f, g, h, i = (np.where(np.isnan(v), z, v) for v in vecinos)
+
+    dz_dx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * celda_x)
+    dz_dy = ((a + 2 * b + c) - (g + 2 * h + i)) / (8 * celda_y)
+
+    pendiente = np.degrees(np.arctan(np.hypot(dz_dx, dz_dy)))
+    orientacion = np.degrees(np.arctan2(-dz_dx, -dz_dy)) % 360
+    orientacion[(dz_dx == 0) & (dz_dy == 0)] = np.nan
+
+    sin_dato = np.isnan(z)
+    pendiente[sin_dato] = np.nan
+    orientacion[sin_dato] = np.nan
+    return pendiente, orientacion
+
+
+def calcular_pendiente_horn(dem, celda_x, celda_y):
+    """
+    Pendiente y orientación de Horn sobre una matriz de elevaciones.
+
+    Los vecinos sin dato (NaN) toman el valor de la celda central y los
+    bordes se replican, así las celdas junto a huecos conservan pendiente.
+
+    Args:
+        dem: matriz 2-D de elevaciones (fila 0 = norte), NaN = sin dato
+        celda_x: ancho de celda en metros (escalar o array (rows, 1))
+        celda_y: alto de celda en metros
+
+    Returns:
+        (pendiente_grados, orientacion_grados); la orientación es el azimut
+        hacia donde cae la ladera (0 = N, 90 = E), NaN en terreno plano
+    """
+    z = np.asarray(dem, dtype=np.float64)
+    rows, cols = z.shape
+    relleno = np.pad(z, 1, mode='edge')
+
+    def vecino(dr, dc):
+        return relleno[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+
+    vecinos = (vecino(-1, -1), vecino(-1, 0), vecino(-1, 1),
+               vecino(0, -1), vecino(0, 1),
+               vecino(1, -1), vecino(1, 0), vecino(1, 1))
+    return _horn(z, vecinos, celda_x, celda_y)
+
+
+def pendientes_puntos(tiles, lons, lats, nodata=NODATA_DEFAULT, pool=None, paso=None):
+    """
+    Elevación, pendiente y orientación de puntos sueltos, con Horn sobre
+    los 3x3 píxeles del DEM alrededor de cada punto (nativos, o del overview
+    que corresponda a `paso`). La misma lectura por tile da la elevación y
+    la pendiente.
+
+    Args:
+        tiles: iterable de (ruta, bounds)
+        lons, lats: arrays de coordenadas
+        nodata: valor nodata a descartar
+        pool: PoolRaster opcional
+        paso: separación entre puntos en grados (None = resolución nativa)
+
+    Returns:
+        (elevaciones, pendientes, orientaciones, tiles_usados)
+    """
+    from rasterio.windows import Window
+
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    elevaciones = np.full(len(lons), np.nan)
+    pendientes = np.full(len(lons), np.nan)
+    orientaciones = np.full(len(lons), np.nan)
+    faltantes = np.ones(len(lons), dtype=bool)
+    tiles_usados = 0
+
+    for ruta, bounds in tiles:
+        dentro = (faltantes &
+                  (lons >= bounds['west']) & (lons <= bounds['east']) &
+                  (lats >= bounds['south']) & (lats <= bounds['north']))
+        if not dentro.any():
+            continue
+
+        idx = np.nonzero(dentro)[0]
+        try:
+            if pool is not None:
+                banda = banda_para_paso(pool, ruta, paso)
+                transform, nodata_raster = banda.transform, banda.nodata
+                rows, cols = indices_pixel(transform, lons[idx], lats[idx])
+                alto, ancho = banda.height, banda.width
+                datos, r0, c0 = banda.datos, 0, 0
+            else:
+                with abrir_para_paso(ruta, paso) as src:
+                    transform, nodata_raster = src.transform, src.nodata
+                    rows, cols = indices_pixel(transform, lons[idx], lats[idx])
+                    alto, ancho = src.height, src.width
+                    # Ventana de los puntos más un píxel de margen para los vecinos
+                    r0 = max(int(rows.min()) - 1, 0)
+                    c0 = max(int(cols.min()) - 1, 0)
+                    r1 = min(int(rows.max()) + 2, alto)
+                    c1 = min(int(cols.max()) + 2, ancho)
+                    if r1 <= r0 or c1 <= c0:
+                        continue
+                    datos = src.read(1, window=Window(c0, r0, c1 - c0, r1 - r0))
+        except Exception as e:
+            print(f'⚠️ Error muestreando pendientes en {ruta}: {e}')
+            continue
+
+        validos = (rows >= 0) & (rows < alto) & (cols >= 0) & (cols < ancho)
+        if not validos.any():
+            continue
+        idx, rows, cols = idx[validos], rows[validos], cols[validos]
+
+        def pixel(dr, dc):
+            rr = np.clip(rows + dr, r0, r0 + datos.shape[0] - 1) - r0
+            cc = np.clip(cols + dc, c0, c0 + datos.shape[1] - 1) - c0
+            v = datos[rr, cc].astype(np.float64)
+            sin_dato = v == nodata
+            if nodata_raster is not None:
+                sin_dato |= v == nodata_raster
+            v[sin_dato] = np.nan
+            return v
+
+        z = pixel(0, 0)
+        vecinos = (pixel(-1, -1), pixel(-1, 0), pixel(-1, 1),
+                   pixel(0, -1), pixel(0, 1),
+                   pixel(1, -1), pixel(1, 0), pixel(1, 1))
+        celda_x = abs(transform.a) * METROS_POR_GRADO * np.cos(np.radians(lats[idx]))
+        celda_y = abs(transform.e) * METROS_POR_GRADO
+        pend, orient = _horn(z, vecinos, celda_x, celda_y)
+
+        tiles_usados += 1
+        encontrados = ~np.isnan(z)
+        elevaciones[idx[encontrados]] = z[encontrados]
+        pendientes[idx[encontrados]] = pend[encontrados]
+        orientaciones[idx[encontrados]] = orient[encontrados]
+        faltantes[idx[encontrados]] = False
+
+        if not faltantes.any():
+            break
+
+    return elevaciones, pendientes, orientaciones, tiles_usados
+
+
+def pendientes_grilla(catalogo, grilla, pool=None, progreso=None):
+    """
+    Lee el DEM bajo la grilla (con un borde de una celda para los vecinos)
+    y calcula pendiente y orientación de Horn.
+
+    Args:
+        catalogo: CatalogoTiles de altimetría
+        grilla: Grilla del análisis (su máscara recorta el resultado)
+        pool: PoolRaster opcional
+        progreso: callable opcional por tile leído (ver muestrear_grilla)
+
+    Returns:
+        (elevaciones, pendientes, orientaciones, tiles_usados); matrices
+        rows x cols con NaN fuera de la máscara o sin dato
+    """
+    extendida = grilla.expandida(1)
+    dem, tiles_usados = muestrear_grilla(catalogo.tiles_bbox(extendida.bbox), extendida,
+                                         pool=pool, progreso=progreso)
+
+    celda_x, celda_y = tamanos_celda(extendida)
+    pendiente, orientacion = calcular_pendiente_horn(dem, celda_x, celda_y)
+
+    interior = (slice(1, -1), slice(1, -1))
+    resultados = [dem[interior].copy(), pendiente[interior], orientacion[interior]]
+    for matriz in resultados:
+        matriz[~grilla.mascara] = np.nan
+    return resultados[0], resultados[1], resultados[2], tiles_usados
+
+
+def estadisticas_pendientes(pendientes, limite):
+    """
+    Promedio/máxima/mínima, distribución por RANGOS_PENDIENTE (% de celdas)
+    y porcentaje transitable (pendiente <= limite).
+
+    Returns:
+        dict, o None si no hay celdas con pendiente
+    """
+    valores = pendientes[~np.isnan(pendientes)]
+    if valores.size == 0:
+        return None
+
+    bordes = [r[1] for r in RANGOS_PENDIENTE] + [RANGOS_PENDIENTE[-1][2]]
+    conteos, _ = np.histogram(valores, bins=bordes)
+    total = valores.size
+
+    return {
+        'promedio': float(valores.mean()),
+        'maxima': float(valores.max()),
+        'minima': float(valores.min()),
+        'distribucion': {
+            etiqueta: round(float(n) / total * 100, 1)
+            for (etiqueta, _, _), n in zip(RANGOS_PENDIENTE, conteos)
+        },
+        'pct_transitable': round(float(np.count_nonzero(valores <= limite)) / total * 100, 1),
+        'celdas': int(total)
+    }
+
+
+def puntos_criticos(lons, lats, pendientes, orientaciones, limite, maximo=10):
+    """
+    Los `maximo` puntos más empinados que superan el límite, de mayor a menor.
+    Acepta columnas alineadas o matrices de grilla con sus lons/lats expandidos.
+    """
+    lons, lats = np.ravel(lons), np.ravel(lats)
+    pendientes, orientaciones = np.ravel(pendientes), np.ravel(orientaciones)
+
+    con_valor = np.where(np.isnan(pendientes), -np.inf, pendientes)
+    candidatos = np.flatnonzero(con_valor > limite)
+    if candidatos.size > maximo:
+        mayores = np.argpartition(con_valor[candidatos], -maximo)[-maximo:]
+        candidatos = candidatos[mayores]
+    candidatos = candidatos[np.argsort(-con_valor[candidatos])]
+
+    criticos = []
+    for k in candidatos.tolist():
+        orientacion = orientaciones[k]
+        criticos.append({
+            'lat': float(lats[k]),
+            'lon': float(lons[k]),
+            'pendiente': round(float(pendientes[k]), 1),
+            'orientacion': None if np.isnan(orientacion) else round(float(orientacion)),
+            'limite': round(float(limite), 1)
+        })
+    return criticos
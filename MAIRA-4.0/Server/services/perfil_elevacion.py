@@ -0,0 +1,267 @@
+"""
+Perfiles de elevación de polilíneas calculados en el servidor
+
+Rutas y planes de fuego dibujaban el perfil densificando la línea en el
+cliente y mandando cada punto a /api/elevation/batch. Acá la polilínea llega
+con sus vértices (GeoJSON LineString o polyline codificada) y el servidor:
+
+- densifica cada tramo por círculo máximo cada `paso` metros (vectorizado),
+- muestrea todas las muestras con el lector de tiles (muestreo_raster.py),
+- refina de forma adaptativa: donde dos muestras consecutivas difieren más
+  de `desnivel` metros inserta el punto medio, hasta PASO_MIN,
+- devuelve columnas alineadas de distancia, elevación, pendiente (%) y
+  ascenso/descenso acumulado, más un resumen y la línea de vista opcional
+  entre los extremos (visibilidad.py).
+
+Uso:
+-----
+    coords = leer_linea(data)                       # [(lat, lon), ...]
+    perfil = perfil_elevacion(catalogo, coords, paso=30, pool=pool_global)
+    perfil.distancias, perfil.elevaciones, perfil.pendientes
+    perfil.a_dict()
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import numpy as np
+
+from .muestreo_raster import muestrear_tiles, a_lista_json
+from .visibilidad import RADIO_TIERRA
+
+PASO_DEFAULT = 30
+PASO_MIN = 10
+DESNIVEL_REFINAR = 10
+PASADAS_REFINAR = 3
+MAX_MUESTRAS = 20000
+
+
+def decodificar_polilinea(texto, precision=5):
+    """Polyline codificada (algoritmo de Google) -> [(lat, lon), ...]."""
+    factor = 10 ** precision
+    coords = []
+    indice = lat = lon = 0
+    while indice < len(texto):
+        deltas = []
+        for _ in range(2):
+            resultado = desplazamiento = 0
+            while True:
+                if indice >= len(texto):
+                    raise ValueError('Polyline codificada truncada')
+                byte = ord(texto[indice]) - 63
+                indice += 1
+                resultado |= (byte & 0x1f) << desplazamiento
+                desplazamiento += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(resultado >> 1) if resultado & 1 else resultado >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coords.append((lat / factor, lon / factor))
+    return coords
+
+
+def leer_linea(data):
+    """
+    Vértices de la línea del request:
+        {"linea": {"type": "LineString", "coordinates": [[lon, lat], ...]}}
+        {"linea": <Feature LineString>} o {"linea": [[lon, lat], ...]}
+        {"polilinea": "<encoded>", "precision": 5}
+
+    Returns:
+        lista de (lat, lon)
+
+    Raises:
+        ValueError: sin línea o con menos de dos vértices
+    """
+    if data.get('polilinea'):
+        coords = decodificar_polilinea(str(data['polilinea']), int(data.get('precision', 5)))
+    else:
+        linea = data.get('linea')
+        if isinstance(linea, dict) and linea.get('type') == 'Feature':
+            linea = linea.get('geometry')
+        if isinstance(linea, dict):
+            if linea.get('type') != 'LineString':
+                raise ValueError('La geometría debe ser LineString')
+            linea = linea.get('coordinates')
+        if not isinstance(linea, list):
+            raise ValueError('Se requiere "linea" (GeoJSON LineString) o "polilinea" codificada')
+        coords = [(float(c[1]), float(c[0])) for c in linea]
+    if len(coords) < 2:
+        raise ValueError('La línea necesita al menos dos vértices')
+    return coords
+
+
+def _vectores(lats, lons):
+    """Coordenadas geográficas -> vectores unitarios 3-D (n x 3)."""
+    lat = np.radians(lats)
+    lon = np.radians(lons)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _a_geograficas(v):
+    lats = np.degrees(np.arctan2(v[:, 2], np.hypot(v[:, 0], v[:, 1])))
+    lons = np.degrees(np.arctan2(v[:, 1], v[:, 0]))
+    return lats, lons
+
+
+def _angulos(a, b):
+    """Ángulo central entre pares de vectores unitarios (estable para tramos cortos)."""
+    return np.arctan2(np.linalg.norm(np.cross(a, b), axis=1), np.einsum('ij,ij->i', a, b))
+
+
+def _interpolar(a, b, angulo, fraccion):
+    """Interpolación esférica (slerp) vectorizada entre pares de vectores."""
+    seno = np.sin(angulo)
+    cortos = seno < 1e-12
+    seno = np.where(cortos, 1.0, seno)
+    wa = np.where(cortos, 1 - fraccion, np.sin((1 - fraccion) * angulo) / seno)
+    wb = np.where(cortos, fraccion, np.sin(fraccion * angulo) / seno)
+    v = wa[:, None] * a + wb[:, None] * b
+    return v / np.linalg.norm(v, axis=1)[:, None]
+
+
+def densificar(coords, paso):
+    """
+    Muestras cada ~`paso` metros sobre el círculo máximo de cada tramo,
+    conservando los vértices originales.
+
+    Returns:
+        (lats, lons, distancias, indices_vertices)
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    v = _vectores(coords[:, 0], coords[:, 1])
+    angulos = _angulos(v[:-1], v[1:])
+    largos = angulos * RADIO_TIERRA
+    partes = np.maximum(np.ceil(largos / paso).astype(np.int64), 1)
+
+    # Cada tramo aporta `partes` muestras (su vértice inicial + intermedias)
+    tramo = np.repeat(np.arange(len(largos)), partes)
+    inicio = np.concatenate([[0], np.cumsum(partes)[:-1]])
+    fraccion = (np.arange(len(tramo)) - inicio[tramo]) / partes[tramo]
+
+    muestras = _interpolar(v[:-1][tramo], v[1:][tramo], angulos[tramo], fraccion)
+    muestras = np.vstack([muestras, v[-1:]])
+    lats, lons = _a_geograficas(muestras)
+
+    acumulado = np.concatenate([[0.0], np.cumsum(largos)])
+    distancias = np.append(acumulado[tramo] + fraccion * largos[tramo], acumulado[-1])
+    vertices = np.append(inicio, len(tramo))
+    return lats, lons, distancias, vertices
+
+
+class PerfilElevacion:
+    """Columnas del perfil alineadas por muestra"""
+
+    __slots__ = ('lats', 'lons', 'distancias', 'elevaciones', 'pendientes',
+                 'ascenso', 'descenso', 'vertices', 'paso', 'tiles', 'linea_vista')
+
+    def __init__(self, lats, lons, distancias, elevaciones, vertices, paso, tiles):
+        self.lats = lats
+        self.lons = lons
+        self.distancias = distancias
+        self.elevaciones = elevaciones
+        self.vertices = vertices
+        self.paso = paso
+        self.tiles = tiles
+        self.linea_vista = None
+
+        # Pendiente del tramo que llega a cada muestra (%); la primera es 0
+        dz = np.diff(elevaciones)
+        dd = np.diff(distancias)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.pendientes = np.concatenate([[0.0], np.where(dd > 0, dz / dd * 100, 0.0)])
+        subida = np.nan_to_num(dz, nan=0.0)
+        self.ascenso = np.concatenate([[0.0], np.cumsum(np.maximum(subida, 0))])
+        self.descenso = np.concatenate([[0.0], np.cumsum(np.maximum(-subida, 0))])
+
+    def resumen(self):
+        validas = ~np.isnan(self.elevaciones)
+        pendientes = self.pendientes[1:][~np.isnan(self.pendientes[1:])]
+        return {
+            'distancia_total': round(float(self.distancias[-1]), 1),
+            'muestras': int(len(self.distancias)),
+            'muestras_validas': int(validas.sum()),
+            'paso': round(self.paso, 1),
+            'elevacion_min': round(float(self.elevaciones[validas].min()), 1) if validas.any() else None,
+            'elevacion_max': round(float(self.elevaciones[validas].max()), 1) if validas.any() else None,
+            'ascenso_total': round(float(self.ascenso[-1]), 1),
+            'descenso_total': round(float(self.descenso[-1]), 1),
+            'pendiente_max': round(float(pendientes.max()), 1) if pendientes.size else None,
+            'pendiente_min': round(float(pendientes.min()), 1) if pendientes.size else None
+        }
+
+    def a_dict(self):
+        salida = {
+            'lats': np.round(self.lats, 6).tolist(),
+            'lons': np.round(self.lons, 6).tolist(),
+            'distancias': np.round(self.distancias, 1).tolist(),
+            'elevaciones': a_lista_json(np.round(self.elevaciones, 1)),
+            'pendientes': a_lista_json(np.round(self.pendientes, 2)),
+            'ascenso_acumulado': np.round(self.ascenso, 1).tolist(),
+            'descenso_acumulado': np.round(self.descenso, 1).tolist(),
+            'vertices': self.vertices.tolist(),
+            'resumen': self.resumen()
+        }
+        if self.linea_vista is not None:
+            salida['linea_vista'] = self.linea_vista
+        return salida
+
+
+def _refinar(catalogo, lats, lons, distancias, z, vertices, desnivel, pool):
+    """
+    Inserta el punto medio en los intervalos con salto de elevación mayor a
+    `desnivel` y más largos que 2 * PASO_MIN; muestrea solo los puntos nuevos.
+    """
+    tiles = 0
+    for _ in range(PASADAS_REFINAR):
+        salto = np.abs(np.diff(z))
+        largo = np.diff(distancias)
+        marcados = np.flatnonzero((np.nan_to_num(salto, nan=0.0) > desnivel) & (largo > 2 * PASO_MIN))
+        if marcados.size == 0 or len(z) + marcados.size > MAX_MUESTRAS:
+            break
+
+        v = _vectores(lats, lons)
+        a, b = v[marcados], v[marcados + 1]
+        medios = _interpolar(a, b, _angulos(a, b), np.full(marcados.size, 0.5))
+        lat_m, lon_m = _a_geograficas(medios)
+        z_m, usados = muestrear_tiles(catalogo.tiles_para_puntos(lon_m, lat_m), lon_m, lat_m, pool=pool)
+        tiles += usados
+
+        lats = np.insert(lats, marcados + 1, lat_m)
+        lons = np.insert(lons, marcados + 1, lon_m)
+        distancias = np.insert(distancias, marcados + 1, (distancias[marcados] + distancias[marcados + 1]) / 2)
+        z = np.insert(z, marcados + 1, z_m)
+        # Cada vértice se corre tantas posiciones como medios se insertaron antes que él
+        vertices = vertices + np.searchsorted(marcados, vertices, side='left')
+    return lats, lons, distancias, z, vertices, tiles
+
+
+def perfil_elevacion(catalogo, coords, paso=PASO_DEFAULT, desnivel=DESNIVEL_REFINAR, pool=None):
+    """
+    Perfil de elevación de una polilínea.
+
+    Args:
+        catalogo: CatalogoTiles de altimetría
+        coords: vértices [(lat, lon), ...]
+        paso: separación objetivo entre muestras en metros (se agranda si la
+              línea superaría MAX_MUESTRAS; nunca baja de PASO_MIN)
+        desnivel: metros de salto entre muestras que disparan el refinamiento
+                  (None o 0 = sin refinar)
+        pool: PoolRaster opcional
+
+    Returns:
+        PerfilElevacion
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    v = _vectores(coords[:, 0], coords[:, 1])
+    largo_total = float(_angulos(v[:-1], v[1:]).sum() * RADIO_TIERRA)
+    paso = max(float(paso), PASO_MIN, largo_total / (MAX_MUESTRAS / 2))
+
+    lats, lons, distancias, vertices = densificar(coords, paso)
+    z, tiles = muestrear_tiles(catalogo.tiles_para_puntos(lons, lats), lons, lats, pool=pool)
+    if desnivel:
+        lats, lons, distancias, z, vertices, extra = _refinar(
+            catalogo, lats, lons, distancias, z, vertices, float(desnivel), pool)
+        tiles += extra
+    return PerfilElevacion(lats, lons, distancias, z, vertices, paso, tiles)
@@ -0,0 +1,235 @@
+"""
+Pipeline único de muestreo de terreno: elevación + pendiente + NDVI + clase
+
+Una sola etapa para grillas o puntos sueltos que devuelve columnas NumPy
+alineadas (mismo largo y orden que las coordenadas). El DEM se lee una vez
+por tile y de esa lectura salen elevación y pendiente; el NDVI se lee una
+vez por tile de vegetación; la clase de terreno se deriva de los arrays sin
+volver a recorrer los puntos. Los catálogos vienen del registro del proceso
+(catalogo_tiles.py), así que los índices no se recargan por request.
+
+Las clases usan las claves de data/factores_terreno.json que pueden
+inferirse de pendiente y NDVI (URBANO, PANTANO y DESIERTO requieren capas
+GIS y no se asignan acá).
+
+Uso:
+-----
+    resultado = muestrear_terreno(catalogo_dem, catalogo_ndvi, grilla=grilla, pool=pool_global)
+    resultado = muestrear_terreno(catalogo_dem, None, lons=lons, lats=lats, pendiente=False)
+
+    resultado.elevacion, resultado.pendiente, resultado.ndvi, resultado.clase
+    resultado.columnas_json(['pendiente', 'clase'], indices, total)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+
+import numpy as np
+
+from .muestreo_raster import muestrear_tiles, normalizar_ndvi, ordenar_por_indice, a_lista_json
+from .grilla_muestreo import muestrear_grilla
+from .pendientes import pendientes_grilla, pendientes_puntos
+
+# Códigos de clase (índice en CLASES_TERRENO); -1 = sin dato
+CLASES_TERRENO = ('ABIERTO', 'BOSQUE_CLARO', 'BOSQUE_DENSO', 'COLINAS', 'MONTAÑA')
+SIN_CLASE = -1
+
+# Umbrales de clasificación
+PENDIENTE_MONTANA = 30
+PENDIENTE_COLINAS = 15
+NDVI_BOSQUE_DENSO = 0.6
+NDVI_BOSQUE_CLARO = 0.4
+
+# Capas opcionales que un cliente puede pedir -> clave en la respuesta JSON
+CAPAS_JSON = {
+    'elevacion': 'elevations',
+    'pendiente': 'pendientes',
+    'orientacion': 'orientaciones',
+    'ndvi': 'ndvi_values',
+    'clase': 'clases_terreno',
+}
+
+
+def clasificar_terreno(pendiente, ndvi):
+    """
+    Clase de terreno vectorizada. El relieve manda sobre la vegetación;
+    sin NDVI la celda se considera abierta.
+
+    Returns:
+        array int8 de códigos en CLASES_TERRENO (SIN_CLASE sin pendiente)
+    """
+    pendiente = np.asarray(pendiente, dtype=np.float64)
+    ndvi = np.nan_to_num(np.asarray(ndvi, dtype=np.float64), nan=0.0)
+    clase = np.select(
+        [pendiente >= PENDIENTE_MONTANA,
+         pendiente >= PENDIENTE_COLINAS,
+         ndvi >= NDVI_BOSQUE_DENSO,
+         ndvi >= NDVI_BOSQUE_CLARO],
+        [CLASES_TERRENO.index('MONTAÑA'),
+         CLASES_TERRENO.index('COLINAS'),
+         CLASES_TERRENO.index('BOSQUE_DENSO'),
+         CLASES_TERRENO.index('BOSQUE_CLARO')],
+        default=CLASES_TERRENO.index('ABIERTO')
+    ).astype(np.int8)
+    clase[np.isnan(pendiente)] = SIN_CLASE
+    return clase
+
+
+def nombres_clase(codigos):
+    """Códigos int -> lista de nombres (None para SIN_CLASE o NaN)."""
+    nombres = []
+    for codigo in np.asarray(codigos, dtype=np.float64).tolist():
+        nombres.append(None if codigo != codigo or codigo < 0 else CLASES_TERRENO[int(codigo)])
+    return nombres
+
+
+class ResultadoTerreno:
+    """Columnas alineadas con (lons, lats); las capas no calculadas quedan en None"""
+
+    def __init__(self, lons, lats, grilla=None):
+        self.lons = lons
+        self.lats = lats
+        self.grilla = grilla
+        self.elevacion = None
+        self.pendiente = None
+        self.orientacion = None
+        self.ndvi = None
+        self.clase = None
+        self.tiles_dem = 0
+        self.tiles_ndvi = 0
+
+    def __len__(self):
+        return len(self.lons)
+
+    def columna(self, capa):
+        """Columna de una capa en float64 (la clase como código con NaN sin dato)."""
+        valores = getattr(self, capa)
+        if valores is None:
+            return None
+        if capa == 'clase':
+            valores = np.where(valores == SIN_CLASE, np.nan, valores.astype(np.float64))
+        return valores
+
+    def matriz(self, capa):
+        """Columna reubicada en la matriz rows x cols de la grilla."""
+        return self.grilla.a_matriz(self.columna(capa))
+
+    def columnas_json(self, capas, indices=None, total=None):
+        """
+        {clave_json: lista} de las capas pedidas, en el orden de `index`
+        original si se pasan indices. Capas no calculadas se omiten.
+        """
+        salida = {}
+        for capa in capas:
+            valores = self.columna(capa)
+            if valores is None or capa not in CAPAS_JSON:
+                continue
+            if capa == 'clase':
+                if indices is not None:
+                    valores = ordenar_por_indice(valores, indices, total)
+                salida[CAPAS_JSON[capa]] = nombres_clase(valores)
+            else:
+                salida[CAPAS_JSON[capa]] = a_lista_json(valores, indices, total)
+        return salida
+
+    def matrices_json(self, capas):
+        """{clave_json: lista 2-D} de las capas pedidas (modo grilla)."""
+        salida = {}
+        for capa in capas:
+            if self.columna(capa) is None or capa not in CAPAS_JSON:
+                continue
+            matriz = self.matriz(capa)
+            if capa == 'clase':
+                salida[CAPAS_JSON[capa]] = [nombres_clase(fila) for fila in matriz]
+            else:
+                salida[CAPAS_JSON[capa]] = a_lista_json(matriz)
+        return salida
+
+
+def _progreso_etapa(progreso, etapa, desde, hasta):
+    """Adapta el callback por tile de muestrear_grilla a porcentaje dentro de una etapa."""
+    if progreso is None:
+        return None
+
+    def por_tile(leidos, total, ruta, bounds):
+        progreso(desde + (hasta - desde) * leidos / max(total, 1), etapa,
+                 tile=os.path.basename(ruta), bounds=bounds)
+    return por_tile
+
+
+def muestrear_terreno(catalogo_dem=None, catalogo_ndvi=None, grilla=None, lons=None, lats=None,
+                      pendiente=True, pool=None, progreso=None, paso=None):
+    """
+    Muestrea todas las capas de terreno en una pasada por fuente.
+
+    Args:
+        catalogo_dem: CatalogoTiles de altimetría (None = sin elevación/pendiente)
+        catalogo_ndvi: CatalogoTiles de vegetación (None = sin NDVI)
+        grilla: Grilla a muestrear (las columnas siguen grilla.coordenadas())
+        lons, lats: puntos sueltos, si no hay grilla
+        pendiente: calcular pendiente/orientación de Horn además de la elevación
+        pool: PoolRaster opcional
+        progreso: callable opcional (porcentaje, etapa, **datos) por tile leído
+                  en modo grilla (ver trabajos.py)
+        paso: separación de los puntos sueltos en grados, para leer el overview
+              adecuado (en modo grilla se usa el paso de la grilla)
+
+    Returns:
+        ResultadoTerreno
+    """
+    if grilla is not None:
+        lons, lats = grilla.coordenadas()
+    else:
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+    resultado = ResultadoTerreno(lons, lats, grilla)
+
+    if catalogo_dem is not None:
+        if grilla is not None:
+            if pendiente:
+                elev, pend, orient, resultado.tiles_dem = pendientes_grilla(
+                    catalogo_dem, grilla, pool=pool, progreso=_progreso_etapa(progreso, 'elevacion', 0, 60))
+                resultado.pendiente = pend[grilla.mascara]
+                resultado.orientacion = orient[grilla.mascara]
+            else:
+                elev, resultado.tiles_dem = muestrear_grilla(
+                    catalogo_dem.tiles_bbox(grilla.bbox), grilla, pool=pool,
+                    progreso=_progreso_etapa(progreso, 'elevacion', 0, 60))
+            resultado.elevacion = elev[grilla.mascara]
+        else:
+            tiles = catalogo_dem.tiles_para_puntos(lons, lats)
+            if pendiente:
+                (resultado.elevacion, resultado.pendiente,
+                 resultado.orientacion, resultado.tiles_dem) = pendientes_puntos(tiles, lons, lats, pool=pool, paso=paso)
+            else:
+                resultado.elevacion, resultado.tiles_dem = muestrear_tiles(tiles, lons, lats, pool=pool, paso=paso)
+
+    if catalogo_ndvi is not None:
+        if grilla is not None:
+            ndvi, resultado.tiles_ndvi = muestrear_grilla(
+                catalogo_ndvi.tiles_bbox(grilla.bbox), grilla, pool=pool,
+                progreso=_progreso_etapa(progreso, 'ndvi', 60, 85))
+            ndvi = ndvi[grilla.mascara]
+        else:
+            tiles = catalogo_ndvi.tiles_para_puntos(lons, lats)
+            ndvi, resultado.tiles_ndvi = muestrear_tiles(tiles, lons, lats, pool=pool, paso=paso)
+        resultado.ndvi = normalizar_ndvi(ndvi)
+
+    if resultado.pendiente is not None:
+        ndvi = resultado.ndvi if resultado.ndvi is not None else np.full(len(lons), np.nan)
+        resultado.clase = clasificar_terreno(resultado.pendiente, ndvi)
+
+    return resultado
+
+
+def capas_request(request, disponibles=tuple(CAPAS_JSON)):
+    """Capas extra pedidas en el JSON ({"capas": ["pendiente", "ndvi", ...]})."""
+    if request.mimetype != 'application/json':
+        return []
+    data = request.get_json(silent=True)
+    pedidas = data.get('capas') if isinstance(data, dict) else None
+    if not isinstance(pedidas, list):
+        return []
+    return [c for c in pedidas if c in disponibles]
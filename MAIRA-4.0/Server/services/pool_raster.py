@@ -0,0 +1,256 @@
+"""
+Pool de rasters abiertos compartido por todo el proceso
+
+Los usuarios trabajan horas sobre la misma zona de operaciones, así que casi
+toda la E/S de tiles se repite. Este pool mantiene:
+
+- Handles rasterio abiertos POR HILO (los datasets GDAL no son thread-safe;
+  con gevent, threading.local es local a cada greenlet).
+- Bandas ya decodificadas como arrays NumPy de solo lectura, compartidas
+  entre hilos y desalojadas por LRU según un presupuesto de memoria.
+- Por tile, el tamaño de píxel y los factores de sus overviews internos,
+  para leer el nivel más grueso que alcance al paso pedido (ver
+  muestreo_raster.elegir_nivel).
+- Tiles exportados a .npy (tiles_npy.py) mapeados con np.memmap en lugar de
+  decodificados: no ocupan el presupuesto (viven en el page cache del
+  sistema, compartido entre workers) y se limitan por cantidad.
+
+Configuración:
+--------------
+- MAIRA_RASTER_POOL_MB: presupuesto de memoria para bandas decodificadas (256)
+- MAIRA_RASTER_HANDLES: handles abiertos máximos por hilo (32)
+- MAIRA_RASTER_MMAP_MAX: tiles .npy mapeados a la vez (512)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+
+class BandaDecodificada:
+    """Banda completa en memoria (o mapeada) con la georreferencia necesaria para muestrear."""
+
+    __slots__ = ('datos', 'transform', 'nodata', 'crs', 'bytes', 'mapeada')
+
+    def __init__(self, datos, transform, nodata, crs=None, mapeada=False):
+        datos.flags.writeable = False
+        self.datos = datos
+        self.transform = transform
+        self.nodata = nodata
+        self.crs = crs
+        self.mapeada = mapeada
+        self.bytes = 0 if mapeada else datos.nbytes
+
+    @property
+    def height(self):
+        return self.datos.shape[0]
+
+    @property
+    def width(self):
+        return self.datos.shape[1]
+
+
+class PoolRaster:
+    """Pool LRU thread-safe de datasets y bandas decodificadas"""
+
+    def __init__(self, presupuesto_mb=256, max_handles_por_hilo=32, max_mapeadas=512):
+        self.presupuesto_bytes = int(presupuesto_mb * 1024 * 1024)
+        self.max_handles_por_hilo = max_handles_por_hilo
+        self.max_mapeadas = max_mapeadas
+
+        self._bandas = OrderedDict()
+        self._mapeadas = OrderedDict()
+        self._niveles = {}
+        self._bytes_en_uso = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        self._hits = 0
+        self._misses = 0
+        self._desalojos = 0
+        self._handles_abiertos = 0
+        self._handles_reutilizados = 0
+
+    # ------------------------------------------------------------------
+    # Handles por hilo
+    # ------------------------------------------------------------------
+    def _handles_hilo(self):
+        handles = getattr(self._local, 'handles', None)
+        if handles is None:
+            handles = OrderedDict()
+            self._local.handles = handles
+        return handles
+
+    def dataset(self, ruta, nivel=0):
+        """
+        Devuelve un dataset rasterio abierto para el hilo actual; con nivel > 0
+        abre el overview interno nivel - 1 (ver niveles()).
+        No cerrar: el pool lo cierra al desalojarlo.
+        """
+        import rasterio
+
+        handles = self._handles_hilo()
+        clave = (ruta, nivel)
+        src = handles.get(clave)
+        if src is not None and not src.closed:
+            handles.move_to_end(clave)
+            with self._lock:
+                self._handles_reutilizados += 1
+            return src
+
+        src = rasterio.open(ruta, overview_level=nivel - 1) if nivel else rasterio.open(ruta)
+        handles[clave] = src
+        with self._lock:
+            self._handles_abiertos += 1
+
+        while len(handles) > self.max_handles_por_hilo:
+            _, viejo = handles.popitem(last=False)
+            try:
+                viejo.close()
+            except Exception:
+                pass
+
+        return src
+
+    # ------------------------------------------------------------------
+    # Bandas decodificadas compartidas
+    # ------------------------------------------------------------------
+    def niveles(self, ruta):
+        """
+        (tamaño de píxel en grados, factores) del tile; factores[0] = 1 es la
+        resolución nativa y factores[k] el overview que abre dataset(ruta, k).
+        """
+        info = self._niveles.get(ruta)
+        if info is None:
+            mapeada = self._banda_mapeada(ruta)
+            if mapeada is not None:
+                # El memmap solo trae las páginas que se tocan: no hacen falta overviews
+                transform = mapeada.transform
+                info = (max(abs(transform.a), abs(transform.e)), [1])
+            else:
+                src = self.dataset(ruta)
+                info = (max(abs(src.transform.a), abs(src.transform.e)), [1] + list(src.overviews(1)))
+            with self._lock:
+                self._niveles[ruta] = info
+        return info
+
+    def banda(self, ruta, banda=1, nivel=0):
+        """
+        Devuelve la banda decodificada (BandaDecodificada) desde cache o disco.
+        El array es de solo lectura porque se comparte entre requests.
+        """
+        clave = (ruta, banda, nivel)
+        with self._lock:
+            entrada = self._bandas.get(clave)
+            if entrada is not None:
+                self._bandas.move_to_end(clave)
+                self._hits += 1
+                return entrada
+
+        # Tile exportado a .npy: se mapea en lugar de decodificarlo
+        if banda == 1:
+            mapeada = self._banda_mapeada(ruta)
+            if mapeada is not None:
+                return mapeada
+
+        with self._lock:
+            self._misses += 1
+
+        # Decodificar fuera del lock para no bloquear a otros hilos
+        src = self.dataset(ruta, nivel)
+        entrada = BandaDecodificada(src.read(banda), src.transform, src.nodata, src.crs)
+
+        with self._lock:
+            existente = self._bandas.get(clave)
+            if existente is not None:
+                return existente
+            self._bandas[clave] = entrada
+            self._bytes_en_uso += entrada.bytes
+            self._desalojar()
+        return entrada
+
+    def _banda_mapeada(self, ruta):
+        """Banda 1 del .npy vigente del tile, mapeada una vez por proceso; None si no hay."""
+        with self._lock:
+            entrada = self._mapeadas.get(ruta)
+            if entrada is not None:
+                self._mapeadas.move_to_end(ruta)
+                self._hits += 1
+                return entrada
+
+        from .tiles_npy import abrir_npy
+
+        abierto = abrir_npy(ruta)
+        if abierto is None:
+            return None
+        entrada = BandaDecodificada(*abierto, mapeada=True)
+        with self._lock:
+            existente = self._mapeadas.get(ruta)
+            if existente is not None:
+                return existente
+            self._misses += 1
+            self._mapeadas[ruta] = entrada
+            while len(self._mapeadas) > self.max_mapeadas:
+                self._mapeadas.popitem(last=False)
+                self._desalojos += 1
+        return entrada
+
+    def _desalojar(self):
+        """Desaloja por LRU hasta entrar en el presupuesto (llamar con lock)."""
+        while self._bytes_en_uso > self.presupuesto_bytes and len(self._bandas) > 1:
+            _, vieja = self._bandas.popitem(last=False)
+            self._bytes_en_uso -= vieja.bytes
+            self._desalojos += 1
+
+    def invalidar(self, ruta):
+        """Descarta las bandas cacheadas de un archivo (p.ej. tras re-extraerlo)."""
+        with self._lock:
+            for clave in [c for c in self._bandas if c[0] == ruta]:
+                self._bytes_en_uso -= self._bandas.pop(clave).bytes
+            self._niveles.pop(ruta, None)
+            self._mapeadas.pop(ruta, None)
+        handles = self._handles_hilo()
+        for clave in [c for c in handles if c[0] == ruta]:
+            handles.pop(clave).close()
+
+    def limpiar(self):
+        """Vacía la cache de bandas y cierra los handles del hilo actual."""
+        with self._lock:
+            self._bandas.clear()
+            self._mapeadas.clear()
+            self._niveles.clear()
+            self._bytes_en_uso = 0
+        handles = self._handles_hilo()
+        while handles:
+            _, src = handles.popitem()
+            try:
+                src.close()
+            except Exception:
+                pass
+
+    def estadisticas(self):
+        """Contadores de uso para diagnóstico."""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'bandas_en_cache': len(self._bandas),
+                'bandas_mapeadas': len(self._mapeadas),
+                'bytes_en_uso': self._bytes_en_uso,
+                'presupuesto_bytes': self.presupuesto_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / total, 3) if total else 0.0,
+                'desalojos': self._desalojos,
+                'handles_abiertos': self._handles_abiertos,
+                'handles_reutilizados': self._handles_reutilizados
+            }
+
+
+pool_global = PoolRaster(
+    presupuesto_mb=float(os.getenv('MAIRA_RASTER_POOL_MB', '256')),
+    max_handles_por_hilo=int(os.getenv('MAIRA_RASTER_HANDLES', '32')),
+    max_mapeadas=int(os.getenv('MAIRA_RASTER_MMAP_MAX', '512'))
+)
@@ -0,0 +1,445 @@
+"""
+Precarga de tiles del área de operaciones
+
+Al crear una partida u operación ya se sabe dónde se va a trabajar, pero las
+caches arrancaban frías: el primer jugador que abría el mapa pagaba cada tile
+base, cada mini-tile de altimetría/vegetación extraído del .tar.gz y cada
+tile GIS. Una precarga toma el bbox del área de operaciones (AO) y en
+segundo plano:
+
+- base: enumera los tiles XYZ del bbox en un rango de zoom (de menor a mayor,
+  hasta MAX_TILES_BASE) y los baja con descargador_tiles a la cache en disco,
+  salteando los que ya están vigentes. Si ni el primer zoom entra en el tope,
+  la precarga se rechaza al crearla (ValueError).
+- altimetria / vegetacion: los mini-tiles del catálogo que faltan en disco se
+  extraen de su .tar.gz (parte local o release) con extractor_tiles y se
+  decodifican en pool_global mientras el AO entre en su presupuesto.
+- gis: lee los GeoJSON de los tiles GIS del AO (quedan en el page cache).
+
+Las tareas corren en un pool de hilos acotado, por debajo del tope de
+descargas por proveedor, así no le quitan lugar al proxy interactivo. El
+avance se consulta por HTTP o llega por Socket.IO a la sala del cliente:
+
+    precarga_progreso  {id, progreso, hechos, total, errores}
+    precarga_completado / precarga_error / precarga_cancelado  {id, ...}
+
+Uso:
+-----
+    gestor_precargas.configurar(socketio)   # una vez, al iniciar
+    precarga = gestor_precargas.iniciar(bbox, datos_dir, cache_dir, zoom=(8, 13), sid=request.sid)
+    gestor_precargas.obtener(precarga.id).a_dict()
+
+    gestor_precargas.ejecutar(precarga)     # en el hilo actual (CLI)
+
+Configuración:
+--------------
+- MAIRA_PRECARGA_CONCURRENCIA: tareas simultáneas por precarga (4)
+- MAIRA_PRECARGA_MAX_TILES: tope de tiles base por proveedor y precarga (3000)
+- MAIRA_PRECARGA_ZOOM: rango de zoom por defecto, p.ej. "8-13"
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import glob
+import math
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .trabajos import PENDIENTE, EJECUTANDO, COMPLETADO, ERROR, CANCELADO, TERMINADOS
+
+CAPAS = ('base', 'altimetria', 'vegetacion', 'gis')
+PROVEEDORES_DEFECTO = ('osm',)
+EXTENSIONES = {'satellite': 'jpg'}   # el resto de los proveedores sirve png
+MAX_TILES_BASE = int(os.getenv('MAIRA_PRECARGA_MAX_TILES', '3000'))
+ZOOM_DEFECTO = tuple(int(z) for z in os.getenv('MAIRA_PRECARGA_ZOOM', '8-13').split('-'))
+LIMITE_WEB_MERCATOR = 85.0511
+
+ARCHIVO_ALTIMETRIA = os.getenv('MAIRA_ALTIMETRIA_ARCHIVO',
+                               'https://github.com/Ehr051/MAIRA_4.0/releases/download/v4.0/maira_altimetria_tiles.tar.gz')
+RELEASE_VEGETACION = 'https://github.com/Ehr051/MAIRA-4.0/releases/download/v4.0/'
+
+
+def leer_bbox(valor):
+    """
+    Bbox {'west','south','east','north'} desde un dict con esas claves o una
+    lista [west, south, east, north]; None si no hay.
+
+    Raises:
+        ValueError si el bbox está incompleto o invertido
+    """
+    if not valor:
+        return None
+    try:
+        if isinstance(valor, dict):
+            bbox = {k: float(valor[k]) for k in ('west', 'south', 'east', 'north')}
+        else:
+            west, south, east, north = (float(v) for v in valor)
+            bbox = {'west': west, 'south': south, 'east': east, 'north': north}
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f'Bbox inválido: {valor}')
+    if bbox['west'] >= bbox['east'] or bbox['south'] >= bbox['north']:
+        raise ValueError(f'Bbox invertido o vacío: {valor}')
+    return bbox
+
+
+def _tile_xy(lon, lat, z):
+    lat = max(-LIMITE_WEB_MERCATOR, min(LIMITE_WEB_MERCATOR, lat))
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def _rango_xyz(bbox, z):
+    """(x0, y0, x1, y1, cantidad) de los tiles del bbox en el zoom z."""
+    x0, y0 = _tile_xy(bbox['west'], bbox['north'], z)
+    x1, y1 = _tile_xy(bbox['east'], bbox['south'], z)
+    return x0, y0, x1, y1, (x1 - x0 + 1) * (y1 - y0 + 1)
+
+
+def validar_tiles_xyz(bbox, zoom_min, limite=MAX_TILES_BASE):
+    """ValueError si ni el primer zoom del bbox entra en `limite`."""
+    cantidad = _rango_xyz(bbox, zoom_min)[4]
+    if cantidad > limite:
+        raise ValueError(f'El bbox pide {cantidad} tiles base en zoom {zoom_min} (máximo {limite}); '
+                         f'bajar el zoom o achicar el bbox')
+
+
+def tiles_xyz(bbox, zoom_min, zoom_max, limite=MAX_TILES_BASE):
+    """
+    [(z, x, y)] de los tiles slippy-map que cubren el bbox, de menor a mayor
+    zoom. Se corta en el último zoom completo que entra en `limite`; si ni el
+    primero entra, ValueError (se cuenta antes de enumerar).
+    """
+    validar_tiles_xyz(bbox, zoom_min, limite)
+    tiles = []
+    for z in range(zoom_min, zoom_max + 1):
+        x0, y0, x1, y1, cantidad = _rango_xyz(bbox, z)
+        if len(tiles) + cantidad > limite:
+            print(f'⚠️ Precarga de tiles base cortada en zoom {z - 1} ({len(tiles)} tiles)')
+            break
+        tiles.extend((z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+    return tiles
+
+
+class Precarga:
+    """Estado y avance de una precarga de AO"""
+
+    def __init__(self, bbox, datos_dir, cache_dir, zoom, proveedores, capas, sid=None):
+        self.id = uuid.uuid4().hex
+        self.bbox = bbox
+        self.datos_dir = datos_dir
+        self.cache_dir = cache_dir
+        self.zoom = zoom
+        self.proveedores = tuple(proveedores)
+        self.capas = tuple(capas)
+        self.sid = sid
+        self.estado = PENDIENTE
+        self.error = None
+        self.total = 0
+        self.hechos = 0
+        self.en_cache = 0
+        self.errores = 0
+        self.por_capa = {}
+        self.creado = time.time()
+        self.terminado = None
+        self.cancelada = False
+        self._lock = threading.Lock()
+
+    @property
+    def clave(self):
+        return (tuple(sorted(self.bbox.items())), self.zoom, self.proveedores, self.capas)
+
+    @property
+    def progreso(self):
+        return 100.0 * self.hechos / self.total if self.total else 0.0
+
+    def contar(self, capa, resultado):
+        """resultado: 'hecho', 'en_cache' o 'error'."""
+        with self._lock:
+            self.hechos += 1
+            if resultado == 'en_cache':
+                self.en_cache += 1
+            elif resultado == 'error':
+                self.errores += 1
+            cuenta = self.por_capa.setdefault(capa, {'hecho': 0, 'en_cache': 0, 'error': 0})
+            cuenta[resultado] += 1
+
+    def a_dict(self):
+        with self._lock:
+            return {
+                'id': self.id,
+                'estado': self.estado,
+                'bbox': self.bbox,
+                'zoom': list(self.zoom),
+                'proveedores': list(self.proveedores),
+                'capas': list(self.capas),
+                'progreso': round(self.progreso, 1),
+                'total': self.total,
+                'hechos': self.hechos,
+                'en_cache': self.en_cache,
+                'errores': self.errores,
+                'por_capa': {capa: dict(cuenta) for capa, cuenta in self.por_capa.items()},
+                'error': self.error,
+                'creado': self.creado,
+                'terminado': self.terminado
+            }
+
+
+class GestorPrecargas:
+    """Precargas de AO en segundo plano, una por área/zoom/capas en curso"""
+
+    def __init__(self, concurrencia=4, ttl=3600):
+        self.concurrencia = concurrencia
+        self.ttl = ttl
+        self.socketio = None
+        self._precargas = {}
+        self._lock = threading.Lock()
+
+    def configurar(self, socketio):
+        """Socket.IO del servidor para emitir progreso (sin él solo se consulta por HTTP)."""
+        self.socketio = socketio
+
+    def crear(self, bbox, datos_dir, cache_dir, zoom=None, proveedores=None, capas=None, sid=None):
+        """
+        Precarga sin arrancar; devuelve la que está en curso si ya hay una
+        igual (mismo bbox, zoom, proveedores y capas).
+        """
+        zoom_min, zoom_max = zoom or ZOOM_DEFECTO
+        zoom = (max(0, int(zoom_min)), min(19, int(zoom_max)))
+        capas = [c for c in (capas or CAPAS) if c in CAPAS]
+        if 'base' in capas:
+            # Antes de arrancar el hilo, para que el endpoint responda 400
+            validar_tiles_xyz(bbox, zoom[0])
+        precarga = Precarga(bbox, datos_dir, cache_dir, zoom,
+                            proveedores or PROVEEDORES_DEFECTO, capas, sid=sid)
+        self._purgar()
+        with self._lock:
+            for existente in self._precargas.values():
+                if existente.clave == precarga.clave and existente.estado not in TERMINADOS:
+                    return existente
+            self._precargas[precarga.id] = precarga
+        return precarga
+
+    def iniciar(self, bbox, datos_dir, cache_dir, zoom=None, proveedores=None, capas=None, sid=None):
+        """Crea la precarga y la corre en un hilo de fondo."""
+        precarga = self.crear(bbox, datos_dir, cache_dir, zoom, proveedores, capas, sid)
+        with self._lock:
+            if precarga.estado != PENDIENTE:
+                return precarga
+            precarga.estado = EJECUTANDO
+        threading.Thread(target=self.ejecutar, args=(precarga,), daemon=True,
+                         name=f'precarga-{precarga.id[:8]}').start()
+        return precarga
+
+    def obtener(self, precarga_id):
+        self._purgar()
+        with self._lock:
+            return self._precargas.get(precarga_id)
+
+    def cancelar(self, precarga_id):
+        """True si se pidió la cancelación; False si no existe o ya terminó."""
+        precarga = self.obtener(precarga_id)
+        if precarga is None or precarga.estado in TERMINADOS:
+            return False
+        precarga.cancelada = True
+        return True
+
+    def estadisticas(self):
+        with self._lock:
+            estados = {}
+            for precarga in self._precargas.values():
+                estados[precarga.estado] = estados.get(precarga.estado, 0) + 1
+            return {
+                'concurrencia': self.concurrencia,
+                'precargas': len(self._precargas),
+                'por_estado': estados
+            }
+
+    # ------------------------------------------------------------------
+    # Ejecución
+    # ------------------------------------------------------------------
+    def ejecutar(self, precarga):
+        """Corre la precarga en el hilo actual hasta terminar o cancelarse."""
+        inicio = time.time()
+        precarga.estado = EJECUTANDO
+        try:
+            tareas = self._tareas(precarga)
+            precarga.total = len(tareas)
+            print(f'🔥 Precarga {precarga.id[:8]}: {precarga.total} tiles del AO '
+                  f'{precarga.bbox} (zoom {precarga.zoom[0]}-{precarga.zoom[1]})')
+
+            ultimo_aviso = [0.0]
+
+            def correr(tarea):
+                if precarga.cancelada:
+                    return
+                capa, funcion = tarea
+                try:
+                    resultado = funcion()
+                except Exception as e:
+                    print(f'⚠️ Precarga {capa}: {e}')
+                    resultado = 'error'
+                precarga.contar(capa, resultado)
+                ahora = time.time()
+                if ahora - ultimo_aviso[0] >= 1.0:
+                    ultimo_aviso[0] = ahora
+                    self._emitir(precarga, 'precarga_progreso', {
+                        'progreso': round(precarga.progreso, 1), 'hechos': precarga.hechos,
+                        'total': precarga.total, 'errores': precarga.errores
+                    })
+
+            with ThreadPoolExecutor(max_workers=self.concurrencia, thread_name_prefix='precarga') as ejecutor:
+                list(ejecutor.map(correr, tareas))
+
+            estado = CANCELADO if precarga.cancelada else COMPLETADO
+        except Exception as e:
+            precarga.error = str(e)
+            estado = ERROR
+
+        precarga.estado = estado
+        precarga.terminado = time.time()
+        print(f'🔥 Precarga {precarga.id[:8]}: {estado} en {precarga.terminado - inicio:.1f}s '
+              f'({precarga.hechos - precarga.en_cache - precarga.errores} cargados, '
+              f'{precarga.en_cache} ya en cache, {precarga.errores} errores)')
+        datos = precarga.a_dict()
+        del datos['id']
+        self._emitir(precarga, f'precarga_{estado}', datos)
+        return precarga
+
+    def _tareas(self, precarga):
+        """[(capa, callable)] de todo lo que hay que calentar; cada callable devuelve el resultado para contar()."""
+        tareas = []
+        if 'base' in precarga.capas:
+            tareas.extend(self._tareas_base(precarga))
+        if 'altimetria' in precarga.capas:
+            tareas.extend(self._tareas_raster(precarga, 'altimetria'))
+        if 'vegetacion' in precarga.capas:
+            tareas.extend(self._tareas_raster(precarga, 'vegetacion'))
+        if 'gis' in precarga.capas:
+            tareas.extend(self._tareas_gis(precarga))
+        return tareas
+
+    def _tareas_base(self, precarga):
+        from .cache_disco_tiles import obtener_cache_tiles
+        from .descarga_tiles import descargador_tiles, url_tile
+
+        cache = obtener_cache_tiles(precarga.cache_dir)
+        xyz = tiles_xyz(precarga.bbox, *precarga.zoom)
+
+        def tarea(proveedor, z, x, y):
+            ext = EXTENSIONES.get(proveedor, 'png')
+            nombre = f'{z}_{x}_{y}.{ext}'
+            # vigente() y no leer(): la precarga no cuenta como acceso para el LRU/LFU
+            if cache.vigente(proveedor, nombre):
+                return 'en_cache'
+            url = url_tile(proveedor, z, x, y, ext)
+            guardar = lambda datos: cache.guardar(proveedor, nombre, datos)
+            if url is None or descargador_tiles.descargar(proveedor, url, guardar) is None:
+                return 'error'
+            return 'hecho'
+
+        return [('base', lambda p=proveedor, t=t: tarea(p, *t))
+                for proveedor in precarga.proveedores for t in xyz]
+
+    def _tareas_raster(self, precarga, capa):
+        from .catalogo_tiles import obtener_catalogo, obtener_catalogo_nacional
+        from .extraccion_tiles import extractor_tiles
+        from .pool_raster import pool_global
+
+        try:
+            if capa == 'altimetria':
+                catalogo = obtener_catalogo_nacional(os.path.join(precarga.datos_dir, 'Altimetria_Mini_Tiles'))
+            else:
+                catalogo = obtener_catalogo(os.path.join(
+                    precarga.datos_dir, 'Vegetacion_Mini_Tiles', 'vegetation_master_index.json'))
+        except FileNotFoundError as e:
+            print(f'⚠️ Precarga sin {capa}: {e}')
+            return []
+
+        # El pool se calienta solo mientras el AO entra en su presupuesto:
+        # con el primer desalojo se sigue extrayendo a disco pero sin decodificar
+        desalojos_inicio = pool_global.estadisticas()['desalojos']
+
+        def tarea(ruta, info):
+            resultado = 'en_cache'
+            if not os.path.exists(ruta):
+                fuente = _fuente_archivo(capa, ruta, info)
+                if fuente is None or extractor_tiles.obtener(*fuente) is None:
+                    return 'error'
+                resultado = 'hecho'
+            if pool_global.estadisticas()['desalojos'] == desalojos_inicio:
+                try:
+                    pool_global.banda(ruta)
+                except ImportError:
+                    pass  # sin rasterio queda solo en disco
+            return resultado
+
+        return [(capa, lambda r=ruta, i=info: tarea(r, i)) for ruta, info in catalogo.entradas_bbox(precarga.bbox)]
+
+    def _tareas_gis(self, precarga):
+        from .catalogo_tiles import obtener_catalogo
+
+        try:
+            catalogo = obtener_catalogo(os.path.join(precarga.datos_dir, 'gis_tiles_master_index.json'))
+        except FileNotFoundError as e:
+            print(f'⚠️ Precarga sin tiles GIS: {e}')
+            return []
+        # {Transporte,Hidrografia,Areas_Urbanas}_Tiles/{subcapa}/{tile_id}.geojson
+        subcapas = [d for d in glob.glob(os.path.join(precarga.datos_dir, '*_Tiles', '*')) if os.path.isdir(d)]
+
+        def tarea(tile_id):
+            leidos = 0
+            for directorio in subcapas:
+                ruta = os.path.join(directorio, f'{tile_id}.geojson')
+                if os.path.exists(ruta):
+                    with open(ruta, 'rb') as f:
+                        while f.read(1 << 20):
+                            pass
+                    leidos += 1
+            return 'hecho' if leidos else 'en_cache'
+
+        return [('gis', lambda t=info['id']: tarea(t)) for info in catalogo.buscar_bbox(precarga.bbox)]
+
+    # ------------------------------------------------------------------
+    def _emitir(self, precarga, evento, datos):
+        if self.socketio is None or precarga.sid is None:
+            return
+        try:
+            self.socketio.emit(evento, dict(datos, id=precarga.id), room=precarga.sid)
+        except Exception as e:
+            print(f'⚠️ Error emitiendo {evento}: {e}')
+
+    def _purgar(self):
+        """Descarta precargas terminadas hace más de TTL segundos."""
+        limite = time.time() - self.ttl
+        with self._lock:
+            for precarga_id in [i for i, p in self._precargas.items()
+                                if p.estado in TERMINADOS and p.terminado < limite]:
+                del self._precargas[precarga_id]
+
+
+def _fuente_archivo(capa, ruta, info):
+    """
+    (fuente, nombre, directorio, prefijo) para extractor_tiles.obtener: la
+    parte .tar.gz local junto al tile si está, si no el archivo publicado.
+    """
+    directorio = os.path.dirname(ruta)
+    archivo = info.get('tar_file') or (f"{info['package']}.tar.gz" if info.get('package') else None)
+    if archivo and os.path.exists(os.path.join(directorio, archivo)):
+        return os.path.join(directorio, archivo), info['filename'], directorio, ''
+    if capa == 'altimetria':
+        # Archivo único con Altimetria_Mini_Tiles/{provincia}/{tile}.tif
+        provincia = os.path.basename(directorio)
+        return (ARCHIVO_ALTIMETRIA, f"{provincia}/{info['filename']}",
+                os.path.dirname(directorio), 'Altimetria_Mini_Tiles/')
+    if archivo:
+        return RELEASE_VEGETACION + archivo, info['filename'], directorio, ''
+    return None
+
+
+gestor_precargas = GestorPrecargas(concurrencia=int(os.getenv('MAIRA_PRECARGA_CONCURRENCIA', '4')))
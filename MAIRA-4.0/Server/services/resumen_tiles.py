@@ -0,0 +1,356 @@
+"""
+Resúmenes precalculados por tile: estadísticas y tablas de áreas sumadas
+
+Preguntas de área amplia (cota máxima de una zona, cobertura de datos, NDVI
+medio) no necesitan abrir los rasters a resolución completa. Al cortar los
+mini-tiles (scripts/crear_mini_tiles.py) o después, sobre un catálogo ya
+publicado (tools/create_tile_summaries.py), cada tile se resume en:
+
+- min, max, media y fracción sin dato del tile completo, que también se
+  escriben en la entrada del tile del índice JSON ('estadisticas'),
+- una grilla de BLOQUES x BLOQUES bloques con min/max y tablas de áreas
+  sumadas (summed-area tables) de suma, celdas válidas y celdas totales.
+
+Todo va a un .npz junto al índice ({indice}.resumen.npz). El servidor
+responde un bbox con tiles completos (resumen del tile) y bloques de los
+tiles de borde (cuatro lecturas de la tabla por tile), y arma vistas
+generales a nivel de tile o de bloque según la escala pedida: una pirámide
+de dos niveles sin abrir ningún GeoTIFF.
+
+En los tiles de borde se usan los bloques que tocan el bbox, así que min y
+max son cotas (el valor real está dentro) y la media es a resolución de
+bloque.
+
+Uso:
+-----
+    # Al generar tiles
+    resumen = ResumenIndice()
+    estadisticas = resumen.agregar('tile_0001.tif', datos, nodata)
+    resumen.guardar(ruta_resumen(ruta_indice))
+
+    # En el servidor
+    resumen_area(catalogo, bbox)                    # dict o None
+    vista_general(catalogo, bbox, rows=64, cols=64)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from .muestreo_raster import NODATA_DEFAULT
+
+BLOQUES = 16
+MAX_CELDAS_VISTA = 512 * 512
+
+
+def ruta_resumen(ruta_indice):
+    """Archivo de resúmenes que acompaña a un índice de mini-tiles."""
+    return os.path.splitext(ruta_indice)[0] + '.resumen.npz'
+
+
+def _tabla_sumada(bloques):
+    """Tabla de áreas sumadas (B+1 x B+1) con fila/columna cero al inicio."""
+    tabla = np.zeros((bloques.shape[0] + 1, bloques.shape[1] + 1), dtype=np.float64)
+    tabla[1:, 1:] = bloques.cumsum(axis=0).cumsum(axis=1)
+    return tabla
+
+
+def resumir_banda(datos, nodata=NODATA_DEFAULT, nodata_raster=None, bloques=BLOQUES, transformar=None):
+    """
+    Estadísticas del tile completo y grillas por bloque de una banda.
+
+    Args:
+        datos: matriz 2-D de la banda (fila 0 = norte)
+        nodata, nodata_raster: valores sin dato (el default del proyecto y el del GeoTIFF)
+        bloques: bloques por lado
+        transformar: función aplicada a los valores válidos (p. ej. normalizar_ndvi)
+
+    Returns:
+        (estadisticas, {'suma', 'validas', 'celdas', 'min', 'max'} de forma bloques x bloques)
+    """
+    valores = np.asarray(datos, dtype=np.float64)
+    alto, ancho = valores.shape
+    validos = ~np.isnan(valores) & (valores != nodata)
+    if nodata_raster is not None:
+        validos &= valores != nodata_raster
+    if transformar is not None:
+        valores = np.where(validos, transformar(valores), np.nan)
+
+    fila_bloque = np.arange(alto) * bloques // alto
+    col_bloque = np.arange(ancho) * bloques // ancho
+    ids = (fila_bloque[:, None] * bloques + col_bloque[None, :])
+    total = bloques * bloques
+
+    ids_validos = ids[validos]
+    v = valores[validos]
+    suma = np.bincount(ids_validos, weights=v, minlength=total)
+    n_validas = np.bincount(ids_validos, minlength=total)
+    celdas = np.bincount(ids.ravel(), minlength=total)
+    minimo = np.full(total, np.inf)
+    maximo = np.full(total, -np.inf)
+    np.minimum.at(minimo, ids_validos, v)
+    np.maximum.at(maximo, ids_validos, v)
+    minimo[n_validas == 0] = np.nan
+    maximo[n_validas == 0] = np.nan
+
+    forma = (bloques, bloques)
+    grillas = {
+        'suma': suma.reshape(forma),
+        'validas': n_validas.reshape(forma),
+        'celdas': celdas.reshape(forma),
+        'min': minimo.reshape(forma).astype(np.float32),
+        'max': maximo.reshape(forma).astype(np.float32)
+    }
+
+    estadisticas = {
+        'min': round(float(v.min()), 3) if v.size else None,
+        'max': round(float(v.max()), 3) if v.size else None,
+        'media': round(float(v.mean()), 3) if v.size else None,
+        'fraccion_nodata': round(1 - v.size / valores.size, 4) if valores.size else 1.0
+    }
+    return estadisticas, grillas
+
+
+class ResumenIndice:
+    """Resúmenes de los tiles de un índice, acumulados al generarlos y luego guardados en .npz"""
+
+    def __init__(self, bloques=BLOQUES):
+        self.bloques = bloques
+        self.rutas = []
+        self._grillas = []
+
+    def agregar(self, ruta_relativa, datos, nodata=NODATA_DEFAULT, nodata_raster=None, transformar=None):
+        """Resume un tile; `ruta_relativa` es relativa al directorio del índice. Devuelve sus estadísticas."""
+        estadisticas, grillas = resumir_banda(datos, nodata, nodata_raster, self.bloques, transformar)
+        self.rutas.append(ruta_relativa.replace(os.sep, '/'))
+        self._grillas.append(grillas)
+        return estadisticas
+
+    def guardar(self, ruta):
+        """Escribe el .npz (tablas sumadas de suma/válidas/celdas y min/max por bloque)."""
+        if not self.rutas:
+            return None
+        suma = np.stack([g['suma'] for g in self._grillas])
+        validas = np.stack([g['validas'] for g in self._grillas])
+        celdas = np.stack([g['celdas'] for g in self._grillas])
+        bmin = np.stack([g['min'] for g in self._grillas])
+        bmax = np.stack([g['max'] for g in self._grillas])
+        with np.errstate(all='ignore'):
+            tile_min = np.nanmin(bmin.reshape(len(self.rutas), -1), axis=1)
+            tile_max = np.nanmax(bmax.reshape(len(self.rutas), -1), axis=1)
+
+        temporal = ruta + '.tmp.npz'
+        np.savez(
+            temporal,
+            bloques=np.int32(self.bloques),
+            rutas=np.array(self.rutas),
+            suma=suma.sum(axis=(1, 2)),
+            validas=validas.sum(axis=(1, 2)).astype(np.int64),
+            celdas=celdas.sum(axis=(1, 2)).astype(np.int64),
+            min=tile_min.astype(np.float32),
+            max=tile_max.astype(np.float32),
+            sat_suma=np.stack([_tabla_sumada(s) for s in suma]),
+            sat_validas=np.stack([_tabla_sumada(n) for n in validas]),
+            sat_celdas=np.stack([_tabla_sumada(c) for c in celdas]),
+            bloques_min=bmin,
+            bloques_max=bmax
+        )
+        os.replace(temporal, ruta)
+        return ruta
+
+
+# ----------------------------------------------------------------------
+# Consulta en el servidor
+# ----------------------------------------------------------------------
+class _Resumenes:
+    """Arrays .npz de los índices de un catálogo y posición de cada tile por ruta"""
+
+    def __init__(self, catalogo):
+        self.posicion = {}
+        partes = {k: [] for k in ('suma', 'validas', 'celdas', 'min', 'max', 'sat_suma',
+                                  'sat_validas', 'sat_celdas', 'bloques_min', 'bloques_max')}
+        self.bloques = BLOQUES
+        for ruta_indice in catalogo.rutas_indice:
+            ruta = ruta_resumen(ruta_indice)
+            if not os.path.exists(ruta):
+                continue
+            with np.load(ruta) as npz:
+                if int(npz['bloques']) != self.bloques:
+                    print(f'⚠️ {os.path.basename(ruta)}: {int(npz["bloques"])} bloques por lado, se esperaban {self.bloques}')
+                    continue
+                directorio = os.path.dirname(ruta_indice)
+                desde = sum(len(p) for p in partes['suma'])
+                for i, relativa in enumerate(npz['rutas']):
+                    self.posicion[os.path.normpath(os.path.join(directorio, str(relativa)))] = desde + i
+                for clave in partes:
+                    partes[clave].append(npz[clave])
+        self.arrays = {k: np.concatenate(v) if v else None for k, v in partes.items()}
+
+    def __len__(self):
+        return len(self.posicion)
+
+
+_resumenes = {}
+_resumenes_lock = threading.Lock()
+
+
+def resumenes_catalogo(catalogo):
+    """Resúmenes del catálogo, recargados cuando cambia su versión."""
+    clave = tuple(catalogo.rutas_indice)
+    version = (catalogo.version, tuple(
+        os.stat(ruta_resumen(r)).st_mtime if os.path.exists(ruta_resumen(r)) else None
+        for r in catalogo.rutas_indice))
+    entrada = _resumenes.get(clave)
+    if entrada is None or entrada[0] != version:
+        with _resumenes_lock:
+            entrada = _resumenes.get(clave)
+            if entrada is None or entrada[0] != version:
+                resumenes = _Resumenes(catalogo)
+                print(f'📚 Resúmenes de tiles: {len(resumenes)}/{catalogo.total} tiles')
+                entrada = (version, resumenes)
+                _resumenes[clave] = entrada
+    return entrada[1]
+
+
+def _rango_bloques(bounds, bbox, bloques):
+    """Filas y columnas [r0, r1) x [c0, c1) de bloques que tocan el bbox."""
+    ancho = bounds['east'] - bounds['west']
+    alto = bounds['north'] - bounds['south']
+    c0 = int(np.floor((bbox['west'] - bounds['west']) / ancho * bloques))
+    c1 = int(np.ceil((bbox['east'] - bounds['west']) / ancho * bloques))
+    r0 = int(np.floor((bounds['north'] - bbox['north']) / alto * bloques))
+    r1 = int(np.ceil((bounds['north'] - bbox['south']) / alto * bloques))
+    c0, r0 = max(c0, 0), max(r0, 0)
+    c1, r1 = min(max(c1, c0 + 1), bloques), min(max(r1, r0 + 1), bloques)
+    return r0, r1, c0, c1
+
+
+def _suma_rectangulo(tabla, r0, r1, c0, c1):
+    return tabla[r1, c1] - tabla[r0, c1] - tabla[r1, c0] + tabla[r0, c0]
+
+
+def resumen_area(catalogo, bbox):
+    """
+    Min/max (cotas), media y cobertura de datos dentro de un bbox, desde los resúmenes.
+
+    Returns:
+        dict, o None si ningún tile del bbox tiene resumen
+    """
+    resumenes = resumenes_catalogo(catalogo)
+    a = resumenes.arrays
+    suma = 0.0
+    validas = celdas = 0
+    minimo, maximo = np.inf, -np.inf
+    completos = parciales = sin_resumen = 0
+
+    for ruta, bounds in catalogo.tiles_bbox(bbox, solo_existentes=False):
+        k = resumenes.posicion.get(os.path.normpath(ruta))
+        if k is None:
+            sin_resumen += 1
+            continue
+        if (bbox['west'] <= bounds['west'] and bbox['east'] >= bounds['east'] and
+                bbox['south'] <= bounds['south'] and bbox['north'] >= bounds['north']):
+            completos += 1
+            suma += float(a['suma'][k])
+            validas += int(a['validas'][k])
+            celdas += int(a['celdas'][k])
+            tile_min, tile_max = a['min'][k], a['max'][k]
+        else:
+            parciales += 1
+            r0, r1, c0, c1 = _rango_bloques(bounds, bbox, resumenes.bloques)
+            suma += float(_suma_rectangulo(a['sat_suma'][k], r0, r1, c0, c1))
+            validas += int(_suma_rectangulo(a['sat_validas'][k], r0, r1, c0, c1))
+            celdas += int(_suma_rectangulo(a['sat_celdas'][k], r0, r1, c0, c1))
+            with np.errstate(all='ignore'):
+                tile_min = np.nanmin(a['bloques_min'][k, r0:r1, c0:c1])
+                tile_max = np.nanmax(a['bloques_max'][k, r0:r1, c0:c1])
+        if not np.isnan(tile_min):
+            minimo = min(minimo, float(tile_min))
+            maximo = max(maximo, float(tile_max))
+
+    if completos + parciales == 0:
+        return None
+    return {
+        'min': round(minimo, 3) if validas else None,
+        'max': round(maximo, 3) if validas else None,
+        'media': round(suma / validas, 3) if validas else None,
+        'celdas': celdas,
+        'celdas_validas': validas,
+        'cobertura': round(validas / celdas, 4) if celdas else 0.0,
+        'exacto': parciales == 0,
+        'tiles': {'completos': completos, 'borde': parciales, 'sin_resumen': sin_resumen}
+    }
+
+
+def vista_general(catalogo, bbox, rows, cols):
+    """
+    Grillas rows x cols de media y máximo sobre el bbox armadas con los
+    resúmenes: por tile si la celda pedida es mayor que un tile, por bloque si no.
+
+    Raises:
+        ValueError si la grilla pedida es inválida o demasiado grande
+    """
+    rows, cols = int(rows), int(cols)
+    if rows < 1 or cols < 1 or rows * cols > MAX_CELDAS_VISTA:
+        raise ValueError(f'La vista debe tener entre 1 y {MAX_CELDAS_VISTA} celdas')
+    if bbox['east'] <= bbox['west'] or bbox['north'] <= bbox['south']:
+        raise ValueError('bbox inválido: se requiere west < east y south < north')
+
+    resumenes = resumenes_catalogo(catalogo)
+    a = resumenes.arrays
+    tiles = [(resumenes.posicion.get(os.path.normpath(ruta)), bounds)
+             for ruta, bounds in catalogo.tiles_bbox(bbox, solo_existentes=False)]
+    tiles = [(k, b) for k, b in tiles if k is not None]
+
+    suma = np.zeros(rows * cols)
+    validas = np.zeros(rows * cols)
+    maximo = np.full(rows * cols, -np.inf)
+    paso_lon = (bbox['east'] - bbox['west']) / cols
+    paso_lat = (bbox['north'] - bbox['south']) / rows
+    nivel = 'bloque'
+
+    if tiles:
+        ks = np.array([k for k, _ in tiles])
+        west = np.array([b['west'] for _, b in tiles])
+        east = np.array([b['east'] for _, b in tiles])
+        south = np.array([b['south'] for _, b in tiles])
+        north = np.array([b['north'] for _, b in tiles])
+
+        if paso_lon >= np.median(east - west) and paso_lat >= np.median(north - south):
+            nivel = 'tile'
+            lons, lats = (west + east) / 2, (south + north) / 2
+            s, n, m = a['suma'][ks], a['validas'][ks], a['max'][ks].astype(np.float64)
+        else:
+            B = resumenes.bloques
+            fraccion = (np.arange(B) + 0.5) / B
+            lons = (west[:, None, None] + (east - west)[:, None, None] * fraccion[None, None, :]).repeat(B, axis=1)
+            lats = (north[:, None, None] - (north - south)[:, None, None] * fraccion[None, :, None]).repeat(B, axis=2)
+            s = np.diff(np.diff(a['sat_suma'][ks], axis=1), axis=2)
+            n = np.diff(np.diff(a['sat_validas'][ks], axis=1), axis=2)
+            m = a['bloques_max'][ks].astype(np.float64)
+            lons, lats, s, n, m = lons.ravel(), lats.ravel(), s.ravel(), n.ravel(), m.ravel()
+
+        c = np.floor((lons - bbox['west']) / paso_lon).astype(np.int64)
+        r = np.floor((bbox['north'] - lats) / paso_lat).astype(np.int64)
+        dentro = (c >= 0) & (c < cols) & (r >= 0) & (r < rows) & (n > 0)
+        ids = r[dentro] * cols + c[dentro]
+        np.add.at(suma, ids, s[dentro])
+        np.add.at(validas, ids, n[dentro])
+        np.maximum.at(maximo, ids, m[dentro])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = np.where(validas > 0, suma / validas, np.nan)
+    maximo[validas == 0] = np.nan
+    return {
+        'bbox': bbox,
+        'rows': rows,
+        'cols': cols,
+        'nivel': nivel,
+        'media': media.reshape(rows, cols),
+        'max': maximo.reshape(rows, cols),
+        'tiles': len(tiles)
+    }
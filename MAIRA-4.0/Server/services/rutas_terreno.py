@@ -0,0 +1,378 @@
+"""
+Rutas campo traviesa de mínimo costo sobre superficies de costo del terreno
+
+La transitabilidad de /api/terreno/analizar solo dice qué porcentaje del
+área queda bajo el límite de pendiente. Este módulo arma, para un área, una
+superficie de costo en segundos por metro y busca sobre ella la ruta más
+rápida entre puntos:
+
+    velocidad = velocidad base del vehículo
+              × factor de movimiento de la clase (data/factores_terreno.json)
+              × factor de pendiente (1 en llano, 0.3 en el límite del vehículo)
+              × factor de clima
+    costo = 1 / velocidad     (inf sobre el límite de pendiente o sin datos)
+
+La búsqueda es A* (Dijkstra multi-origen si se pasan varios orígenes) en
+8-vecindad sobre la grilla aplanada, con heap binario (heapq). La heurística
+es la distancia en línea recta al costo mínimo de la superficie, admisible.
+
+Dos caches: el muestreo de rasters del área va a cache_raster (compartida
+con el análisis, no depende del vehículo) y la superficie de costo a
+cache_costos por área + vehículo + clima. Sin área explícita, el bbox de la
+ruta se ajusta hacia afuera a una retícula de AREA_RETICULA grados, así las
+consultas cercanas de una misma operación caen en la misma área cacheada.
+
+Uso:
+-----
+    ruta = planificar_ruta(catalogo, catalogo_ndvi, origenes=[(lat, lon)], destino=(lat, lon),
+                           vehiculo='TAM', clima='seco', pool=pool_global)
+    ruta['geometria'], ruta['tiempo_s'], ruta['distancia_m']
+
+Configuración:
+--------------
+- MAIRA_RUTAS_MAX_CELDAS: celdas máximas de una superficie; la resolución se
+  agranda para respetarlo (1000000)
+- MAIRA_CACHE_RUTAS_MB: presupuesto de la cache de superficies de costo (128)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import json
+import math
+import heapq
+from functools import lru_cache
+
+import numpy as np
+
+from .grilla_muestreo import Grilla, METROS_POR_GRADO
+from .pipeline_terreno import muestrear_terreno, CLASES_TERRENO
+from .analisis_terreno import LIMITES_VEHICULOS, FACTORES_CLIMA, limite_pendiente
+from .cache_terreno import (
+    CacheTTL, cache_raster, clave_raster, clave_analisis, cuantizar_poligono, bytes_resultado
+)
+
+# Velocidad campo traviesa en terreno abierto y llano (km/h)
+VELOCIDADES_VEHICULOS = {
+    'TAM': 40,
+    'VCLC': 45,
+    'M113': 35,
+    'infanteria': 4,
+    'camion': 30
+}
+
+# Fracción de la velocidad que queda justo en el límite de pendiente
+FACTOR_PENDIENTE_LIMITE = 0.3
+
+RESOLUCION_DEFAULT = 30
+MAX_CELDAS_RUTA = int(os.getenv('MAIRA_RUTAS_MAX_CELDAS', '1000000'))
+MARGEN_MIN = 2000           # metros alrededor de orígenes/destino
+MARGEN_RELATIVO = 0.25      # fracción de la distancia recta
+AREA_RETICULA = 0.05        # grados
+
+cache_costos = CacheTTL(
+    presupuesto_mb=float(os.getenv('MAIRA_CACHE_RUTAS_MB', '128')),
+    ttl=float(os.getenv('MAIRA_CACHE_TERRENO_TTL', '900'))
+)
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+class SinRuta(Exception):
+    """No hay camino transitable entre los orígenes y el destino"""
+
+
+@lru_cache(maxsize=1)
+def factores_movimiento():
+    """Factor de velocidad por código de clase (CLASES_TERRENO), desde factores_terreno.json."""
+    with open(os.path.join(_DATA_DIR, 'factores_terreno.json'), encoding='utf-8') as f:
+        factores = json.load(f)['factores']
+    return np.array([factores.get(clase, {}).get('movimiento', 1.0) for clase in CLASES_TERRENO])
+
+
+@lru_cache(maxsize=1)
+def _climas_bv8():
+    with open(os.path.join(_DATA_DIR, 'factores_clima.json'), encoding='utf-8') as f:
+        return json.load(f)['climas']
+
+
+def factor_clima(clima):
+    """Factor de velocidad del clima: claves del análisis (seco/humedo/inundado) o de BV8."""
+    if clima in FACTORES_CLIMA:
+        return FACTORES_CLIMA[clima]
+    return _climas_bv8().get(str(clima).upper(), {}).get('movimiento', 1.0)
+
+
+class SuperficieCosto:
+    """Costo en segundos por metro de cada celda de la grilla (inf = intransitable)"""
+
+    __slots__ = ('grilla', 'costo', 'pendiente', 'clase', 'celda_x', 'celda_y', 'vehiculo', 'clima')
+
+    def __init__(self, grilla, costo, pendiente, clase, vehiculo, clima):
+        self.grilla = grilla
+        self.costo = costo
+        self.pendiente = pendiente
+        self.clase = clase
+        self.vehiculo = vehiculo
+        self.clima = clima
+        lat_centro = (grilla.bbox['north'] + grilla.bbox['south']) / 2
+        self.celda_y = grilla.paso_lat * METROS_POR_GRADO
+        self.celda_x = grilla.paso_lon * METROS_POR_GRADO * math.cos(math.radians(lat_centro))
+
+    @property
+    def bytes(self):
+        return self.costo.nbytes + self.pendiente.nbytes + self.clase.nbytes
+
+    def celda(self, lat, lon):
+        """Índice plano de la celda que contiene (lat, lon) o None si cae fuera."""
+        fila = math.floor((self.grilla.bbox['north'] - lat) / self.grilla.paso_lat)
+        col = math.floor((lon - self.grilla.bbox['west']) / self.grilla.paso_lon)
+        if not (0 <= fila < self.grilla.rows and 0 <= col < self.grilla.cols):
+            return None
+        return fila * self.grilla.cols + col
+
+
+def superficie_costo(terreno, grilla, vehiculo, clima):
+    """Superficie de costo de un vehículo/clima sobre un muestreo de terreno ya hecho."""
+    limite = limite_pendiente(vehiculo, clima)
+    velocidad_base = VELOCIDADES_VEHICULOS.get(vehiculo, 30) / 3.6 * factor_clima(clima)
+
+    pendiente = terreno.matriz('pendiente')
+    clase = terreno.matriz('clase')
+    factor_clase = factores_movimiento()[np.nan_to_num(clase, nan=0).astype(np.int64)]
+    factor_pend = 1 - (1 - FACTOR_PENDIENTE_LIMITE) * np.clip(np.nan_to_num(pendiente, nan=0) / limite, 0, 1)
+
+    with np.errstate(divide='ignore'):
+        costo = 1.0 / (velocidad_base * factor_clase * factor_pend)
+    costo[np.isnan(pendiente) | (pendiente > limite) | ~grilla.mascara] = np.inf
+    return SuperficieCosto(grilla, costo, pendiente.astype(np.float32),
+                           np.nan_to_num(clase, nan=-1).astype(np.int8), vehiculo, clima)
+
+
+def grilla_ruta(puntos, resolucion=RESOLUCION_DEFAULT, area=None):
+    """
+    Grilla del área de búsqueda.
+
+    Args:
+        puntos: [(lat, lon), ...] orígenes y destino
+        area: dict opcional {"bbox": {...}} o {"poligono": [...]} de la operación;
+              sin área se usa el bbox de los puntos con margen, ajustado a la retícula
+
+    Returns:
+        (grilla, poligono cuantizado o None)
+    """
+    poligono = None
+    if area:
+        poligono = cuantizar_poligono(area.get('poligono')) if area.get('poligono') else None
+        spec = {'bbox': area['bbox']} if area.get('bbox') else {'poligono': poligono}
+        bbox = Grilla.desde_spec(dict(spec, rows=1, cols=1)).bbox
+    else:
+        lats = [p[0] for p in puntos]
+        lons = [p[1] for p in puntos]
+        lat_centro = (max(lats) + min(lats)) / 2
+        metros_lon = METROS_POR_GRADO * math.cos(math.radians(lat_centro))
+        recta = math.hypot((max(lats) - min(lats)) * METROS_POR_GRADO, (max(lons) - min(lons)) * metros_lon)
+        margen = max(MARGEN_MIN, MARGEN_RELATIVO * recta)
+        bbox = {
+            'west': math.floor((min(lons) - margen / metros_lon) / AREA_RETICULA) * AREA_RETICULA,
+            'east': math.ceil((max(lons) + margen / metros_lon) / AREA_RETICULA) * AREA_RETICULA,
+            'south': math.floor((min(lats) - margen / METROS_POR_GRADO) / AREA_RETICULA) * AREA_RETICULA,
+            'north': math.ceil((max(lats) + margen / METROS_POR_GRADO) / AREA_RETICULA) * AREA_RETICULA
+        }
+
+    # Resolución mínima que respeta MAX_CELDAS_RUTA, redondeada a 10 m para estabilizar la cache
+    lat_centro = (bbox['north'] + bbox['south']) / 2
+    area_m2 = ((bbox['north'] - bbox['south']) * METROS_POR_GRADO *
+               (bbox['east'] - bbox['west']) * METROS_POR_GRADO * math.cos(math.radians(lat_centro)))
+    minima = math.ceil(math.sqrt(area_m2 / MAX_CELDAS_RUTA) / 10) * 10
+    resolucion = max(float(resolucion), minima)
+    return Grilla.desde_spec({'bbox': bbox, 'resolucion': resolucion}, poligono), poligono
+
+
+def superficie_para_area(catalogo, catalogo_ndvi, grilla, poligono, vehiculo, clima, pool=None):
+    """
+    Superficie de costo desde cache o muestreando el área.
+
+    Returns:
+        (superficie, raster_hit, costo_hit)
+    """
+    clave = clave_raster(poligono, grilla, catalogo, catalogo_ndvi)
+    clave_costo = clave_analisis(clave, vehiculo, clima, 'costo')
+    superficie = cache_costos.obtener(clave_costo)
+    if superficie is not None:
+        return superficie, True, True
+
+    entrada = cache_raster.obtener(clave)
+    raster_hit = entrada is not None
+    if raster_hit:
+        terreno = entrada[0]
+    else:
+        terreno = muestrear_terreno(catalogo, catalogo_ndvi, grilla=grilla, pool=pool)
+        cache_raster.guardar(clave, (terreno, None), bytes_resultado(terreno))
+
+    superficie = superficie_costo(terreno, grilla, vehiculo, clima)
+    cache_costos.guardar(clave_costo, superficie, superficie.bytes)
+    return superficie, raster_hit, False
+
+
+def ruta_minimo_costo(superficie, origenes, destino):
+    """
+    A* multi-origen sobre la superficie (8-vecindad). El costo de un paso es
+    su largo por el promedio del costo de las dos celdas.
+
+    Args:
+        origenes: índices planos de celda
+        destino: índice plano de celda
+
+    Returns:
+        (camino, tiempo_s, exploradas): camino es la lista de índices desde el
+        origen elegido hasta el destino
+
+    Raises:
+        SinRuta si el destino no es alcanzable
+    """
+    rows, cols = superficie.costo.shape
+    costo = superficie.costo.ravel().tolist()
+    inf = math.inf
+    if costo[destino] == inf:
+        raise SinRuta('El destino cae en terreno intransitable para el vehículo')
+    origenes = [o for o in origenes if costo[o] != inf]
+    if not origenes:
+        raise SinRuta('Los orígenes caen en terreno intransitable para el vehículo')
+
+    dx, dy = superficie.celda_x, superficie.celda_y
+    diagonal = math.hypot(dx, dy)
+    vecinos = [
+        (-cols - 1, -1, -1, diagonal), (-cols, -1, 0, dy), (-cols + 1, -1, 1, diagonal),
+        (-1, 0, -1, dx), (1, 0, 1, dx),
+        (cols - 1, 1, -1, diagonal), (cols, 1, 0, dy), (cols + 1, 1, 1, diagonal)
+    ]
+    finitos = superficie.costo[np.isfinite(superficie.costo)]
+    costo_min = float(finitos.min())
+    fila_d, col_d = divmod(destino, cols)
+
+    g = [inf] * (rows * cols)
+    previo = [-1] * (rows * cols)
+    heap = []
+    for o in origenes:
+        g[o] = 0.0
+        fila, col = divmod(o, cols)
+        heapq.heappush(heap, (math.hypot((fila - fila_d) * dy, (col - col_d) * dx) * costo_min, 0.0, o))
+
+    exploradas = 0
+    hypot = math.hypot
+    heappush, heappop = heapq.heappush, heapq.heappop
+    while heap:
+        _, gi, i = heappop(heap)
+        if gi > g[i]:
+            continue
+        exploradas += 1
+        if i == destino:
+            break
+        fila, col = divmod(i, cols)
+        ci = costo[i]
+        for desplazamiento, df, dc, largo in vecinos:
+            c = col + dc
+            f = fila + df
+            if c < 0 or c >= cols or f < 0 or f >= rows:
+                continue
+            j = i + desplazamiento
+            cj = costo[j]
+            if cj == inf:
+                continue
+            nuevo = gi + largo * (ci + cj) * 0.5
+            if nuevo < g[j]:
+                g[j] = nuevo
+                previo[j] = i
+                heappush(heap, (nuevo + hypot((f - fila_d) * dy, (c - col_d) * dx) * costo_min, nuevo, j))
+
+    if g[destino] == inf:
+        raise SinRuta('No existe ruta transitable entre los puntos')
+
+    camino = [destino]
+    while previo[camino[-1]] != -1:
+        camino.append(previo[camino[-1]])
+    camino.reverse()
+    return camino, g[destino], exploradas
+
+
+def _simplificar(filas, cols):
+    """Conserva solo las celdas donde el camino cambia de dirección."""
+    if len(filas) <= 2:
+        return np.arange(len(filas))
+    df = np.diff(filas)
+    dc = np.diff(cols)
+    giro = (df[1:] != df[:-1]) | (dc[1:] != dc[:-1])
+    return np.concatenate([[0], np.flatnonzero(giro) + 1, [len(filas) - 1]])
+
+
+def planificar_ruta(catalogo, catalogo_ndvi, origenes, destino, vehiculo='TAM', clima='seco',
+                    resolucion=RESOLUCION_DEFAULT, area=None, pool=None):
+    """
+    Ruta más rápida campo traviesa entre el mejor de los orígenes y el destino.
+
+    Args:
+        origenes: [(lat, lon), ...]
+        destino: (lat, lon)
+        area: área de la operación (ver grilla_ruta)
+
+    Returns:
+        dict con geometria (GeoJSON LineString), distancia_m, tiempo_s,
+        eta_min, velocidad_media_kmh, origen (índice en `origenes`),
+        composición del recorrido por clase y datos de la búsqueda
+
+    Raises:
+        ValueError: vehículo desconocido o puntos fuera del área
+        SinRuta: sin camino transitable
+    """
+    if vehiculo not in LIMITES_VEHICULOS:
+        raise ValueError(f'Vehículo desconocido: {vehiculo}')
+    grilla, poligono = grilla_ruta(list(origenes) + [destino], resolucion, area)
+    superficie, raster_hit, costo_hit = superficie_para_area(
+        catalogo, catalogo_ndvi, grilla, poligono, vehiculo, clima, pool)
+
+    celdas_origen = [superficie.celda(lat, lon) for lat, lon in origenes]
+    celda_destino = superficie.celda(*destino)
+    if celda_destino is None or any(c is None for c in celdas_origen):
+        raise ValueError('Orígenes y destino deben estar dentro del área')
+
+    camino, tiempo, exploradas = ruta_minimo_costo(superficie, celdas_origen, celda_destino)
+    filas, cols = np.divmod(np.asarray(camino), grilla.cols)
+
+    lats = grilla.lats[filas]
+    lons = grilla.lons[cols]
+    pasos = np.hypot(np.diff(filas) * superficie.celda_y, np.diff(cols) * superficie.celda_x)
+    distancia = float(pasos.sum())
+
+    # Metros recorridos en cada clase de terreno (cada paso se asigna a su celda de llegada)
+    clases = superficie.clase[filas[1:], cols[1:]]
+    composicion = {
+        CLASES_TERRENO[codigo]: round(float(pasos[clases == codigo].sum()), 1)
+        for codigo in np.unique(clases) if codigo >= 0
+    }
+
+    vertices = _simplificar(filas, cols)
+    return {
+        'geometria': {
+            'type': 'LineString',
+            'coordinates': [[round(float(lons[k]), 6), round(float(lats[k]), 6)] for k in vertices]
+        },
+        'distancia_m': round(distancia, 1),
+        'tiempo_s': round(tiempo, 1),
+        'eta_min': round(tiempo / 60, 1),
+        'velocidad_media_kmh': round(distancia / tiempo * 3.6, 1) if tiempo > 0 else None,
+        'origen': celdas_origen.index(camino[0]),
+        'pendiente_maxima': round(float(np.nanmax(superficie.pendiente[filas, cols])), 1),
+        'composicion_m': composicion,
+        'busqueda': {
+            'celdas_exploradas': exploradas,
+            'celdas_grilla': grilla.rows * grilla.cols,
+            'resolucion': round(superficie.celda_y, 1),
+            'vehiculo': vehiculo,
+            'clima': clima,
+            'limite_pendiente': round(limite_pendiente(vehiculo, clima), 1)
+        },
+        'grilla': grilla.metadata(),
+        'cache': {'raster': raster_hit, 'costo': costo_hit}
+    }
@@ -0,0 +1,104 @@
+"""
+Almacén de mini-tiles como arrays .npy crudos leídos por np.memmap
+
+Los mini-tiles son grillas chicas y fijas; decodificarlos con GDAL en cada
+proceso (y en cada worker de gunicorn) repite trabajo. Exportados a .npy sin
+compresión, con un sidecar JSON de georreferencia, el pool (pool_raster.py)
+los abre con np.load(mmap_mode='r'): no hay decodificación por request y las
+páginas quedan en el page cache del sistema, compartidas entre workers.
+
+Junto a cada tile.tif:
+- tile.npy: banda 1 con su dtype original, o float16 con NaN como sin dato
+  (--float16: la mitad de bytes, error < 0.5 % en elevación)
+- tile.npy.json: transform (6 coeficientes), nodata, crs, dtype
+
+El .npy se ignora si es más viejo que el .tif (tile re-extraído).
+
+Uso:
+-----
+    exportar_tile('/.../tile_0001.tif', float16=False)   # tools/export_tiles_npy.py
+    datos, transform, nodata, crs = abrir_npy('/.../tile_0001.tif')  # None si no hay .npy vigente
+
+Configuración:
+--------------
+- MAIRA_RASTER_BACKEND: 'auto' usa el .npy si existe, 'rasterio' lo ignora (auto)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import json
+
+import numpy as np
+
+BACKEND = os.getenv('MAIRA_RASTER_BACKEND', 'auto').lower()
+
+
+def ruta_npy(ruta_tif):
+    return os.path.splitext(ruta_tif)[0] + '.npy'
+
+
+def exportar_tile(ruta_tif, float16=False):
+    """
+    Escribe tile.npy y tile.npy.json junto al GeoTIFF.
+
+    Returns:
+        bytes escritos del .npy
+    """
+    import rasterio
+
+    with rasterio.open(ruta_tif) as src:
+        datos = src.read(1)
+        transform = src.transform
+        nodata = src.nodata
+        crs = src.crs.to_wkt() if src.crs else None
+
+    if float16 and np.issubdtype(datos.dtype, np.floating):
+        # float16 no representa -9999 exacto: el sin dato pasa a NaN
+        valores = datos.astype(np.float16)
+        if nodata is not None:
+            valores[datos == nodata] = np.nan
+        datos, nodata = valores, None
+
+    destino = ruta_npy(ruta_tif)
+    temporal = destino + '.tmp.npy'
+    np.save(temporal, np.ascontiguousarray(datos))
+    with open(destino + '.json.tmp', 'w', encoding='utf-8') as f:
+        json.dump({
+            'transform': list(transform)[:6],
+            'nodata': nodata,
+            'crs': crs,
+            'dtype': str(datos.dtype),
+            'forma': list(datos.shape)
+        }, f)
+    os.replace(destino + '.json.tmp', destino + '.json')
+    os.replace(temporal, destino)
+    return os.path.getsize(destino)
+
+
+def abrir_npy(ruta_tif):
+    """
+    (datos memmap de solo lectura, transform, nodata, crs) del .npy vigente
+    del tile, o None si no hay, es más viejo que el .tif o el backend está
+    forzado a rasterio.
+    """
+    if BACKEND == 'rasterio':
+        return None
+    destino = ruta_npy(ruta_tif)
+    try:
+        mtime_npy = os.stat(destino).st_mtime
+    except FileNotFoundError:
+        return None
+    try:
+        if os.stat(ruta_tif).st_mtime > mtime_npy:
+            return None
+    except FileNotFoundError:
+        pass
+
+    from affine import Affine
+
+    with open(destino + '.json', 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    datos = np.load(destino, mmap_mode='r')
+    return datos, Affine(*meta['transform']), meta.get('nodata'), meta.get('crs')
@@ -0,0 +1,313 @@
+"""
+Trabajos asíncronos en un pool acotado de procesos, con progreso por Socket.IO
+
+Los análisis grandes (polígonos de cientos de km²) tardan decenas de segundos.
+Corridos dentro del request ocupan un worker de gunicorn y, con gevent,
+bloquean el chat y las posiciones de todos los usuarios de ese worker. Este
+gestor los ejecuta en procesos aparte:
+
+- enviar() devuelve de inmediato un Trabajo con id; el endpoint responde 202.
+- La función corre en un ProcessPoolExecutor (spawn) y reporta avance con
+  progreso(porcentaje, etapa, **datos); cada llamada viaja por una cola al
+  proceso del servidor, que la reemite por Socket.IO a la sala del cliente.
+- cancelar() descarta un trabajo en cola o marca uno en curso: el próximo
+  progreso() del proceso hijo lanza TrabajoCancelado.
+- El resultado queda disponible por TTL para GET /api/trabajos/<id>/resultado.
+
+Eventos Socket.IO (a la sala `sid` del cliente que envió el trabajo):
+    trabajo_progreso   {id, tipo, progreso, etapa, ...datos}   (p.ej. tile, bounds)
+    trabajo_completado {id, tipo}
+    trabajo_error      {id, tipo, error}
+    trabajo_cancelado  {id, tipo}
+
+Uso:
+-----
+    gestor_trabajos.configurar(socketio)           # una vez, al iniciar
+    trabajo = gestor_trabajos.enviar('analisis_terreno', funcion, parametros,
+                                     sid=socket_id, al_terminar=callback)
+    gestor_trabajos.obtener(trabajo.id).estado
+
+    # `funcion` debe ser importable (nivel de módulo) y aceptar (parametros, progreso)
+
+Configuración:
+--------------
+- MAIRA_TRABAJOS_PROCESOS: procesos del pool (2)
+- MAIRA_TRABAJOS_TTL: segundos que se conserva un trabajo terminado (600)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import time
+import uuid
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+
+PENDIENTE = 'pendiente'
+EJECUTANDO = 'ejecutando'
+COMPLETADO = 'completado'
+ERROR = 'error'
+CANCELADO = 'cancelado'
+
+TERMINADOS = (COMPLETADO, ERROR, CANCELADO)
+
+
+class TrabajoCancelado(Exception):
+    """Lanzada dentro del proceso hijo cuando el trabajo fue cancelado"""
+
+
+# ----------------------------------------------------------------------
+# Lado proceso hijo
+# ----------------------------------------------------------------------
+_canal = None
+_cancelados = None
+
+
+def _inicializar_proceso(canal, cancelados):
+    global _canal, _cancelados
+    _canal = canal
+    _cancelados = cancelados
+
+
+def _ejecutar(trabajo_id, funcion, parametros):
+    """Corre `funcion` en el proceso hijo con un callback de progreso propio del trabajo."""
+    def progreso(porcentaje, etapa=None, **datos):
+        if _cancelados.get(trabajo_id):
+            raise TrabajoCancelado(trabajo_id)
+        _canal.put((trabajo_id, float(porcentaje), etapa, datos))
+
+    _canal.put((trabajo_id, 0.0, 'iniciado', {}))
+    return funcion(parametros, progreso)
+
+
+# ----------------------------------------------------------------------
+# Lado servidor
+# ----------------------------------------------------------------------
+class Trabajo:
+    """Estado de un trabajo visto desde el servidor"""
+
+    def __init__(self, tipo, sid=None, al_terminar=None):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.sid = sid
+        self.al_terminar = al_terminar
+        self.estado = PENDIENTE
+        self.progreso = 0.0
+        self.etapa = None
+        self.resultado = None
+        self.error = None
+        self.creado = time.time()
+        self.terminado = None
+        self.future = None
+
+    def a_dict(self):
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'estado': self.estado,
+            'progreso': round(self.progreso, 1),
+            'etapa': self.etapa,
+            'error': self.error,
+            'creado': self.creado,
+            'terminado': self.terminado
+        }
+
+
+class GestorTrabajos:
+    """Pool de procesos compartido por los endpoints pesados"""
+
+    def __init__(self, max_procesos=2, ttl=600):
+        self.max_procesos = max_procesos
+        self.ttl = ttl
+        self.socketio = None
+
+        self._trabajos = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._manager = None
+        self._canal = None
+        self._cancelados = None
+        self._monitor_activo = False
+
+    def configurar(self, socketio):
+        """Socket.IO del servidor para emitir progreso (sin él solo se consulta por HTTP)."""
+        self.socketio = socketio
+
+    def _pool(self):
+        """Crea el pool al primer uso: los procesos spawn no heredan el estado de gevent."""
+        if self._executor is None:
+            contexto = multiprocessing.get_context('spawn')
+            self._manager = contexto.Manager()
+            self._canal = self._manager.Queue()
+            self._cancelados = self._manager.dict()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_procesos,
+                mp_context=contexto,
+                initializer=_inicializar_proceso,
+                initargs=(self._canal, self._cancelados)
+            )
+            print(f'⚙️ Pool de trabajos iniciado ({self.max_procesos} procesos)')
+        return self._executor
+
+    def enviar(self, tipo, funcion, parametros, sid=None, al_terminar=None):
+        """
+        Encola `funcion(parametros, progreso)` en el pool.
+
+        Args:
+            tipo: nombre del tipo de trabajo (para el cliente y las estadísticas)
+            funcion: callable de nivel de módulo (picklable)
+            parametros: dict picklable
+            sid: sala Socket.IO del cliente (request.sid / socket.id)
+            al_terminar: callable opcional en el servidor que transforma el
+                         valor devuelto por el hijo en el resultado guardado
+
+        Returns:
+            Trabajo
+        """
+        with self._lock:
+            executor = self._pool()
+            trabajo = Trabajo(tipo, sid=sid, al_terminar=al_terminar)
+            trabajo.future = executor.submit(_ejecutar, trabajo.id, funcion, parametros)
+            self._trabajos[trabajo.id] = trabajo
+        print(f'📥 Trabajo {tipo} {trabajo.id[:8]} encolado')
+        self._iniciar_monitor()
+        return trabajo
+
+    def obtener(self, trabajo_id):
+        self._purgar()
+        with self._lock:
+            return self._trabajos.get(trabajo_id)
+
+    def cancelar(self, trabajo_id):
+        """
+        Cancela un trabajo pendiente o en curso.
+
+        Returns:
+            True si se canceló o se pidió la cancelación; False si ya terminó o no existe
+        """
+        trabajo = self.obtener(trabajo_id)
+        if trabajo is None or trabajo.estado in TERMINADOS:
+            return False
+        self._cancelados[trabajo_id] = True
+        if trabajo.future.cancel():
+            self._terminar(trabajo, CANCELADO)
+        return True
+
+    def estadisticas(self):
+        with self._lock:
+            estados = {}
+            for trabajo in self._trabajos.values():
+                estados[trabajo.estado] = estados.get(trabajo.estado, 0) + 1
+            return {
+                'procesos': self.max_procesos,
+                'pool_iniciado': self._executor is not None,
+                'trabajos': len(self._trabajos),
+                'por_estado': estados
+            }
+
+    # ------------------------------------------------------------------
+    # Monitor: reemite progreso y cierra trabajos terminados
+    # ------------------------------------------------------------------
+    def _iniciar_monitor(self):
+        with self._lock:
+            if self._monitor_activo:
+                return
+            self._monitor_activo = True
+        if self.socketio is not None:
+            self.socketio.start_background_task(self._monitor)
+        else:
+            threading.Thread(target=self._monitor, daemon=True).start()
+
+    def _dormir(self, segundos):
+        if self.socketio is not None:
+            self.socketio.sleep(segundos)
+        else:
+            time.sleep(segundos)
+
+    def _emitir(self, trabajo, evento, datos):
+        if self.socketio is None or trabajo.sid is None:
+            return
+        try:
+            self.socketio.emit(evento, dict(datos, id=trabajo.id, tipo=trabajo.tipo), room=trabajo.sid)
+        except Exception as e:
+            print(f'⚠️ Error emitiendo {evento}: {e}')
+
+    def _monitor(self):
+        while True:
+            self._drenar_progreso()
+
+            with self._lock:
+                activos = [t for t in self._trabajos.values() if t.estado not in TERMINADOS]
+            for trabajo in activos:
+                if trabajo.future.done():
+                    self._cerrar(trabajo)
+
+            self._purgar()
+            with self._lock:
+                if not any(t.estado not in TERMINADOS for t in self._trabajos.values()):
+                    self._monitor_activo = False
+                    return
+            self._dormir(0.2)
+
+    def _drenar_progreso(self):
+        while True:
+            try:
+                trabajo_id, porcentaje, etapa, datos = self._canal.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                trabajo = self._trabajos.get(trabajo_id)
+            if trabajo is None or trabajo.estado in TERMINADOS:
+                continue
+            trabajo.estado = EJECUTANDO
+            trabajo.progreso = porcentaje
+            trabajo.etapa = etapa
+            self._emitir(trabajo, 'trabajo_progreso', dict(datos, progreso=round(porcentaje, 1), etapa=etapa))
+
+    def _cerrar(self, trabajo):
+        """Pasa el resultado (o el error) del future al trabajo."""
+        try:
+            salida = trabajo.future.result()
+            if self._cancelados.get(trabajo.id):
+                # Se pidió cancelar después del último progreso() del hijo
+                raise TrabajoCancelado(trabajo.id)
+            if trabajo.al_terminar is not None:
+                salida = trabajo.al_terminar(salida)
+            trabajo.resultado = salida
+            self._terminar(trabajo, COMPLETADO)
+        except (TrabajoCancelado, CancelledError):
+            self._terminar(trabajo, CANCELADO)
+        except Exception as e:
+            trabajo.error = str(e)
+            self._terminar(trabajo, ERROR)
+
+    def _terminar(self, trabajo, estado):
+        trabajo.estado = estado
+        trabajo.terminado = time.time()
+        if estado == COMPLETADO:
+            trabajo.progreso = 100.0
+        self._cancelados.pop(trabajo.id, None)
+
+        duracion = trabajo.terminado - trabajo.creado
+        print(f'📤 Trabajo {trabajo.tipo} {trabajo.id[:8]}: {estado} en {duracion:.1f}s')
+        if estado == ERROR:
+            self._emitir(trabajo, 'trabajo_error', {'error': trabajo.error})
+        else:
+            self._emitir(trabajo, f'trabajo_{estado}', {})
+
+    def _purgar(self):
+        """Descarta trabajos terminados hace más de TTL segundos."""
+        limite = time.time() - self.ttl
+        with self._lock:
+            for trabajo_id in [i for i, t in self._trabajos.items()
+                               if t.estado in TERMINADOS and t.terminado < limite]:
+                del self._trabajos[trabajo_id]
+
+
+gestor_trabajos = GestorTrabajos(
+    max_procesos=int(os.getenv('MAIRA_TRABAJOS_PROCESOS', '2')),
+    ttl=float(os.getenv('MAIRA_TRABAJOS_TTL', '600'))
+)
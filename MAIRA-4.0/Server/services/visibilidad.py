@@ -0,0 +1,352 @@
+"""
+Intervisibilidad: cuencas visuales (viewshed) y líneas de vista sobre el DEM
+
+Cuenca visual por barrido radial R2 vectorizado: por observador se lee una
+sola vez la ventana del DEM (grilla cuadrada centrada en él, ver
+grilla_muestreo.py) y se trazan rayos hacia todas las celdas del borde. Cada
+rayo es una fila de un array (rayos x pasos); el ángulo máximo acumulado
+(np.maximum.accumulate) dice qué celdas quedan por encima del horizonte
+local. Una celda es visible si algún rayo la ve.
+
+Corrección por curvatura terrestre y refracción: z' = z - d²·(1-k)/(2R).
+
+Las cuencas se cachean por celda de observador (posición redondeada a la
+grilla de la resolución) + alturas + alcance + versión del catálogo, así
+los puestos de observación repetidos en una sesión no se recalculan.
+
+Uso:
+-----
+    cuenca = cuenca_visual_observador(catalogo, lat, lon, altura=2, alcance=5000, pool=pool_global)
+    cuenca.visible          # matriz float32: 1 visible, 0 no visible, NaN fuera de alcance
+    grilla, conteo, cuencas = cuencas_combinadas(catalogo, observadores, alcance=5000)
+    linea_de_vista(catalogo, (lat0, lon0), (lat1, lon1), altura_obs=2, altura_obj=2)
+
+Configuración:
+--------------
+- MAIRA_VISIBILIDAD_ALCANCE_MAX: alcance máximo por observador en metros (20000)
+- MAIRA_CACHE_VISIBILIDAD_MB: presupuesto de la cache de cuencas (64)
+
+Autor: MAIRA Team
+Fecha: 2025-11-14
+"""
+
+import os
+import math
+
+import numpy as np
+
+from .grilla_muestreo import Grilla, METROS_POR_GRADO, muestrear_grilla
+from .muestreo_raster import muestrear_tiles
+from .cache_terreno import CacheTTL
+
+RADIO_TIERRA = 6371000
+COEF_REFRACCION = 0.13
+
+ALCANCE_MAX = float(os.getenv('MAIRA_VISIBILIDAD_ALCANCE_MAX', '20000'))
+RESOLUCION_DEFAULT = 30
+RAYOS_POR_BLOQUE = 512   # acota la memoria del barrido: bloques de rayos x pasos
+MAX_MUESTRAS_LINEA = 5000   # muestras por perfil de línea de vista
+
+cache_cuencas = CacheTTL(
+    presupuesto_mb=float(os.getenv('MAIRA_CACHE_VISIBILIDAD_MB', '64')),
+    ttl=float(os.getenv('MAIRA_CACHE_TERRENO_TTL', '900'))
+)
+
+
+def caida_curvatura(distancias):
+    """Descenso aparente del terreno (m) por curvatura y refracción a cada distancia."""
+    return np.square(distancias) * (1 - COEF_REFRACCION) / (2 * RADIO_TIERRA)
+
+
+def barrido_radial(dem, fila, col, celda_x, celda_y, altura_obs=2.0, altura_obj=0.0, alcance=None):
+    """
+    Cuenca visual R2 de un observador sobre una matriz de elevaciones.
+
+    En cada paso del rayo la elevación se interpola entre las dos celdas que
+    lo flanquean en el eje menor (las que quedan al costado no hacen de
+    obstáculo en pendientes suaves); solo la celda que se marca usa el
+    índice redondeado. Los rayos se procesan de a RAYOS_POR_BLOQUE.
+
+    Args:
+        dem: matriz 2-D (fila 0 = norte), NaN = sin dato
+        fila, col: celda del observador
+        celda_x, celda_y: tamaño de celda en metros
+        altura_obs: altura del observador sobre el terreno
+        altura_obj: altura del objetivo sobre el terreno (0 = ver el suelo)
+        alcance: distancia máxima en metros (None = toda la ventana)
+
+    Returns:
+        matriz float32: 1 visible, 0 no visible, NaN sin dato o fuera de alcance
+    """
+    dem = np.asarray(dem, dtype=np.float32)
+    rows, cols = dem.shape
+    radio = max(fila, col, rows - 1 - fila, cols - 1 - col)
+    z_obs = float(dem[fila, col]) + altura_obs
+
+    salida = np.full(dem.shape, np.nan, dtype=np.float32)
+    if radio == 0 or np.isnan(z_obs):
+        return salida
+
+    # Celdas del borde del cuadrado de radio `radio`: un rayo hacia cada una
+    lado = np.arange(-radio, radio + 1, dtype=np.int32)
+    interior = np.arange(-radio + 1, radio, dtype=np.int32)
+    dx = np.concatenate([lado, lado, np.full(len(interior), -radio), np.full(len(interior), radio)]).astype(np.int32)
+    dy = np.concatenate([np.full(len(lado), -radio), np.full(len(lado), radio), interior, interior]).astype(np.int32)
+
+    pasos = np.arange(1, radio + 1, dtype=np.float32) / np.float32(radio)
+    for inicio in range(0, len(dx), RAYOS_POR_BLOQUE):
+        bx = dx[inicio:inicio + RAYOS_POR_BLOQUE, None]
+        by = dy[inicio:inicio + RAYOS_POR_BLOQUE, None]
+
+        # DDA: en el paso k el rayo avanza k celdas en su eje mayor (exacto)
+        # y una fracción en el menor
+        pos_f = fila + by * pasos
+        pos_c = col + bx * pasos
+        eje_x = np.abs(bx) == radio                      # eje mayor = columnas
+        menor = np.where(eje_x, pos_f, pos_c)
+        base = np.floor(menor)
+        peso = (menor - base).astype(np.float32)
+        base = base.astype(np.int32)
+
+        f_marca = np.rint(pos_f).astype(np.int32)
+        c_marca = np.rint(pos_c).astype(np.int32)
+        f0 = np.where(eje_x, base, f_marca)
+        c0 = np.where(eje_x, c_marca, base)
+        f1 = f0 + eje_x
+        c1 = c0 + ~eje_x
+        dentro = ((f_marca >= 0) & (f_marca < rows) & (c_marca >= 0) & (c_marca < cols) &
+                  (f0 >= 0) & (f0 < rows) & (c0 >= 0) & (c0 < cols) &
+                  ((peso == 0) | ((f1 < rows) & (c1 < cols))))
+        np.clip(f0, 0, rows - 1, out=f0)
+        np.clip(c0, 0, cols - 1, out=c0)
+        np.clip(f1, 0, rows - 1, out=f1)
+        np.clip(c1, 0, cols - 1, out=c1)
+        np.clip(f_marca, 0, rows - 1, out=f_marca)
+        np.clip(c_marca, 0, cols - 1, out=c_marca)
+
+        z0 = dem[f0, c0]
+        z = np.where(peso > 0, z0 + peso * (dem[f1, c1] - z0), z0)
+        distancias = np.hypot((pos_c - col) * np.float32(celda_x), (pos_f - fila) * np.float32(celda_y))
+        z -= caida_curvatura(distancias)
+        sin_dato = np.isnan(z) | ~dentro
+
+        # Pendiente de la visual en cada paso del rayo y horizonte acumulado previo
+        angulo_terreno = np.where(sin_dato, -np.inf, (z - z_obs) / distancias).astype(np.float32)
+        horizonte = np.maximum.accumulate(angulo_terreno, axis=1)
+        horizonte[:, 1:] = horizonte[:, :-1]
+        horizonte[:, 0] = -np.inf
+        angulo_objetivo = (z + altura_obj - z_obs) / distancias
+
+        evaluables = ~sin_dato
+        if alcance is not None:
+            evaluables &= distancias <= alcance
+        visibles = evaluables & (angulo_objetivo >= horizonte)
+
+        # Una celda es visible si algún rayo la ve
+        fe, ce = f_marca[evaluables], c_marca[evaluables]
+        salida[fe, ce] = np.fmax(salida[fe, ce], 0)
+        salida[f_marca[visibles], c_marca[visibles]] = 1
+
+    salida[fila, col] = 1
+    return salida
+
+
+class CuencaVisual:
+    """Cuenca visual de un observador sobre su ventana de DEM"""
+
+    __slots__ = ('grilla', 'visible', 'lat', 'lon', 'elevacion', 'alcance')
+
+    def __init__(self, grilla, visible, lat, lon, elevacion, alcance):
+        self.grilla = grilla
+        self.visible = visible
+        self.lat = lat
+        self.lon = lon
+        self.elevacion = elevacion
+        self.alcance = alcance
+
+    @property
+    def bytes(self):
+        return self.visible.nbytes
+
+    def resumen(self):
+        """Celdas visibles y porcentaje del área evaluada dentro del alcance."""
+        evaluadas = int(np.count_nonzero(~np.isnan(self.visible)))
+        visibles = int(np.count_nonzero(self.visible == 1))
+        area_celda = (self.grilla.paso_lat * METROS_POR_GRADO *
+                      self.grilla.paso_lon * METROS_POR_GRADO * math.cos(math.radians(self.lat)))
+        return {
+            'lat': self.lat,
+            'lon': self.lon,
+            'elevacion': None if np.isnan(self.elevacion) else round(float(self.elevacion), 1),
+            'celdas_visibles': visibles,
+            'celdas_evaluadas': evaluadas,
+            'pct_visible': round(visibles / evaluadas * 100, 1) if evaluadas else 0.0,
+            'area_visible_km2': round(visibles * area_celda / 1e6, 3)
+        }
+
+
+def ventana_observador(lat, lon, alcance, resolucion):
+    """
+    Grilla cuadrada de lado 2·radio+1 celdas centrada en la celda del
+    observador. La posición se redondea a la grilla de la resolución, así
+    observadores en la misma celda comparten ventana (y cache).
+
+    Returns:
+        (grilla, lat_celda, lon_celda)
+    """
+    paso_lat = resolucion / METROS_POR_GRADO
+    lat_celda = round(lat / paso_lat) * paso_lat
+    paso_lon = resolucion / (METROS_POR_GRADO * math.cos(math.radians(lat_celda)))
+    lon_celda = round(lon / paso_lon) * paso_lon
+
+    radio = max(1, math.ceil(alcance / resolucion))
+    bbox = {
+        'west': lon_celda - (radio + 0.5) * paso_lon,
+        'east': lon_celda + (radio + 0.5) * paso_lon,
+        'south': lat_celda - (radio + 0.5) * paso_lat,
+        'north': lat_celda + (radio + 0.5) * paso_lat
+    }
+    lado = 2 * radio + 1
+    return Grilla(bbox, lado, lado), lat_celda, lon_celda
+
+
+def cuenca_visual_observador(catalogo, lat, lon, altura=2.0, alcance=5000, altura_objetivo=0.0,
+                             resolucion=RESOLUCION_DEFAULT, pool=None):
+    """
+    Cuenca visual de un observador, desde cache o calculada sobre su ventana de DEM.
+
+    Raises:
+        ValueError si el alcance o la resolución son inválidos
+    """
+    if not 0 < alcance <= ALCANCE_MAX:
+        raise ValueError(f'alcance debe estar entre 0 y {ALCANCE_MAX:.0f} metros')
+    if resolucion <= 0:
+        raise ValueError('resolucion debe ser positiva (metros)')
+
+    grilla, lat_celda, lon_celda = ventana_observador(lat, lon, alcance, resolucion)
+    clave = (round(lat_celda / grilla.paso_lat), round(lon_celda / grilla.paso_lon),
+             float(altura), float(altura_objetivo), float(alcance), float(resolucion), catalogo.version)
+    cuenca = cache_cuencas.obtener(clave)
+    if cuenca is not None:
+        return cuenca
+
+    dem, _ = muestrear_grilla(catalogo.tiles_bbox(grilla.bbox), grilla, pool=pool)
+    centro = grilla.rows // 2
+    celda_y = grilla.paso_lat * METROS_POR_GRADO
+    celda_x = grilla.paso_lon * METROS_POR_GRADO * math.cos(math.radians(lat_celda))
+
+    visible = barrido_radial(dem, centro, centro, celda_x, celda_y,
+                             altura_obs=altura, altura_obj=altura_objetivo, alcance=alcance)
+    cuenca = CuencaVisual(grilla, visible, lat_celda, lon_celda, dem[centro, centro], alcance)
+    cache_cuencas.guardar(clave, cuenca, cuenca.bytes)
+    return cuenca
+
+
+def cuencas_combinadas(catalogo, observadores, alcance=5000, altura_objetivo=0.0,
+                       resolucion=RESOLUCION_DEFAULT, pool=None):
+    """
+    Cuencas de varios observadores reproyectadas a una grilla común.
+
+    Args:
+        observadores: lista de dicts {"lat", "lon", "altura"?, "alcance"?}
+
+    Returns:
+        (grilla, conteo, cuencas): conteo es la matriz de cuántos observadores
+        ven cada celda (NaN donde ninguno la evalúa)
+    """
+    cuencas = [
+        cuenca_visual_observador(
+            catalogo, float(o['lat']), float(o['lon']),
+            altura=float(o.get('altura', 2.0)),
+            alcance=float(o.get('alcance', alcance)),
+            altura_objetivo=altura_objetivo, resolucion=resolucion, pool=pool
+        )
+        for o in observadores
+    ]
+
+    bbox = {
+        'west': min(c.grilla.bbox['west'] for c in cuencas),
+        'east': max(c.grilla.bbox['east'] for c in cuencas),
+        'south': min(c.grilla.bbox['south'] for c in cuencas),
+        'north': max(c.grilla.bbox['north'] for c in cuencas)
+    }
+    grilla = Grilla.desde_spec({'bbox': bbox, 'resolucion': resolucion})
+
+    conteo = np.zeros(grilla.forma, dtype=np.float32)
+    evaluada = np.zeros(grilla.forma, dtype=bool)
+    for cuenca in cuencas:
+        # Celda de la ventana del observador más cercana a cada celda de salida
+        ventana = cuenca.grilla
+        filas = np.floor((ventana.bbox['north'] - grilla.lats) / ventana.paso_lat).astype(np.int64)
+        columnas = np.floor((grilla.lons - ventana.bbox['west']) / ventana.paso_lon).astype(np.int64)
+        ok_filas = (filas >= 0) & (filas < ventana.rows)
+        ok_columnas = (columnas >= 0) & (columnas < ventana.cols)
+        if not ok_filas.any() or not ok_columnas.any():
+            continue
+
+        bloque = cuenca.visible[np.ix_(filas[ok_filas], columnas[ok_columnas])]
+        sub = np.ix_(ok_filas, ok_columnas)
+        conteo[sub] += np.nan_to_num(bloque, nan=0.0)
+        evaluada[sub] |= ~np.isnan(bloque)
+
+    conteo[~evaluada] = np.nan
+    return grilla, conteo, cuencas
+
+
+def linea_de_vista(catalogo, origen, destino, altura_obs=2.0, altura_obj=2.0,
+                   paso=RESOLUCION_DEFAULT, pool=None):
+    """
+    Línea de vista punto a punto sobre un perfil muestreado cada `paso` metros.
+
+    Args:
+        origen, destino: (lat, lon)
+
+    Returns:
+        dict con visible (None sin datos), distancia, margen mínimo de la
+        visual sobre el terreno y la primera obstrucción
+
+    Raises:
+        ValueError: si el perfil supera MAX_MUESTRAS_LINEA muestras
+    """
+    lat0, lon0 = map(float, origen)
+    lat1, lon1 = map(float, destino)
+    cos_lat = math.cos(math.radians((lat0 + lat1) / 2))
+    distancia = math.hypot((lon1 - lon0) * METROS_POR_GRADO * cos_lat, (lat1 - lat0) * METROS_POR_GRADO)
+
+    n = max(2, math.ceil(distancia / paso) + 1)
+    if n > MAX_MUESTRAS_LINEA:
+        raise ValueError(f'Línea de {distancia / 1000:.1f} km con paso {paso:g} m: {n} muestras '
+                         f'(máximo {MAX_MUESTRAS_LINEA}); usar un paso mayor')
+    lats = np.linspace(lat0, lat1, n)
+    lons = np.linspace(lon0, lon1, n)
+    distancias = np.linspace(0, distancia, n)
+
+    z, _ = muestrear_tiles(catalogo.tiles_para_puntos(lons, lats), lons, lats, pool=pool)
+    resultado = {'distancia': round(distancia, 1), 'muestras': n}
+    if np.isnan(z[0]) or np.isnan(z[-1]):
+        resultado.update({'visible': None, 'error': 'Sin datos de elevación en los extremos'})
+        return resultado
+
+    z_efectiva = z - caida_curvatura(distancias)
+    z_ojo = z_efectiva[0] + altura_obs
+    z_objetivo = z_efectiva[-1] + altura_obj
+    visual = z_ojo + (z_objetivo - z_ojo) * distancias / max(distancia, 1e-9)
+
+    # Margen de la visual sobre el terreno en los puntos intermedios
+    margen = (visual - z_efectiva)[1:-1]
+    obstruidos = np.flatnonzero(np.nan_to_num(margen, nan=np.inf) < 0)
+
+    resultado.update({
+        'visible': obstruidos.size == 0,
+        'margen_minimo': None if np.all(np.isnan(margen)) else round(float(np.nanmin(margen)), 1),
+        'obstruccion': None
+    })
+    if obstruidos.size:
+        k = int(obstruidos[0]) + 1
+        resultado['obstruccion'] = {
+            'lat': float(lats[k]),
+            'lon': float(lons[k]),
+            'distancia': round(float(distancias[k]), 1),
+            'elevacion': round(float(z[k]), 1)
+        }
+    return resultado
@@ -3,14 +3,26 @@ from rasterio.windows import Window
 from rasterio.merge import merge
 from rasterio.warp import reproject, Resampling
 import os
+import sys
 import json
-import tarfile
 import tempfile
 from pathlib import Path
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Server'))
+
+from services.resumen_tiles import ResumenIndice, ruta_resumen
+from services.archivo_tiles import escribir_tar_indexado
+from services.almacen_tiles import MBTiles
+
 # Configuración para tiles pequeños
 TILE_SIZE_KM = 25  # Cada tile será de 25x25 km aprox
 MAX_TAR_SIZE_MB = 45  # Límite para GitHub (menos que 50MB para seguridad)
+FACTORES_OVERVIEW = [2, 4, 8, 16]  # Overviews internos para muestreo por resolución
+MIN_PIXELES_OVERVIEW = 32  # No generar niveles de menos de 32 píxeles por lado
+FORMATO_COG = True  # Tiles como Cloud-Optimized GeoTIFF (False = perfil de la fuente)
+COMPRESION_COG = 'ZSTD'  # Se cae a DEFLATE si el GDAL instalado no tiene ZSTD
+BLOQUE_COG = 256  # Tiling interno en píxeles
+MBTILES_SALIDA = os.getenv('MAIRA_MINI_TILES_MBTILES')  # Además de los TAR, todos los mini-tiles en un único .mbtiles
 
 def calcular_tile_size_pixels(src, tile_size_km):
     """
@@ -31,6 +43,55 @@ def calcular_tile_size_pixels(src, tile_size_km):
     
     return max(pixels_x, pixels_y)  # Usar el mayor para tiles cuadrados
 
+def escribir_mini_tile(ruta, datos, profile):
+    """
+    Escribe un mini-tile con overviews internos (promedio).
+    
+    En modo COG el archivo queda con tiling interno, compresión con predictor
+    y los IFDs de todos los niveles al comienzo: un cliente lee el header con
+    un HTTP Range y después solo los bloques que necesita.
+    """
+    alto, ancho = datos.shape[1:]
+    factores = [f for f in FACTORES_OVERVIEW if min(ancho, alto) // f >= MIN_PIXELES_OVERVIEW]
+    
+    if not FORMATO_COG:
+        with rasterio.open(ruta, 'w', **profile) as dst:
+            dst.write(datos)
+            if factores:
+                dst.build_overviews(factores, Resampling.average)
+                dst.update_tags(ns='rio_overview', resampling='average')
+        return
+    
+    from rasterio.io import MemoryFile
+    from rasterio.shutil import copy as copiar_raster
+    
+    # Tile y overviews en memoria; el driver COG los reordena al copiar
+    perfil_memoria = {k: v for k, v in profile.items()
+                      if k not in ('tiled', 'blockxsize', 'blockysize', 'compress', 'predictor', 'interleave')}
+    perfil_memoria['driver'] = 'GTiff'
+    
+    opciones = [
+        {'driver': 'COG', 'compress': COMPRESION_COG},
+        {'driver': 'COG', 'compress': 'DEFLATE'},
+    ]
+    with MemoryFile() as memoria:
+        with memoria.open(**perfil_memoria) as tmp:
+            tmp.write(datos)
+            if factores:
+                tmp.build_overviews(factores, Resampling.average)
+        
+        with memoria.open() as tmp:
+            error = None
+            for opcion in opciones:
+                try:
+                    copiar_raster(tmp, ruta, predictor='YES', blocksize=BLOQUE_COG,
+                                  overviews='FORCE_USE_EXISTING' if factores else 'NONE',
+                                  overview_resampling='AVERAGE', **opcion)
+                    return
+                except Exception as e:
+                    error = e
+            raise error
+
 def crear_mini_tiles_provincia(provincia_json_path, tif_files_dir, output_dir):
     """
     Toma un JSON de provincia y crea mini-tiles compatibles con GitHub
@@ -138,6 +199,7 @@ def cortar_en_mini_tiles(mosaic_path, output_dir, provincia_name):
         height, width = src.height, src.width
         
         mini_tiles_data = []
+        resumen = ResumenIndice()
         tile_count = 0
         current_tar_files = []
         current_tar_size = 0
@@ -177,13 +239,16 @@ def cortar_en_mini_tiles(mosaic_path, output_dir, provincia_name):
                 mini_tile_filename = f"{provincia_name}_tile_{tile_count:04d}.tif"
                 mini_tile_path = os.path.join(output_dir, mini_tile_filename)
                 
-                # Guardar mini-tile
-                with rasterio.open(mini_tile_path, 'w', **profile) as dst:
-                    dst.write(tile_data)
+                # Guardar mini-tile (COG con overviews internos, así el servidor
+                # lee el nivel más grueso que alcanza a la resolución pedida)
+                escribir_mini_tile(mini_tile_path, tile_data, profile)
                 
                 # Calcular bounds geográficos
                 bounds = rasterio.windows.bounds(window, src.transform)
                 
+                # Estadísticas del tile y bloques para el resumen (tablas de áreas sumadas)
+                estadisticas = resumen.agregar(mini_tile_filename, tile_data[0], nodata_raster=src.nodata)
+                
                 # Agregar a metadata
                 mini_tiles_data.append({
                     'id': f"{provincia_name}_tile_{tile_count:04d}",
@@ -195,6 +260,7 @@ def cortar_en_mini_tiles(mosaic_path, output_dir, provincia_name):
                         'north': bounds[3]
                     },
                     'tile_index': tile_count,
+                    'estadisticas': estadisticas,
                     'tar_file': f"{provincia_name}_part_{tar_index:02d}.tar.gz"
                 })
                 
@@ -225,25 +291,38 @@ def cortar_en_mini_tiles(mosaic_path, output_dir, provincia_name):
         }
         
         index_path = os.path.join(output_dir, f"{provincia_name}_mini_tiles_index.json")
+        resumen_path = resumen.guardar(ruta_resumen(index_path))
+        if resumen_path:
+            index_data['resumen_file'] = os.path.basename(resumen_path)
+        
         with open(index_path, 'w') as f:
             json.dump(index_data, f, indent=2)
         
         print(f"✅ {provincia_name}: {tile_count} mini-tiles en {tar_index} archivos TAR")
         print(f"📄 Índice guardado: {index_path}")
+        if resumen_path:
+            print(f"📚 Resumen guardado: {resumen_path}")
 
 def crear_tar_file(tif_files, output_dir, provincia_name, tar_index):
     """
-    Crea un archivo TAR.GZ con los TIF especificados
+    Crea un archivo TAR.GZ con los TIF especificados.
+    Cada TIF va en su propio miembro gzip, con el índice de offsets en
+    {tar}.idx.json, para que el servidor extraiga un tile con un Range
+    (ver Server/services/archivo_tiles.py)
     """
     
     tar_filename = f"{provincia_name}_part_{tar_index:02d}.tar.gz"
     tar_path = os.path.join(output_dir, tar_filename)
     
-    with tarfile.open(tar_path, 'w:gz') as tar:
-        for tif_path in tif_files:
-            # Agregar solo el nombre del archivo, no la ruta completa
-            arcname = os.path.basename(tif_path)
-            tar.add(tif_path, arcname=arcname)
+    # Agregar solo el nombre del archivo, no la ruta completa
+    escribir_tar_indexado(tar_path, [(tif_path, os.path.basename(tif_path)) for tif_path in tif_files])
+    
+    # Mismos TIF en el .mbtiles, con la ruta que sirve /Client/Libs/datos_argentina/
+    if MBTILES_SALIDA:
+        MBTiles(MBTILES_SALIDA).escribir_lote(
+            (f"Altimetria_Mini_Tiles/{provincia_name}/{os.path.basename(tif_path)}", Path(tif_path).read_bytes())
+            for tif_path in tif_files
+        )
     
     # Eliminar archivos TIF individuales después de agregarlos al TAR
     for tif_path in tif_files:
@@ -388,6 +467,9 @@ if __name__ == "__main__":
     
     if os.path.exists(tif_dir):
         procesar_todas_las_provincias(tif_dir)
+        if MBTILES_SALIDA:
+            MBTiles(MBTILES_SALIDA).compactar()
+            print(f"🗃️ Mini-tiles también en: {MBTILES_SALIDA}")
     else:
         print("❌ Directorio no encontrado. Extrae primero los archivos TIF.")
         print("💡 Comando sugerido:")
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark de backends de lectura de mini-tiles: rasterio vs .npy memmap
+
+Muestrea puntos aleatorios sobre el catálogo de altimetría con:
+- rasterio por ventana, sin pool (un open + read por tile y request),
+- PoolRaster decodificando con rasterio (primera pasada en frío, luego caliente),
+- PoolRaster con los .npy de tools/export_tiles_npy.py mapeados (frío/caliente).
+
+"Frío" es un pool nuevo en el proceso; las páginas de los archivos pueden
+seguir en el page cache del sistema, que es justamente lo que comparten los
+workers con el backend memmap.
+
+Uso:
+    python tools/benchmark_raster_backends.py
+    python tools/benchmark_raster_backends.py --puntos 50000 --repeticiones 10
+
+Autor: MAIRA Team
+Fecha: Noviembre 2025
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Server'))
+
+from services import tiles_npy
+from services.catalogo_tiles import obtener_catalogo_nacional
+from services.muestreo_raster import muestrear_tiles
+from services.pool_raster import PoolRaster
+
+# Configuración
+BASE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'Client', 'Libs', 'datos_argentina'
+)
+
+
+def puntos_aleatorios(tiles, n, semilla=0):
+    """n puntos uniformes dentro de tiles elegidos al azar."""
+    rng = np.random.default_rng(semilla)
+    elegidos = rng.integers(0, len(tiles), n)
+    west = np.array([b['west'] for _, b in tiles])[elegidos]
+    east = np.array([b['east'] for _, b in tiles])[elegidos]
+    south = np.array([b['south'] for _, b in tiles])[elegidos]
+    north = np.array([b['north'] for _, b in tiles])[elegidos]
+    return west + rng.random(n) * (east - west), south + rng.random(n) * (north - south)
+
+
+def medir(catalogo, lons, lats, pool, repeticiones):
+    """(segundos primera pasada, mejor segundos siguientes, valores)."""
+    tiles = catalogo.tiles_para_puntos(lons, lats)
+    inicio = time.perf_counter()
+    valores, _ = muestrear_tiles(tiles, lons, lats, pool=pool)
+    primera = time.perf_counter() - inicio
+    mejores = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        muestrear_tiles(tiles, lons, lats, pool=pool)
+        mejores.append(time.perf_counter() - inicio)
+    return primera, min(mejores) if mejores else primera, valores
+
+
+def main():
+    parser = argparse.ArgumentParser(description='rasterio vs .npy memmap para muestreo de puntos')
+    parser.add_argument('--puntos', type=int, default=20000)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--datos', default=BASE_DIR,
+                        help='Directorio datos_argentina (default: Client/Libs/datos_argentina)')
+    args = parser.parse_args()
+
+    catalogo = obtener_catalogo_nacional(os.path.join(args.datos, 'Altimetria_Mini_Tiles'))
+    tiles = catalogo.tiles_bbox({'west': -180, 'south': -90, 'east': 180, 'north': 90})
+    if not tiles:
+        print('❌ No hay tiles extraídos')
+        sys.exit(1)
+    lons, lats = puntos_aleatorios(tiles, args.puntos)
+    con_npy = sum(os.path.exists(tiles_npy.ruta_npy(r)) for r, _ in tiles)
+
+    print('=' * 70)
+    print(f'⏱️  BENCHMARK BACKENDS RASTER: {args.puntos} puntos, {len(tiles)} tiles ({con_npy} con .npy)')
+    print('=' * 70)
+
+    resultados = {}
+    backend = tiles_npy.BACKEND
+    try:
+        tiles_npy.BACKEND = 'rasterio'
+        resultados['rasterio sin pool'] = medir(catalogo, lons, lats, None, args.repeticiones)
+        resultados['pool rasterio'] = medir(catalogo, lons, lats, PoolRaster(presupuesto_mb=4096), args.repeticiones)
+        if con_npy:
+            tiles_npy.BACKEND = 'auto'
+            resultados['pool memmap .npy'] = medir(catalogo, lons, lats, PoolRaster(presupuesto_mb=4096), args.repeticiones)
+        else:
+            print('⚠️  Sin .npy: correr antes tools/export_tiles_npy.py')
+    finally:
+        tiles_npy.BACKEND = backend
+
+    referencia = resultados['rasterio sin pool'][2]
+    print(f"{'backend':<22}{'frío (s)':>12}{'caliente (s)':>14}{'puntos/s':>14}{'máx |Δ|':>10}")
+    for nombre, (primera, caliente, valores) in resultados.items():
+        diferencia = np.nanmax(np.abs(valores - referencia)) if np.isfinite(valores).any() else float('nan')
+        print(f'{nombre:<22}{primera:>12.4f}{caliente:>14.4f}{args.puntos / caliente:>14.0f}{diferencia:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark del descargador de tiles contra un servidor upstream local
+
+Levanta un servidor de tiles de prueba (latencia configurable, cuenta
+requests y conexiones) y simula muchos clientes pidiendo los mismos tiles
+sin cachear, comparando:
+- una conexión nueva por tile (como el descargar_tile original),
+- DescargadorTiles (Server/services/descarga_tiles.py): sesiones keep-alive,
+  requests agrupados y tope de concurrencia.
+
+Con --servir solo deja corriendo el upstream de prueba, para apuntarle un
+servidor MAIRA real:
+    MAIRA_TILES_UPSTREAM="osm=http://127.0.0.1:8090/{z}/{x}/{y}.{ext}" python Server/serverhttps.py
+
+Uso:
+    python tools/benchmark_tile_proxy.py
+    python tools/benchmark_tile_proxy.py --clientes 50 --tiles 20 --latencia 0.2
+    python tools/benchmark_tile_proxy.py --servir --puerto 8090
+
+Autor: MAIRA Team
+Fecha: Noviembre 2025
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Server'))
+
+from services.descarga_tiles import DescargadorTiles
+
+
+class UpstreamPrueba(ThreadingHTTPServer):
+    """Servidor de tiles falso: bytes deterministas por ruta, con latencia."""
+
+    daemon_threads = True
+
+    def __init__(self, puerto, latencia):
+        super().__init__(('127.0.0.1', puerto), ManejadorTiles)
+        self.latencia = latencia
+        self.requests = 0
+        self.conexiones = set()
+        self.simultaneos = 0
+        self.max_simultaneos = 0
+        self.lock = threading.Lock()
+
+
+class ManejadorTiles(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_GET(self):
+        servidor = self.server
+        with servidor.lock:
+            servidor.requests += 1
+            servidor.conexiones.add(self.client_address)
+            servidor.simultaneos += 1
+            servidor.max_simultaneos = max(servidor.max_simultaneos, servidor.simultaneos)
+        time.sleep(servidor.latencia)
+        cuerpo = (self.path.encode('utf-8') * 64)[:4096]
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+        with servidor.lock:
+            servidor.simultaneos -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+def bajar_sin_pool(proveedor, url):
+    import requests
+    respuesta = requests.get(url, timeout=10)
+    respuesta.raise_for_status()
+    return respuesta.content
+
+
+def correr(nombre, bajar, pedidos, servidor):
+    servidor.requests = 0
+    servidor.conexiones = set()
+    servidor.max_simultaneos = 0
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(pedidos)) as ejecutor:
+        resultados = list(ejecutor.map(lambda url: bajar('prueba', url), pedidos))
+    duracion = time.perf_counter() - inicio
+    fallidos = sum(r is None for r in resultados)
+    print(f'{nombre:<22}{duracion:>10.2f}{servidor.requests:>12}{len(servidor.conexiones):>12}'
+          f'{servidor.max_simultaneos:>12}{fallidos:>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Descargador de tiles vs conexión por tile, contra upstream local')
+    parser.add_argument('--clientes', type=int, default=50, help='Requests simultáneos')
+    parser.add_argument('--tiles', type=int, default=10, help='Tiles distintos entre los que se reparten')
+    parser.add_argument('--latencia', type=float, default=0.1, help='Segundos por respuesta del upstream')
+    parser.add_argument('--concurrencia', type=int, default=8, help='Tope de descargas simultáneas')
+    parser.add_argument('--puerto', type=int, default=8090)
+    parser.add_argument('--servir', action='store_true', help='Solo levantar el upstream de prueba')
+    args = parser.parse_args()
+
+    servidor = UpstreamPrueba(args.puerto, args.latencia)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{args.puerto}'
+
+    if args.servir:
+        print(f'🗺️  Upstream de prueba en {base}/{{z}}/{{x}}/{{y}}.png (Ctrl+C para salir)')
+        try:
+            while True:
+                time.sleep(5)
+                print(f'   {servidor.requests} requests, {len(servidor.conexiones)} conexiones')
+        except KeyboardInterrupt:
+            return
+
+    rng = random.Random(0)
+    pedidos = [f'{base}/12/{rng.randrange(args.tiles)}/100.png' for _ in range(args.clientes)]
+
+    print('=' * 80)
+    print(f'⏱️  {args.clientes} requests sobre {args.tiles} tiles, upstream con {args.latencia * 1000:.0f} ms')
+    print('=' * 80)
+    print(f"{'modo':<22}{'seg':>10}{'upstream':>12}{'conexiones':>12}{'simultáneas':>12}{'fallidos':>10}")
+    correr('conexión por tile', bajar_sin_pool, pedidos, servidor)
+    correr('DescargadorTiles', DescargadorTiles(concurrencia=args.concurrencia).descargar, pedidos, servidor)
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
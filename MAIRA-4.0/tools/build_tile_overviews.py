@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Agrega overviews internos a mini-tiles ya extraídos
+
+Los tiles generados antes de que crear_mini_tiles.py y
+vegetation_tile_processor.py escribieran overviews se leen siempre a
+resolución completa. Este script recorre los catálogos que usa el servidor
+y construye en cada tile los niveles 2x, 4x, ... (promedio) que le faltan,
+para que el muestreo por resolución (Server/services/muestreo_raster.py)
+pueda usarlos.
+
+Uso:
+    python tools/build_tile_overviews.py
+    python tools/build_tile_overviews.py --capa altimetria --factores 2 4 8 16
+
+Autor: MAIRA Team
+Fecha: Noviembre 2025
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Server'))
+
+from services.catalogo_tiles import obtener_catalogo, obtener_catalogo_nacional
+
+# Configuración
+BASE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'Client', 'Libs', 'datos_argentina'
+)
+MIN_PIXELES_OVERVIEW = 32
+
+
+def catalogo_capa(datos, capa):
+    """Catálogo que el servidor usa para la capa, o None si no hay índices."""
+    try:
+        if capa == 'altimetria':
+            return obtener_catalogo_nacional(os.path.join(datos, 'Altimetria_Mini_Tiles'))
+        return obtener_catalogo(os.path.join(datos, 'Vegetacion_Mini_Tiles', 'vegetation_master_index.json'))
+    except FileNotFoundError:
+        return None
+
+
+def agregar_overviews(ruta, factores):
+    """Construye los niveles faltantes; devuelve los factores agregados."""
+    import rasterio
+    from rasterio.enums import Resampling
+
+    with rasterio.open(ruta, 'r+') as dst:
+        existentes = set(dst.overviews(1))
+        nuevos = [f for f in factores
+                  if f not in existentes and min(dst.width, dst.height) // f >= MIN_PIXELES_OVERVIEW]
+        if nuevos:
+            dst.build_overviews(sorted(existentes | set(nuevos)), Resampling.average)
+            dst.update_tags(ns='rio_overview', resampling='average')
+    return nuevos
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Overviews internos para mini-tiles existentes')
+    parser.add_argument('--capa', choices=['altimetria', 'vegetacion', 'todas'], default='todas')
+    parser.add_argument('--factores', type=int, nargs='+', default=[2, 4, 8, 16])
+    parser.add_argument('--datos', default=BASE_DIR,
+                        help='Directorio datos_argentina (default: Client/Libs/datos_argentina)')
+    args = parser.parse_args()
+
+    print('=' * 70)
+    print('🔭 OVERVIEWS DE MINI-TILES')
+    print('=' * 70)
+
+    capas = ['altimetria', 'vegetacion'] if args.capa == 'todas' else [args.capa]
+    inicio = time.time()
+    for capa in capas:
+        catalogo = catalogo_capa(args.datos, capa)
+        if catalogo is None:
+            print(f'⚠️  Sin índices de {capa}')
+            continue
+
+        tiles = catalogo.tiles_bbox({'west': -180, 'south': -90, 'east': 180, 'north': 90})
+        actualizados = errores = 0
+        for ruta, _ in tiles:
+            try:
+                actualizados += bool(agregar_overviews(ruta, args.factores))
+            except Exception as e:
+                errores += 1
+                print(f'❌ {os.path.basename(ruta)}: {e}')
+        print(f'✅ {capa}: {actualizados}/{len(tiles)} tiles con overviews nuevos'
+              + (f', {errores} errores' if errores else ''))
+
+    print(f'\n⏱️  {time.time() - inicio:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
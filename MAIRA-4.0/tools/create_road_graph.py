@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Construye el grafo vial topológico (CSR) a partir de las capas de Transporte
+
+Lee rutas nacionales, provinciales y caminos desde Transporte_GeoJSON (capas
+completas) o, si no están, desde Transporte_Tiles (las features repetidas
+entre tiles se descartan). Escribe un .npy por array en Grafo_Vial/, que el
+servidor abre por mmap (Server/services/grafo_vial.py).
+
+Uso:
+    python tools/create_road_graph.py
+    python tools/create_road_graph.py --salida /ruta/Grafo_Vial --decimales 5
+
+Autor: MAIRA Team
+Fecha: Noviembre 2025
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Server'))
+
+from services.grafo_vial import construir_grafo, guardar_grafo, TIPOS_VIA, DECIMALES_NODO
+
+# Configuración
+BASE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'Client', 'Libs', 'datos_argentina'
+)
+
+
+def archivos_capa(tipo):
+    """GeoJSON completo de la capa o, si no existe, sus tiles."""
+    completo = os.path.join(BASE_DIR, 'Transporte_GeoJSON', f'{tipo}.geojson')
+    if os.path.exists(completo):
+        return [completo]
+    return sorted(glob.glob(os.path.join(BASE_DIR, 'Transporte_Tiles', tipo, '*.geojson')))
+
+
+def leer_lineas(archivos, tipo):
+    """Genera (coords, tipo) por cada LineString / parte de MultiLineString."""
+    for ruta in archivos:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            datos = json.load(f)
+        for feature in datos.get('features', []):
+            geometria = feature.get('geometry') or {}
+            if geometria.get('type') == 'LineString':
+                yield geometria['coordinates'], tipo
+            elif geometria.get('type') == 'MultiLineString':
+                for parte in geometria['coordinates']:
+                    yield parte, tipo
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Grafo vial CSR desde las capas de Transporte')
+    parser.add_argument('--salida', default=os.path.join(BASE_DIR, 'Grafo_Vial'),
+                        help='Directorio de salida (default: datos_argentina/Grafo_Vial)')
+    parser.add_argument('--decimales', type=int, default=DECIMALES_NODO,
+                        help='Decimales de grado para unir vértices (default: 6 ≈ 0.1 m)')
+    args = parser.parse_args()
+
+    print('=' * 70)
+    print('🛣️  CONSTRUCCIÓN DEL GRAFO VIAL')
+    print('=' * 70)
+
+    inicio = time.time()
+    fuentes = {}
+
+    def todas_las_lineas():
+        for i, tipo in enumerate(TIPOS_VIA):
+            archivos = archivos_capa(tipo)
+            fuentes[tipo] = len(archivos)
+            if not archivos:
+                print(f'⚠️  Sin datos para {tipo}')
+                continue
+            print(f'📂 {tipo}: {len(archivos)} archivo(s)')
+            yield from leer_lineas(archivos, i)
+
+    try:
+        grafo = construir_grafo(todas_las_lineas(), decimales=args.decimales)
+    except ValueError as e:
+        print(f'❌ {e}')
+        sys.exit(1)
+
+    metadata = guardar_grafo(grafo, args.salida, fuente={'archivos_por_tipo': fuentes})
+
+    print(f"\n✅ {metadata['nodos']} nodos, {metadata['aristas']} aristas")
+    for tipo, km in metadata['km_por_tipo'].items():
+        print(f'   ├─ {tipo}: {km} km')
+    tamano = sum(os.path.getsize(p) for p in glob.glob(os.path.join(args.salida, '*.npy')))
+    print(f'💾 {args.salida} ({tamano / (1024 * 1024):.1f} MB) en {time.time() - inicio:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Genera los resúmenes por tile de catálogos de mini-tiles ya publicados
+
+Para índices creados antes de que scripts/crear_mini_tiles.py escribiera
+estadísticas: recorre los tiles extraídos de altimetría y/o vegetación,
+agrega 'estadisticas' (min, max, media, fracción sin dato) a cada entrada
+del índice y escribe {indice}.resumen.npz con las tablas de áreas sumadas
+por bloque (Server/services/resumen_tiles.py). El NDVI se guarda
+normalizado a 0-1.
+
+Uso:
+    python tools/create_tile_summaries.py
+    python tools/create_tile_summaries.py --capa vegetacion
+    python tools/create_tile_summaries.py --datos /ruta/datos_argentina
+
+Autor: MAIRA Team
+Fecha: Noviembre 2025
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Server'))
+
+from services.resumen_tiles import ResumenIndice, ruta_resumen
+from services.catalogo_tiles import resolver_ruta_default
+from services.muestreo_raster import normalizar_ndvi
+
+# Configuración
+BASE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'Client', 'Libs', 'datos_argentina'
+)
+
+
+def indices_capa(datos, capa):
+    """Índices JSON que lee el servidor para la capa."""
+    if capa == 'altimetria':
+        return sorted(glob.glob(os.path.join(datos, 'Altimetria_Mini_Tiles', '*', '*_mini_tiles_index.json')))
+    ruta = os.path.join(datos, 'Vegetacion_Mini_Tiles', 'vegetation_master_index.json')
+    return [ruta] if os.path.exists(ruta) else []
+
+
+def resumir_indice(ruta_indice, transformar=None):
+    """Resume los tiles presentes del índice; devuelve (resumidos, faltantes)."""
+    import rasterio
+
+    with open(ruta_indice, 'r', encoding='utf-8') as f:
+        datos = json.load(f)
+
+    directorio = os.path.dirname(ruta_indice)
+    resumen = ResumenIndice()
+    faltantes = 0
+    for valor in datos.get('tiles', {}).values():
+        for info in (valor if isinstance(valor, list) else [valor]):
+            if not (info.get('bounds') and info.get('filename')):
+                continue
+            ruta = resolver_ruta_default(directorio, info)
+            if not os.path.exists(ruta):
+                faltantes += 1
+                continue
+            with rasterio.open(ruta) as src:
+                info['estadisticas'] = resumen.agregar(
+                    os.path.relpath(ruta, directorio), src.read(1),
+                    nodata_raster=src.nodata, transformar=transformar)
+
+    destino = resumen.guardar(ruta_resumen(ruta_indice))
+    if destino:
+        datos['resumen_file'] = os.path.basename(destino)
+        temporal = ruta_indice + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(datos, f, indent=2, ensure_ascii=False)
+        os.replace(temporal, ruta_indice)
+    return len(resumen.rutas), faltantes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resúmenes por tile (estadísticas y tablas de áreas sumadas)')
+    parser.add_argument('--capa', choices=['altimetria', 'vegetacion', 'todas'], default='todas')
+    parser.add_argument('--datos', default=BASE_DIR,
+                        help='Directorio datos_argentina (default: Client/Libs/datos_argentina)')
+    args = parser.parse_args()
+
+    print('=' * 70)
+    print('📚 RESÚMENES DE MINI-TILES')
+    print('=' * 70)
+
+    capas = ['altimetria', 'vegetacion'] if args.capa == 'todas' else [args.capa]
+    inicio = time.time()
+    for capa in capas:
+        indices = indices_capa(args.datos, capa)
+        if not indices:
+            print(f'⚠️  Sin índices de {capa}')
+            continue
+        transformar = normalizar_ndvi if capa == 'vegetacion' else None
+        for ruta_indice in indices:
+            resumidos, faltantes = resumir_indice(ruta_indice, transformar)
+            aviso = f' ({faltantes} sin extraer)' if faltantes else ''
+            print(f'✅ {os.path.basename(ruta_indice)}: {resumidos} tiles{aviso}')
+
+    print(f'\n⏱️  {time.time() - inicio:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Empaqueta un área de operaciones en un único archivo .mbtiles
+
+Lleva a una notebook sin conexión todo lo que el mapa pide de un AO en un
+solo archivo en lugar de decenas de miles: los tiles base de un proveedor
+(tomados de la cache del proxy, o bajados con --descargar) y los mini-tiles
+de altimetría/vegetación del bbox (Server/services/almacen_tiles.py). Los
+mini-tiles que falten en disco se pueden traer antes con
+tools/prefetch_ao_tiles.py.
+
+En la notebook el servidor lo usa como paquete de solo lectura:
+    MAIRA_TILES_PAQUETES=/ruta/ao.mbtiles python Server/serverhttps.py
+
+Uso:
+    python tools/export_ao_mbtiles.py --bbox -62.5 -38.5 -61.5 -37.5 --salida ao_bahia.mbtiles
+    python tools/export_ao_mbtiles.py --bbox -62.5 -38.5 -61.5 -37.5 --zoom 8 14 --descargar --salida ao.mbtiles
+
+Autor: MAIRA Team
+Fecha: Noviembre 2025
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ, 'Server'))
+
+from services.almacen_tiles import MBTiles
+from services.cache_disco_tiles import obtener_cache_tiles
+from services.catalogo_tiles import obtener_catalogo, obtener_catalogo_nacional
+from services.descarga_tiles import descargador_tiles, url_tile
+from services.precarga_tiles import EXTENSIONES, ZOOM_DEFECTO, leer_bbox, tiles_xyz
+
+
+def tiles_base(args, xyz, faltantes):
+    """(nombre, bytes) de los tiles base del AO que están en cache o se pudieron bajar."""
+    cache = obtener_cache_tiles(args.cache)
+    ext = EXTENSIONES.get(args.proveedor, 'png')
+
+    def buscar(zxy):
+        z, x, y = zxy
+        nombre = f'{z}_{x}_{y}.{ext}'
+        datos = cache.almacen.leer(args.proveedor, nombre)
+        if datos is None and args.descargar:
+            url = url_tile(args.proveedor, z, x, y, ext)
+            if url:
+                datos = descargador_tiles.descargar(
+                    args.proveedor, url, lambda d: cache.guardar(args.proveedor, nombre, d))
+        return nombre, datos
+
+    with ThreadPoolExecutor(max_workers=args.concurrencia) as ejecutor:
+        for nombre, datos in ejecutor.map(buscar, xyz):
+            if datos is None:
+                faltantes.append(nombre)
+            else:
+                yield nombre, datos
+
+
+def mini_tiles(args, bbox, faltantes):
+    """(ruta relativa a datos_argentina, bytes) de los mini-tiles del AO en disco."""
+    catalogos = []
+    try:
+        catalogos.append(obtener_catalogo_nacional(os.path.join(args.datos, 'Altimetria_Mini_Tiles')))
+    except FileNotFoundError as e:
+        print(f'⚠️ Sin altimetría: {e}')
+    try:
+        catalogos.append(obtener_catalogo(
+            os.path.join(args.datos, 'Vegetacion_Mini_Tiles', 'vegetation_master_index.json')))
+    except FileNotFoundError as e:
+        print(f'⚠️ Sin vegetación: {e}')
+
+    for catalogo in catalogos:
+        for ruta, _ in catalogo.entradas_bbox(bbox):
+            nombre = os.path.relpath(ruta, args.datos).replace(os.sep, '/')
+            if os.path.exists(ruta):
+                with open(ruta, 'rb') as f:
+                    yield nombre, f.read()
+            else:
+                faltantes.append(nombre)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Paquete .mbtiles de un área de operaciones para uso sin conexión')
+    parser.add_argument('--bbox', nargs=4, type=float, required=True, metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'))
+    parser.add_argument('--zoom', nargs=2, type=int, default=list(ZOOM_DEFECTO), metavar=('MIN', 'MAX'))
+    parser.add_argument('--proveedor', default='osm', help='Proveedor de tiles base')
+    parser.add_argument('--salida', required=True, help='Archivo .mbtiles a generar')
+    parser.add_argument('--descargar', action='store_true', help='Bajar los tiles base que no estén en cache')
+    parser.add_argument('--sin-mini-tiles', action='store_true', help='Solo tiles base')
+    parser.add_argument('--max-tiles', type=int, default=20000, help='Tope de tiles base')
+    parser.add_argument('--concurrencia', type=int, default=4)
+    parser.add_argument('--datos', default=os.path.join(RAIZ, 'Client', 'Libs', 'datos_argentina'))
+    parser.add_argument('--cache', default=os.path.join(RAIZ, 'static', 'tiles'), help='Cache de tiles base del proxy')
+    args = parser.parse_args()
+
+    try:
+        bbox = leer_bbox(args.bbox)
+        xyz = tiles_xyz(bbox, *args.zoom, limite=args.max_tiles)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print('=' * 70)
+    print('🗃️  PAQUETE MBTILES DEL ÁREA DE OPERACIONES')
+    print('=' * 70)
+
+    inicio = time.time()
+    paquete = MBTiles(args.salida)
+    paquete.poner_metadata(
+        name=f'MAIRA AO {args.proveedor}',
+        type='baselayer',
+        format=EXTENSIONES.get(args.proveedor, 'png'),
+        bounds=','.join(str(bbox[k]) for k in ('west', 'south', 'east', 'north')),
+        minzoom=args.zoom[0],
+        maxzoom=args.zoom[1],
+        maira_proveedor=args.proveedor
+    )
+
+    faltantes_base = []
+    base = paquete.escribir_lote(tiles_base(args, xyz, faltantes_base))
+    print(f'🗺️  {base} tiles base de {args.proveedor} (faltan {len(faltantes_base)})')
+
+    if not args.sin_mini_tiles:
+        faltantes_mini = []
+        mini = paquete.escribir_lote(mini_tiles(args, bbox, faltantes_mini))
+        print(f'🏔️  {mini} mini-tiles de altimetría/vegetación (faltan {len(faltantes_mini)} en disco)')
+        if faltantes_mini:
+            print('💡 Traerlos antes con: python tools/prefetch_ao_tiles.py --bbox ... --capas altimetria vegetacion')
+
+    paquete.compactar()
+    tamano = os.path.getsize(args.salida) / (1024 * 1024)
+    print(f'\n✅ {args.salida}: {tamano:.1f} MB en {time.time() - inicio:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Exporta los mini-tiles extraídos a .npy crudos para el backend memmap
+
+Escribe tile.npy + tile.npy.json junto a cada GeoTIFF de los catálogos de
+altimetría y vegetación (Server/services/tiles_npy.py). El pool de rasters
+del servidor los prefiere automáticamente: se leen con np.memmap, sin
+decodificar, y comparten el page cache entre workers de gunicorn.
+
+Uso:
+    python tools/export_tiles_npy.py
+    python tools/export_tiles_npy.py --capa altimetria --float16
+    python tools/export_tiles_npy.py --borrar      # quita los .npy exportados
+
+Autor: MAIRA Team
+Fecha: Noviembre 2025
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Server'))
+
+from services.catalogo_tiles import obtener_catalogo, obtener_catalogo_nacional
+from services.tiles_npy import exportar_tile, ruta_npy
+
+# Configuración
+BASE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'Client', 'Libs', 'datos_argentina'
+)
+
+
+def catalogo_capa(datos, capa):
+    """Catálogo que el servidor usa para la capa, o None si no hay índices."""
+    try:
+        if capa == 'altimetria':
+            return obtener_catalogo_nacional(os.path.join(datos, 'Altimetria_Mini_Tiles'))
+        return obtener_catalogo(os.path.join(datos, 'Vegetacion_Mini_Tiles', 'vegetation_master_index.json'))
+    except FileNotFoundError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mini-tiles a .npy para lectura por memmap')
+    parser.add_argument('--capa', choices=['altimetria', 'vegetacion', 'todas'], default='todas')
+    parser.add_argument('--float16', action='store_true',
+                        help='Guardar bandas float como float16 (mitad de tamaño, sin dato = NaN)')
+    parser.add_argument('--borrar', action='store_true', help='Eliminar los .npy exportados')
+    parser.add_argument('--datos', default=BASE_DIR,
+                        help='Directorio datos_argentina (default: Client/Libs/datos_argentina)')
+    args = parser.parse_args()
+
+    print('=' * 70)
+    print('🧮 EXPORTACIÓN DE MINI-TILES A .NPY')
+    print('=' * 70)
+
+    capas = ['altimetria', 'vegetacion'] if args.capa == 'todas' else [args.capa]
+    inicio = time.time()
+    for capa in capas:
+        catalogo = catalogo_capa(args.datos, capa)
+        if catalogo is None:
+            print(f'⚠️  Sin índices de {capa}')
+            continue
+
+        tiles = catalogo.tiles_bbox({'west': -180, 'south': -90, 'east': 180, 'north': 90})
+        total_bytes = errores = 0
+        for ruta, _ in tiles:
+            try:
+                if args.borrar:
+                    for archivo in (ruta_npy(ruta), ruta_npy(ruta) + '.json'):
+                        if os.path.exists(archivo):
+                            os.remove(archivo)
+                else:
+                    # float16 solo tiene sentido en elevación (el NDVI ya es uint8)
+                    total_bytes += exportar_tile(ruta, float16=args.float16 and capa == 'altimetria')
+            except Exception as e:
+                errores += 1
+                print(f'❌ {os.path.basename(ruta)}: {e}')
+
+        accion = 'borrados' if args.borrar else f'exportados ({total_bytes / (1024 * 1024):.1f} MB)'
+        print(f'✅ {capa}: {len(tiles) - errores}/{len(tiles)} tiles {accion}')
+
+    print(f'\n⏱️  {time.time() - inicio:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
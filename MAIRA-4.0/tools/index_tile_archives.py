@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Reempaqueta .tar.gz de tiles existentes como archivos indexados
+
+Los .tar.gz generados antes de Server/services/archivo_tiles.py son un único
+stream gzip: el servidor tiene que bajarlos enteros para sacar un tile. Este
+script los recorre en streaming (sin cargarlos en memoria) y los reescribe
+con un miembro gzip por entrada y el índice archivo.tar.gz.idx.json, que hay
+que subir junto al .tar.gz al release.
+
+Uso:
+    python tools/index_tile_archives.py maira_altimetria_tiles.tar.gz
+    python tools/index_tile_archives.py Client/Libs/datos_argentina/Vegetacion_Mini_Tiles/*.tar.gz
+
+Autor: MAIRA Team
+Fecha: Noviembre 2025
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Server'))
+
+from services.archivo_tiles import abrir_stream, escribir_tar_indexado, ruta_indice
+
+
+def miembros_tar(ruta):
+    """(bytes, nombre) de cada archivo del tar.gz, leyendo en streaming."""
+    with abrir_stream(ruta) as tar:
+        for miembro in tar:
+            if miembro.isfile():
+                with tar.extractfile(miembro) as f:
+                    yield f.read(), miembro.name
+
+
+def main():
+    parser = argparse.ArgumentParser(description='.tar.gz de tiles a formato indexado (lectura por Range)')
+    parser.add_argument('archivos', nargs='+', help='Archivos .tar.gz a reempaquetar')
+    parser.add_argument('--forzar', action='store_true', help='Reempaquetar aunque ya tengan índice')
+    args = parser.parse_args()
+
+    print('=' * 70)
+    print('🗂️  INDEXADO DE ARCHIVOS DE TILES')
+    print('=' * 70)
+
+    inicio = time.time()
+    for ruta in args.archivos:
+        if os.path.exists(ruta_indice(ruta)) and not args.forzar:
+            print(f'⏭️  {os.path.basename(ruta)}: ya indexado')
+            continue
+        try:
+            temporal = ruta + '.indexado.tmp'
+            indice = escribir_tar_indexado(temporal, miembros_tar(ruta))
+            os.replace(temporal, ruta)
+            os.replace(ruta_indice(temporal), ruta_indice(ruta))
+            print(f'✅ {os.path.basename(ruta)}: {len(indice)} miembros '
+                  f'({os.path.getsize(ruta) / (1024 * 1024):.1f} MB)')
+        except Exception as e:
+            print(f'❌ {os.path.basename(ruta)}: {e}')
+
+    print(f'\n⏱️  {time.time() - inicio:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Precarga los tiles de un área de operaciones antes de un ejercicio
+
+Corre la misma precarga que disparan crearPartida/crearOperacionGB cuando
+traen areaOperaciones (Server/services/precarga_tiles.py), en primer plano y
+con avance por consola: tiles base a la cache de static/tiles, mini-tiles de
+altimetría/vegetación extraídos a datos_argentina y tiles GIS leídos.
+
+Uso:
+    python tools/prefetch_ao_tiles.py --bbox -62.5 -38.5 -61.5 -37.5
+    python tools/prefetch_ao_tiles.py --bbox -62.5 -38.5 -61.5 -37.5 --zoom 8 14 --proveedores osm satellite
+    python tools/prefetch_ao_tiles.py --bbox -62.5 -38.5 -61.5 -37.5 --capas altimetria vegetacion
+
+Autor: MAIRA Team
+Fecha: Noviembre 2025
+"""
+
+import os
+import sys
+import argparse
+import threading
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ, 'Server'))
+
+from services.precarga_tiles import CAPAS, ZOOM_DEFECTO, GestorPrecargas, leer_bbox
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precarga de tiles base, mini-tiles y tiles GIS de un AO')
+    parser.add_argument('--bbox', nargs=4, type=float, required=True, metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'))
+    parser.add_argument('--zoom', nargs=2, type=int, default=list(ZOOM_DEFECTO), metavar=('MIN', 'MAX'))
+    parser.add_argument('--proveedores', nargs='+', default=['osm'])
+    parser.add_argument('--capas', nargs='+', default=list(CAPAS), choices=CAPAS)
+    parser.add_argument('--concurrencia', type=int, default=4, help='Tareas simultáneas')
+    parser.add_argument('--datos', default=os.path.join(RAIZ, 'Client', 'Libs', 'datos_argentina'))
+    parser.add_argument('--cache', default=os.path.join(RAIZ, 'static', 'tiles'), help='Cache de tiles base')
+    args = parser.parse_args()
+
+    try:
+        bbox = leer_bbox(args.bbox)
+        gestor = GestorPrecargas(concurrencia=args.concurrencia)
+        precarga = gestor.crear(bbox, args.datos, args.cache, zoom=args.zoom,
+                                proveedores=args.proveedores, capas=args.capas)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print('=' * 70)
+    print('🔥 PRECARGA DE TILES DEL ÁREA DE OPERACIONES')
+    print('=' * 70)
+
+    hilo = threading.Thread(target=gestor.ejecutar, args=(precarga,), daemon=True)
+    hilo.start()
+    try:
+        while hilo.is_alive():
+            hilo.join(2)
+            if precarga.total:
+                print(f'   {precarga.progreso:5.1f}%  {precarga.hechos}/{precarga.total}  '
+                      f'({precarga.en_cache} ya en cache, {precarga.errores} errores)')
+    except KeyboardInterrupt:
+        print('⏹️  Cancelando...')
+        precarga.cancelada = True
+        hilo.join()
+
+    print()
+    for capa, cuenta in sorted(precarga.a_dict()['por_capa'].items()):
+        print(f"   {capa:<12} {cuenta['hecho']:>6} cargados {cuenta['en_cache']:>6} en cache {cuenta['error']:>6} errores")
+    print(f'\n⏱️  {precarga.terminado - precarga.creado:.1f}s  ({precarga.estado})')
+    if precarga.error:
+        print(f'❌ {precarga.error}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,7 +9,6 @@ Basado en elevation_tile_processor.py adaptado para datos de vegetación NDVI
 import os
 import sys
 import json
-import tarfile
 import tempfile
 import shutil
 import argparse
@@ -24,6 +23,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Server'))
+
+from services.archivo_tiles import escribir_tar_indexado
+from services.almacen_tiles import MBTiles
+
 try:
     from osgeo import gdal, osr
     import numpy as np
@@ -37,7 +41,8 @@ except ImportError as e:
 class VegetationTileProcessor:
     """Procesador de tiles de vegetación NDVI para MAIRA 4.0"""
     
-    def __init__(self, input_dir: str, output_dir: str, max_archive_size: int = 95):
+    def __init__(self, input_dir: str, output_dir: str, max_archive_size: int = 95, cog: bool = True,
+                 mbtiles: Optional[str] = None):
         """
         Inicializar procesador de tiles de vegetación
         
@@ -45,6 +50,8 @@ class VegetationTileProcessor:
             input_dir: Directorio con archivos TIF de vegetación
             output_dir: Directorio de salida para mini-tiles
             max_archive_size: Tamaño máximo de archivo TAR en MB
+            cog: Escribir los mini-tiles como Cloud-Optimized GeoTIFF
+            mbtiles: Además de los TAR, guardar los mini-tiles en este .mbtiles
         """
         self.input_dir = Path(input_dir)
         self.output_dir = Path(output_dir)
@@ -56,7 +63,12 @@ class VegetationTileProcessor:
         
         # Configuración de tiles
         self.tile_size = 256  # Píxeles por tile
+        self.factores_overview = [2, 4, 8]  # Overviews internos (promedio) para muestreo por resolución
+        self.min_pixeles_overview = 32
         self.compression = 'LZW'  # Compresión para GeoTIFF
+        self.cog = cog
+        self.compresion_cog = ['ZSTD', 'DEFLATE']  # En orden de preferencia según el GDAL instalado
+        self.mbtiles = MBTiles(mbtiles) if mbtiles else None
         
         logger.info(f"🌱 Inicializando procesador de vegetación")
         logger.info(f"📂 Input: {self.input_dir}")
@@ -312,20 +324,22 @@ class VegetationTileProcessor:
             # Crear directorio si no existe
             tile_path.parent.mkdir(parents=True, exist_ok=True)
             
-            # Crear dataset de salida
-            driver = gdal.GetDriverByName('GTiff')
+            # Crear dataset de salida (en memoria si se copia después como COG)
             alto, ancho = datos.shape
             
-            dataset = driver.Create(
-                str(tile_path), ancho, alto, 1, gdal.GDT_Byte,
-                options=[
-                    'COMPRESS=LZW',
-                    'PREDICTOR=2',
-                    'TILED=YES',
-                    'BLOCKXSIZE=256',
-                    'BLOCKYSIZE=256'
-                ]
-            )
+            if self.cog:
+                dataset = gdal.GetDriverByName('MEM').Create('', ancho, alto, 1, gdal.GDT_Byte)
+            else:
+                dataset = gdal.GetDriverByName('GTiff').Create(
+                    str(tile_path), ancho, alto, 1, gdal.GDT_Byte,
+                    options=[
+                        f'COMPRESS={self.compression}',
+                        'PREDICTOR=2',
+                        'TILED=YES',
+                        'BLOCKXSIZE=256',
+                        'BLOCKYSIZE=256'
+                    ]
+                )
             
             if not dataset:
                 raise ValueError(f"No se pudo crear {tile_path}")
@@ -345,6 +359,16 @@ class VegetationTileProcessor:
             dataset.SetMetadataItem('ORIGINAL_TYPE', 'NDVI')
             dataset.SetMetadataItem('PROCESSOR', 'MAIRA_vegetation_processor')
             
+            # Overviews internos: el servidor lee el nivel más grueso que alcanza
+            # a la separación de puntos pedida
+            factores = [f for f in self.factores_overview
+                        if min(ancho, alto) // f >= self.min_pixeles_overview]
+            if factores:
+                dataset.BuildOverviews('AVERAGE', factores)
+            
+            if self.cog:
+                self.copiar_como_cog(dataset, tile_path, bool(factores))
+            
             # Cerrar dataset
             dataset = None
             
@@ -364,6 +388,35 @@ class VegetationTileProcessor:
             logger.error(f"❌ Error creando mini-tile {tile_x},{tile_y}: {e}")
             return None
     
+    def copiar_como_cog(self, dataset, tile_path: Path, con_overviews: bool):
+        """
+        Copia el dataset como Cloud-Optimized GeoTIFF: tiling interno, predictor,
+        overviews existentes y los IFDs al comienzo del archivo para HTTP Range.
+        Sin driver COG (GDAL < 3.1) se escribe un GeoTIFF tileado con overviews.
+        """
+        driver_cog = gdal.GetDriverByName('COG')
+        if driver_cog is None:
+            gdal.GetDriverByName('GTiff').CreateCopy(
+                str(tile_path), dataset,
+                options=['TILED=YES', 'BLOCKXSIZE=256', 'BLOCKYSIZE=256', 'COMPRESS=DEFLATE',
+                         'PREDICTOR=2', 'COPY_SRC_OVERVIEWS=YES']
+            )
+            return
+        
+        error = None
+        for compresion in self.compresion_cog:
+            try:
+                driver_cog.CreateCopy(
+                    str(tile_path), dataset,
+                    options=[f'COMPRESS={compresion}', 'PREDICTOR=YES', 'BLOCKSIZE=256',
+                             'OVERVIEW_RESAMPLING=AVERAGE',
+                             'OVERVIEWS=FORCE_USE_EXISTING' if con_overviews else 'OVERVIEWS=NONE']
+                )
+                return
+            except RuntimeError as e:
+                error = e
+        raise error
+    
     def calcular_bounds_geotransform(self, geotransform: tuple, ancho: int, alto: int) -> Dict:
         """Calcula bounds a partir de geotransform"""
         x_min = geotransform[0]
@@ -379,23 +432,28 @@ class VegetationTileProcessor:
         }
     
     def crear_archivo_tar(self, tiles: List[Dict], region: str, part_num: int) -> str:
-        """Crea archivo TAR.GZ con mini-tiles"""
+        """Crea archivo TAR.GZ con mini-tiles (un miembro gzip por tile + índice .idx.json)"""
         output_tar = self.output_dir / f"{region}_part_{part_num:02d}.tar.gz"
         
         logger.info(f"📦 Creando {output_tar} con {len(tiles)} tiles...")
         
         try:
-            with tarfile.open(output_tar, 'w:gz', compresslevel=6) as tar:
-                for tile in tiles:
-                    tile_path = Path(tile['path'])
-                    if tile_path.exists():
-                        arcname = f"{region}/{tile['filename']}"
-                        tar.add(tile_path, arcname=arcname)
+            escribir_tar_indexado(str(output_tar), [
+                (tile['path'], f"{region}/{tile['filename']}")
+                for tile in tiles if Path(tile['path']).exists()
+            ])
             
             # Verificar tamaño
             size_mb = output_tar.stat().st_size / (1024 * 1024)
             logger.info(f"✅ Archivo creado: {output_tar.name} ({size_mb:.1f}MB)")
             
+            # Mismos tiles en el .mbtiles, con la ruta que sirve /Client/Libs/datos_argentina/
+            if self.mbtiles is not None:
+                self.mbtiles.escribir_lote(
+                    (f"Vegetacion_Mini_Tiles/{region}/{tile['filename']}", Path(tile['path']).read_bytes())
+                    for tile in tiles if Path(tile['path']).exists()
+                )
+            
             # Limpiar tiles temporales
             for tile in tiles:
                 tile_path = Path(tile['path'])
@@ -630,6 +688,15 @@ def main():
         default=95,
         help="Tamaño máximo de archivo TAR en MB (default: 95)"
     )
+    parser.add_argument(
+        '--sin-cog',
+        action='store_true',
+        help="Escribir GeoTIFF tileado LZW en lugar de Cloud-Optimized GeoTIFF"
+    )
+    parser.add_argument(
+        '--mbtiles',
+        help="Además de los TAR, guardar los mini-tiles en un único archivo .mbtiles"
+    )
     parser.add_argument(
         '--verbose', '-v',
         action='store_true',
@@ -651,12 +718,16 @@ def main():
     processor = VegetationTileProcessor(
         input_dir=str(input_dir),
         output_dir=args.output,
-        max_archive_size=args.max_size
+        max_archive_size=args.max_size,
+        cog=not args.sin_cog,
+        mbtiles=args.mbtiles
     )
     
     # Procesar
     try:
         resultado = processor.procesar_todos()
+        if processor.mbtiles is not None:
+            processor.mbtiles.compactar()
         
         if resultado['status'] == 'success':
             logger.info("✅ Procesamiento exitoso")